@@ -0,0 +1,276 @@
+"""
+Insert-time anomaly scoring from running per-category statistics.
+
+    python anomaly.py rebuild [user_id]
+
+`category_stats` keeps, for each user and expense category, Welford's
+count, mean and sum of squared deviations plus a streaming estimate of
+the ANOMALY_QUANTILE quantile. A new expense is scored against the
+statistics before it is folded in, so each write costs one primary key
+read and one upsert instead of a scan of the history. An amount more
+than ANOMALY_Z_THRESHOLD standard deviations above the mean that also
+clears the quantile estimate raises an 'anomaly_alert' notification;
+the quantile guard keeps heavy-tailed categories from alerting on
+every large but ordinary purchase.
+
+The quantile estimate is a one-number stochastic approximation sketch:
+it moves up by rate * std * q when an amount lands above it and down by
+rate * std * (1 - q) when one lands below, so it settles where a
+fraction q of amounts fall under it. sp_add_transaction applies the
+same update in SQL; keep the two in step.
+
+Updates and deletes through the API take the old amount back out of
+the Welford moments. Rows written around the API (imports, archive
+restores) are picked up by `rebuild`. Each row records the currency its
+moments are in; the first write after the user's currency changes
+rebuilds them in the new one.
+"""
+import math
+import os
+import sys
+
+from fx import convert_rows, user_currency
+
+ANOMALY_Z_THRESHOLD = float(os.environ.get('ANOMALY_Z_THRESHOLD', 2.5))
+ANOMALY_MIN_COUNT = int(os.environ.get('ANOMALY_MIN_COUNT', 8))
+ANOMALY_QUANTILE = float(os.environ.get('ANOMALY_QUANTILE', 0.95))
+ANOMALY_QUANTILE_RATE = float(os.environ.get('ANOMALY_QUANTILE_RATE', 0.1))
+
+
+class CategoryStats:
+    """Running moments and quantile estimate for one user's category"""
+
+    __slots__ = ('n', 'mean', 'm2', 'quantile')
+
+    def __init__(self, n=0, mean=0.0, m2=0.0, quantile=None):
+        self.n = int(n)
+        self.mean = float(mean)
+        self.m2 = float(m2)
+        self.quantile = float(quantile) if quantile is not None else None
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def add(self, amount):
+        self.n += 1
+        delta = amount - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (amount - self.mean)
+
+        if self.quantile is None:
+            self.quantile = amount
+        elif amount > self.quantile:
+            self.quantile += ANOMALY_QUANTILE_RATE * self.std * ANOMALY_QUANTILE
+        elif amount < self.quantile:
+            self.quantile -= ANOMALY_QUANTILE_RATE * self.std * (1 - ANOMALY_QUANTILE)
+
+    def remove(self, amount):
+        """Undo add(amount) for the moments; the quantile estimate is left as is"""
+        if self.n <= 1:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        mean = (self.n * self.mean - amount) / (self.n - 1)
+        self.m2 = max(self.m2 - (amount - mean) * (amount - self.mean), 0.0)
+        self.mean = mean
+        self.n -= 1
+
+    def score(self, amount):
+        """
+        z-score of amount against the statistics so far
+
+        Returns:
+            tuple: (z, is_anomalous)
+        """
+        std = self.std
+        if self.n < ANOMALY_MIN_COUNT or std == 0:
+            return 0.0, False
+        z = (amount - self.mean) / std
+        return z, z > ANOMALY_Z_THRESHOLD and amount > self.quantile
+
+
+def _load(cursor, user_id, categories, currency):
+    """
+    Returns:
+        tuple: ({category: CategoryStats}, True if any of them is in
+        another currency than `currency`)
+    """
+    placeholders = ', '.join(['%s'] * len(categories))
+    cursor.execute(
+        f"""SELECT category, n, mean, m2, quantile, currency FROM category_stats
+        WHERE user_id = %s AND category IN ({placeholders}) FOR UPDATE""",
+        (user_id, *categories)
+    )
+    stats = {}
+    stale = False
+    for row in cursor.fetchall():
+        if not isinstance(row, dict):
+            row = dict(zip(('category', 'n', 'mean', 'm2', 'quantile', 'currency'), row))
+        stats[row['category']] = CategoryStats(row['n'], row['mean'], row['m2'], row['quantile'])
+        # NULL: written by sp_add_transaction, which doesn't know the currency
+        stale |= row['currency'] is not None and row['currency'] != currency
+    return stats, stale
+
+
+def _save(cursor, user_id, stats, currency):
+    cursor.executemany(
+        """INSERT INTO category_stats (user_id, category, n, mean, m2, quantile, currency)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE n = VALUES(n), mean = VALUES(mean), m2 = VALUES(m2),
+            quantile = VALUES(quantile), currency = VALUES(currency)""",
+        [(user_id, category, s.n, s.mean, s.m2, s.quantile, currency) for category, s in stats.items()]
+    )
+
+
+def _replay(cursor, user_id, fx):
+    """Statistics of the user's hot and archived expenses, folded in date order"""
+    from archive import load_cold_rows
+
+    cursor.execute(
+        """SELECT category, amount, transaction_date, currency FROM transactions
+        WHERE user_id = %s AND type = 'expense'""",
+        (user_id,)
+    )
+    rows = cursor.fetchall()
+    rows += [row for row in load_cold_rows(cursor, user_id) if row['type'] == 'expense']
+    if fx is not None:
+        rows = convert_rows(fx, cursor, user_id, rows)
+    rows.sort(key=lambda row: str(row['transaction_date']))
+
+    stats = {}
+    for row in rows:
+        stats.setdefault(row['category'], CategoryStats()).add(float(row['amount']))
+    return stats, len(rows)
+
+
+def _replace(cursor, user_id, stats, currency):
+    cursor.execute("DELETE FROM category_stats WHERE user_id = %s", (user_id,))
+    if stats:
+        _save(cursor, user_id, stats, currency)
+
+
+def _notify(cursor, user_id, anomalies):
+    cursor.executemany(
+        """INSERT INTO notifications (user_id, title, message, type)
+        VALUES (%s, %s, %s, 'anomaly_alert')""",
+        [(user_id, 'Unusual Transaction',
+          f"{a['amount']:.2f} on {a['category']}{' at ' + a['merchant'] if a['merchant'] else ''} "
+          f"is well above your usual {a['category']} spending ({a['expected_range']})")
+         for a in anomalies]
+    )
+
+
+def score_transactions(cursor, user_id, rows, transaction_ids=None, notify=True, fx=None):
+    """
+    Score new transactions, fold them into the statistics and raise a
+    notification for each anomaly. Runs inside the inserting transaction.
+
+    Args:
+        cursor: Cursor on the user's shard
+        user_id: Owner of the rows
+        rows: Dicts with type, category, amount (in the user's currency)
+            and optionally merchant
+        transaction_ids: Ids of rows, reported with the anomalies
+        notify: False to update the statistics without scoring
+        fx: FxRates for a rebuild; required if the ledger has foreign rows
+
+    Returns:
+        list: Anomalies as dicts, in the shape of detect_anomalies
+    """
+    expenses = [(i, row) for i, row in enumerate(rows) if row.get('type') == 'expense' and row.get('category')]
+    if not expenses:
+        return []
+
+    currency = user_currency(cursor, user_id)
+    stats, stale = _load(cursor, user_id, sorted({row['category'] for _, row in expenses}), currency)
+    if stale:
+        # Built in the user's previous currency. The rebuild reads the
+        # ledger, which already holds these rows, so they go unscored.
+        _replace(cursor, user_id, _replay(cursor, user_id, fx)[0], currency)
+        return []
+    anomalies = []
+    for i, row in expenses:
+        amount = float(row['amount'])
+        category_stats = stats.setdefault(row['category'], CategoryStats())
+        z, anomalous = category_stats.score(amount)
+        if anomalous and notify:
+            mean, std = category_stats.mean, category_stats.std
+            anomalies.append({
+                "transaction_id": transaction_ids[i] if transaction_ids else None,
+                "date": str(row.get('transaction_date'))[:10],
+                "category": row['category'],
+                "merchant": row.get('merchant'),
+                "amount": amount,
+                "z_score": round(z, 2),
+                "expected_range": f"{round(max(mean - std, 0), 2)} - {round(mean + std, 2)}",
+                "severity": "high" if z > 3 else "medium"
+            })
+        category_stats.add(amount)
+
+    _save(cursor, user_id, stats, currency)
+    if anomalies:
+        _notify(cursor, user_id, anomalies)
+    return anomalies
+
+
+def forget_transaction(cursor, user_id, row):
+    """Take an updated or deleted transaction's old amount out of the statistics"""
+    if row.get('type') != 'expense' or not row.get('category'):
+        return
+    currency = user_currency(cursor, user_id)
+    stats, stale = _load(cursor, user_id, [row['category']], currency)
+    # Stale statistics are rebuilt by the next score_transactions
+    if row['category'] in stats and not stale:
+        stats[row['category']].remove(float(row['amount']))
+        _save(cursor, user_id, stats, currency)
+
+
+def rebuild_user(connection, user_id, fx=None):
+    """
+    Recompute user_id's statistics from the hot and archived expenses in date order
+
+    Args:
+        fx: FxRates for converting foreign-currency rows; required if there are any
+
+    Returns:
+        int: Number of expenses folded in
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        stats, count = _replay(cursor, user_id, fx)
+        _replace(cursor, user_id, stats, user_currency(cursor, user_id))
+        connection.commit()
+        return count
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    from app import fx_rates, shard_router
+
+    def users_on(shard):
+        connection = shard_router.connect(shard)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT DISTINCT user_id FROM transactions")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+
+    if len(sys.argv) in (2, 3) and sys.argv[1] == 'rebuild':
+        if len(sys.argv) == 3:
+            user_ids = [int(sys.argv[2])]
+        else:
+            user_ids = [u for ids in shard_router.fan_out(users_on).values() for u in ids]
+        for user_id in user_ids:
+            connection = shard_router.connect_user(user_id, for_write=True)
+            try:
+                print(f"user {user_id}: {rebuild_user(connection, user_id, fx_rates)} expenses")
+            finally:
+                connection.close()
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -1,23 +1,71 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
-import mysql.connector
 from mysql.connector import Error
 from datetime import datetime, timedelta
+from decimal import Decimal
 import numpy as np
-from sklearn.linear_model import LinearRegression
 import pandas as pd
 from predictions import FinancialPredictor
+from responses import FastJSONProvider, PayloadCache, compress_response, payload_response
+from export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, arrow_available, iter_chunks, parse_columns
+from forecasting import ForecastState, fit_forecast_state, month_index
+from backtest import BACKTEST_MIN_HISTORY, run_backtest, user_series
+from insights import SpendingAggregates
+from anomaly import forget_transaction, score_transactions
+from fx import FxRates, MissingRate, convert_rows, user_currency
+from health import HealthEngine, HealthIndexMissing
+from inbox import (INBOX_BULK_MAX, INBOX_MAX_PAGE, INBOX_MAX_WAIT, INBOX_PAGE_SIZE, INBOX_WAIT_TIMEOUT,
+                   NotificationHub, delete_notifications, inbox_version, list_notifications, mark_read,
+                   notifications_after, unread_count)
+from jobs import JobQueue, QueueFull
+from singleflight import SingleFlight
+from sharding import ShardMoving, ShardRouter
+from replication import CONSISTENCY_HEADER, INBOX_CONSISTENCY_HEADER, parse_token
+from archive import (WEEKDAYS, archived_locations, cold_monthly_totals, iter_cold_segments, load_archived_rows,
+                     load_cold_rows, load_cold_summaries, restore_month)
+from auth import HashPoolBusy, PasswordHasher
+from categorize import Categorizer, record_correction
+from modelstore import ModelStore, pack_frame, unpack_frame
+from search import (SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, SUGGEST_LIMIT, index_transaction,
+                    index_transactions, search_transaction_ids, suggest_merchants,
+                    unindex_transaction)
+from writebuffer import GroupCommitter
+from warmup import Warmer
 import os
+import time
+import zlib
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+app.after_request(compress_response)
 financial_predictor = FinancialPredictor()
+payload_cache = PayloadCache(
+    max_entries=int(os.environ.get('PAYLOAD_CACHE_SIZE', 256)),
+    ttl_seconds=int(os.environ.get('PAYLOAD_CACHE_TTL', 300))
+)
+# Monthly totals in each user's currency, keyed by ledger and FX table version
+monthly_totals_cache = PayloadCache(
+    max_entries=int(os.environ.get('MONTHLY_TOTALS_CACHE_SIZE', 1024)),
+    ttl_seconds=int(os.environ.get('MONTHLY_TOTALS_CACHE_TTL', 3600))
+)
+prediction_jobs = JobQueue()
+request_flights = SingleFlight()
+categorizer = Categorizer()
+model_store = ModelStore()
+warm_up = Warmer()
+password_hasher = PasswordHasher()
+GROUP_COMMIT = os.environ.get('GROUP_COMMIT', '0') == '1'
+CATEGORIZE_MAX_BATCH = int(os.environ.get('CATEGORIZE_MAX_BATCH', 100000))
+SINGLEFLIGHT_TIMEOUT = float(os.environ.get('SINGLEFLIGHT_TIMEOUT', 60))
+JOB_INLINE_WAIT = float(os.environ.get('JOB_INLINE_WAIT', 0))
+JOB_MAX_WAIT = float(os.environ.get('JOB_MAX_WAIT', 30))
+BUDGET_SCENARIOS_MAX = int(os.environ.get('BUDGET_SCENARIOS_MAX', 5000))
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY')
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 
-CORS(app)
+CORS(app, expose_headers=[CONSISTENCY_HEADER, INBOX_CONSISTENCY_HEADER])
 jwt = JWTManager(app)
 
 # Database configuration
@@ -29,41 +77,335 @@ DB_CONFIG = {
     'password': os.environ.get('DB_PASSWORD')
 }
 
-def get_db_connection():
+shard_router = ShardRouter.from_env(dict(DB_CONFIG, ssl_disabled=False))
+notification_hub = NotificationHub(shard_router)
+fx_rates = FxRates(shard_router)
+health_engine = HealthEngine()
+
+def get_db_connection(user_id=None, for_write=False, read_only=False, scope='ledger'):
+    """
+    Connection to the shard holding user_id's rows, or to the directory
+    database (users, user_shards) when no user is given. read_only
+    connections may be served by a replica that has caught up with the
+    client's consistency token: the ledger token, or the inbox token for
+    scope='inbox'.
+    """
+    min_version = None
+    if has_request_context():
+        if for_write:
+            g.written_user = user_id
+        if read_only:
+            header = INBOX_CONSISTENCY_HEADER if scope == 'inbox' else CONSISTENCY_HEADER
+            min_version = parse_token(request.headers.get(header))
+
     try:
-        connection = mysql.connector.connect(**DB_CONFIG,ssl_disabled=False)
-        return connection
+        if user_id is None:
+            return shard_router.connect_directory()
+        return shard_router.connect_user(int(user_id), for_write=for_write, read_only=read_only,
+                                         min_version=min_version, scope=scope)
     except Error as e:
         print(f"Error connecting to MySQL: {e}")
         return None
 
+@app.after_request
+def add_consistency_token(response):
+    """After a successful write, hand the client the ledger and inbox versions its reads must observe"""
+    user_id = g.pop('written_user', None)
+    if user_id is None or not 200 <= response.status_code < 300:
+        return response
+
+    connection = get_db_connection(user_id)
+    if connection:
+        cursor = connection.cursor(dictionary=True)
+        response.headers[CONSISTENCY_HEADER] = str(get_ledger_version(cursor, user_id))
+        # A ledger write can notify too (budget and anomaly alerts)
+        response.headers[INBOX_CONSISTENCY_HEADER] = str(inbox_version(cursor, user_id))
+        cursor.close()
+        connection.close()
+    return response
+
+def create_shard_user(user_id, email, name):
+    """Stub users row on the user's shard so its foreign keys hold"""
+    if shard_router.shard_for(user_id) == shard_router.directory:
+        return
+
+    connection = get_db_connection(user_id, for_write=True)
+    cursor = connection.cursor()
+    cursor.execute(
+        "INSERT INTO users (id, email, password_hash, name) VALUES (%s, %s, '!', %s)",
+        (user_id, email, name)
+    )
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+@app.errorhandler(ShardMoving)
+def handle_shard_moving(e):
+    return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+
+@app.errorhandler(TimeoutError)
+def handle_timeout(e):
+    # A coalesced request gave up waiting on the identical one in flight
+    return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+
+@app.errorhandler(HashPoolBusy)
+def handle_hash_pool_busy(e):
+    return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+
+@app.errorhandler(HealthIndexMissing)
+def handle_health_index_missing(e):
+    return jsonify({'error': str(e)}), 503, {'Retry-After': '60'}
+
+@app.errorhandler(MissingRate)
+def handle_missing_rate(e):
+    return jsonify({'error': str(e)}), 500
+
 def get_user_transactions_df(user_id):
-    connection = get_db_connection()
+    """
+    The user's hot and archived transactions in their currency, newest
+    first. Kept in the model store as memory-mapped columns until the
+    ledger, the user's currency or the FX table changes.
+    """
+    connection = get_db_connection(user_id, read_only=True)
     cursor = connection.cursor(dictionary=True)
+    try:
+        base = user_currency(cursor, user_id)
+        fx_rates.refresh()
+        version = f"{get_ledger_version(cursor, user_id)}-{base}-{zlib.crc32(repr(fx_rates.version).encode()):08x}"
+        packed = model_store.get_or_fit(
+            user_id, 'ledger', version, lambda: pack_frame(read_transactions_df(cursor, user_id, base))
+        )
+    finally:
+        cursor.close()
+        connection.close()
 
+    return unpack_frame(packed)
+
+def read_transactions_df(cursor, user_id, base):
     cursor.execute("""
         SELECT
             transaction_date AS date,
             amount,
             type,
             category,
-            merchant
+            merchant,
+            currency
         FROM transactions
         WHERE user_id = %s
         ORDER BY transaction_date DESC
     """, (user_id,))
 
     rows = cursor.fetchall()
-    cursor.close()
-    connection.close()
+    cold = load_cold_rows(cursor, user_id)
 
     df = pd.DataFrame(rows)
+    if cold:
+        cold_df = pd.DataFrame(cold, columns=['transaction_date', 'amount', 'type', 'category', 'merchant', 'currency'])
+        df = pd.concat([df, cold_df.rename(columns={'transaction_date': 'date'})], ignore_index=True)
+        df = df.sort_values('date', ascending=False, kind='stable', ignore_index=True)
 
     if not df.empty:
+        # Every prediction works in the user's currency
+        if df['currency'].notna().any():
+            df['amount'] = fx_rates.convert(df['amount'], df['currency'], df['date'], base)
         df["amount"] = df["amount"].astype(float)
 
     return df
 
+def get_ledger_version(cursor, user_id):
+    # Bumped by triggers on every write to the user's transactions, budgets and goals
+    cursor.execute("SELECT version FROM ledger_versions WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    return row['version'] if isinstance(row, dict) else row[0]
+
+def coalesce(user_id, endpoint, params, fn):
+    """
+    Run fn() once for identical concurrent requests. The key includes the
+    ledger version, so a request arriving after a write never gets a
+    result computed before it.
+    """
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return fn()
+
+    try:
+        cursor = connection.cursor(dictionary=True)
+        version = get_ledger_version(cursor, user_id)
+    finally:
+        cursor.close()
+        connection.close()
+
+    key = (int(user_id), endpoint, params, version)
+    return request_flights.do(key, fn, timeout=SINGLEFLIGHT_TIMEOUT)
+
+def claim_warm(key):
+    """Count a request served from a cache key for the login warm-up metrics"""
+    if has_request_context():
+        warm_up.claim(key)
+
+def monthly_totals_key(cursor, user_id):
+    fx_rates.refresh()
+    base = user_currency(cursor, user_id)
+    return (int(user_id), 'monthly-totals', get_ledger_version(cursor, user_id), base, fx_rates.version), base
+
+def get_monthly_totals(cursor, user_id):
+    """
+    (month, type, category, total, count) rows for the user's hot and
+    archived transactions, in the user's currency
+
+    Rows in the user's currency are summed by the database. Foreign rows
+    are summed per day and currency, converted at that day's rate in one
+    vectorized pass, then rolled up to months. The result is cached until
+    the ledger or the FX table changes.
+    """
+    key, base = monthly_totals_key(cursor, user_id)
+    claim_warm(key)
+    cached = monthly_totals_cache.get(key)
+    if cached is not None:
+        return cached
+
+    cursor.execute("""
+        SELECT `year_month` AS month, type, category,
+            SUM(amount) AS total, COUNT(*) AS count
+        FROM transactions
+        WHERE user_id = %s AND (currency IS NULL OR currency = %s)
+        GROUP BY `year_month`, type, category
+    """, (user_id, base))
+    rows = cursor.fetchall() + cold_monthly_totals(cursor, user_id, fx_rates)
+
+    cursor.execute("""
+        SELECT transaction_date, type, category, currency, SUM(amount) AS total, COUNT(*) AS count
+        FROM transactions
+        WHERE user_id = %s AND currency <> %s
+        GROUP BY transaction_date, type, category, currency
+    """, (user_id, base))
+    foreign = pd.DataFrame(cursor.fetchall(),
+                           columns=['transaction_date', 'type', 'category', 'currency', 'total', 'count'])
+    if not foreign.empty:
+        foreign['total'] = fx_rates.convert(foreign['total'], foreign['currency'], foreign['transaction_date'], base)
+        foreign['month'] = [str(d)[:7] for d in foreign['transaction_date']]
+        for row in foreign.groupby(['month', 'type', 'category'], as_index=False)[['total', 'count']].sum().itertuples():
+            rows.append({'month': row.month, 'type': row.type, 'category': row.category,
+                         'total': Decimal(f"{row.total:.2f}"), 'count': int(row.count)})
+
+    totals = {}
+    for row in rows:
+        group = (row['month'], row['type'], row['category'])
+        total, count = totals.get(group, (Decimal(0), 0))
+        totals[group] = (total + Decimal(row['total']), count + int(row['count']))
+    result = [
+        {'month': month, 'type': t, 'category': c, 'total': total, 'count': count}
+        for (month, t, c), (total, count) in sorted(totals.items())
+    ]
+    monthly_totals_cache.put(key, result)
+    return result
+
+def load_forecast_state(cursor, user_id):
+    """Return the user's persisted forecast state, refitting it only when the ledger or the user's currency moved"""
+    today = datetime.now()
+    version = get_ledger_version(cursor, user_id)
+    base = user_currency(cursor, user_id)
+
+    cursor.execute("SELECT state FROM forecast_states WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    state = ForecastState.from_json(row['state']) if row else None
+
+    if state is None or state.ledger_version != version or state.currency != base:
+        state = fit_forecast_state(get_monthly_totals(cursor, user_id), today.year, today.month, version, base)
+    elif not state.advance_to(today.year, today.month):
+        return state
+
+    save_forecast_state(cursor, user_id, state)
+    return state
+
+def save_forecast_state(cursor, user_id, state):
+    cursor.execute("""
+        INSERT INTO forecast_states (user_id, state, ledger_version)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE state = VALUES(state), ledger_version = VALUES(ledger_version)
+    """, (user_id, state.to_json(), state.ledger_version))
+
+def observe_forecast_transactions(cursor, user_id, rows):
+    """
+    Fold just-inserted transactions into the forecast state in O(1) each.
+    Must run in the inserting transaction, after the INSERT bumped the ledger version.
+    """
+    cursor.execute("SELECT state FROM forecast_states WHERE user_id = %s FOR UPDATE", (user_id,))
+    row = cursor.fetchone()
+    if not row:
+        return
+
+    state = ForecastState.from_json(row['state'])
+    version = get_ledger_version(cursor, user_id)
+    # Any other write since the state was saved, or a new currency, means it needs a refit anyway
+    if version != state.ledger_version + len(rows) or state.currency != user_currency(cursor, user_id):
+        return
+
+    for data in rows:
+        tx_date = datetime.strptime(str(data['transaction_date'])[:10], '%Y-%m-%d')
+        if not state.observe_transaction(data['type'], data['category'], tx_date.year,
+                                         tx_date.month, float(data['amount'])):
+            return
+    state.ledger_version = version
+    save_forecast_state(cursor, user_id, state)
+
+def load_insight_state(cursor, user_id):
+    """Return the user's spending aggregates, rebuilding them only when the ledger or the user's currency moved"""
+    version = get_ledger_version(cursor, user_id)
+    base = user_currency(cursor, user_id)
+
+    cursor.execute("SELECT state FROM insight_states WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    state = SpendingAggregates.from_json(row['state']) if row else None
+    if state is not None and state.ledger_version == version and state.currency == base:
+        return state
+
+    cursor.execute("""
+        SELECT transaction_date AS date, amount, type, category, currency
+        FROM transactions
+        WHERE user_id = %s AND type = 'expense'
+    """, (user_id,))
+    rows = cursor.fetchall()
+    rows += [
+        {'date': row['transaction_date'], 'amount': row['amount'], 'type': row['type'],
+         'category': row['category'], 'currency': row['currency']}
+        for row in load_cold_rows(cursor, user_id)
+    ]
+    rows = convert_rows(fx_rates, cursor, user_id, rows, date_key='date')
+    state = SpendingAggregates.from_frame(pd.DataFrame(rows, columns=['date', 'amount', 'type', 'category']),
+                                          version, base)
+    save_insight_state(cursor, user_id, state)
+    return state
+
+def save_insight_state(cursor, user_id, state):
+    cursor.execute("""
+        INSERT INTO insight_states (user_id, state, ledger_version)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE state = VALUES(state), ledger_version = VALUES(ledger_version)
+    """, (user_id, state.to_json(), state.ledger_version))
+
+def observe_insight_transactions(cursor, user_id, rows):
+    """
+    Fold just-inserted transactions into the spending aggregates in O(1) each.
+    Must run in the inserting transaction, after the INSERT bumped the ledger version.
+    """
+    cursor.execute("SELECT state FROM insight_states WHERE user_id = %s FOR UPDATE", (user_id,))
+    row = cursor.fetchone()
+    if not row:
+        return
+
+    state = SpendingAggregates.from_json(row['state'])
+    version = get_ledger_version(cursor, user_id)
+    if version != state.ledger_version + len(rows) or state.currency != user_currency(cursor, user_id):
+        return
+
+    for data in rows:
+        state.observe(data['type'], data['category'], str(data['transaction_date'])[:10], data['amount'])
+    state.ledger_version = version
+    save_insight_state(cursor, user_id, state)
+
 # ==================== Authentication Routes ====================
 
 @app.route('/api/auth/register', methods=['POST'])
@@ -89,13 +431,14 @@ def register():
             return jsonify({'error': 'User already exists'}), 409
         
         # Create user
-        hashed_password = generate_password_hash(password)
+        hashed_password = password_hasher.hash(password)
         cursor.execute(
             "INSERT INTO users (email, password_hash, name) VALUES (%s, %s, %s)",
             (email, hashed_password, name)
         )
         connection.commit()
         user_id = cursor.lastrowid
+        create_shard_user(user_id, email, name)
         
         access_token = create_access_token(identity=str(user_id))
         return jsonify({
@@ -110,6 +453,19 @@ def register():
         cursor.close()
         connection.close()
 
+def save_password_hash(user_id, password_hash):
+    """Store a re-hashed password; runs on the hashing pool after the login response"""
+    connection = get_db_connection()
+    if not connection:
+        return
+    try:
+        cursor = connection.cursor()
+        cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hash, user_id))
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -131,10 +487,15 @@ def login():
         )
         user = cursor.fetchone()
         
-        if not user or not check_password_hash(user['password_hash'], password):
+        if not password_hasher.verify(user['password_hash'] if user else None, password) or not user:
             return jsonify({'error': 'Invalid credentials'}), 401
+
+        if password_hasher.needs_rehash(user['password_hash']):
+            password_hasher.rehash_later(password, lambda new_hash: save_password_hash(user['id'], new_hash))
         
         access_token = create_access_token(identity=str(user['id']))
+        # The dashboard loads right after login; have its caches ready
+        warm_up.schedule(user['id'], warm_user)
         return jsonify({
             'access_token': access_token,
             'user': {'id': user['id'], 'email': user['email'], 'name': user['name']}
@@ -148,6 +509,45 @@ def login():
 
 # ==================== Transaction Routes ====================
 
+def transactions_payload(cursor, user_id, start_date=None, end_date=None):
+    """
+    The encoded transaction list, cached until the ledger changes
+
+    Returns:
+        tuple: (cache key, EncodedPayload)
+    """
+    query = "SELECT * FROM transactions WHERE user_id = %s"
+    params = [user_id]
+    
+    if start_date:
+        query += " AND transaction_date >= %s"
+        params.append(start_date)
+    if end_date:
+        query += " AND transaction_date <= %s"
+        params.append(end_date)
+    
+    query += " ORDER BY transaction_date DESC"
+
+    def load_transactions():
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        cold = load_cold_rows(cursor, user_id, start_date, end_date)
+        if not cold:
+            return rows
+        rows.extend(cold)
+        rows.sort(key=lambda r: r['transaction_date'], reverse=True)
+        return rows
+
+    cache_key = (user_id, 'transactions', start_date, end_date,
+                 get_ledger_version(cursor, user_id))
+    # Concurrent cache misses share one query and one encode
+    payload = request_flights.do(
+        cache_key,
+        lambda: payload_cache.get_or_build(cache_key, load_transactions),
+        timeout=SINGLEFLIGHT_TIMEOUT
+    )
+    return cache_key, payload
+
 @app.route('/api/transactions', methods=['GET'])
 @jwt_required()
 def get_transactions():
@@ -157,27 +557,15 @@ def get_transactions():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, read_only=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
     try:
         cursor = connection.cursor(dictionary=True)
-        query = "SELECT * FROM transactions WHERE user_id = %s"
-        params = [user_id]
-        
-        if start_date:
-            query += " AND transaction_date >= %s"
-            params.append(start_date)
-        if end_date:
-            query += " AND transaction_date <= %s"
-            params.append(end_date)
-        
-        query += " ORDER BY transaction_date DESC"
-        cursor.execute(query, params)
-        transactions = cursor.fetchall()
-        
-        return jsonify(transactions), 200
+        cache_key, payload = transactions_payload(cursor, user_id, start_date, end_date)
+        claim_warm(cache_key)
+        return payload_response(payload), 200
         
     except Error as e:
         return jsonify({'error': str(e)}), 500
@@ -185,34 +573,283 @@ def get_transactions():
         cursor.close()
         connection.close()
 
+@app.route('/api/transactions/search', methods=['GET'])
+@jwt_required()
+def search_transactions():
+    user_id = int(get_jwt_identity())
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), SEARCH_MAX_LIMIT)
+
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        cursor = connection.cursor(dictionary=True)
+        ids = search_transaction_ids(cursor, user_id, query, limit)
+        if not ids:
+            return jsonify({'query': query, 'results': []}), 200
+
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(
+            f"SELECT * FROM transactions WHERE user_id = %s AND id IN ({placeholders})",
+            (user_id, *ids)
+        )
+        found = {row['id']: row for row in cursor.fetchall()}
+
+        # Ids missing from the hot table belong to archived months; decode only those
+        if len(found) < len(ids):
+            found.update(load_archived_rows(cursor, user_id, [i for i in ids if i not in found]))
+
+        return jsonify({
+            'query': query,
+            'results': [found[i] for i in ids if i in found]
+        }), 200
+
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+@app.route('/api/merchants/suggest', methods=['GET'])
+@jwt_required()
+def merchant_suggestions():
+    user_id = int(get_jwt_identity())
+    prefix = request.args.get('prefix', '')
+    limit = min(request.args.get('limit', SUGGEST_LIMIT, type=int), SEARCH_MAX_LIMIT)
+
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        cursor = connection.cursor(dictionary=True)
+        return jsonify(suggest_merchants(cursor, user_id, prefix, limit)), 200
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+@app.route('/api/transactions/categorize', methods=['POST'])
+@jwt_required()
+def categorize_transactions():
+    user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    items = data.get('transactions')
+
+    if not isinstance(items, list):
+        return jsonify({'error': 'transactions must be a list'}), 400
+    if len(items) > CATEGORIZE_MAX_BATCH:
+        return jsonify({'error': f'At most {CATEGORIZE_MAX_BATCH} transactions per request'}), 413
+
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        cursor = connection.cursor(dictionary=True)
+        return jsonify({'suggestions': categorizer.categorize(cursor, user_id, items)}), 200
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+@app.route('/api/transactions/export', methods=['GET'])
+@jwt_required()
+def export_transactions():
+    user_id = int(get_jwt_identity())
+    export_format = request.args.get('format', 'csv')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format, use one of {', '.join(EXPORT_FORMATS)}"}), 400
+    mimetype, extension, encoder, needs_arrow = EXPORT_FORMATS[export_format]
+    if needs_arrow and not arrow_available():
+        return jsonify({'error': f"{export_format} export requires pyarrow"}), 501
+
+    try:
+        columns = parse_columns(request.args.get('columns'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    # Column names come from the EXPORT_COLUMNS whitelist
+    query = f"SELECT {', '.join(columns)} FROM transactions WHERE user_id = %s"
+    params = [user_id]
+    if start_date:
+        query += " AND transaction_date >= %s"
+        params.append(start_date)
+    if end_date:
+        query += " AND transaction_date <= %s"
+        params.append(end_date)
+    query += " ORDER BY transaction_date, id"
+
+    def chunks():
+        # Archived months come first, one decoded segment's rows at a time
+        archive_cursor = connection.cursor(dictionary=True)
+        try:
+            for rows in iter_cold_segments(archive_cursor, user_id, start_date, end_date):
+                for i in range(0, len(rows), EXPORT_CHUNK_SIZE):
+                    yield [tuple(row[c] for c in columns) for row in rows[i:i + EXPORT_CHUNK_SIZE]]
+        finally:
+            archive_cursor.close()
+
+        # Unbuffered cursor: rows are pulled from the server one chunk at a time
+        cursor = connection.cursor(buffered=False)
+        try:
+            cursor.execute(query, params)
+            yield from iter_chunks(cursor)
+        finally:
+            cursor.close()
+
+    def generate():
+        try:
+            yield from encoder(chunks(), columns)
+        finally:
+            connection.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=transactions.{extension}'}
+    )
+
+def normalize_currency(data):
+    """Upper-case data['currency']; returns an error for a currency without FX rates"""
+    currency = (data.get('currency') or '').strip().upper() or None
+    data['currency'] = currency
+    if currency and not fx_rates.supports(currency):
+        return f"No FX rates loaded for {currency}"
+    return None
+
+def suggest_category(connection, user_id, data):
+    """Fill in a missing category from the user's history; returns where it came from"""
+    if data.get('category'):
+        return 'user'
+    cursor = connection.cursor(dictionary=True)
+    try:
+        suggestion = categorizer.categorize(cursor, int(user_id), [data])[0]
+    finally:
+        cursor.close()
+    data['category'] = suggestion['category'] or 'Other'
+    return suggestion['source'] or 'default'
+
+_auto_increment_steps = {}
+
+def auto_increment_step(cursor, shard):
+    # Ids of one multi-row INSERT are consecutive, auto_increment_increment apart
+    if shard not in _auto_increment_steps:
+        cursor.execute("SELECT @@auto_increment_increment")
+        _auto_increment_steps[shard] = int(cursor.fetchone()[0])
+    return _auto_increment_steps[shard]
+
+def flush_transaction_batch(shard, items):
+    """
+    Insert transactions from concurrent requests with one multi-row INSERT
+    and one commit. items are (user_id, data) pairs; returns their new ids.
+    """
+    connection = shard_router.connect(shard)
+    try:
+        cursor = connection.cursor()
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(items))
+        cursor.execute(
+            f"""INSERT INTO transactions
+            (user_id, type, category, amount, transaction_date, description, merchant, currency)
+            VALUES {placeholders}""",
+            [value for user_id, data in items for value in (
+                user_id, data['type'], data['category'], data['amount'],
+                data['transaction_date'], data.get('description'), data.get('merchant'), data.get('currency'))]
+        )
+        step = auto_increment_step(cursor, shard)
+        ids = [cursor.lastrowid + i * step for i in range(len(items))]
+
+        index_transactions(cursor, [
+            (user_id, transaction_id, data.get('merchant'), data.get('description'), data['category'])
+            for (user_id, data), transaction_id in zip(items, ids)
+        ])
+
+        by_user = {}
+        for (user_id, data), transaction_id in zip(items, ids):
+            by_user.setdefault(user_id, []).append((data, transaction_id))
+        forecast_cursor = connection.cursor(dictionary=True)
+        # Sorted so concurrent batches take the forecast row locks in the same order
+        for user_id in sorted(by_user):
+            rows = convert_rows(fx_rates, forecast_cursor, user_id, [data for data, _ in by_user[user_id]])
+            observe_forecast_transactions(forecast_cursor, user_id, rows)
+            observe_insight_transactions(forecast_cursor, user_id, rows)
+            score_transactions(forecast_cursor, user_id, rows, [i for _, i in by_user[user_id]], fx=fx_rates)
+        forecast_cursor.close()
+
+        connection.commit()
+        cursor.close()
+        return ids
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+transaction_writes = GroupCommitter(flush_transaction_batch) if GROUP_COMMIT else None
+
 @app.route('/api/transactions', methods=['POST'])
 @jwt_required()
 def create_transaction():
     user_id = get_jwt_identity()
     data = request.get_json()
     
-    required_fields = ['type', 'category', 'amount', 'transaction_date']
+    required_fields = ['type', 'amount', 'transaction_date']
     if not all(field in data for field in required_fields):
         return jsonify({'error': 'Missing required fields'}), 400
+
+    currency_error = normalize_currency(data)
+    if currency_error:
+        return jsonify({'error': currency_error}), 400
+
+    if transaction_writes is not None:
+        return create_transaction_grouped(int(user_id), data)
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, for_write=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
     try:
         cursor = connection.cursor()
+
+        # Category is optional; fill it in from the user's history
+        category_source = suggest_category(connection, user_id, data)
+
         cursor.execute(
             """INSERT INTO transactions 
-            (user_id, type, category, amount, transaction_date, description, merchant)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+            (user_id, type, category, amount, transaction_date, description, merchant, currency)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
             (user_id, data['type'], data['category'], data['amount'],
-             data['transaction_date'], data.get('description'), data.get('merchant'))
+             data['transaction_date'], data.get('description'), data.get('merchant'), data['currency'])
         )
+        transaction_id = cursor.lastrowid
+        index_transaction(cursor, user_id, transaction_id, data.get('merchant'),
+                          data.get('description'), data['category'])
+
+        forecast_cursor = connection.cursor(dictionary=True)
+        # Running statistics are kept in the user's currency
+        rows = convert_rows(fx_rates, forecast_cursor, user_id, [data])
+        observe_forecast_transactions(forecast_cursor, user_id, rows)
+        observe_insight_transactions(forecast_cursor, user_id, rows)
+        score_transactions(forecast_cursor, user_id, rows, [transaction_id], fx=fx_rates)
+        forecast_cursor.close()
         connection.commit()
         
         return jsonify({
             'message': 'Transaction created',
-            'id': cursor.lastrowid
+            'id': transaction_id,
+            'category': data['category'],
+            'category_source': category_source
         }), 201
         
     except Error as e:
@@ -221,36 +858,90 @@ def create_transaction():
         cursor.close()
         connection.close()
 
+def create_transaction_grouped(user_id, data):
+    """create_transaction through the group-commit buffer (GROUP_COMMIT=1)"""
+    shard = shard_router.writable_shard(user_id)
+    g.written_user = user_id
+
+    category_source = 'user'
+    if not data.get('category'):
+        connection = get_db_connection(user_id, read_only=True)
+        if not connection:
+            return jsonify({'error': 'Database connection failed'}), 500
+        try:
+            category_source = suggest_category(connection, user_id, data)
+        finally:
+            connection.close()
+
+    try:
+        transaction_id = transaction_writes.submit(shard, (user_id, data))
+    except (Error, TimeoutError) as e:
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({
+        'message': 'Transaction created',
+        'id': transaction_id,
+        'category': data['category'],
+        'category_source': category_source
+    }), 201
+
+def fetch_for_write(connection, cursor, user_id, transaction_id):
+    """
+    The row an edit or delete applies to. Archived rows are read-only, so
+    the month holding an archived id is restored into the hot table first.
+    """
+    query = """SELECT merchant, description, type, category, amount, transaction_date, currency
+        FROM transactions WHERE id = %s AND user_id = %s"""
+    cursor.execute(query, (transaction_id, user_id))
+    existing = cursor.fetchone()
+    if existing:
+        return existing
+
+    period = archived_locations(cursor, user_id, [transaction_id]).get(transaction_id)
+    if period is None:
+        return None
+    restore_month(connection, user_id, period)
+    cursor.execute(query, (transaction_id, user_id))
+    return cursor.fetchone()
+
 @app.route('/api/transactions/<int:transaction_id>', methods=['PUT'])
 @jwt_required()
 def update_transaction(transaction_id):
     user_id = get_jwt_identity()
     data = request.get_json()
+
+    currency_error = normalize_currency(data)
+    if currency_error:
+        return jsonify({'error': currency_error}), 400
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, for_write=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
     try:
-        cursor = connection.cursor()
+        cursor = connection.cursor(dictionary=True)
         
         # Verify ownership
-        cursor.execute(
-            "SELECT id FROM transactions WHERE id = %s AND user_id = %s",
-            (transaction_id, user_id)
-        )
-        if not cursor.fetchone():
+        existing = fetch_for_write(connection, cursor, user_id, transaction_id)
+        if not existing:
             return jsonify({'error': 'Transaction not found'}), 404
         
         cursor.execute(
             """UPDATE transactions SET 
             type = %s, category = %s, amount = %s, 
-            transaction_date = %s, description = %s, merchant = %s
+            transaction_date = %s, description = %s, merchant = %s, currency = %s
             WHERE id = %s AND user_id = %s""",
             (data.get('type'), data.get('category'), data.get('amount'),
              data.get('transaction_date'), data.get('description'),
-             data.get('merchant'), transaction_id, user_id)
+             data.get('merchant'), data['currency'], transaction_id, user_id)
         )
+        unindex_transaction(cursor, user_id, transaction_id, existing['merchant'])
+        index_transaction(cursor, user_id, transaction_id, data.get('merchant'),
+                          data.get('description'), data.get('category'))
+        record_correction(cursor, user_id, transaction_id, existing, data)
+        old, new = convert_rows(fx_rates, cursor, user_id, [existing, data])
+        forget_transaction(cursor, user_id, old)
+        score_transactions(cursor, user_id, [new], notify=False, fx=fx_rates)
         connection.commit()
         
         return jsonify({'message': 'Transaction updated'}), 200
@@ -266,21 +957,25 @@ def update_transaction(transaction_id):
 def delete_transaction(transaction_id):
     user_id = get_jwt_identity()
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, for_write=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
     try:
-        cursor = connection.cursor()
+        cursor = connection.cursor(dictionary=True)
+        existing = fetch_for_write(connection, cursor, user_id, transaction_id)
+        if not existing:
+            return jsonify({'error': 'Transaction not found'}), 404
+
         cursor.execute(
             "DELETE FROM transactions WHERE id = %s AND user_id = %s",
             (transaction_id, user_id)
         )
+        unindex_transaction(cursor, user_id, transaction_id, existing['merchant'])
+        record_correction(cursor, user_id, transaction_id, existing)
+        forget_transaction(cursor, user_id, convert_rows(fx_rates, cursor, user_id, [existing])[0])
         connection.commit()
         
-        if cursor.rowcount == 0:
-            return jsonify({'error': 'Transaction not found'}), 404
-        
         return jsonify({'message': 'Transaction deleted'}), 200
         
     except Error as e:
@@ -296,25 +991,23 @@ def delete_transaction(transaction_id):
 def get_budgets():
     user_id = get_jwt_identity()
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, read_only=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
     try:
         cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            """SELECT b.*, 
-            COALESCE(SUM(CASE WHEN t.type = 'expense' THEN t.amount ELSE 0 END), 0) as spent
-            FROM budgets b
-            LEFT JOIN transactions t ON t.user_id = b.user_id 
-            AND t.category = b.category
-            AND MONTH(t.transaction_date) = MONTH(CURRENT_DATE())
-            AND YEAR(t.transaction_date) = YEAR(CURRENT_DATE())
-            WHERE b.user_id = %s
-            GROUP BY b.id""",
-            (user_id,)
-        )
+        cursor.execute("SELECT * FROM budgets WHERE user_id = %s ORDER BY id", (user_id,))
         budgets = cursor.fetchall()
+
+        # Spending in the user's currency, whatever currency each expense was in
+        month = datetime.now().strftime('%Y-%m')
+        spent = {
+            row['category']: row['total'] for row in get_monthly_totals(cursor, user_id)
+            if row['month'] == month and row['type'] == 'expense'
+        }
+        for budget in budgets:
+            budget['spent'] = spent.get(budget['category'], Decimal(0))
         
         return jsonify(budgets), 200
         
@@ -333,7 +1026,7 @@ def create_budget():
     if not data.get('category') or not data.get('limit_amount'):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, for_write=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
@@ -365,7 +1058,7 @@ def update_budget(budget_id):
     if not data.get('category') or not data.get('limit_amount'):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, for_write=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
@@ -395,7 +1088,7 @@ def update_budget(budget_id):
 def delete_budget(budget_id):
     user_id = get_jwt_identity()
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, for_write=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
@@ -425,7 +1118,7 @@ def delete_budget(budget_id):
 def get_goals():
     user_id = get_jwt_identity()
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, read_only=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
@@ -455,7 +1148,7 @@ def create_goal():
     if not all(field in data for field in required_fields):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, for_write=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
@@ -505,7 +1198,7 @@ def update_goal(goal_id):
     if not all(field in data for field in required_fields):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, for_write=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
@@ -537,7 +1230,7 @@ def update_goal(goal_id):
 def delete_goal(goal_id):
     user_id = get_jwt_identity()
     
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, for_write=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
@@ -562,147 +1255,279 @@ def delete_goal(goal_id):
         cursor.close()
         connection.close()
 
-# ==================== Analytics & Predictions ====================
+# ==================== Notification Routes ====================
 
-@app.route('/api/analytics/dashboard', methods=['GET'])
+@app.route('/api/notifications', methods=['GET'])
 @jwt_required()
-def get_dashboard_analytics():
-    user_id = get_jwt_identity()
-    
-    connection = get_db_connection()
+def get_notifications():
+    user_id = int(get_jwt_identity())
+    before = request.args.get('before', type=int)
+    limit = min(max(request.args.get('limit', INBOX_PAGE_SIZE, type=int), 1), INBOX_MAX_PAGE)
+    unread_only = request.args.get('unread') in ('1', 'true')
+
+    connection = get_db_connection(user_id, read_only=True, scope='inbox')
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
-    
+
     try:
         cursor = connection.cursor(dictionary=True)
-        
-        # Current month statistics
-        cursor.execute(
-            """SELECT 
-            SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as total_income,
-            SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as total_expenses,
-            COUNT(*) as transaction_count
-            FROM transactions 
-            WHERE user_id = %s 
-            AND MONTH(transaction_date) = MONTH(CURRENT_DATE())
-            AND YEAR(transaction_date) = YEAR(CURRENT_DATE())""",
-            (user_id,)
-        )
-        monthly_stats = cursor.fetchone()
-        
-        # Category breakdown
-        cursor.execute(
-            """SELECT category, SUM(amount) as total
-            FROM transactions
-            WHERE user_id = %s 
-            AND type = 'expense'
-            AND MONTH(transaction_date) = MONTH(CURRENT_DATE())
-            AND YEAR(transaction_date) = YEAR(CURRENT_DATE())
-            GROUP BY category
-            ORDER BY total DESC""",
-            (user_id,)
-        )
-        category_breakdown = cursor.fetchall()
-        
+        notifications, next_cursor = list_notifications(cursor, user_id, before, limit, unread_only)
+        unread, latest_id = unread_count(cursor, user_id)
+
         return jsonify({
-            'monthly_stats': monthly_stats,
-            'category_breakdown': category_breakdown
+            'notifications': notifications,
+            'next_cursor': next_cursor,
+            'unread': unread,
+            'latest_id': latest_id
         }), 200
-        
+
     except Error as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
         connection.close()
 
-@app.route('/api/predictions/cashflow', methods=['GET'])
+@app.route('/api/notifications/unread-count', methods=['GET'])
 @jwt_required()
-def predict_cashflow():
-    user_id = get_jwt_identity()
-    
-    connection = get_db_connection()
+def get_unread_count():
+    user_id = int(get_jwt_identity())
+
+    connection = get_db_connection(user_id, read_only=True, scope='inbox')
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
-    
+
     try:
         cursor = connection.cursor(dictionary=True)
-        
-        # Get last 6 months of data
-        cursor.execute(
-            """SELECT 
-            DATE_FORMAT(transaction_date, '%Y-%m') as month,
-            SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as income,
-            SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as expenses
-            FROM transactions
-            WHERE user_id = %s
-            AND transaction_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 6 MONTH)
-            GROUP BY DATE_FORMAT(transaction_date, '%Y-%m')
-            ORDER BY month ASC""",
-            (user_id,)
-        )
-        historical_data = cursor.fetchall()
-        
-        if len(historical_data) < 2:
-            return jsonify({'error': 'Insufficient data for prediction'}), 400
-        
-        # Simple linear regression for prediction
-        df = pd.DataFrame(historical_data)
-        df['month_num'] = range(len(df))
-        
-        # Predict expenses
-        X = df[['month_num']].values
-        y_expenses = df['expenses'].values
-        
-        model = LinearRegression()
-        model.fit(X, y_expenses)
-        
-        next_month = len(df)
-        predicted_expenses = model.predict([[next_month]])[0]
-        
-        # Average income for prediction
-        avg_income = df['income'].mean()
-        
-        predicted_balance = avg_income - predicted_expenses
-        
-        return jsonify({
-            'predicted_expenses': round(predicted_expenses, 2),
-            'predicted_income': round(avg_income, 2),
-            'predicted_balance': round(predicted_balance, 2),
-            'confidence': 'medium',
-            'historical_data': historical_data
-        }), 200
-        
+        unread, latest_id = unread_count(cursor, user_id)
+        return jsonify({'unread': unread, 'latest_id': latest_id}), 200
+
     except Error as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
         connection.close()
 
-@app.route('/api/insights/spending-patterns', methods=['GET'])
+def notification_selection(data):
+    """Validate a bulk request body: {"ids": [...]} or {"up_to": id}"""
+    ids = data.get('ids')
+    up_to = data.get('up_to')
+    if ids is not None:
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            return None, None, 'ids must be a non-empty list of notification ids'
+        if len(ids) > INBOX_BULK_MAX:
+            return None, None, f'At most {INBOX_BULK_MAX} ids per request'
+        return ids, None, None
+    if isinstance(up_to, int):
+        return None, up_to, None
+    return None, None, 'Pass ids or up_to'
+
+@app.route('/api/notifications/read', methods=['POST'])
 @jwt_required()
-def get_spending_patterns():
-    user_id = get_jwt_identity()
-    
-    connection = get_db_connection()
+def mark_notifications_read():
+    user_id = int(get_jwt_identity())
+    ids, up_to, error = notification_selection(request.get_json() or {})
+    if error:
+        return jsonify({'error': error}), 400
+
+    connection = get_db_connection(user_id, for_write=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
-    
+
+    try:
+        cursor = connection.cursor(dictionary=True)
+        marked = mark_read(cursor, user_id, ids, up_to)
+        connection.commit()
+        unread, latest_id = unread_count(cursor, user_id)
+        return jsonify({'marked': marked, 'unread': unread, 'latest_id': latest_id}), 200
+
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+@app.route('/api/notifications', methods=['DELETE'])
+@jwt_required()
+def delete_notifications_bulk():
+    user_id = int(get_jwt_identity())
+    ids, up_to, error = notification_selection(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({'error': error}), 400
+
+    connection = get_db_connection(user_id, for_write=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        cursor = connection.cursor(dictionary=True)
+        deleted = delete_notifications(cursor, user_id, ids, up_to)
+        connection.commit()
+        unread, latest_id = unread_count(cursor, user_id)
+        return jsonify({'deleted': deleted, 'unread': unread, 'latest_id': latest_id}), 200
+
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+@app.route('/api/notifications/wait', methods=['GET'])
+@jwt_required()
+def wait_for_notifications():
+    """Long poll: return notifications newer than `after` as soon as one exists"""
+    user_id = int(get_jwt_identity())
+    after = request.args.get('after', 0, type=int)
+    timeout = min(max(request.args.get('timeout', INBOX_WAIT_TIMEOUT, type=float), 0), INBOX_MAX_WAIT)
+
+    def check():
+        # Primary, not a replica: the hub saw the new id there
+        connection = get_db_connection(user_id)
+        if not connection:
+            raise Error('Database connection failed')
+        try:
+            cursor = connection.cursor(dictionary=True)
+            unread, latest_id = unread_count(cursor, user_id)
+            notifications = notifications_after(cursor, user_id, after) if latest_id > after else []
+            return {'notifications': notifications, 'unread': unread, 'latest_id': latest_id}
+        finally:
+            cursor.close()
+            connection.close()
+
+    try:
+        result = check()
+        # No connection is held while parked
+        if result['latest_id'] <= after and timeout > 0 and notification_hub.wait(user_id, after, timeout) > after:
+            result = check()
+        return jsonify(result), 200
+
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== Analytics & Predictions ====================
+
+@app.route('/api/analytics/dashboard', methods=['GET'])
+@jwt_required()
+def get_dashboard_analytics():
+    user_id = get_jwt_identity()
+    
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = connection.cursor(dictionary=True)
+        
+        # Current month statistics, in the user's currency
+        month = datetime.now().strftime('%Y-%m')
+        current = [row for row in get_monthly_totals(cursor, user_id) if row['month'] == month]
+        count = sum(row['count'] for row in current)
+        monthly_stats = {
+            'total_income': sum((r['total'] for r in current if r['type'] == 'income'), Decimal(0)) if count else None,
+            'total_expenses': sum((r['total'] for r in current if r['type'] == 'expense'), Decimal(0)) if count else None,
+            'transaction_count': count
+        }
+        
+        # Category breakdown
+        by_category = {}
+        for row in current:
+            if row['type'] == 'expense':
+                by_category[row['category']] = by_category.get(row['category'], Decimal(0)) + row['total']
+        category_breakdown = [
+            {'category': category, 'total': total}
+            for category, total in sorted(by_category.items(), key=lambda item: item[1], reverse=True)
+        ]
+        
+        return jsonify({
+            'monthly_stats': monthly_stats,
+            'category_breakdown': category_breakdown
+        }), 200
+        
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+@app.route('/api/predictions/cashflow', methods=['GET'])
+@jwt_required()
+def predict_cashflow():
+    user_id = int(get_jwt_identity())
+    
+    connection = get_db_connection(user_id)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = connection.cursor(dictionary=True)
+        
+        # Holt-Winters state is refit only when the ledger changed
+        state = load_forecast_state(cursor, user_id)
+        connection.commit()
+        
+        if state.closed_months < 2:
+            return jsonify({'error': 'Insufficient data for prediction'}), 400
+        
+        expenses = state.forecast('expense:total')
+        income = state.forecast('income:total')
+        # Neither series can go below zero; the balance uses the clamped values the response shows
+        predicted_expenses = max(expenses['forecast'], 0)
+        predicted_income = max(income['forecast'], 0)
+        predicted_balance = predicted_income - predicted_expenses
+        
+        # Confidence from the relative width of the expense interval
+        spread = (expenses['upper_bound'] - expenses['lower_bound']) / (2 * max(expenses['forecast'], 1))
+        confidence = 'high' if spread < 0.25 else 'medium' if spread < 0.5 else 'low'
+        
+        historical_data = [
+            {'month': month, 'income': income_total, 'expenses': expense_total}
+            for (month, income_total), (_, expense_total) in zip(
+                state.history('income:total'), state.history('expense:total')
+            )
+        ]
+        
+        return jsonify({
+            'forecast_month': expenses['month'],
+            'predicted_expenses': predicted_expenses,
+            'expenses_interval': [max(expenses['lower_bound'], 0), expenses['upper_bound']],
+            'predicted_income': predicted_income,
+            'income_interval': [max(income['lower_bound'], 0), income['upper_bound']],
+            'predicted_balance': round(predicted_balance, 2),
+            'confidence': confidence,
+            'historical_data': historical_data
+        }), 200
+        
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+@app.route('/api/insights/spending-patterns', methods=['GET'])
+@jwt_required()
+def get_spending_patterns():
+    user_id = get_jwt_identity()
+    
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
     try:
         cursor = connection.cursor(dictionary=True)
         
-        # Day of week analysis
+        # Day of week analysis, over rows already in the user's currency
+        base = user_currency(cursor, user_id)
         cursor.execute(
             """SELECT 
             DAYNAME(transaction_date) as day_of_week,
             COUNT(*) as transaction_count,
             SUM(amount) as total_amount
             FROM transactions
-            WHERE user_id = %s AND type = 'expense'
+            WHERE user_id = %s AND type = 'expense' AND (currency IS NULL OR currency = %s)
             GROUP BY DAYNAME(transaction_date)
             ORDER BY FIELD(DAYNAME(transaction_date), 
                 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 
                 'Friday', 'Saturday', 'Sunday')""",
-            (user_id,)
+            (user_id, base)
         )
         day_patterns = cursor.fetchall()
         
@@ -711,12 +1536,54 @@ def get_spending_patterns():
             """SELECT merchant, COUNT(*) as visits, SUM(amount) as total_spent
             FROM transactions
             WHERE user_id = %s AND type = 'expense' AND merchant IS NOT NULL
+            AND (currency IS NULL OR currency = %s)
             GROUP BY merchant
-            ORDER BY total_spent DESC
-            LIMIT 10""",
-            (user_id,)
+            ORDER BY total_spent DESC""",
+            (user_id, base)
         )
         top_merchants = cursor.fetchall()
+
+        # Foreign-currency expenses are converted at their own day's rate
+        cursor.execute(
+            """SELECT transaction_date, merchant, amount, currency
+            FROM transactions
+            WHERE user_id = %s AND type = 'expense' AND currency <> %s""",
+            (user_id, base)
+        )
+        foreign = cursor.fetchall()
+        partials = []
+        if foreign:
+            amounts = fx_rates.convert([r['amount'] for r in foreign], [r['currency'] for r in foreign],
+                                       [r['transaction_date'] for r in foreign], base)
+            weekdays = {}
+            merchants = {}
+            for row, amount in zip(foreign, amounts):
+                amount = Decimal(f"{amount:.2f}")
+                day = WEEKDAYS[pd.Timestamp(row['transaction_date']).dayofweek]
+                total, count = weekdays.get(day, (Decimal(0), 0))
+                weekdays[day] = (total + amount, count + 1)
+                if row['merchant'] is not None:
+                    total, count = merchants.get(row['merchant'], (Decimal(0), 0))
+                    merchants[row['merchant']] = (total + amount, count + 1)
+            partials.append({'weekdays': weekdays, 'merchants': merchants})
+
+        # Fold in the converted rows and the archived months' rollups
+        summaries = partials + list(load_cold_summaries(cursor, user_id, fx_rates).values())
+        if summaries:
+            days = {row['day_of_week']: row for row in day_patterns}
+            merchants = {row['merchant']: row for row in top_merchants}
+            for summary in summaries:
+                for day, (total, count) in summary['weekdays'].items():
+                    row = days.setdefault(day, {'day_of_week': day, 'transaction_count': 0, 'total_amount': Decimal(0)})
+                    row['transaction_count'] += count
+                    row['total_amount'] += Decimal(total)
+                for merchant, (total, count) in summary['merchants'].items():
+                    row = merchants.setdefault(merchant, {'merchant': merchant, 'visits': 0, 'total_spent': Decimal(0)})
+                    row['visits'] += count
+                    row['total_spent'] += Decimal(total)
+            day_patterns = [days[day] for day in WEEKDAYS if day in days]
+            top_merchants = sorted(merchants.values(), key=lambda r: r['total_spent'], reverse=True)
+        top_merchants = top_merchants[:10]
         
         return jsonify({
             'day_patterns': day_patterns,
@@ -729,18 +1596,15 @@ def get_spending_patterns():
         cursor.close()
         connection.close()
 
-@app.route('/api/predictions/cashflow-advanced', methods=['GET'])
-@jwt_required()
-def cashflow_prediction_advanced():
-    user_id = get_jwt_identity()
+def compute_cashflow_advanced(user_id):
     df = get_user_transactions_df(user_id)
 
     if df.empty:
-        return jsonify({
+        return {
             "confidence": "low",
             "message": "Insufficient data",
             "historical_data": []
-        }), 200
+        }
 
     result = financial_predictor.predict_cash_flow(df)
     df['date'] = pd.to_datetime(df['date'])
@@ -757,129 +1621,296 @@ def cashflow_prediction_advanced():
         })
 
     result["historical_data"] = historical_data
+    return result
 
-    return jsonify(result), 200
+def compute_spending_insights(user_id):
+    # Per-month partials are kept current by the insert paths, so this
+    # only rescans the ledger after an update, delete or import
+    connection = get_db_connection(user_id)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        state = load_insight_state(cursor, user_id)
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
 
+    if not state.n_months:
+        return {}
 
-@app.route('/api/predictions/budget-risk', methods=['GET'])
+    return state.insights()
+
+# Heavy predictions that run on the job pool instead of the request thread
+JOB_KINDS = {
+    'cashflow-advanced': compute_cashflow_advanced,
+    'spending-insights': compute_spending_insights,
+}
+
+def run_prediction_job(user_id, kind, wait):
+    """
+    Serve a fresh result, or enqueue the job and answer 202 with it for
+    the client to poll at /api/jobs/<job_id>. A positive `wait` holds the
+    request thread up to that many seconds for the result first.
+    """
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        cursor = connection.cursor(dictionary=True)
+        key = (user_id, kind, get_ledger_version(cursor, user_id))
+    finally:
+        cursor.close()
+        connection.close()
+
+    claim_warm(key)
+    job = prediction_jobs.fresh_result(key)
+    if job is None:
+        try:
+            job = prediction_jobs.submit(user_id, kind, key, JOB_KINDS[kind], user_id)
+        except QueueFull as e:
+            return jsonify({'error': str(e)}), 429
+        if wait > 0:
+            prediction_jobs.wait(job, min(wait, JOB_MAX_WAIT))
+
+    if job.status == 'done':
+        return jsonify(job.result), 200
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), 500
+    return jsonify(job.to_dict()), 202
+
+def warm_user(user_id, filled):
+    """
+    Fill the caches the dashboard reads right after login, under the keys
+    its requests will look up. Runs on warm_up's pool; filled(key, seconds)
+    records each entry for the warm-hit metrics.
+    """
+    def timed(fill):
+        started = time.perf_counter()
+        key = fill()
+        if key is not None:
+            filled(key, time.perf_counter() - started)
+
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return
+    try:
+        cursor = connection.cursor(dictionary=True)
+
+        def fill_monthly_totals():
+            get_monthly_totals(cursor, user_id)
+            return monthly_totals_key(cursor, user_id)[0]
+
+        timed(lambda: transactions_payload(cursor, user_id)[0])
+        timed(fill_monthly_totals)
+        version = get_ledger_version(cursor, user_id)
+    finally:
+        cursor.close()
+        connection.close()
+
+    # Heavy predictions go to the process pool and overlap with the rest
+    jobs = []
+    for kind, func in JOB_KINDS.items():
+        key = (user_id, kind, version)
+        try:
+            jobs.append(prediction_jobs.fresh_result(key) or prediction_jobs.submit(user_id, kind, key, func, user_id))
+        except QueueFull:
+            pass
+
+    # Loads the ledger into the model store on the way
+    timed(lambda: budget_risk_payload(user_id)[0])
+
+    # Record each prediction when it lands instead of holding a warm-up thread
+    def landed(job):
+        if job.status == 'done':
+            filled(job.key, job.finished_at - job.started_at)
+
+    for job in jobs:
+        prediction_jobs.add_done_callback(job, landed)
+
+@app.route('/api/metrics/warmup', methods=['GET'])
 @jwt_required()
-def budget_risk_prediction():
-    user_id = get_jwt_identity()
-    df = get_user_transactions_df(user_id)
+def warmup_metrics():
+    return jsonify(warm_up.stats()), 200
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT category, limit_amount
-        FROM budgets
-        WHERE user_id = %s
-    """, (user_id,))
-    budgets = {row["category"]: float(row["limit_amount"]) for row in cursor.fetchall()}
-    cursor.close()
-    connection.close()
+@app.route('/api/predictions/cashflow-advanced', methods=['GET'])
+@jwt_required()
+def cashflow_prediction_advanced():
+    user_id = int(get_jwt_identity())
+    wait = request.args.get('wait', JOB_INLINE_WAIT, type=float)
+    return run_prediction_job(user_id, 'cashflow-advanced', wait)
 
-    result = financial_predictor.predict_budget_overrun(df, budgets)
-    return jsonify(result), 200
+@app.route('/api/jobs', methods=['POST'])
+@jwt_required()
+def submit_job():
+    user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    kind = data.get('kind')
 
-@app.route('/api/predictions/goal-timeline/<int:goal_id>', methods=['GET'])
+    if kind not in JOB_KINDS:
+        return jsonify({'error': f"Unknown job kind, use one of {', '.join(JOB_KINDS)}"}), 400
+
+    return run_prediction_job(user_id, kind, float(data.get('wait', 0)))
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
 @jwt_required()
-def goal_timeline_prediction(goal_id):
-    user_id = get_jwt_identity()
+def get_job(job_id):
+    user_id = int(get_jwt_identity())
+    job = prediction_jobs.get(job_id, user_id)
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
 
-    cursor.execute("""
-        SELECT current_amount, target_amount
-        FROM savings_goals
-        WHERE id = %s AND user_id = %s
-    """, (goal_id, user_id))
-    goal = cursor.fetchone()
+    wait = request.args.get('wait', 0, type=float)
+    if wait > 0:
+        prediction_jobs.wait(job, min(wait, JOB_MAX_WAIT))
 
-    cursor.execute("""
-        SELECT
-            SUM(CASE WHEN type='income' THEN amount ELSE 0 END) AS income,
-            SUM(CASE WHEN type='expense' THEN amount ELSE 0 END) AS expense
-        FROM transactions
-        WHERE user_id = %s
-    """, (user_id,))
-    totals = cursor.fetchone()
+    return jsonify(job.to_dict()), 200
 
-    cursor.close()
-    connection.close()
+@app.route('/api/jobs/metrics', methods=['GET'])
+@jwt_required()
+def job_metrics():
+    return jsonify(prediction_jobs.metrics()), 200
 
-    result = financial_predictor.calculate_savings_goal_timeline(
-        float(goal["current_amount"]),
-        float(goal["target_amount"]),
-        float(totals["income"] or 0),
-        float(totals["expense"] or 0)
-    )
+@app.route('/api/metrics/coalescing', methods=['GET'])
+@jwt_required()
+def coalescing_metrics():
+    return jsonify({
+        'singleflight': request_flights.stats(),
+        'payload_cache': {'hits': payload_cache.hits, 'misses': payload_cache.misses}
+    }), 200
 
-    return jsonify(result), 200
 
-@app.route("/api/analytics/monthly-trend", methods=["GET"])
+@app.route('/api/metrics/auth', methods=['GET'])
 @jwt_required()
-def get_monthly_trend():
-    user_id = int(get_jwt_identity())
+def auth_metrics():
+    return jsonify(password_hasher.stats()), 200
 
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"error": "Database connection failed"}), 500
 
-    try:
-        cursor = connection.cursor(dictionary=True)
+@app.route('/api/metrics/writes', methods=['GET'])
+@jwt_required()
+def write_metrics():
+    if transaction_writes is None:
+        return jsonify({'group_commit': False}), 200
+    return jsonify(dict(transaction_writes.stats(), group_commit=True)), 200
 
-        query = """
-            SELECT 
-                DATE_FORMAT(transaction_date, '%Y-%m') as month,
-                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as income,
-                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as expenses
-            FROM transactions
-            WHERE user_id = %s
-            GROUP BY month
-            ORDER BY month ASC
-        """
 
-        cursor.execute(query, (user_id,))
-        results = cursor.fetchall()
+@app.route('/api/metrics/inbox', methods=['GET'])
+@jwt_required()
+def inbox_metrics():
+    return jsonify(notification_hub.stats()), 200
 
-        return jsonify(results), 200
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+@app.route('/api/metrics/model-store', methods=['GET'])
+@jwt_required()
+def model_store_metrics():
+    return jsonify(dict(model_store.stats(), disk=model_store.usage())), 200
+
+
+@app.route('/api/metrics/replication', methods=['GET'])
+@jwt_required()
+def replication_metrics():
+    return jsonify({
+        'replicas': {name: len(replicas) for name, replicas in shard_router.replicas.items()},
+        'replica_reads': shard_router.replica_reads,
+        'primary_fallbacks': shard_router.primary_fallbacks
+    }), 200
 
+
+@app.route('/api/predictions/cashflow-simulation', methods=['GET'])
+@jwt_required()
+def cashflow_simulation():
+    user_id = int(get_jwt_identity())
+    n_paths = min(request.args.get('paths', 10000, type=int), 100000)
+    # Seeded per user by default so repeated requests agree
+    seed = request.args.get('seed', user_id, type=int)
+
+    if n_paths <= 0:
+        return jsonify({'error': 'paths must be positive'}), 400
+
+    def simulate():
+        df = get_user_transactions_df(user_id)
+        if df.empty:
+            return {'error': 'Insufficient data for simulation'}
+        return financial_predictor.simulate_cash_flow(df, n_paths=n_paths, seed=seed)
+
+    result = coalesce(user_id, 'cashflow-simulation', (n_paths, seed), simulate)
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify(result), 200
+
+
+def budget_risk_payload(user_id):
+    """
+    Encoded budget overrun predictions, cached until the ledger or budgets change
+
+    Returns:
+        tuple: (cache key, EncodedPayload)
+    """
+    def predict():
+        df = get_user_transactions_df(user_id)
+
+        connection = get_db_connection(user_id, read_only=True)
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT category, limit_amount
+            FROM budgets
+            WHERE user_id = %s
+        """, (user_id,))
+        budgets = {row["category"]: float(row["limit_amount"]) for row in cursor.fetchall()}
+        cursor.close()
+        connection.close()
+
+        return financial_predictor.predict_budget_overrun(df, budgets)
+
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return None, None
+    try:
+        cursor = connection.cursor(dictionary=True)
+        # Budget writes bump the ledger version too
+        key = (int(user_id), 'budget-risk', get_ledger_version(cursor, user_id))
     finally:
         cursor.close()
         connection.close()
-    
-@app.route("/api/predictions/spending-insights", methods=["GET"])
+
+    payload = request_flights.do(
+        key,
+        lambda: payload_cache.get_or_build(key, predict),
+        timeout=SINGLEFLIGHT_TIMEOUT
+    )
+    return key, payload
+
+@app.route('/api/predictions/budget-risk', methods=['GET'])
 @jwt_required()
-def spending_insights():
+def budget_risk_prediction():
     user_id = int(get_jwt_identity())
+    key, payload = budget_risk_payload(user_id)
+    if payload is None:
+        return jsonify({'error': 'Database connection failed'}), 500
+    claim_warm(key)
+    return payload_response(payload), 200
 
-    connection = get_db_connection()
+@app.route("/api/analytics/monthly-trend", methods=["GET"])
+@jwt_required()
+def get_monthly_trend():
+    user_id = int(get_jwt_identity())
+
+    connection = get_db_connection(user_id, read_only=True)
     if not connection:
         return jsonify({"error": "Database connection failed"}), 500
 
     try:
         cursor = connection.cursor(dictionary=True)
 
-        cursor.execute(
-            "SELECT transaction_date as date, amount, type, category FROM transactions WHERE user_id = %s",
-            (user_id,)
-        )
-
-        rows = cursor.fetchall()
-
-        if not rows:
-            return jsonify({}), 200
-
-        df = pd.DataFrame(rows)
-
-        predictor = FinancialPredictor()
-        insights = predictor.generate_spending_insights(df)
+        # Hot and archived months, in the user's currency
+        months = {}
+        for row in get_monthly_totals(cursor, user_id):
+            month = months.setdefault(row['month'], {'month': row['month'], 'income': Decimal(0), 'expenses': Decimal(0)})
+            month['income' if row['type'] == 'income' else 'expenses'] += row['total']
+        results = [months[month] for month in sorted(months)]
 
-        return jsonify(insights), 200
+        return jsonify(results), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -887,6 +1918,26 @@ def spending_insights():
     finally:
         cursor.close()
         connection.close()
+    
+@app.route('/api/analytics/health', methods=['GET'])
+@jwt_required()
+def get_health_metrics():
+    """
+    Savings rate, emergency cover, expense volatility and budget adherence,
+    ranked against all users, as of the last `python health.py refresh`
+    """
+    user_id = int(get_jwt_identity())
+    report = health_engine.report(user_id)
+    if report is None:
+        return jsonify({'error': 'No health metrics for this user yet'}), 404
+    return jsonify(report), 200
+
+@app.route("/api/predictions/spending-insights", methods=["GET"])
+@jwt_required()
+def spending_insights():
+    user_id = int(get_jwt_identity())
+    wait = request.args.get('wait', JOB_INLINE_WAIT, type=float)
+    return run_prediction_job(user_id, 'spending-insights', wait)
 
 @app.route('/api/predictions/budget-risk', methods=['GET'])
 @jwt_required()
@@ -899,7 +1950,7 @@ def predict_budget_risk():
     if transactions_df.empty:
         return jsonify([]), 200
 
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, read_only=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
 
@@ -934,32 +1985,164 @@ def predict_budget_risk():
     finally:
         cursor.close()
         connection.close()
-@app.route('/api/predictions/spending-insights', methods=['GET'])
+
+@app.route('/api/predictions/backtest', methods=['GET'])
 @jwt_required()
-def get_spending_insights():
+def backtest_forecasts():
+    """
+    Accuracy of each forecasting model replayed over every closed month
+    of the user's history. ?series=expense:total,... limits the series.
+    """
     user_id = int(get_jwt_identity())
+    keys = request.args.get('series')
+    keys = set(keys.split(',')) if keys else None
+    min_history = max(request.args.get('min_history', BACKTEST_MIN_HISTORY, type=int), 1)
 
-    transactions_df = get_user_transactions_df(user_id)
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
 
-    if transactions_df.empty:
-        return jsonify({}), 200
+    try:
+        cursor = connection.cursor(dictionary=True)
+        today = datetime.now()
+        series = user_series(get_monthly_totals(cursor, user_id), month_index(today.year, today.month), keys)
+        return jsonify(run_backtest(series, min_history)), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    finally:
+        cursor.close()
+        connection.close()
+
+@app.route('/api/predictions/budget-scenarios', methods=['POST'])
+@jwt_required()
+def predict_budget_scenarios():
+    """
+    Overrun risk for many candidate budget sets in one call. The body is
+    {"scenarios": [{category: limit, ...}, ...]}; categories a scenario
+    leaves out keep their saved budget, and a null limit removes one.
+    """
+    user_id = int(get_jwt_identity())
+    scenarios = (request.get_json(silent=True) or {}).get('scenarios')
+
+    if not isinstance(scenarios, list) or not all(isinstance(s, dict) for s in scenarios):
+        return jsonify({'error': 'scenarios must be a list of {category: limit} objects'}), 400
+    if len(scenarios) > BUDGET_SCENARIOS_MAX:
+        return jsonify({'error': f'At most {BUDGET_SCENARIOS_MAX} scenarios per request'}), 400
+    try:
+        scenarios = [
+            {category: None if limit is None else float(limit) for category, limit in scenario.items()}
+            for scenario in scenarios
+        ]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Budget limits must be numbers'}), 400
+
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        cursor = connection.cursor(dictionary=True)
+
+        cursor.execute(
+            "SELECT category, limit_amount FROM budgets WHERE user_id = %s",
+            (user_id,)
+        )
+        budgets = {b['category']: float(b['limit_amount']) for b in cursor.fetchall()}
+
+        # Month-to-date spending from the cached monthly totals, not the ledger
+        month = datetime.now().strftime('%Y-%m')
+        spent = {
+            row['category']: float(row['total']) for row in get_monthly_totals(cursor, user_id)
+            if row['month'] == month and row['type'] == 'expense'
+        }
+
+        results = financial_predictor.evaluate_budget_scenarios(spent, scenarios, budgets)
+        return jsonify({'scenarios': results}), 200
+
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def get_recent_monthly_averages(cursor, user_id, months=3):
+    """Average monthly (income, expenses) over the user's last `months` months with data"""
+    by_month = {}
+    for row in get_monthly_totals(cursor, user_id):
+        income, expenses = by_month.get(row['month'], (0.0, 0.0))
+        if row['type'] == 'income':
+            income += float(row['total'])
+        else:
+            expenses += float(row['total'])
+        by_month[row['month']] = (income, expenses)
+
+    recent = [by_month[month] for month in sorted(by_month)[-months:]]
+    if not recent:
+        return None
+
+    avg_income = sum(income for income, _ in recent) / len(recent)
+    avg_expenses = sum(expenses for _, expenses in recent) / len(recent)
+    return avg_income, avg_expenses
+
+@app.route('/api/predictions/goal-timelines', methods=['GET'])
+@jwt_required()
+def predict_goal_timelines():
+    user_id = int(get_jwt_identity())
+
+    connection = get_db_connection(user_id, read_only=True)
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
 
     try:
-        insights = financial_predictor.generate_spending_insights(
-            transactions_df
+        cursor = connection.cursor(dictionary=True)
+
+        cursor.execute("""
+            SELECT id, goal_name, current_amount, target_amount, deadline
+            FROM savings_goals
+            WHERE user_id = %s AND status = 'active'
+            ORDER BY deadline ASC
+        """, (user_id,))
+        goals = cursor.fetchall()
+
+        # One aggregate scan shared by every goal
+        averages = get_recent_monthly_averages(cursor, user_id)
+
+        if not averages:
+            return jsonify({
+                "status": "insufficient_data",
+                "message": "Not enough transaction history",
+                "goals": []
+            }), 200
+
+        avg_income, avg_expenses = averages
+        timelines = financial_predictor.calculate_savings_goal_timelines(
+            goals, avg_income, avg_expenses
         )
 
-        return jsonify(insights), 200
+        return jsonify({
+            "monthly_income": round(avg_income, 2),
+            "monthly_expenses": round(avg_expenses, 2),
+            "monthly_surplus": round(avg_income - avg_expenses, 2),
+            "goals": timelines
+        }), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    finally:
+        cursor.close()
+        connection.close()
+
 @app.route('/api/predictions/goal-timeline/<int:goal_id>', methods=['GET'])
 @jwt_required()
 def predict_goal_timeline(goal_id):
     user_id = int(get_jwt_identity())
 
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, read_only=True)
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
 
@@ -978,29 +2161,15 @@ def predict_goal_timeline(goal_id):
         if not goal:
             return jsonify({'error': 'Goal not found'}), 404
 
-        # Get monthly income & expenses (last 3 months avg)
-        cursor.execute("""
-            SELECT
-                DATE_FORMAT(transaction_date, '%Y-%m') as month,
-                SUM(CASE WHEN type='income' THEN amount ELSE 0 END) as income,
-                SUM(CASE WHEN type='expense' THEN amount ELSE 0 END) as expenses
-            FROM transactions
-            WHERE user_id = %s
-            GROUP BY month
-            ORDER BY month DESC
-            LIMIT 3
-        """, (user_id,))
-
-        monthly_data = cursor.fetchall()
+        averages = get_recent_monthly_averages(cursor, user_id)
 
-        if not monthly_data:
+        if not averages:
             return jsonify({
                 "status": "insufficient_data",
                 "message": "Not enough transaction history"
             }), 200
 
-        avg_income = sum(float(m['income']) for m in monthly_data) / len(monthly_data)
-        avg_expenses = sum(float(m['expenses']) for m in monthly_data) / len(monthly_data)
+        avg_income, avg_expenses = averages
 
         result = financial_predictor.calculate_savings_goal_timeline(
             float(goal['current_amount']),
@@ -1017,26 +2186,6 @@ def predict_goal_timeline(goal_id):
     finally:
         cursor.close()
         connection.close()
-@app.route('/api/predictions/spending-insights', methods=['GET'])
-@jwt_required()
-def spending_insights_advanced():
-    user_id = get_jwt_identity()
-    df = get_user_transactions_df(user_id)
-
-    if df.empty:
-        return jsonify({
-            "monthly_trend": "insufficient_data",
-            "weekend_vs_weekday": {
-                "weekend_avg": 0,
-                "weekday_avg": 0,
-                "difference_pct": 0
-            },
-            "impulse_spending_score": 0
-        }), 200
-
-    insights = financial_predictor.generate_spending_insights(df)
-    return jsonify(insights), 200
-
 @app.route('/api/goals/<int:goal_id>/contribute', methods=['POST'])
 @jwt_required()
 def contribute_to_goal(goal_id):
@@ -1045,7 +2194,7 @@ def contribute_to_goal(goal_id):
 
     amount = float(data.get('amount', 0))
 
-    connection = get_db_connection()
+    connection = get_db_connection(user_id, for_write=True)
     cursor = connection.cursor()
 
     # Insert contribution
@@ -0,0 +1,593 @@
+"""
+Cold tier for old transactions.
+
+    python archive.py run [user_id]
+    python archive.py restore <user_id> <YYYY-MM>
+    python archive.py index [user_id]
+    python archive.py summarize [user_id]
+
+`run` moves every closed month older than ARCHIVE_HORIZON_MONTHS out of
+`transactions` into one `transaction_archive` row per user-month: a
+compressed columnar segment holding the rows, plus summary columns
+(totals by type/category, weekday and merchant) that aggregate queries
+read without decoding the segment. Months that already have a segment
+are merged, so rows backdated into an archived month are picked up on
+the next run.
+
+`archived_transactions` maps each archived id to its month, so a row
+is found by id by decoding only its own segment. Archived rows are
+read-only; editing or deleting one restores its month into the hot
+table first (`restore` does the same by hand). `index` fills
+archived_transactions for months archived before it existed.
+
+Segments keep each row's own amount and currency; the summary columns
+are in the user's currency at archive time and record which one. A
+summary in another currency than the user's current one is rebuilt
+from its segment on read, and `summarize` rewrites such summaries in
+place.
+"""
+import io
+import json
+import os
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from export import EXPORT_COLUMNS, _arrow_schema, _record_batch, arrow_available, pa, pq
+from fx import convert_rows, user_currency
+
+
+ARCHIVE_HORIZON_MONTHS = int(os.environ.get('ARCHIVE_HORIZON_MONTHS', 24))
+ARCHIVE_CACHE_SEGMENTS = int(os.environ.get('ARCHIVE_CACHE_SEGMENTS', 2048))
+
+SEGMENT_COLUMNS = list(EXPORT_COLUMNS)
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def archive_cutoff(today=None, horizon=ARCHIVE_HORIZON_MONTHS):
+    """First day of the oldest month that stays hot"""
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - horizon
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _period(day):
+    return f"{day.year:04d}-{day.month:02d}"
+
+
+def _period_bounds(period):
+    """First day of the month and first day of the next one"""
+    year, month = int(period[:4]), int(period[5:7])
+    return date(year, month, 1), date(year + month // 12, month % 12 + 1, 1)
+
+
+def _period_days(period):
+    """Inclusive (first, last) dates of the month"""
+    first, after = _period_bounds(period)
+    return first, date.fromordinal(after.toordinal() - 1)
+
+
+def _dict_rows(cursor):
+    rows = cursor.fetchall()
+    if rows and not isinstance(rows[0], dict):
+        names = [d[0] for d in cursor.description]
+        rows = [dict(zip(names, row)) for row in rows]
+    return rows
+
+
+# Segment encoding
+
+def encode_segment(rows):
+    """
+    Encode transaction rows (dicts with SEGMENT_COLUMNS) as a compressed segment
+
+    Returns:
+        tuple: (format, bytes) - 'parquet' when pyarrow is installed, else 'json.z'
+    """
+    if arrow_available():
+        schema = _arrow_schema(SEGMENT_COLUMNS)
+        batch = _record_batch([[row[c] for c in SEGMENT_COLUMNS] for row in rows], schema)
+        buffer = io.BytesIO()
+        pq.write_table(pa.Table.from_batches([batch]), buffer, compression='zstd')
+        return 'parquet', buffer.getvalue()
+
+    def plain(value):
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    payload = [[plain(row[c]) for c in SEGMENT_COLUMNS] for row in rows]
+    return 'json.z', zlib.compress(json.dumps(payload).encode('utf-8'), 6)
+
+
+def decode_segment(segment_format, blob):
+    """Rows of a segment as dicts, typed like a `SELECT *` on transactions"""
+    if segment_format == 'parquet':
+        if not arrow_available():
+            raise RuntimeError("Reading parquet archive segments requires pyarrow")
+        rows = pq.read_table(io.BytesIO(blob)).to_pylist()
+    else:
+        rows = []
+        for values in json.loads(zlib.decompress(blob)):
+            row = dict(zip(SEGMENT_COLUMNS, values))
+            row['amount'] = Decimal(row['amount'])
+            row['transaction_date'] = date.fromisoformat(row['transaction_date'])
+            if row.get('created_at'):
+                row['created_at'] = datetime.fromisoformat(row['created_at'])
+            rows.append(row)
+
+    # Segments written before a column was added (new columns go last)
+    for row in rows:
+        for column in SEGMENT_COLUMNS:
+            row.setdefault(column, None)
+    return rows
+
+
+def summarize(rows, currency=None):
+    """Aggregates kept next to a segment so rollups never decode it; amounts are in `currency`"""
+    totals = {}
+    weekdays = {}
+    merchants = {}
+    for row in rows:
+        amount = Decimal(row['amount'])
+        key = (row['type'], row['category'])
+        total, count = totals.get(key, (Decimal(0), 0))
+        totals[key] = (total + amount, count + 1)
+
+        if row['type'] != 'expense':
+            continue
+        day = WEEKDAYS[row['transaction_date'].weekday()]
+        total, count = weekdays.get(day, (Decimal(0), 0))
+        weekdays[day] = (total + amount, count + 1)
+        if row.get('merchant'):
+            total, count = merchants.get(row['merchant'], (Decimal(0), 0))
+            merchants[row['merchant']] = (total + amount, count + 1)
+
+    return {
+        'currency': currency,
+        'totals': [[t, c, str(total), count] for (t, c), (total, count) in totals.items()],
+        'weekdays': {day: [str(total), count] for day, (total, count) in weekdays.items()},
+        'merchants': {m: [str(total), count] for m, (total, count) in merchants.items()},
+    }
+
+
+# Decoded segments are immutable for a given (user, period, archived_at, row_count)
+
+class _SegmentCache:
+    def __init__(self, max_entries=ARCHIVE_CACHE_SEGMENTS):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            rows = self._entries.get(key)
+            if rows is not None:
+                self._entries.move_to_end(key)
+            return rows
+
+    def put(self, key, rows):
+        with self._lock:
+            self._entries[key] = rows
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+segment_cache = _SegmentCache()
+
+
+# Reads
+
+def archived_periods(cursor, user_id):
+    """{period: (archived_at, row_count)} for the user's cold months"""
+    cursor.execute(
+        "SELECT period, archived_at, row_count FROM transaction_archive WHERE user_id = %s",
+        (user_id,)
+    )
+    return {row['period']: (row['archived_at'], row['row_count']) for row in _dict_rows(cursor)}
+
+
+def _wanted_periods(cursor, user_id, start, end):
+    """{period: stamp} of the archived months overlapping [start, end]"""
+    wanted = {}
+    for period, stamp in archived_periods(cursor, user_id).items():
+        first, last = _period_days(period)
+        if (start and last < start) or (end and first > end):
+            continue
+        wanted[period] = stamp
+    return wanted
+
+
+def _parse_bound(value):
+    return date.fromisoformat(str(value)[:10]) if value else None
+
+
+def _within(rows, start, end):
+    if not (start or end):
+        return rows
+    return [
+        r for r in rows
+        if (not start or r['transaction_date'] >= start)
+        and (not end or r['transaction_date'] <= end)
+    ]
+
+
+def load_cold_rows(cursor, user_id, start_date=None, end_date=None):
+    """
+    Archived transactions for user_id, oldest month first
+
+    Args:
+        cursor: Cursor on the user's shard
+        user_id: Owner of the rows
+        start_date, end_date: Optional inclusive bounds (date or ISO string)
+
+    Returns:
+        list: Row dicts with SEGMENT_COLUMNS
+    """
+    start, end = _parse_bound(start_date), _parse_bound(end_date)
+    wanted = _wanted_periods(cursor, user_id, start, end)
+    if not wanted:
+        return []
+
+    segments = {}
+    missing = []
+    for period, stamp in wanted.items():
+        rows = segment_cache.get((user_id, period, stamp))
+        if rows is None:
+            missing.append(period)
+        else:
+            segments[period] = rows
+
+    if missing:
+        placeholders = ', '.join(['%s'] * len(missing))
+        cursor.execute(
+            f"""SELECT period, segment_format, segment
+            FROM transaction_archive
+            WHERE user_id = %s AND period IN ({placeholders})""",
+            (user_id, *missing)
+        )
+        for row in _dict_rows(cursor):
+            rows = decode_segment(row['segment_format'], bytes(row['segment']))
+            segment_cache.put((user_id, row['period'], wanted[row['period']]), rows)
+            segments[row['period']] = rows
+
+    cold = []
+    for period in sorted(segments):
+        cold.extend(_within(segments[period], start, end))
+    return cold
+
+
+def iter_cold_segments(cursor, user_id, start_date=None, end_date=None):
+    """
+    Archived transactions one month at a time, oldest first. Each segment
+    is fetched and decoded only when the caller gets to it, and is not
+    added to the segment cache, so reading the whole archive holds one
+    month's rows at a time.
+    """
+    start, end = _parse_bound(start_date), _parse_bound(end_date)
+    for period, stamp in sorted(_wanted_periods(cursor, user_id, start, end).items()):
+        rows = segment_cache.get((user_id, period, stamp))
+        if rows is None:
+            cursor.execute(
+                "SELECT segment_format, segment FROM transaction_archive WHERE user_id = %s AND period = %s",
+                (user_id, period)
+            )
+            found = _dict_rows(cursor)
+            if not found:
+                continue
+            rows = decode_segment(found[0]['segment_format'], bytes(found[0]['segment']))
+        yield _within(rows, start, end)
+
+
+def _stale_summaries(summaries, base):
+    return sorted(period for period, summary in summaries.items() if summary.get('currency') != base)
+
+
+def _resummarize(cursor, user_id, period, fx, base):
+    rows = convert_rows(fx, cursor, user_id, load_cold_rows(cursor, user_id, *_period_days(period)))
+    return rows, summarize(rows, base)
+
+
+def load_cold_summaries(cursor, user_id, fx=None):
+    """
+    {period: summary dict} for the user's cold months
+
+    With fx (an FxRates), summaries written in another currency than the
+    user's current one are rebuilt from their segments, so every summary
+    is in the user's currency.
+    """
+    cursor.execute(
+        "SELECT period, summary FROM transaction_archive WHERE user_id = %s ORDER BY period",
+        (user_id,)
+    )
+    summaries = {
+        row['period']: json.loads(row['summary']) if isinstance(row['summary'], (str, bytes)) else row['summary']
+        for row in _dict_rows(cursor)
+    }
+    if fx is not None and summaries:
+        base = user_currency(cursor, user_id)
+        for period in _stale_summaries(summaries, base):
+            summaries[period] = _resummarize(cursor, user_id, period, fx, base)[1]
+    return summaries
+
+
+def cold_monthly_totals(cursor, user_id, fx=None):
+    """Archived months as (month, type, category, total, count) rows, the shape of the hot GROUP BY"""
+    return [
+        {'month': period, 'type': t, 'category': c, 'total': Decimal(total), 'count': count}
+        for period, summary in load_cold_summaries(cursor, user_id, fx).items()
+        for t, c, total, count in summary['totals']
+    ]
+
+
+def archived_locations(cursor, user_id, ids):
+    """{transaction id: period} for the ids that are archived"""
+    if not ids:
+        return {}
+    cursor.execute(
+        f"""SELECT transaction_id, period FROM archived_transactions
+        WHERE user_id = %s AND transaction_id IN ({', '.join(['%s'] * len(ids))})""",
+        (user_id, *ids)
+    )
+    return {row['transaction_id']: row['period'] for row in _dict_rows(cursor)}
+
+
+def load_archived_rows(cursor, user_id, ids):
+    """{transaction id: row} for archived ids, decoding only the segments that hold them"""
+    locations = archived_locations(cursor, user_id, ids)
+    found = {}
+    for period in sorted(set(locations.values())):
+        for row in load_cold_rows(cursor, user_id, *_period_days(period)):
+            if locations.get(row['id']) == period:
+                found[row['id']] = row
+    return found
+
+
+# Moving rows between tiers
+
+def _type_totals(rows):
+    income = sum((Decimal(r['amount']) for r in rows if r['type'] == 'income'), Decimal(0))
+    expenses = sum((Decimal(r['amount']) for r in rows if r['type'] == 'expense'), Decimal(0))
+    return income, expenses
+
+
+def _write_segment(cursor, user_id, period, rows, fx=None):
+    rows.sort(key=lambda r: (r['transaction_date'], r['id']))
+    segment_format, blob = encode_segment(rows)
+    currency = None
+    if fx is not None:
+        currency = user_currency(cursor, user_id)
+        rows = convert_rows(fx, cursor, user_id, rows)
+    income, expenses = _type_totals(rows)
+    cursor.execute("DELETE FROM transaction_archive WHERE user_id = %s AND period = %s", (user_id, period))
+    cursor.execute(
+        """INSERT INTO transaction_archive
+        (user_id, period, row_count, total_income, total_expenses, summary,
+         segment_format, segment, archived_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+        (user_id, period, len(rows), income, expenses, json.dumps(summarize(rows, currency)),
+         segment_format, blob, datetime.now().replace(microsecond=0))
+    )
+    _locate(cursor, user_id, period, [r['id'] for r in rows])
+
+
+
+def _locate(cursor, user_id, period, ids):
+    cursor.execute("DELETE FROM archived_transactions WHERE user_id = %s AND period = %s", (user_id, period))
+    if ids:
+        cursor.executemany(
+            "INSERT INTO archived_transactions (user_id, transaction_id, period) VALUES (%s, %s, %s)",
+            [(user_id, transaction_id, period) for transaction_id in ids]
+        )
+
+
+def archive_user(connection, user_id, today=None, horizon=ARCHIVE_HORIZON_MONTHS, fx=None):
+    """
+    Move the user's transactions older than the horizon into the cold tier
+
+    Each month is archived and deleted from the hot table in its own
+    transaction, so a failure leaves every month in exactly one tier. The
+    month's rows are read FOR UPDATE and only the ids written to the
+    segment are deleted, so a row backdated into the month meanwhile
+    stays hot until the next run.
+    Pass fx (an FxRates) to convert foreign rows in the summaries.
+
+    Returns:
+        int: Number of rows moved
+    """
+    cutoff = archive_cutoff(today, horizon)
+    cursor = connection.cursor(dictionary=True)
+    moved = 0
+    try:
+        cursor.execute(
+            """SELECT DISTINCT `year_month` AS period FROM transactions
+            WHERE user_id = %s AND transaction_date < %s""",
+            (user_id, cutoff)
+        )
+        periods = sorted(row['period'] for row in cursor.fetchall())
+        connection.commit()
+
+        for period in periods:
+            first, after = _period_bounds(period)
+            cursor.execute(
+                f"""SELECT {', '.join(SEGMENT_COLUMNS)} FROM transactions
+                WHERE user_id = %s AND transaction_date >= %s AND transaction_date < %s
+                ORDER BY transaction_date, id
+                FOR UPDATE""",
+                (user_id, first, after)
+            )
+            hot = cursor.fetchall()
+            if not hot:
+                connection.commit()
+                continue
+
+            rows = list(hot)
+            if period in archived_periods(cursor, user_id):
+                rows = load_cold_rows(cursor, user_id, *_period_days(period)) + rows
+            _write_segment(cursor, user_id, period, rows, fx)
+            ids = [row['id'] for row in hot]
+            cursor.execute(
+                f"DELETE FROM transactions WHERE user_id = %s AND id IN ({', '.join(['%s'] * len(ids))})",
+                (user_id, *ids)
+            )
+            connection.commit()
+            moved += len(hot)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return moved
+
+
+def index_user(connection, user_id):
+    """
+    Rebuild archived_transactions for the user's archived months
+
+    Returns:
+        int: Number of archived rows located
+    """
+    cursor = connection.cursor(dictionary=True)
+    located = 0
+    try:
+        for period in sorted(archived_periods(cursor, user_id)):
+            ids = [row['id'] for row in load_cold_rows(cursor, user_id, *_period_days(period))]
+            _locate(cursor, user_id, period, ids)
+            connection.commit()
+            located += len(ids)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return located
+
+
+def summarize_user(connection, user_id, fx):
+    """
+    Rewrite the user's archived summaries that are not in their current
+    currency, e.g. after user_preferences.currency changed
+
+    Returns:
+        int: Number of months rewritten
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        base = user_currency(cursor, user_id)
+        stale = _stale_summaries(load_cold_summaries(cursor, user_id), base)
+        for period in stale:
+            rows, summary = _resummarize(cursor, user_id, period, fx, base)
+            income, expenses = _type_totals(rows)
+            cursor.execute(
+                """UPDATE transaction_archive SET total_income = %s, total_expenses = %s, summary = %s
+                WHERE user_id = %s AND period = %s""",
+                (income, expenses, json.dumps(summary), user_id, period)
+            )
+            connection.commit()
+        return len(stale)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def restore_month(connection, user_id, period):
+    """
+    Move an archived month back into the hot table
+
+    Returns:
+        int: Number of rows restored
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        rows = load_cold_rows(cursor, user_id, *_period_days(period))
+        if rows:
+            cursor.executemany(
+                f"""INSERT INTO transactions (user_id, {', '.join(SEGMENT_COLUMNS)})
+                VALUES (%s, {', '.join(['%s'] * len(SEGMENT_COLUMNS))})""",
+                [(user_id, *[row[c] for c in SEGMENT_COLUMNS]) for row in rows]
+            )
+        cursor.execute("DELETE FROM transaction_archive WHERE user_id = %s AND period = %s", (user_id, period))
+        _locate(cursor, user_id, period, [])
+        connection.commit()
+        return len(rows)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    from app import fx_rates, shard_router
+
+    def users_on(shard):
+        connection = shard_router.connect(shard)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT DISTINCT user_id FROM transactions WHERE transaction_date < %s",
+                           (archive_cutoff(),))
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+
+    def archived_users_on(shard):
+        connection = shard_router.connect(shard)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT DISTINCT user_id FROM transaction_archive")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+
+    if len(sys.argv) in (2, 3) and sys.argv[1] == 'run':
+        if len(sys.argv) == 3:
+            user_ids = [int(sys.argv[2])]
+        else:
+            user_ids = [u for ids in shard_router.fan_out(users_on).values() for u in ids]
+        for user_id in user_ids:
+            connection = shard_router.connect_user(user_id, for_write=True)
+            try:
+                print(f"user {user_id}: archived {archive_user(connection, user_id, fx=fx_rates)} rows")
+            finally:
+                connection.close()
+    elif len(sys.argv) in (2, 3) and sys.argv[1] == 'index':
+        if len(sys.argv) == 3:
+            user_ids = [int(sys.argv[2])]
+        else:
+            user_ids = [u for ids in shard_router.fan_out(archived_users_on).values() for u in ids]
+        for user_id in user_ids:
+            connection = shard_router.connect_user(user_id, for_write=True)
+            try:
+                print(f"user {user_id}: located {index_user(connection, user_id)} archived rows")
+            finally:
+                connection.close()
+    elif len(sys.argv) in (2, 3) and sys.argv[1] == 'summarize':
+        if len(sys.argv) == 3:
+            user_ids = [int(sys.argv[2])]
+        else:
+            user_ids = [u for ids in shard_router.fan_out(archived_users_on).values() for u in ids]
+        for user_id in user_ids:
+            connection = shard_router.connect_user(user_id, for_write=True)
+            try:
+                print(f"user {user_id}: rewrote {summarize_user(connection, user_id, fx_rates)} summaries")
+            finally:
+                connection.close()
+    elif len(sys.argv) == 4 and sys.argv[1] == 'restore':
+        user_id = int(sys.argv[2])
+        connection = shard_router.connect_user(user_id, for_write=True)
+        try:
+            print(f"user {user_id}: restored {restore_month(connection, user_id, sys.argv[3])} rows")
+        finally:
+            connection.close()
+    else:
+        print(__doc__)
+        sys.exit(1)
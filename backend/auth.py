@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+# Password hashing policy. AUTH_HASH_METHOD is a werkzeug method string
+# such as "scrypt:32768:8:1" or "pbkdf2:sha256:600000". When it is unset
+# and AUTH_HASH_TARGET_MS is, the scrypt work factor is calibrated at
+# startup so one hash takes about that long on this machine.
+AUTH_HASH_METHOD = os.environ.get('AUTH_HASH_METHOD')
+AUTH_HASH_TARGET_MS = float(os.environ.get('AUTH_HASH_TARGET_MS', 0))
+AUTH_HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+AUTH_HASH_MAX_QUEUED = int(os.environ.get('AUTH_HASH_MAX_QUEUED', 64))
+AUTH_HASH_TIMEOUT = float(os.environ.get('AUTH_HASH_TIMEOUT', 10))
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+MIN_SCRYPT_N = 2 ** 14
+MAX_SCRYPT_N = 2 ** 20
+
+
+class HashPoolBusy(Exception):
+    """Too many password hashes are queued; the client should retry"""
+
+
+def calibrate_scrypt(target_ms, r=8, p=1):
+    """
+    Largest power-of-two scrypt N whose hash takes at most target_ms here
+
+    Returns:
+        str: werkzeug method string, never weaker than MIN_SCRYPT_N
+    """
+    n = MIN_SCRYPT_N
+    while n < MAX_SCRYPT_N:
+        start = time.perf_counter()
+        hashlib.scrypt(b'calibrate', salt=b'0' * 16, n=n * 2, r=r, p=p, maxmem=132 * n * 2 * r * p)
+        if (time.perf_counter() - start) * 1000 > target_ms:
+            break
+        n *= 2
+    return f"scrypt:{n}:{r}:{p}"
+
+
+def hash_method(pwhash):
+    """Method part of a werkzeug hash, e.g. "scrypt:32768:8:1" """
+    return pwhash.split('$', 1)[0]
+
+
+class PasswordHasher:
+    """
+    Runs password KDFs on a small dedicated thread pool.
+
+    scrypt and pbkdf2 release the GIL, so request threads waiting on the
+    pool cost nothing, and at most `workers` hashes use CPU at once no
+    matter how many logins arrive together. Beyond `max_queued` waiting
+    hashes, callers get HashPoolBusy instead of piling up.
+    """
+
+    def __init__(self, method=None, workers=AUTH_HASH_WORKERS, max_queued=AUTH_HASH_MAX_QUEUED,
+                 timeout=AUTH_HASH_TIMEOUT):
+        if method is None:
+            method = AUTH_HASH_METHOD or (
+                calibrate_scrypt(AUTH_HASH_TARGET_MS) if AUTH_HASH_TARGET_MS else DEFAULT_METHOD
+            )
+        self.method = method
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pwhash')
+        self._slots = threading.BoundedSemaphore(workers + max_queued)
+        self._dummy_hash = None
+
+        self._lock = threading.Lock()
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected = 0
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolBusy("Authentication is busy, retry shortly")
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def _run(self, fn, *args):
+        try:
+            return self._submit(fn, *args).result(self.timeout)
+        except TimeoutError:
+            raise HashPoolBusy("Authentication is busy, retry shortly")
+
+    def hash(self, password):
+        with self._lock:
+            self.hashed += 1
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """
+        Check password against pwhash. Pass pwhash=None for an unknown
+        account: a hash is still checked so the response takes as long.
+        """
+        if pwhash is None:
+            if self._dummy_hash is None:
+                self._dummy_hash = self._run(generate_password_hash, 'unused', self.method)
+            pwhash = self._dummy_hash
+        with self._lock:
+            self.verified += 1
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return hash_method(pwhash) != self.method
+
+    def rehash_later(self, password, save):
+        """
+        Re-hash with the current policy in the background and hand the new
+        hash to save(new_hash). Skipped when the pool is busy; the next
+        login tries again.
+        """
+        def rehash():
+            try:
+                save(generate_password_hash(password, self.method))
+            except Exception as e:
+                print(f"Error re-hashing password: {e}")
+                return
+            with self._lock:
+                self.rehashed += 1
+
+        try:
+            self._submit(rehash)
+        except HashPoolBusy:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "method": self.method,
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "hashed": self.hashed,
+                "verified": self.verified,
+                "rehashed": self.rehashed,
+                "rejected": self.rejected,
+            }
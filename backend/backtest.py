@@ -0,0 +1,287 @@
+"""
+Month-end forecast backtesting for one user or a whole cohort.
+
+    python backtest.py [user_id ...]
+
+Every monthly series (income:total, expense:total and expense:<category>,
+as in fit_forecast_state) is replayed at every historical month-end: the
+model sees the closed months before t and forecasts month t. Series of
+any length and start month are stacked left-aligned into one
+(series x months) array, so each model is one pass over the month axis
+for the whole cohort rather than one refit per user and month.
+
+Holt-Winters reproduces what a batch_fit refit at each month-end would
+forecast. The recursion has no lookahead: batch_fit's parameter choice
+at t is the argmin of the squared errors accumulated before t, and its
+seasonal start values come from the first two seasons, which it only
+uses once t >= 2 * SEASON_LENGTH. So one non-seasonal pass and one
+seasonal pass over the (series x params) grid give every month's
+forecast. The run-rate baselines mirror predict_cash_flow at a month-end.
+
+The report has MAE, MAPE (over non-zero actuals), bias and runtime per
+model, plus the empirical coverage of the prediction interval where the
+model has one.
+"""
+import sys
+import time
+
+import numpy as np
+from scipy.stats import norm
+
+from forecasting import PARAM_GRID, SEASON_LENGTH, month_index, series_keys
+
+BACKTEST_MIN_HISTORY = 2
+BACKTEST_COVERAGE = 0.95
+
+
+def series_matrix(monthly_rows, before_month):
+    """
+    Closed monthly series of one user from get_monthly_totals rows
+
+    Args:
+        monthly_rows: Dicts with month ('YYYY-MM'), type, category and total
+        before_month: month_index() of the first month not to include
+
+    Returns:
+        tuple: (keys, first_month, values array (n_series, n_months))
+    """
+    totals = {}
+    for row in monthly_rows:
+        year, month = (int(part) for part in row['month'].split('-'))
+        index = month_index(year, month)
+        if index >= before_month:
+            continue
+        for key in series_keys(row['type'], row['category']):
+            by_month = totals.setdefault(key, {})
+            by_month[index] = by_month.get(index, 0.0) + float(row['total'] or 0)
+
+    months = [m for by_month in totals.values() for m in by_month]
+    if not months:
+        return [], before_month, np.zeros((0, 0))
+
+    first_month = min(months)
+    keys = sorted(set(totals) | {'income:total', 'expense:total'})
+    values = np.zeros((len(keys), before_month - first_month))
+    for row, key in enumerate(keys):
+        for index, amount in totals.get(key, {}).items():
+            values[row, index - first_month] = amount
+    return keys, first_month, values
+
+
+def stack_series(series):
+    """
+    Left-align series of different lengths into one array
+
+    Args:
+        series: List of (first_month, 1-d values)
+
+    Returns:
+        tuple: (values (n, max_len) padded with NaN, first_months, lengths)
+    """
+    lengths = np.array([len(values) for _, values in series], dtype=np.int64)
+    values = np.full((len(series), int(lengths.max()) if len(series) else 0), np.nan)
+    for i, (_, row) in enumerate(series):
+        values[i, :len(row)] = row
+    first_months = np.array([first for first, _ in series], dtype=np.int64)
+    return values, first_months, lengths
+
+
+def holt_winters_paths(values, first_months, seasonal, coverage=BACKTEST_COVERAGE, grid=PARAM_GRID):
+    """
+    One-step Holt-Winters forecasts at every month of every series
+
+    Args:
+        values: (n, T) left-aligned monthly totals, NaN past each series' end
+        first_months: month_index() of column 0 of each row
+        seasonal: Run the seasonal grid from batch_fit's two-season start
+            values instead of the non-seasonal grid
+
+    Returns:
+        tuple: (forecast, lower, upper), each (n, T); column t is the
+        forecast of month t from months 0 .. t-1
+    """
+    n, T = values.shape
+    if not seasonal:
+        grid = np.unique(np.column_stack([grid[:, :2], np.zeros(len(grid))]), axis=0)
+    alpha, beta, gamma = grid[None, :, 0], grid[None, :, 1], grid[None, :, 2]
+    rows = np.arange(n)
+    filled = np.nan_to_num(values)
+
+    factors = np.zeros((n, len(grid), SEASON_LENGTH))
+    if seasonal and T >= 2 * SEASON_LENGTH:
+        level0 = filled[:, :SEASON_LENGTH].mean(axis=1)
+        trend0 = (filled[:, SEASON_LENGTH:2 * SEASON_LENGTH].mean(axis=1) - level0) / SEASON_LENGTH
+        seasons = (first_months[:, None] + np.arange(SEASON_LENGTH)) % 12
+        factors[rows[:, None], :, seasons] = (filled[:, :SEASON_LENGTH] - level0[:, None])[:, :, None]
+    else:
+        level0 = filled[:, 0] if T else np.zeros(n)
+        trend0 = np.zeros(n)
+
+    level = np.repeat(level0[:, None], len(grid), axis=1)
+    trend = np.repeat(trend0[:, None], len(grid), axis=1)
+    sse = np.zeros((n, len(grid)))
+    forecast = np.full((n, T), np.nan)
+    sigma = np.full((n, T), np.nan)
+
+    for t in range(T):
+        season = (first_months + t) % 12
+        s = factors[rows, :, season]
+        predicted = level + trend + s
+        if t:
+            best = sse.argmin(axis=1)
+            forecast[:, t] = predicted[rows, best]
+            sigma[:, t] = np.sqrt(sse[rows, best] / t)
+
+        live = ~np.isnan(values[:, t])
+        y = filled[:, t][:, None]
+        error = y - predicted
+        sse = np.where(live[:, None], sse + error * error, sse)
+
+        previous_level = level
+        new_level = alpha * (y - s) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - previous_level) + (1 - beta) * trend
+        level = np.where(live[:, None], new_level, level)
+        trend = np.where(live[:, None], new_trend, trend)
+        factors[rows, :, season] = np.where(live[:, None], gamma * (y - level) + (1 - gamma) * s, s)
+
+    half_width = norm.ppf(0.5 + coverage / 2) * sigma
+    return forecast, forecast - half_width, forecast + half_width
+
+
+def holt_winters_forecasts(values, first_months, coverage=BACKTEST_COVERAGE):
+    """
+    Forecasts as production would have made them: non-seasonal until two
+    full seasons are closed, seasonal from then on
+    """
+    forecast, lower, upper = holt_winters_paths(values, first_months, False, coverage)
+    if values.shape[1] > 2 * SEASON_LENGTH:
+        seasonal = holt_winters_paths(values, first_months, True, coverage)
+        later = np.arange(values.shape[1]) >= 2 * SEASON_LENGTH
+        # Rows too short for a seasonal fit never reach those columns
+        for path, replacement in zip((forecast, lower, upper), seasonal):
+            path[:, later] = replacement[:, later]
+    return forecast, lower, upper
+
+
+def baseline_forecasts(values):
+    """
+    Run-rate forecasts, each (n, T) with column t forecasting month t
+
+    naive: the last closed month
+    mean: the mean of every closed month
+    blend: predict_cash_flow's 60% current run rate, 40% historical mean
+    """
+    filled = np.nan_to_num(values)
+    n, T = values.shape
+    last = np.full((n, T), np.nan)
+    mean = np.full((n, T), np.nan)
+    blend = np.full((n, T), np.nan)
+    if T < 2:
+        return {'naive': last, 'mean': mean, 'blend': blend}
+
+    cumulative = np.cumsum(filled, axis=1)
+    months = np.arange(1, T + 1)
+    last[:, 1:] = filled[:, :-1]
+    mean[:, 1:] = cumulative[:, :-1] / months[:-1]
+    blend[:, 1:] = filled[:, :-1]
+    blend[:, 2:] = 0.6 * filled[:, 1:-1] + 0.4 * cumulative[:, :-2] / months[:-2]
+    return {'naive': last, 'mean': mean, 'blend': blend}
+
+
+def score(actual, forecast, scored, lower=None, upper=None):
+    """Accuracy over the cells where scored is True"""
+    a, f = actual[scored], forecast[scored]
+    error = f - a
+    nonzero = a != 0
+    report = {
+        "n": int(scored.sum()),
+        "mae": round(float(np.abs(error).mean()), 2) if len(a) else None,
+        "mape": round(float((np.abs(error[nonzero]) / np.abs(a[nonzero])).mean() * 100), 2) if nonzero.any() else None,
+        "bias": round(float(error.mean()), 2) if len(a) else None,
+    }
+    if lower is not None:
+        inside = (a >= lower[scored]) & (a <= upper[scored])
+        report["interval_coverage"] = round(float(inside.mean()), 4) if len(a) else None
+    return report
+
+
+def run_backtest(series, min_history=BACKTEST_MIN_HISTORY, coverage=BACKTEST_COVERAGE):
+    """
+    Replay every month-end of every series and score each model
+
+    Args:
+        series: List of (first_month, 1-d array of closed monthly totals)
+        min_history: Closed months a forecast needs before it is scored
+        coverage: Nominal coverage of the prediction intervals
+
+    Returns:
+        dict: Per-model accuracy and runtime
+    """
+    if not series:
+        return {"series": 0, "forecasts": 0, "models": {}}
+
+    values, first_months, lengths = stack_series(series)
+    T = values.shape[1]
+    scored = (np.arange(T)[None, :] >= min_history) & (np.arange(T)[None, :] < lengths[:, None])
+
+    models = {}
+    started = time.perf_counter()
+    forecast, lower, upper = holt_winters_forecasts(values, first_months, coverage)
+    elapsed = time.perf_counter() - started
+    models["holt_winters"] = dict(score(values, forecast, scored, lower, upper),
+                                  nominal_coverage=coverage, seconds=round(elapsed, 4))
+
+    started = time.perf_counter()
+    baselines = baseline_forecasts(values)
+    elapsed = time.perf_counter() - started
+    for name, forecast in baselines.items():
+        models[name] = dict(score(values, forecast, scored), seconds=round(elapsed / len(baselines), 4))
+
+    return {"series": len(series), "forecasts": int(scored.sum()), "models": models}
+
+
+def user_series(monthly_rows, before_month, keys=None):
+    """(first_month, values) per series of one user, optionally limited to keys"""
+    names, first_month, values = series_matrix(monthly_rows, before_month)
+    return [(first_month, values[i]) for i, name in enumerate(names) if keys is None or name in keys]
+
+
+if __name__ == '__main__':
+    from datetime import datetime
+
+    from app import get_monthly_totals, shard_router
+
+    def users_on(shard):
+        connection = shard_router.connect(shard)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT DISTINCT user_id FROM transactions")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+
+    if any(arg in ('-h', '--help') for arg in sys.argv[1:]):
+        print(__doc__)
+        sys.exit(1)
+
+    if len(sys.argv) > 1:
+        user_ids = [int(arg) for arg in sys.argv[1:]]
+    else:
+        user_ids = [u for ids in shard_router.fan_out(users_on).values() for u in ids]
+
+    today = datetime.now()
+    current = month_index(today.year, today.month)
+    series = []
+    for user_id in user_ids:
+        connection = shard_router.connect_user(user_id)
+        try:
+            cursor = connection.cursor(dictionary=True)
+            series += user_series(get_monthly_totals(cursor, user_id), current)
+            cursor.close()
+        finally:
+            connection.close()
+
+    report = run_backtest(series)
+    print(f"{len(user_ids)} users, {report['series']} series, {report['forecasts']} forecasts")
+    for name, model in report['models'].items():
+        print(f"  {name:13} " + ", ".join(f"{k}={v}" for k, v in model.items() if k != 'n'))
@@ -0,0 +1,132 @@
+"""
+Insert throughput with one commit per row versus group commit.
+
+Run from backend/:
+    python -m benchmarks.bench_group_commit [threads] [seconds] [commit_ms] [window_ms]
+
+Uses a SQLite file in WAL mode with synchronous=FULL as the stand-in
+database, so every commit is an fsync like an InnoDB commit with
+innodb_flush_log_at_trx_commit=1. Local disks with a write cache fsync
+in well under a millisecond; commit_ms adds that much to every commit,
+serialized like flushes of a single redo log device. Each
+thread plays a request that inserts one transaction and waits for its
+acknowledgement.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_transactions
+from writebuffer import GroupCommitter
+
+
+COLUMNS = ('user_id', 'type', 'category', 'amount', 'transaction_date', 'description', 'merchant')
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=FULL")
+    return connection
+
+
+def create_schema(path):
+    connection = connect(path)
+    connection.execute(f"""CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, {', '.join(COLUMNS)})""")
+    connection.commit()
+    connection.close()
+
+
+def values(row):
+    return (1, row['type'], row['category'], str(row['amount']), str(row['transaction_date']),
+            row['description'], row['merchant'])
+
+
+def run(threads, seconds, insert):
+    rows = make_transactions(10000)
+    stop = threading.Event()
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        i = offset
+        while not stop.is_set():
+            start = time.perf_counter()
+            insert(values(rows[i % len(rows)]))
+            with lock:
+                latencies.append(time.perf_counter() - start)
+            i += threads
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in pool:
+        thread.join()
+    ms = np.array(latencies) * 1000
+    return len(latencies) / seconds, np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+def main(threads=32, seconds=5.0, commit_ms=0.0, window_ms=5.0):
+    directory = tempfile.mkdtemp()
+    log_lock = threading.Lock()
+
+    def log_flush():
+        if commit_ms:
+            with log_lock:
+                time.sleep(commit_ms / 1000)
+
+    path = os.path.join(directory, 'per_row.db')
+    create_schema(path)
+    local = threading.local()
+
+    def per_row(row):
+        if not hasattr(local, 'connection'):
+            local.connection = connect(path)
+        cursor = local.connection.execute(
+            f"INSERT INTO transactions ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+        local.connection.commit()
+        log_flush()
+        return cursor.lastrowid
+
+    results = {'per-row commit': run(threads, seconds, per_row)}
+
+    group_path = os.path.join(directory, 'group.db')
+    create_schema(group_path)
+    group_connection = connect(group_path)
+
+    def flush(key, items):
+        placeholders = ', '.join(['(?, ?, ?, ?, ?, ?, ?)'] * len(items))
+        cursor = group_connection.execute(
+            f"INSERT INTO transactions ({', '.join(COLUMNS)}) VALUES {placeholders}",
+            [value for item in items for value in item])
+        group_connection.commit()
+        log_flush()
+        last = cursor.lastrowid
+        return list(range(last - len(items) + 1, last + 1))
+
+    committer = GroupCommitter(flush, window_ms=window_ms)
+    results[f'group commit ({committer.window * 1000:.0f} ms window)'] = run(
+        threads, seconds, lambda row: committer.submit('shard', row))
+    stats = committer.stats()
+
+    print(f"{threads} concurrent writers, {seconds:.0f}s each, {commit_ms} ms added per commit")
+    print(f"{'mode':<32}{'rows/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode, (rate, p50, p99) in results.items():
+        print(f"{mode:<32}{rate:>10.0f}{p50:>10.2f}{p99:>10.2f}")
+    print(f"mean batch {stats['mean_batch_size']}, largest {stats['max_batch_size']}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if len(args) > 0 else 32,
+         float(args[1]) if len(args) > 1 else 5.0,
+         float(args[2]) if len(args) > 2 else 0.0,
+         float(args[3]) if len(args) > 3 else 5.0)
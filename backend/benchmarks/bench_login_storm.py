@@ -0,0 +1,176 @@
+"""
+CRUD latency while a burst of logins hits the server.
+
+Run from backend/ against a running API:
+    python -m benchmarks.bench_login_storm --base-url http://localhost:5000/api
+
+Phase one measures GET/POST /transactions latency alone, phase two
+repeats it while --storm threads log in back to back. With password
+hashing on its bounded pool the CRUD percentiles should barely move;
+logins beyond the pool's queue get 503 with Retry-After.
+
+Without a server, --local runs the same two phases in process: the CRUD
+stand-in encodes a transaction list (CPU work holding the GIL) and
+logins either hash inline on the request threads or go through
+auth.PasswordHasher.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import numpy as np
+
+from benchmarks.synthetic import make_transactions
+
+
+def percentiles(samples):
+    if not samples:
+        return "n/a"
+    ms = np.array(samples) * 1000
+    return (f"p50 {np.percentile(ms, 50):7.1f} ms  p95 {np.percentile(ms, 95):7.1f} ms  "
+            f"p99 {np.percentile(ms, 99):7.1f} ms  n={len(ms)}")
+
+
+def run_phase(crud, login, crud_threads, storm_threads, seconds):
+    """Run crud() and login() in loops; return CRUD latencies and login outcomes"""
+    stop = threading.Event()
+    latencies = []
+    logins = {'ok': 0, 'busy': 0, 'error': 0}
+    lock = threading.Lock()
+
+    def crud_loop():
+        while not stop.is_set():
+            start = time.perf_counter()
+            crud()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    def login_loop():
+        while not stop.is_set():
+            outcome = login()
+            with lock:
+                logins[outcome] += 1
+
+    threads = [threading.Thread(target=crud_loop) for _ in range(crud_threads)]
+    threads += [threading.Thread(target=login_loop) for _ in range(storm_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, logins
+
+
+# HTTP mode
+
+def request(base_url, method, path, body=None, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return response.status, json.loads(response.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def http_main(args):
+    password = 'storm-' + uuid.uuid4().hex[:8]
+    accounts = []
+    for i in range(args.accounts):
+        email = f"storm-{uuid.uuid4().hex[:12]}@example.com"
+        status, body = request(args.base_url, 'POST', '/auth/register',
+                               {'email': email, 'password': password, 'name': f'Storm {i}'})
+        if status != 201:
+            raise SystemExit(f"register failed with {status}")
+        accounts.append((email, body['access_token']))
+    token = accounts[0][1]
+
+    def crud():
+        request(args.base_url, 'POST', '/transactions', {
+            'type': 'expense', 'category': 'Food & Dining', 'amount': 12.5,
+            'transaction_date': time.strftime('%Y-%m-%d'), 'merchant': 'Storm Cafe'
+        }, token)
+        request(args.base_url, 'GET', '/transactions', token=token)
+
+    counter = iter(range(10 ** 9))
+
+    def login():
+        email = accounts[next(counter) % len(accounts)][0]
+        status, _ = request(args.base_url, 'POST', '/auth/login', {'email': email, 'password': password})
+        return 'ok' if status == 200 else 'busy' if status == 503 else 'error'
+
+    report(args, crud, login)
+
+
+# Local mode
+
+def local_main(args):
+    from werkzeug.security import check_password_hash, generate_password_hash
+    from auth import HashPoolBusy, PasswordHasher
+    import responses
+
+    rows = make_transactions(2000)
+    hasher = PasswordHasher()
+    pwhash = generate_password_hash('secret', hasher.method)
+
+    def crud():
+        responses.encode_json(rows)
+        json.loads(json.dumps([{k: str(v) for k, v in row.items()} for row in rows[:500]]))
+
+    def inline_login():
+        check_password_hash(pwhash, 'secret')
+        return 'ok'
+
+    def pooled_login():
+        try:
+            hasher.verify(pwhash, 'secret')
+            return 'ok'
+        except HashPoolBusy:
+            time.sleep(0.05)
+            return 'busy'
+
+    print(f"hash method {hasher.method}, pool workers {hasher.workers}")
+    print("-- logins hashed on request threads")
+    report(args, crud, inline_login)
+    print("-- logins hashed on the bounded pool")
+    report(args, crud, pooled_login)
+
+
+def report(args, crud, login):
+    baseline, _ = run_phase(crud, login, args.crud_threads, 0, args.seconds)
+    print(f"CRUD alone       {percentiles(baseline)}")
+    storm, logins = run_phase(crud, login, args.crud_threads, args.storm, args.seconds)
+    print(f"CRUD with storm  {percentiles(storm)}")
+    print(f"logins: {logins['ok']} ok, {logins['busy']} busy (503), {logins['error']} failed "
+          f"in {args.seconds:.0f}s with {args.storm} storm threads")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base-url', help="API root, e.g. http://localhost:5000/api")
+    parser.add_argument('--local', action='store_true', help="In-process run without a server")
+    parser.add_argument('--accounts', type=int, default=20)
+    parser.add_argument('--storm', type=int, default=32, help="Concurrent login threads")
+    parser.add_argument('--crud-threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    if args.local:
+        local_main(args)
+    elif args.base_url:
+        http_main(args)
+    else:
+        parser.error("pass --base-url or --local")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Serialization time and bytes on the wire for a large transaction list.
+
+Run from backend/:
+    python -m benchmarks.bench_serialization [n_rows]
+"""
+import gzip
+import sys
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import responses
+from benchmarks.synthetic import make_transactions
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(n_rows=50000):
+    rows = make_transactions(n_rows)
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+
+    default_time, default_body = best_of(lambda: default_provider.dumps(rows).encode('utf-8'))
+    fast_time, fast_body = best_of(lambda: responses.encode_json(rows))
+    payload = responses.EncodedPayload(fast_body)
+    cached_time, _ = best_of(lambda: payload.body)
+
+    print(f"rows: {n_rows}")
+    print(f"{'encoder':<28}{'ms':>10}{'bytes':>12}")
+    print(f"{'flask default':<28}{default_time * 1000:>10.1f}{len(default_body):>12}")
+    print(f"{'fast (' + ('orjson' if responses.orjson else 'json') + ')':<28}"
+          f"{fast_time * 1000:>10.1f}{len(fast_body):>12}")
+    print(f"{'cached payload':<28}{cached_time * 1000:>10.3f}{len(fast_body):>12}")
+
+    gzip_time, gzip_body = best_of(lambda: gzip.compress(fast_body, responses.GZIP_LEVEL), repeat=3)
+    print(f"{'gzip level ' + str(responses.GZIP_LEVEL):<28}{gzip_time * 1000:>10.1f}{len(gzip_body):>12}")
+    if responses.brotli is not None:
+        br_time, br_body = best_of(
+            lambda: responses.brotli.compress(fast_body, quality=responses.BROTLI_QUALITY), repeat=3
+        )
+        print(f"{'brotli quality ' + str(responses.BROTLI_QUALITY):<28}{br_time * 1000:>10.1f}{len(br_body):>12}")
+
+    # A cached payload pays the compression cost once
+    payload.variant('gzip')
+    reuse_time, _ = best_of(lambda: payload.variant('gzip'))
+    print(f"{'cached gzip variant':<28}{reuse_time * 1000:>10.3f}{len(payload.variant('gzip')):>12}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,427 @@
+"""
+Load test that replays the dashboard's request mix from many users at once.
+
+Run from backend/:
+    python -m benchmarks.loadtest --users 200 --concurrency 64 --rate 20 --duration 60
+    python -m benchmarks.loadtest --base-url http://localhost:5000/api --out run.json
+    python -m benchmarks.loadtest --compare before.json after.json
+
+Each virtual session replays what FinanceTracker.js does for a user:
+
+    POST /auth/login
+    the eight mount requests, in parallel as the browser's effects fire
+    (GET /transactions, /budgets, /goals, /analytics/dashboard,
+    /predictions/cashflow-advanced, /predictions/budget-risk,
+    /predictions/spending-insights, /notifications/unread-count); a
+    prediction that answers 202 is polled at GET /jobs/<id>?wait=20
+    until its job is done
+    a pause of --think seconds (exponential)
+    POST /transactions, then GET /budgets and GET /transactions with the
+    X-Consistency-Token the write returned
+
+The notifications long-poll that follows the unread count is left out:
+it holds a request open by design and would only measure the wait
+timeout.
+
+Sessions arrive as a Poisson process at --rate per second (open model),
+at most --concurrency at a time; an arrival that finds every slot busy
+waits, and that wait is reported separately so a saturated server shows
+up as queueing instead of hiding in the latencies. --rate 0 runs a
+closed model: --concurrency sessions back to back.
+
+The database is a stand-in: a scratch MySQL database loaded from
+database/schema.sql, migrated with `python migrate.py up` and named by
+the usual DB_* variables (or SHARDS_CONFIG). The app's SQL is MySQL,
+so SQLite can't stand in for it. Users loadtest-<n>@example.com are
+registered through the API and their ledgers are written straight to
+their shards from benchmarks.synthetic, along with a few budgets and an
+emergency-fund goal. Users that already have transactions are reused,
+so repeated runs hit the same data. Without --base-url the app is
+served in process on a threaded werkzeug server, which is one worker
+process, not gunicorn.
+
+Per endpoint the report has p50/p95/p99 latency, error rate and
+throughput, plus the time until all eight mount requests, and the jobs
+they queue, are done. The JSON written to --out (default
+loadtest-<timestamp>.json) also records the run's settings; --compare
+prints the p95 and error-rate change between two such files.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks.synthetic import EXPENSE_CATEGORIES, MERCHANTS, make_transactions
+
+PASSWORD = 'loadtest-password'
+MOUNT_REQUESTS = (
+    '/transactions',
+    '/budgets',
+    '/goals',
+    '/analytics/dashboard',
+    '/predictions/cashflow-advanced',
+    '/predictions/budget-risk',
+    '/predictions/spending-insights',
+    '/notifications/unread-count',
+)
+# Browsers open at most this many connections per host over HTTP/1.1
+BROWSER_CONNECTIONS = 6
+# Seconds each job poll may be held open, as in the dashboard
+JOB_POLL_WAIT = 20
+SEED_BATCH = 1000
+SEED_BUDGETS = ('Food & Dining', 'Shopping', 'Entertainment', 'Transportation')
+
+
+def email_for(n):
+    return f"loadtest-{n}@example.com"
+
+
+# HTTP
+
+def request(base_url, method, path, body=None, token=None, headers=None, timeout=60):
+    """(status, parsed body, response headers); status 0 for a connection failure"""
+    all_headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'}
+    if token:
+        all_headers['Authorization'] = f'Bearer {token}'
+    all_headers.update(headers or {})
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, headers=all_headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            raw = response.read()
+            status, response_headers = response.status, response.headers
+    except urllib.error.HTTPError as e:
+        raw, status, response_headers = e.read(), e.code, e.headers
+    except (urllib.error.URLError, OSError):
+        return 0, None, {}
+
+    if response_headers.get('Content-Encoding') == 'gzip':
+        raw = gzip.decompress(raw)
+    try:
+        parsed = json.loads(raw) if raw else None
+    except ValueError:
+        parsed = None
+    return status, parsed, response_headers
+
+
+class Recorder:
+    """Latency and outcome of every request, by endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # endpoint -> ([seconds], [ok])
+        self.mount = []
+        self.queue_delays = []
+        self.sessions = 0
+        self.failed_sessions = 0
+
+    def call(self, base_url, method, path, endpoint=None, **kwargs):
+        started = time.perf_counter()
+        status, body, headers = request(base_url, method, path, **kwargs)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            latencies, outcomes = self.samples.setdefault(endpoint or f"{method} {path}", ([], []))
+            latencies.append(elapsed)
+            outcomes.append(200 <= status < 300)
+        return status, body, headers
+
+    def session(self, mount_seconds, queued, ok):
+        with self._lock:
+            self.sessions += 1
+            self.failed_sessions += not ok
+            self.queue_delays.append(queued)
+            if mount_seconds is not None:
+                self.mount.append(mount_seconds)
+
+
+# Sessions
+
+def run_session(base_url, recorder, user, think, rng, browser):
+    """One login, dashboard mount and add-transaction; returns (mount seconds, ok)"""
+    status, body, _ = recorder.call(base_url, 'POST', '/auth/login',
+                                    body={'email': user, 'password': PASSWORD})
+    if status != 200:
+        return None, False
+    token = body['access_token']
+
+    def mount(path):
+        status, body, _ = recorder.call(base_url, 'GET', path, token=token)
+        if status != 202:
+            return status
+        # A queued prediction: poll its job until it is done
+        while True:
+            status, job, _ = recorder.call(base_url, 'GET', f"/jobs/{body['job_id']}?wait={JOB_POLL_WAIT}",
+                                           endpoint='GET /jobs/<id>', token=token)
+            if status != 200 or job['status'] == 'failed':
+                return status if status != 200 else 500
+            if job['status'] == 'done':
+                return status
+
+    started = time.perf_counter()
+    mounted = list(browser.map(mount, MOUNT_REQUESTS))
+    mount_seconds = time.perf_counter() - started
+    ok = all(200 <= status < 300 for status in mounted)
+
+    time.sleep(rng.expovariate(1 / think) if think > 0 else 0)
+
+    status, _, headers = recorder.call(base_url, 'POST', '/transactions', token=token, body={
+        'type': 'expense',
+        'category': rng.choice(EXPENSE_CATEGORIES),
+        'amount': round(rng.lognormvariate(6.0, 1.0), 2),
+        'transaction_date': date.today().isoformat(),
+        'description': '',
+        'merchant': rng.choice(MERCHANTS),
+    })
+    ok &= status == 201
+    consistency = headers.get('X-Consistency-Token')
+    read_headers = {'X-Consistency-Token': consistency} if consistency else None
+
+    status, _, _ = recorder.call(base_url, 'GET', '/budgets', endpoint='GET /budgets (refetch)', token=token)
+    ok &= status == 200
+    status, _, _ = recorder.call(base_url, 'GET', '/transactions', endpoint='GET /transactions (refetch)',
+                                 token=token, headers=read_headers)
+    ok &= status == 200
+    return mount_seconds, ok
+
+
+def run_load(base_url, users, concurrency, rate, duration, think, seed=0):
+    """Drive sessions for duration seconds; returns the Recorder and the wall time"""
+    recorder = Recorder()
+    slots = threading.BoundedSemaphore(concurrency)
+    stop_at = time.perf_counter() + duration
+    rng = random.Random(seed)
+    browsers = ThreadPoolExecutor(max_workers=concurrency * BROWSER_CONNECTIONS, thread_name_prefix='browser')
+
+    class Browser:
+        # Caps one session's parallel requests like a browser's connection limit
+        def map(self, fn, items):
+            limit = threading.Semaphore(BROWSER_CONNECTIONS)
+
+            def limited(item):
+                with limit:
+                    return fn(item)
+            return browsers.map(limited, items)
+
+    def session(arrived, session_seed):
+        queued = time.perf_counter() - arrived
+        session_rng = random.Random(session_seed)
+        try:
+            mount_seconds, ok = run_session(base_url, recorder, session_rng.choice(users), think,
+                                            session_rng, Browser())
+        except Exception as e:
+            print(f"session failed: {e}")
+            mount_seconds, ok = None, False
+        finally:
+            slots.release()
+        recorder.session(mount_seconds, queued, ok)
+
+    started = time.perf_counter()
+    threads = []
+    if rate > 0:
+        next_arrival = started
+        while next_arrival < stop_at:
+            time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            arrived = next_arrival
+            slots.acquire()
+            thread = threading.Thread(target=session, args=(arrived, rng.random()), daemon=True)
+            thread.start()
+            threads.append(thread)
+            next_arrival += rng.expovariate(rate)
+    else:
+        def closed_loop(worker):
+            loop_rng = random.Random(seed + worker)
+            while time.perf_counter() < stop_at:
+                slots.acquire()
+                session(time.perf_counter(), loop_rng.random())
+
+        threads = [threading.Thread(target=closed_loop, args=(i,), daemon=True) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    browsers.shutdown()
+    return recorder, elapsed
+
+
+# Report
+
+def summarize(samples, elapsed):
+    latencies, outcomes = samples
+    ms = np.asarray(latencies) * 1000
+    errors = len(outcomes) - sum(outcomes)
+    return {
+        'requests': len(ms),
+        'errors': errors,
+        'error_rate': round(errors / len(ms), 4) if len(ms) else None,
+        'throughput_rps': round(len(ms) / elapsed, 2),
+        'p50_ms': round(float(np.percentile(ms, 50)), 1) if len(ms) else None,
+        'p95_ms': round(float(np.percentile(ms, 95)), 1) if len(ms) else None,
+        'p99_ms': round(float(np.percentile(ms, 99)), 1) if len(ms) else None,
+    }
+
+
+def build_report(recorder, elapsed, settings):
+    endpoints = {name: summarize(samples, elapsed) for name, samples in sorted(recorder.samples.items())}
+    everything = ([], [])
+    for latencies, outcomes in recorder.samples.values():
+        everything[0].extend(latencies)
+        everything[1].extend(outcomes)
+    return {
+        'settings': settings,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(time.time() - elapsed)),
+        'seconds': round(elapsed, 2),
+        'sessions': recorder.sessions,
+        'failed_sessions': recorder.failed_sessions,
+        'sessions_per_second': round(recorder.sessions / elapsed, 2),
+        'overall': summarize(everything, elapsed),
+        'dashboard_mount': summarize((recorder.mount, [True] * len(recorder.mount)), elapsed),
+        'queue_delay': summarize((recorder.queue_delays, [True] * len(recorder.queue_delays)), elapsed),
+        'endpoints': endpoints,
+    }
+
+
+def print_report(report):
+    print(f"{report['sessions']} sessions ({report['failed_sessions']} with errors) in {report['seconds']}s, "
+          f"{report['sessions_per_second']} sessions/s, {report['overall']['throughput_rps']} requests/s")
+    print(f"{'':38} {'n':>6} {'err%':>6} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    rows = [('dashboard mount (all 7)', report['dashboard_mount']), ('queue delay', report['queue_delay'])]
+    rows += list(report['endpoints'].items()) + [('all requests', report['overall'])]
+    for name, stats in rows:
+        if not stats['requests']:
+            continue
+        print(f"{name:38} {stats['requests']:6d} {stats['error_rate'] * 100:6.2f} {stats['throughput_rps']:7.2f} "
+              f"{stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} {stats['p99_ms']:8.1f}")
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def change(old, new):
+        if old is None or new is None:
+            return 'n/a'
+        return f"{new - old:+.1f}" if not old else f"{new - old:+.1f} ({(new - old) / old * 100:+.0f}%)"
+
+    print(f"{'':38} {'p95 ms':>22} {'err%':>14}")
+    names = ['dashboard_mount'] + sorted(set(before['endpoints']) | set(after['endpoints'])) + ['overall']
+    for name in names:
+        old = before.get(name) or before['endpoints'].get(name) or {}
+        new = after.get(name) or after['endpoints'].get(name) or {}
+        old_error = (old.get('error_rate') or 0) * 100
+        new_error = (new.get('error_rate') or 0) * 100
+        print(f"{name:38} {change(old.get('p95_ms'), new.get('p95_ms')):>22} {new_error - old_error:+13.2f}")
+
+
+# Setup
+
+def seed_users(base_url, count, rows):
+    """Register count users with synthetic ledgers (reusing existing ones); returns their emails"""
+    from app import shard_router
+
+    today = date.today()
+    for n in range(count):
+        email = email_for(n)
+        status, body, _ = request(base_url, 'POST', '/auth/register',
+                                  {'email': email, 'password': PASSWORD, 'name': f'Load Test {n}'})
+        if status == 409:
+            status, body, _ = request(base_url, 'POST', '/auth/login', {'email': email, 'password': PASSWORD})
+        if status not in (200, 201):
+            raise SystemExit(f"could not register or log in {email}: HTTP {status}")
+        user_id, token = body['user']['id'], body['access_token']
+
+        connection = shard_router.connect_user(user_id, for_write=True)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT COUNT(*) FROM transactions WHERE user_id = %s", (user_id,))
+            if cursor.fetchone()[0]:
+                continue
+            ledger = make_transactions(rows, user_id=user_id, seed=n)
+            values = [(user_id, r['type'], r['category'], r['amount'], r['transaction_date'],
+                       r['description'], r['merchant']) for r in ledger]
+            for i in range(0, len(values), SEED_BATCH):
+                cursor.executemany("""
+                    INSERT INTO transactions
+                    (user_id, type, category, amount, transaction_date, description, merchant)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, values[i:i + SEED_BATCH])
+                connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+
+        # Budgets near the user's typical monthly spend, so some are at risk
+        spend = {}
+        for r in ledger:
+            if r['type'] == 'expense' and r['transaction_date'] >= today - timedelta(days=90):
+                spend[r['category']] = spend.get(r['category'], 0) + float(r['amount']) / 3
+        for category in SEED_BUDGETS:
+            request(base_url, 'POST', '/budgets', {'category': category,
+                                                   'limit_amount': round(spend.get(category, 500) * 1.1, 2)}, token)
+        request(base_url, 'POST', '/goals', {'goal_name': 'Emergency fund', 'target_amount': 300000,
+                                             'current_amount': 50000,
+                                             'deadline': (today + timedelta(days=365)).isoformat()}, token)
+        if (n + 1) % 50 == 0:
+            print(f"seeded {n + 1}/{count} users")
+    return [email_for(n) for n in range(count)]
+
+
+def serve_in_process():
+    """Start the app on a threaded werkzeug server; returns its API root"""
+    os.environ.setdefault('JWT_SECRET_KEY', 'loadtest')
+    from werkzeug.serving import make_server
+    from app import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/api"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base-url', help="API root of a running server; default serves the app in process")
+    parser.add_argument('--users', type=int, default=100, help="Seeded users sessions pick from")
+    parser.add_argument('--rows', type=int, default=1000, help="Transactions per seeded user")
+    parser.add_argument('--concurrency', type=int, default=32, help="Sessions in flight at most")
+    parser.add_argument('--rate', type=float, default=10, help="Session arrivals per second; 0 for a closed loop")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds to keep starting sessions")
+    parser.add_argument('--think', type=float, default=2, help="Mean pause before adding a transaction")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="Results file (default loadtest-<timestamp>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Compare two results files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    base_url = args.base_url or serve_in_process()
+    users = seed_users(base_url, args.users, args.rows)
+    print(f"{len(users)} users ready, running for {args.duration:.0f}s against {base_url}")
+
+    recorder, elapsed = run_load(base_url, users, args.concurrency, args.rate, args.duration, args.think, args.seed)
+    settings = {k: v for k, v in vars(args).items() if k not in ('compare', 'out')}
+    settings['base_url'] = base_url if args.base_url else 'in-process'
+    report = build_report(recorder, elapsed, settings)
+    print_report(report)
+
+    out = args.out or time.strftime('loadtest-%Y%m%d-%H%M%S.json')
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {out}")
+
+
+if __name__ == '__main__':
+    main()
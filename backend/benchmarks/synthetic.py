@@ -0,0 +1,75 @@
+"""
+Synthetic ledgers shaped like rows from the transactions table, used by
+the benchmarks and the load-testing harness
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+EXPENSE_CATEGORIES = [
+    'Food & Dining', 'Transportation', 'Shopping', 'Entertainment', 'Utilities',
+    'Healthcare', 'Education', 'Travel', 'Insurance', 'Subscriptions', 'Other'
+]
+INCOME_CATEGORIES = ['Salary', 'Freelance', 'Investments', 'Other Income']
+MERCHANTS = [
+    'Swiggy', 'Zomato', 'Uber', 'Ola', 'Amazon', 'Flipkart', 'Netflix', 'Spotify',
+    'BigBasket', 'Reliance Digital', 'Apollo Pharmacy', 'IRCTC', 'Airtel', 'Jio',
+    'Starbucks', 'PVR Cinemas', 'Decathlon', 'Myntra', 'Tata Power', 'LIC'
+]
+
+
+def make_transactions(n_rows, user_id=1, end_date=None, years=3, seed=0):
+    """
+    Generate n_rows transaction dicts as returned by a dictionary cursor
+
+    Args:
+        n_rows: Number of rows to generate
+        user_id: Owner of the rows
+        end_date: Last possible transaction date (defaults to today)
+        years: How far back the history goes
+        seed: RNG seed so runs are comparable
+
+    Returns:
+        list: Row dicts with Decimal amounts and date/datetime columns
+    """
+    rng = np.random.default_rng(seed)
+    end_date = end_date or date.today()
+    span = 365 * years
+    offsets = rng.integers(0, span, n_rows)
+    is_income = rng.random(n_rows) < 0.08
+    expense_cat = rng.integers(0, len(EXPENSE_CATEGORIES), n_rows)
+    income_cat = rng.integers(0, len(INCOME_CATEGORIES), n_rows)
+    merchant = rng.integers(0, len(MERCHANTS), n_rows)
+    expense_amount = np.round(rng.lognormal(6.0, 1.0, n_rows), 2)
+    income_amount = np.round(rng.normal(60000, 8000, n_rows).clip(1000), 2)
+
+    rows = []
+    created = datetime.combine(end_date, datetime.min.time())
+    for i in range(n_rows):
+        income = bool(is_income[i])
+        tx_date = end_date - timedelta(days=int(offsets[i]))
+        rows.append({
+            'id': i + 1,
+            'user_id': user_id,
+            'type': 'income' if income else 'expense',
+            'category': INCOME_CATEGORIES[income_cat[i]] if income else EXPENSE_CATEGORIES[expense_cat[i]],
+            'amount': Decimal(f"{income_amount[i] if income else expense_amount[i]:.2f}"),
+            'transaction_date': tx_date,
+            'description': None if income else f"Purchase #{i}",
+            'merchant': None if income else MERCHANTS[merchant[i]],
+            'created_at': created,
+            'updated_at': created,
+        })
+    rows.sort(key=lambda r: r['transaction_date'], reverse=True)
+    return rows
+
+
+def make_transactions_df(n_rows, **kwargs):
+    """Same ledger in the shape returned by get_user_transactions_df"""
+    rows = make_transactions(n_rows, **kwargs)
+    df = pd.DataFrame(rows).rename(columns={'transaction_date': 'date'})
+    df = df[['id', 'date', 'amount', 'type', 'category', 'merchant', 'description']]
+    df['amount'] = df['amount'].astype(float)
+    return df
@@ -0,0 +1,406 @@
+"""
+Transaction auto-categorization.
+
+    python categorize.py retrain <user_id>
+    python categorize.py train-global
+
+Each user gets a multinomial naive Bayes model over hashed character
+n-grams of "type merchant description". Naive Bayes is linear in the
+features and its sufficient statistics are per-class feature counts, so
+training is incremental: a model remembers the last transaction id it
+learned from and folds in newer rows the next time it is used. New
+categories simply add a row.
+
+Edits and deletes can't be caught up by id, so they are logged in
+category_corrections (record_correction) with the old text and
+category. Because the counts are plain sums, a model that had already
+learned the row subtracts the old example and adds the new one, and
+every worker's model applies the log the same way.
+
+A global model trained on every user's ledger answers when the user's
+own model is too young or not confident. Models are cached per process
+and persisted with joblib under MODEL_DIR/categorizer.
+"""
+import os
+import re
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+MODEL_DIR = os.environ.get('MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+CATEGORIZER_FEATURES = 2 ** 18
+CATEGORIZER_CACHE_USERS = int(os.environ.get('CATEGORIZER_CACHE_USERS', 256))
+CATEGORIZER_SAVE_EVERY = int(os.environ.get('CATEGORIZER_SAVE_EVERY', 25))
+CATEGORIZE_MIN_EXAMPLES = int(os.environ.get('CATEGORIZE_MIN_EXAMPLES', 20))
+CATEGORIZE_MIN_CONFIDENCE = float(os.environ.get('CATEGORIZE_MIN_CONFIDENCE', 0.5))
+
+_DIGITS = re.compile(r'\d+')
+
+
+_vectorizer = HashingVectorizer(
+    analyzer='char_wb',
+    ngram_range=(3, 5),
+    n_features=CATEGORIZER_FEATURES,
+    lowercase=False,
+    alternate_sign=False,
+    norm=None,
+    dtype=np.float32,
+)
+
+
+def transaction_text(type_, merchant, description):
+    # Reference numbers ("Purchase #4821") carry no category signal, and
+    # folding them makes repeated imports collapse to one distinct text
+    return _DIGITS.sub('0', f"{type_ or ''} {merchant or ''} {description or ''}".lower())
+
+
+def vectorize(texts):
+    return _vectorizer.transform(texts)
+
+
+class CategoryModel:
+    """
+    Multinomial naive Bayes kept as sparse per-class feature counts.
+
+    Scoring a row is X @ W.T + |X| * bias + prior, where W = log1p(C / alpha)
+    only has entries where a class has seen a feature; the smoothing mass
+    of unseen features folds into the per-class bias.
+    """
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.classes = []
+        self.counts = sp.csr_matrix((0, CATEGORIZER_FEATURES), dtype=np.float64)
+        self.class_examples = np.zeros(0)
+        self.trained_through = 0
+        self.corrected_through = 0
+        self.n_examples = 0
+        self._compiled = None
+
+    def partial_fit(self, texts, labels, last_id=None):
+        """
+        Fold labelled examples into the counts
+
+        Args:
+            texts: Output of transaction_text for each example
+            labels: Category of each example
+            last_id: Highest transaction id in this batch
+        """
+        if len(texts):
+            index = {c: i for i, c in enumerate(self.classes)}
+            for label in labels:
+                if label not in index:
+                    index[label] = len(self.classes)
+                    self.classes.append(label)
+
+            k = len(self.classes)
+            rows = np.fromiter((index[label] for label in labels), dtype=np.int64, count=len(labels))
+            onehot = sp.csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))), shape=(k, len(rows)))
+            counts = self.counts
+            if counts.shape[0] < k:
+                counts = sp.vstack([counts, sp.csr_matrix((k - counts.shape[0], CATEGORIZER_FEATURES))]).tocsr()
+            self.counts = counts + (onehot @ vectorize(texts)).tocsr()
+
+            examples = np.zeros(k)
+            examples[:len(self.class_examples)] = self.class_examples
+            self.class_examples = examples + np.bincount(rows, minlength=k)
+            self.n_examples += len(texts)
+            self._compiled = None
+
+        if last_id is not None:
+            self.trained_through = max(self.trained_through, int(last_id))
+
+    def unlearn(self, texts, labels):
+        """Take previously learned examples back out of the counts"""
+        index = {c: i for i, c in enumerate(self.classes)}
+        known = [j for j, label in enumerate(labels) if label in index]
+        if not known:
+            return
+
+        k = len(self.classes)
+        rows = np.fromiter((index[labels[j]] for j in known), dtype=np.int64, count=len(known))
+        onehot = sp.csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))), shape=(k, len(rows)))
+        counts = (self.counts - onehot @ vectorize([texts[j] for j in known])).tocsr()
+        np.maximum(counts.data, 0, out=counts.data)
+        counts.eliminate_zeros()
+        self.counts = counts
+
+        self.class_examples = np.maximum(self.class_examples - np.bincount(rows, minlength=k), 0)
+        self.n_examples = max(self.n_examples - len(known), 0)
+        self._compiled = None
+
+    def _weights(self):
+        if self._compiled is None:
+            weights = self.counts.copy()
+            weights.data = np.log1p(weights.data / self.alpha)
+            totals = np.asarray(self.counts.sum(axis=1)).ravel()
+            bias = np.log(self.alpha) - np.log(totals + self.alpha * CATEGORIZER_FEATURES)
+            prior = np.log((self.class_examples + 1) / (self.n_examples + len(self.classes)))
+            self._compiled = (weights.T.tocsr().astype(np.float32), bias, prior)
+        return self._compiled
+
+    def predict(self, texts):
+        """
+        Returns:
+            tuple: (list of categories, ndarray of probabilities)
+        """
+        if not self.classes or not len(texts):
+            return [None] * len(texts), np.zeros(len(texts))
+
+        weights, bias, prior = self._weights()
+        X = vectorize(texts)
+        scores = (X @ weights).toarray() + np.asarray(X.sum(axis=1)) * bias + prior
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        best = scores.argmax(axis=1)
+        confidence = scores[np.arange(len(best)), best] / scores.sum(axis=1)
+        return [self.classes[i] for i in best], confidence
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_compiled'] = None
+        return state
+
+
+class Categorizer:
+    """Per-user models with a global fallback, cached in memory and on disk"""
+
+    def __init__(self, model_dir=MODEL_DIR, cache_users=CATEGORIZER_CACHE_USERS):
+        self.model_dir = os.path.join(model_dir, 'categorizer')
+        self.cache_users = cache_users
+        self._models = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._global = None
+        self._global_mtime = None
+
+    def _path(self, name):
+        return os.path.join(self.model_dir, f"{name}.joblib")
+
+    def _save(self, name, model):
+        os.makedirs(self.model_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.model_dir, suffix='.tmp')
+        os.close(fd)
+        joblib.dump(model, tmp)
+        os.replace(tmp, self._path(name))
+
+    def _load(self, name):
+        try:
+            return joblib.load(self._path(name))
+        except FileNotFoundError:
+            return None
+
+    def global_model(self):
+        """The global model, reloaded when train-global replaces the file"""
+        try:
+            mtime = os.stat(self._path('global')).st_mtime
+        except FileNotFoundError:
+            return None
+        if mtime != self._global_mtime:
+            self._global = self._load('global')
+            self._global_mtime = mtime
+        return self._global
+
+    def user_model(self, cursor, user_id):
+        """The user's model, caught up with transactions added since it was last used"""
+        with self._lock:
+            lock = self._locks.setdefault(user_id, threading.Lock())
+
+        with lock:
+            with self._lock:
+                model = self._models.get(user_id)
+                if model is not None:
+                    self._models.move_to_end(user_id)
+            if model is None:
+                model = self._load(f"user-{user_id}") or CategoryModel()
+
+            learned = self.catch_up(cursor, user_id, model)
+            if learned >= CATEGORIZER_SAVE_EVERY or (learned and model.n_examples == learned):
+                self._save(f"user-{user_id}", model)
+
+            with self._lock:
+                self._models[user_id] = model
+                self._models.move_to_end(user_id)
+                while len(self._models) > self.cache_users:
+                    evicted, _ = self._models.popitem(last=False)
+                    self._locks.pop(evicted, None)
+        return model
+
+    @staticmethod
+    def catch_up(cursor, user_id, model):
+        """
+        Apply the user's logged corrections, then train model on their
+        transactions newer than model.trained_through
+
+        Returns:
+            int: Number of examples learned or corrected
+        """
+        # Corrections first: a row the model hasn't learned yet is read
+        # below with its current category, so only older rows need fixing
+        cursor.execute(
+            """SELECT id, transaction_id, old_text, old_category, new_text, new_category
+            FROM category_corrections
+            WHERE user_id = %s AND id > %s
+            ORDER BY id""",
+            (user_id, getattr(model, 'corrected_through', 0))
+        )
+        corrections = [
+            c if isinstance(c, dict) else dict(zip(
+                ('id', 'transaction_id', 'old_text', 'old_category', 'new_text', 'new_category'), c))
+            for c in cursor.fetchall()
+        ]
+        learned = [c for c in corrections if c['transaction_id'] <= model.trained_through]
+        if learned:
+            model.unlearn([c['old_text'] for c in learned], [c['old_category'] for c in learned])
+            relearn = [c for c in learned if c['new_category'] is not None]
+            model.partial_fit([c['new_text'] for c in relearn], [c['new_category'] for c in relearn])
+        if corrections:
+            model.corrected_through = corrections[-1]['id']
+
+        cursor.execute(
+            """SELECT id, type, merchant, description, category FROM transactions
+            WHERE user_id = %s AND id > %s
+            ORDER BY id""",
+            (user_id, model.trained_through)
+        )
+        rows = cursor.fetchall()
+        if model.trained_through == 0:
+            from archive import load_cold_rows
+            rows = load_cold_rows(cursor, user_id) + rows
+        if not rows:
+            return len(learned)
+
+        rows = [r if isinstance(r, dict) else dict(zip(('id', 'type', 'merchant', 'description', 'category'), r))
+                for r in rows]
+        model.partial_fit(
+            [transaction_text(r['type'], r['merchant'], r['description']) for r in rows],
+            [r['category'] for r in rows],
+            last_id=max(r['id'] for r in rows)
+        )
+        return len(learned) + len(rows)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._models.pop(user_id, None)
+
+    def categorize(self, cursor, user_id, items):
+        """
+        Suggest a category for each item
+
+        Args:
+            cursor: Cursor on the user's shard
+            user_id: Owner of the ledger
+            items: Dicts with type, merchant and description
+
+        Returns:
+            list: Dicts with category, confidence and source ('user', 'global' or None)
+        """
+        texts = [transaction_text(i.get('type'), i.get('merchant'), i.get('description')) for i in items]
+        if not texts:
+            return []
+
+        # Imports repeat the same few merchants; score each distinct text once
+        unique, inverse = np.unique(np.array(texts, dtype=object), return_inverse=True)
+        unique = list(unique)
+
+        user = self.user_model(cursor, user_id)
+        labels, confidence = user.predict(unique)
+        source = np.full(len(unique), 'user' if user.classes else None, dtype=object)
+
+        fallback = self.global_model()
+        if fallback is not None and fallback.classes:
+            weak = np.flatnonzero(
+                (user.n_examples < CATEGORIZE_MIN_EXAMPLES) | (confidence < CATEGORIZE_MIN_CONFIDENCE)
+            )
+            if len(weak):
+                global_labels, global_confidence = fallback.predict([unique[i] for i in weak])
+                for j, i in enumerate(weak):
+                    if labels[i] is None or global_confidence[j] > confidence[i]:
+                        labels[i] = global_labels[j]
+                        confidence[i] = global_confidence[j]
+                        source[i] = 'global'
+
+        return [
+            {'category': labels[i], 'confidence': round(float(confidence[i]), 3), 'source': source[i]}
+            for i in inverse.ravel()
+        ]
+
+
+def record_correction(cursor, user_id, transaction_id, old, new=None):
+    """
+    Log an edit (new is the updated row) or delete (new is None) of a
+    transaction for the categorizer to relearn. Call it in the same
+    database transaction as the write.
+    """
+    old_text = transaction_text(old.get('type'), old.get('merchant'), old.get('description'))
+    new_text = new_category = None
+    if new is not None:
+        new_text = transaction_text(new.get('type'), new.get('merchant'), new.get('description'))
+        new_category = new.get('category')
+        if (new_text, new_category) == (old_text, old.get('category')):
+            return
+    cursor.execute(
+        """INSERT INTO category_corrections
+        (user_id, transaction_id, old_text, old_category, new_text, new_category)
+        VALUES (%s, %s, %s, %s, %s, %s)""",
+        (user_id, transaction_id, old_text, old.get('category'), new_text, new_category)
+    )
+
+
+def train_global(router, sample_per_user=2000):
+    """
+    Fit the global model on up to sample_per_user recent rows of every user
+
+    Returns:
+        CategoryModel
+    """
+    def rows_on(shard):
+        connection = router.connect(shard)
+        try:
+            cursor = connection.cursor()
+            cursor.execute(router.sql(shard, """
+                SELECT type, merchant, description, category FROM (
+                    SELECT type, merchant, description, category,
+                        ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id DESC) AS rn
+                    FROM transactions
+                ) ranked
+                WHERE rn <= %s"""), (sample_per_user,))
+            return cursor.fetchall()
+        finally:
+            connection.close()
+
+    model = CategoryModel()
+    for rows in router.fan_out(rows_on).values():
+        if rows:
+            model.partial_fit([transaction_text(t, m, d) for t, m, d, _ in rows], [r[3] for r in rows])
+    return model
+
+
+if __name__ == '__main__':
+    from app import shard_router
+
+    categorizer = Categorizer()
+    if len(sys.argv) == 2 and sys.argv[1] == 'train-global':
+        model = train_global(shard_router)
+        categorizer._save('global', model)
+        print(f"global model: {model.n_examples} examples, {len(model.classes)} categories")
+    elif len(sys.argv) == 3 and sys.argv[1] == 'retrain':
+        user_id = int(sys.argv[2])
+        connection = shard_router.connect_user(user_id)
+        try:
+            model = CategoryModel()
+            learned = Categorizer.catch_up(connection.cursor(dictionary=True), user_id, model)
+            categorizer._save(f"user-{user_id}", model)
+            print(f"user {user_id}: {learned} examples, {len(model.classes)} categories")
+        finally:
+            connection.close()
+    else:
+        print(__doc__)
+        sys.exit(1)
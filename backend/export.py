@@ -0,0 +1,157 @@
+import csv
+import io
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - csv export still works
+    pa = None
+    pq = None
+
+
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 10000))
+
+# Exportable columns in output order; the arrow type is used for arrow/parquet
+EXPORT_COLUMNS = {
+    'id': 'int64',
+    'type': 'string',
+    'category': 'string',
+    'amount': 'decimal',
+    'transaction_date': 'date',
+    'description': 'string',
+    'merchant': 'string',
+    'created_at': 'timestamp',
+    'currency': 'string',
+}
+
+
+def arrow_available():
+    return pa is not None
+
+
+def parse_columns(value):
+    """
+    Validate a comma separated column list from the query string
+
+    Args:
+        value: e.g. "transaction_date,amount,category" or None for all columns
+
+    Returns:
+        list: Column names in the requested order
+
+    Raises:
+        ValueError: If a column is not exportable
+    """
+    if not value:
+        return list(EXPORT_COLUMNS)
+
+    columns = [c.strip() for c in value.split(',') if c.strip()]
+    unknown = [c for c in columns if c not in EXPORT_COLUMNS]
+    if unknown or not columns:
+        raise ValueError(f"Unknown export columns: {', '.join(unknown) or value}")
+    return columns
+
+
+def iter_chunks(cursor, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of row tuples from an unbuffered cursor"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def stream_csv(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _arrow_type(kind):
+    return {
+        'int64': pa.int64(),
+        'string': pa.string(),
+        'decimal': pa.decimal128(10, 2),
+        'date': pa.date32(),
+        'timestamp': pa.timestamp('s'),
+    }[kind]
+
+
+def _arrow_schema(columns):
+    return pa.schema([(c, _arrow_type(EXPORT_COLUMNS[c])) for c in columns])
+
+
+def _record_batch(rows, schema):
+    arrays = [
+        pa.array([row[i] for row in rows], type=field.type)
+        for i, field in enumerate(schema)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def stream_arrow(chunks, columns):
+    schema = _arrow_schema(columns)
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema) as writer:
+        for rows in chunks:
+            writer.write_batch(_record_batch(rows, schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def stream_parquet(chunks, columns):
+    # Each chunk becomes one row group, so only the footer grows with row count
+    schema = _arrow_schema(columns)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='snappy') as writer:
+        for rows in chunks:
+            writer.write_batch(_record_batch(rows, schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# format -> (mimetype, file extension, encoder, needs pyarrow)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv', stream_csv, False),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows', stream_arrow, True),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', stream_parquet, True),
+}
@@ -0,0 +1,357 @@
+import json
+from itertools import product
+
+import numpy as np
+from scipy.stats import norm
+
+SEASON_LENGTH = 12
+RECENT_MONTHS = 12
+
+# Smoothing parameter grid searched by the batch fit (alpha, beta, gamma)
+PARAM_GRID = np.array(list(product(
+    (0.1, 0.3, 0.5, 0.8),
+    (0.0, 0.05, 0.2),
+    (0.05, 0.2, 0.4),
+)))
+
+
+def month_index(year, month):
+    """Months since year 0, so consecutive calendar months differ by one"""
+    return year * 12 + month - 1
+
+
+def month_label(index):
+    return f"{index // 12}-{index % 12 + 1:02}"
+
+
+class SeriesState:
+    """
+    Additive Holt-Winters state for one monthly series.
+
+    Seasonal factors are indexed by calendar month (0 = January) so the
+    December factor is always seasonal[11]. Updating with a closed month
+    and forecasting are both O(1).
+    """
+
+    __slots__ = ('level', 'trend', 'seasonal', 'alpha', 'beta', 'gamma',
+                 'sse', 'n_errors', 'open_total', 'recent')
+
+    def __init__(self, level=0.0, trend=0.0, seasonal=None, alpha=0.3, beta=0.05,
+                 gamma=0.0, sse=0.0, n_errors=0, open_total=0.0, recent=None):
+        self.level = float(level)
+        self.trend = float(trend)
+        self.seasonal = [float(s) for s in seasonal] if seasonal is not None else [0.0] * SEASON_LENGTH
+        self.alpha = float(alpha)
+        self.beta = float(beta)
+        self.gamma = float(gamma)
+        self.sse = float(sse)
+        self.n_errors = int(n_errors)
+        self.open_total = float(open_total)
+        self.recent = list(recent or [])
+
+    def close_month(self, season):
+        """Fold the open month's total into the smoothing state"""
+        y = self.open_total
+        error = y - (self.level + self.trend + self.seasonal[season])
+        self.sse += error * error
+        self.n_errors += 1
+
+        previous_level = self.level
+        self.level = self.alpha * (y - self.seasonal[season]) + (1 - self.alpha) * (self.level + self.trend)
+        self.trend = self.beta * (self.level - previous_level) + (1 - self.beta) * self.trend
+        self.seasonal[season] = self.gamma * (y - self.level) + (1 - self.gamma) * self.seasonal[season]
+
+        self.recent.append(round(y, 2))
+        del self.recent[:-RECENT_MONTHS]
+        self.open_total = 0.0
+
+    def forecast(self, steps, season, coverage=0.95):
+        """
+        Point forecast and prediction interval `steps` months after the last closed month
+
+        Args:
+            steps: 1 for the open month, 2 for the month after, ...
+            season: Calendar month index (0-11) of the target month
+            coverage: Prediction interval coverage
+
+        Returns:
+            tuple: (forecast, lower, upper)
+        """
+        point = self.level + steps * self.trend + self.seasonal[season]
+        sigma2 = self.sse / self.n_errors if self.n_errors else 0.0
+
+        # ETS(A,A,A) h-step variance
+        factor = 1.0
+        for j in range(1, steps):
+            c = self.alpha * (1 + j * self.beta) + (self.gamma if j % SEASON_LENGTH == 0 else 0.0)
+            factor += c * c
+        half_width = norm.ppf(0.5 + coverage / 2) * np.sqrt(sigma2 * factor)
+
+        return point, point - float(half_width), point + float(half_width)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class ForecastState:
+    """
+    Per-user bundle of series states sharing one calendar.
+
+    `open_month` is the month still accumulating transactions; every month
+    before it has been folded into the smoothing state. Amounts dated in a
+    later month wait in `scheduled` ({month_index: {series key: total}})
+    until that month opens. `ledger_version` and `currency` record which
+    ledger the state reflects, and in which currency, so stale state can
+    be refit.
+    """
+
+    def __init__(self, open_month, series=None, ledger_version=0, closed_months=0, scheduled=None,
+                 currency=None):
+        self.open_month = open_month
+        self.series = series or {}
+        self.ledger_version = ledger_version
+        self.closed_months = closed_months
+        self.scheduled = scheduled or {}
+        self.currency = currency
+
+    def advance_to(self, year, month):
+        """
+        Close every month before (year, month)
+
+        Returns:
+            bool: True if the state changed
+        """
+        target = month_index(year, month)
+        if target <= self.open_month:
+            return False
+
+        while self.open_month < target:
+            season = self.open_month % 12
+            for state in self.series.values():
+                state.close_month(season)
+            self.open_month += 1
+            self.closed_months += 1
+            for key, amount in self.scheduled.pop(self.open_month, {}).items():
+                self.series.setdefault(key, SeriesState()).open_total += amount
+        return True
+
+    def observe(self, key, year, month, amount):
+        """
+        Add one transaction amount to a series in O(1)
+
+        Returns:
+            bool: False if the transaction falls in an already closed month,
+            which can only be absorbed by a refit
+        """
+        index = month_index(year, month)
+        if index < self.open_month:
+            return False
+
+        if index > self.open_month:
+            # Future-dated: closing the open month now would close it early
+            by_key = self.scheduled.setdefault(index, {})
+            by_key[key] = by_key.get(key, 0.0) + amount
+            return True
+
+        if key not in self.series:
+            self.series[key] = SeriesState()
+        self.series[key].open_total += amount
+        return True
+
+    def observe_transaction(self, transaction_type, category, year, month, amount):
+        """Apply one new transaction to every series it belongs to"""
+        index = month_index(year, month)
+        if index < self.open_month:
+            return False
+
+        for key in series_keys(transaction_type, category):
+            self.observe(key, year, month, amount)
+        return True
+
+    def forecast(self, key, steps=1, coverage=0.95):
+        state = self.series.get(key)
+        if state is None:
+            return None
+
+        target = self.open_month + steps - 1
+        point, lower, upper = state.forecast(steps, target % 12, coverage)
+        return {
+            "month": month_label(target),
+            "forecast": round(point, 2),
+            "lower_bound": round(lower, 2),
+            "upper_bound": round(upper, 2),
+            "month_to_date": round(state.open_total, 2) if steps == 1 else None,
+            "trend": round(state.trend, 2),
+        }
+
+    def history(self, key, months=6):
+        """(month, total) for the open month and the closed months before it, oldest first"""
+        state = self.series.get(key)
+        if state is None:
+            return []
+
+        values = state.recent[-(months - 1):] + [state.open_total] if months > 1 else [state.open_total]
+        first = self.open_month - len(values) + 1
+        return [(month_label(first + i), round(v, 2)) for i, v in enumerate(values)]
+
+    def to_json(self):
+        return json.dumps({
+            "open_month": self.open_month,
+            "ledger_version": self.ledger_version,
+            "currency": self.currency,
+            "closed_months": self.closed_months,
+            "series": {key: state.to_dict() for key, state in self.series.items()},
+            "scheduled": {str(index): by_key for index, by_key in self.scheduled.items()},
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode('utf-8')
+        raw = json.loads(data)
+        return cls(
+            raw["open_month"],
+            {key: SeriesState.from_dict(s) for key, s in raw["series"].items()},
+            raw["ledger_version"],
+            raw["closed_months"],
+            {int(index): by_key for index, by_key in raw.get("scheduled", {}).items()},
+            raw.get("currency"),
+        )
+
+
+def batch_fit(values, first_month, grid=PARAM_GRID):
+    """
+    Fit additive Holt-Winters to many monthly series at once.
+
+    Every series is run against every parameter combination in a single
+    (series x params) array per time step, and the combination with the
+    lowest one-step squared error is kept for each series.
+
+    Args:
+        values: Array (n_series, n_months) of closed monthly totals
+        first_month: month_index() of column 0
+        grid: Array (n_params, 3) of (alpha, beta, gamma)
+
+    Returns:
+        list: SeriesState per row of values
+    """
+    values = np.asarray(values, dtype=float)
+    n_series, n_months = values.shape
+    seasonal_fit = n_months >= 2 * SEASON_LENGTH
+    if not seasonal_fit:
+        # Two full seasons are needed to separate seasonality from trend
+        grid = np.unique(np.column_stack([grid[:, :2], np.zeros(len(grid))]), axis=0)
+
+    alpha = grid[None, :, 0]
+    beta = grid[None, :, 1]
+    gamma = grid[None, :, 2]
+    n_params = len(grid)
+
+    seasonal = np.zeros((n_series, n_params, SEASON_LENGTH))
+    if seasonal_fit:
+        first_season = values[:, :SEASON_LENGTH]
+        level0 = first_season.mean(axis=1)
+        trend0 = (values[:, SEASON_LENGTH:2 * SEASON_LENGTH].mean(axis=1) - level0) / SEASON_LENGTH
+        deviations = first_season - level0[:, None]
+        season_of = (first_month + np.arange(SEASON_LENGTH)) % 12
+        seasonal[:, :, season_of] = deviations[:, None, :]
+    elif n_months:
+        level0 = values[:, 0]
+        trend0 = np.zeros(n_series)
+    else:
+        level0 = np.zeros(n_series)
+        trend0 = np.zeros(n_series)
+
+    level = np.repeat(level0[:, None], n_params, axis=1)
+    trend = np.repeat(trend0[:, None], n_params, axis=1)
+    sse = np.zeros((n_series, n_params))
+
+    for t in range(n_months):
+        season = (first_month + t) % 12
+        y = values[:, t][:, None]
+        s = seasonal[:, :, season]
+        error = y - (level + trend + s)
+        sse += error * error
+
+        previous_level = level
+        level = alpha * (y - s) + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous_level) + (1 - beta) * trend
+        seasonal[:, :, season] = gamma * (y - level) + (1 - gamma) * s
+
+    best = sse.argmin(axis=1) if n_params else np.zeros(n_series, dtype=int)
+    rows = np.arange(n_series)
+    states = []
+    for i, p in zip(rows, best):
+        states.append(SeriesState(
+            level=level[i, p],
+            trend=trend[i, p],
+            seasonal=seasonal[i, p],
+            alpha=grid[p, 0],
+            beta=grid[p, 1],
+            gamma=grid[p, 2],
+            sse=sse[i, p],
+            n_errors=n_months,
+            recent=np.round(values[i, -RECENT_MONTHS:], 2).tolist(),
+        ))
+    return states
+
+
+def fit_forecast_state(monthly_rows, current_year, current_month, ledger_version=0, currency=None):
+    """
+    Cold-start a ForecastState from monthly aggregates
+
+    Args:
+        monthly_rows: Iterable of dicts with keys month ('YYYY-MM'), type,
+            category and total, one per (month, type, category)
+        current_year, current_month: The calendar month still in progress;
+            later months are kept as scheduled amounts
+        ledger_version: Ledger version the aggregates were read at
+        currency: Currency the totals are in
+
+    Returns:
+        ForecastState: Series 'income:total', 'expense:total' and
+        'expense:<category>' for every expense category
+    """
+    totals = {}
+    for row in monthly_rows:
+        year, month = (int(part) for part in row['month'].split('-'))
+        index = month_index(year, month)
+        amount = float(row['total'] or 0)
+        for key in series_keys(row['type'], row['category']):
+            totals.setdefault(key, {})
+            totals[key][index] = totals[key].get(index, 0.0) + amount
+
+    open_month = month_index(current_year, current_month)
+    months = [m for by_month in totals.values() for m in by_month if m <= open_month]
+    first_month = min(months) if months else open_month
+
+    keys = sorted(set(totals) | {'income:total', 'expense:total'})
+    n_closed = open_month - first_month
+    values = np.zeros((len(keys), n_closed))
+    open_totals = np.zeros(len(keys))
+    scheduled = {}
+    for row, key in enumerate(keys):
+        for index, amount in totals.get(key, {}).items():
+            if index == open_month:
+                open_totals[row] = amount
+            elif index > open_month:
+                scheduled.setdefault(index, {})[key] = amount
+            else:
+                values[row, index - first_month] = amount
+
+    states = batch_fit(values, first_month)
+    for state, open_total in zip(states, open_totals):
+        state.open_total = float(open_total)
+
+    return ForecastState(open_month, dict(zip(keys, states)), ledger_version, n_closed, scheduled, currency)
+
+
+def series_keys(transaction_type, category):
+    """Series a transaction contributes to"""
+    if transaction_type == 'income':
+        return ['income:total']
+    return ['expense:total', f"expense:{category}"]
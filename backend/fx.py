@@ -0,0 +1,215 @@
+"""
+Historical FX rates and vectorized currency conversion.
+
+    python fx.py load <rates.csv>
+
+`fx_rates` in the directory database holds one rate per currency and
+day: units of the currency per one unit of FX_QUOTE_CURRENCY. The CSV
+has date,currency,rate columns (a reference-rate download reshaped to
+long form) and is upserted, so reloading a corrected file is safe.
+
+Each process keeps the table as one sorted day array and one rate array
+per currency. Converting a column of amounts groups it by currency and
+finds every row's rate with a single np.searchsorted over that
+currency's days: the latest rate on or before the transaction date,
+or the earliest known rate for older dates.
+
+A transaction's `currency` is NULL when it is in the user's own
+currency (user_preferences.currency), so ledgers without foreign rows
+never touch the rate table.
+"""
+import csv
+import os
+import sys
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+FX_QUOTE_CURRENCY = os.environ.get('FX_QUOTE_CURRENCY', 'USD')
+FX_DEFAULT_CURRENCY = 'INR'
+FX_REFRESH_SECONDS = float(os.environ.get('FX_REFRESH_SECONDS', 300))
+FX_LOAD_BATCH_SIZE = 5000
+
+
+class MissingRate(Exception):
+    """No FX rates are loaded for a currency that needs converting"""
+
+
+def to_days(dates):
+    """Days since the epoch for an array of dates, parsing each distinct date once"""
+    codes, uniques = pd.factorize(np.asarray(dates, dtype=object))
+    days = pd.to_datetime(uniques).values.astype('datetime64[D]').astype(np.int64)
+    return days[codes]
+
+
+class FxRates:
+    """Per-process copy of fx_rates, reloaded when the table changes"""
+
+    def __init__(self, router, quote=FX_QUOTE_CURRENCY, refresh_seconds=FX_REFRESH_SECONDS):
+        self.router = router
+        self.quote = quote
+        self.refresh_seconds = refresh_seconds
+        self.version = None
+        self._series = {}
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Reload the table if it changed; checked at most every refresh_seconds"""
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if not force and self._checked_at is not None and now - self._checked_at < self.refresh_seconds:
+                return
+            connection = self.router.connect_directory()
+            try:
+                cursor = connection.cursor()
+                cursor.execute("SELECT COUNT(*), MAX(updated_at) FROM fx_rates")
+                count, updated = cursor.fetchone()
+                version = (int(count), str(updated))
+                if version != self.version:
+                    cursor.execute("SELECT currency, rate_date, rate FROM fx_rates ORDER BY currency, rate_date")
+                    self._series = self._build(cursor.fetchall())
+                    self.version = version
+                cursor.close()
+            finally:
+                connection.close()
+            self._checked_at = now
+
+    @staticmethod
+    def _build(rows):
+        if not rows:
+            return {}
+        currencies = np.array([r[0] for r in rows], dtype=object)
+        days = to_days([r[1] for r in rows])
+        rates = np.array([float(r[2]) for r in rows])
+        # Rows arrive sorted by currency, so each currency is one slice
+        starts = np.flatnonzero(np.r_[True, currencies[1:] != currencies[:-1]])
+        ends = np.r_[starts[1:], len(rows)]
+        return {currencies[s]: (days[s:e], rates[s:e]) for s, e in zip(starts, ends)}
+
+    def supports(self, currency):
+        self.refresh()
+        return currency == self.quote or currency in self._series
+
+    def rates_on(self, currency, days):
+        """Units of currency per quote unit on each day"""
+        if currency == self.quote:
+            return np.ones(len(days))
+        series = self._series.get(currency)
+        if series is None:
+            raise MissingRate(f"No FX rates loaded for {currency}")
+        rate_days, rates = series
+        index = np.searchsorted(rate_days, days, side='right') - 1
+        return rates[np.maximum(index, 0)]
+
+    def convert(self, amounts, currencies, dates, to):
+        """
+        Convert amounts to currency `to` at each row's date
+
+        Args:
+            amounts: Sequence of amounts
+            currencies: Currency of each amount; None means it is already in `to`
+            dates: Date of each amount
+            to: Target currency code
+
+        Returns:
+            ndarray: Converted amounts as float64
+        """
+        self.refresh()
+        out = np.asarray(amounts, dtype=np.float64).copy()
+        codes, uniques = pd.factorize(np.asarray(currencies, dtype=object))
+        dates = np.asarray(dates, dtype=object)
+        for code, currency in enumerate(uniques):
+            if currency == to:
+                continue
+            rows = np.flatnonzero(codes == code)
+            days = to_days(dates[rows])
+            out[rows] *= self.rates_on(to, days) / self.rates_on(currency, days)
+        return out
+
+
+def user_currency(cursor, user_id):
+    cursor.execute("SELECT currency FROM user_preferences WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    currency = (row['currency'] if isinstance(row, dict) else row[0]) if row else None
+    return currency or FX_DEFAULT_CURRENCY
+
+
+def convert_rows(fx, cursor, user_id, rows, date_key='transaction_date'):
+    """
+    Row dicts with `amount` in the user's currency. Rows already in it are
+    returned as they are; converted rows are copies with a Decimal amount.
+    """
+    foreign = [i for i, row in enumerate(rows) if row.get('currency')]
+    if not foreign:
+        return rows
+
+    base = user_currency(cursor, user_id)
+    amounts = fx.convert(
+        [rows[i]['amount'] for i in foreign],
+        [rows[i]['currency'] for i in foreign],
+        [str(rows[i][date_key])[:10] for i in foreign],
+        base
+    )
+    rows = list(rows)
+    for i, amount in zip(foreign, amounts):
+        rows[i] = dict(rows[i], amount=Decimal(f"{amount:.2f}"))
+    return rows
+
+
+def load_csv(connection, path):
+    """
+    Upsert rates from a date,currency,rate CSV
+
+    Returns:
+        int: Number of rates written
+    """
+    cursor = connection.cursor()
+    written = 0
+    try:
+        with open(path, newline='') as f:
+            batch = []
+            for row in csv.DictReader(f):
+                if not row.get('rate'):
+                    continue
+                batch.append((row['currency'].strip().upper(), row['date'][:10], row['rate']))
+                if len(batch) == FX_LOAD_BATCH_SIZE:
+                    written += _upsert(cursor, batch)
+                    batch = []
+            written += _upsert(cursor, batch)
+        connection.commit()
+        return written
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _upsert(cursor, batch):
+    if batch:
+        cursor.executemany(
+            """INSERT INTO fx_rates (currency, rate_date, rate) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE rate = VALUES(rate)""",
+            batch
+        )
+    return len(batch)
+
+
+if __name__ == '__main__':
+    from app import shard_router
+
+    if len(sys.argv) == 3 and sys.argv[1] == 'load':
+        connection = shard_router.connect_directory()
+        try:
+            print(f"loaded {load_csv(connection, sys.argv[2])} rates")
+        finally:
+            connection.close()
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,456 @@
+"""
+Cohort financial-health metrics with percentile ranks across all users.
+
+    python health.py build
+    python health.py refresh
+
+Four metrics are computed for every user over the last
+HEALTH_WINDOW_MONTHS closed months, in the user's currency:
+
+    savings_rate        (income - expenses) / income
+    emergency_months    active "emergency" savings goals / average monthly expenses
+    expense_volatility  coefficient of variation of monthly expenses (lower is better)
+    budget_adherence    share of (budget, month) pairs spent within the limit
+
+`build` reads each shard with a few grouped queries (monthly totals per
+user, budgets, emergency funds, ledger versions) and computes all users
+at once with np.bincount over integer user, month and budget codes. The
+result is a HealthIndex: the per-user rows plus, per metric, a sorted
+array of every user's value, so a percentile rank is one binary search.
+It is saved with joblib under MODEL_DIR/health and loaded memory-mapped;
+workers reload it when the file changes.
+
+`refresh` compares the index's per-user ledger versions with
+ledger_versions and recomputes only the users that changed (and
+rebuilds everything once the window moves to a new month), moving each
+changed value inside the sorted arrays without re-sorting. Run both
+from cron; the API never computes metrics, it serves the last saved
+index as built (503 until the first one exists) and reloads it when the
+file changes, so a user's report is as fresh as the last refresh.
+
+The window is shorter than ARCHIVE_HORIZON_MONTHS, so archived segments
+never need reading.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from categorize import MODEL_DIR
+from forecasting import month_index, month_label
+
+HEALTH_WINDOW_MONTHS = int(os.environ.get('HEALTH_WINDOW_MONTHS', 6))
+HEALTH_INDEX_PATH = os.environ.get('HEALTH_INDEX_PATH', os.path.join(MODEL_DIR, 'health', 'index.joblib'))
+HEALTH_REFRESH_BATCH = 1000
+
+METRICS = ('savings_rate', 'emergency_months', 'expense_volatility', 'budget_adherence')
+LOWER_IS_BETTER = {'expense_volatility'}
+
+
+def current_window(as_of=None):
+    """(first, last) month_index of the closed months the metrics cover"""
+    as_of = as_of or datetime.now()
+    last = month_index(as_of.year, as_of.month) - 1
+    return last - HEALTH_WINDOW_MONTHS + 1, last
+
+
+# Bulk reads, one shard at a time
+
+def _in_clause(user_ids):
+    if user_ids is None:
+        return '', ()
+    return f" AND user_id IN ({', '.join(['%s'] * len(user_ids))})", tuple(user_ids)
+
+
+def read_shard(router, shard, fx, first_month, last_month, user_ids=None):
+    """
+    Everything the metrics need for the users on a shard
+
+    Args:
+        user_ids: Limit to these users; None for every user on the shard
+
+    Returns:
+        dict: DataFrames monthly (user_id, month, type, category, total),
+        budgets (user_id, category, limit_amount), emergency (user_id,
+        fund) and versions (user_id, version)
+    """
+    start = f"{month_label(first_month)}-01"
+    end = f"{month_label(last_month + 1)}-01"
+    users, user_params = _in_clause(user_ids)
+
+    connection = router.connect(shard)
+    try:
+        cursor = connection.cursor()
+
+        def query(sql, params=()):
+            cursor.execute(router.sql(shard, sql), params)
+            return cursor.fetchall()
+
+        versions = pd.DataFrame(
+            query(f"SELECT user_id, version FROM ledger_versions WHERE 1 = 1{users}", user_params),
+            columns=['user_id', 'version']
+        )
+        currencies = dict(query(f"SELECT user_id, currency FROM user_preferences WHERE 1 = 1{users}", user_params))
+
+        monthly = pd.DataFrame(query(f"""
+            SELECT user_id, `year_month`, type, category, SUM(amount)
+            FROM transactions
+            WHERE `year_month` BETWEEN %s AND %s AND currency IS NULL{users}
+            GROUP BY user_id, `year_month`, type, category
+        """, (month_label(first_month), month_label(last_month), *user_params)),
+            columns=['user_id', 'month', 'type', 'category', 'total'])
+
+        foreign = pd.DataFrame(query(f"""
+            SELECT user_id, transaction_date, type, category, currency, SUM(amount)
+            FROM transactions
+            WHERE transaction_date >= %s AND transaction_date < %s AND currency IS NOT NULL{users}
+            GROUP BY user_id, transaction_date, type, category, currency
+        """, (start, end, *user_params)), columns=['user_id', 'transaction_date', 'type', 'category', 'currency', 'total'])
+
+        budgets = pd.DataFrame(
+            query(f"SELECT user_id, category, limit_amount FROM budgets WHERE 1 = 1{users}", user_params),
+            columns=['user_id', 'category', 'limit_amount']
+        )
+        emergency = pd.DataFrame(query(f"""
+            SELECT user_id, SUM(current_amount) FROM savings_goals
+            WHERE status = 'active' AND goal_name LIKE %s{users}
+            GROUP BY user_id
+        """, ('%emergency%', *user_params)), columns=['user_id', 'fund'])
+        cursor.close()
+    finally:
+        connection.close()
+
+    if not foreign.empty:
+        # Convert per target currency, each group in one vectorized call
+        from fx import FX_DEFAULT_CURRENCY
+        base = foreign['user_id'].map(lambda u: currencies.get(u) or FX_DEFAULT_CURRENCY)
+        totals = foreign['total'].to_numpy(dtype=np.float64)
+        for currency in base.unique():
+            rows = (base == currency).to_numpy()
+            totals[rows] = fx.convert(totals[rows], foreign['currency'][rows], foreign['transaction_date'][rows], currency)
+        foreign = foreign.assign(total=totals, month=[str(d)[:7] for d in foreign['transaction_date']])
+        monthly = pd.concat([monthly, foreign[['user_id', 'month', 'type', 'category', 'total']]], ignore_index=True)
+
+    return {'monthly': monthly, 'budgets': budgets, 'emergency': emergency, 'versions': versions}
+
+
+def _concat(parts, name):
+    frames = [part[name] for part in parts if not part[name].empty]
+    return pd.concat(frames, ignore_index=True) if frames else parts[0][name].iloc[0:0]
+
+
+def compute_metrics(data, first_month, last_month):
+    """
+    Metrics for every user in data, vectorized across users
+
+    Returns:
+        tuple: (sorted user ids, values (n_users, len(METRICS)) with NaN
+        where a metric is undefined, ledger versions)
+    """
+    versions = data['versions'].drop_duplicates('user_id').sort_values('user_id')
+    user_ids = versions['user_id'].to_numpy(dtype=np.int64)
+    n, m = len(user_ids), last_month - first_month + 1
+    values = np.full((n, len(METRICS)), np.nan)
+    if not n:
+        return user_ids, values, versions['version'].to_numpy(dtype=np.int64)
+
+    def codes(frame):
+        index = np.searchsorted(user_ids, frame['user_id'].to_numpy(dtype=np.int64))
+        index = np.minimum(index, n - 1)
+        return index, user_ids[index] == frame['user_id'].to_numpy(dtype=np.int64)
+
+    monthly = data['monthly']
+    u, known = codes(monthly)
+    labels, distinct = pd.factorize(monthly['month'])
+    months = np.array([month_index(int(s[:4]), int(s[5:7])) for s in distinct], dtype=np.int64)[labels] - first_month
+    known &= (months >= 0) & (months < m)
+    totals = monthly['total'].to_numpy(dtype=np.float64)
+    expense = (monthly['type'] == 'expense').to_numpy() & known
+    income = (monthly['type'] == 'income').to_numpy() & known
+
+    by_month = np.bincount(u[expense] * m + months[expense], weights=totals[expense], minlength=n * m).reshape(n, m)
+    expenses = by_month.sum(axis=1)
+    incomes = np.bincount(u[income], weights=totals[income], minlength=n)
+    avg_expenses = expenses / m
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values[:, 0] = np.where(incomes > 0, (incomes - expenses) / incomes, np.nan)
+
+        eu, eknown = codes(data['emergency'])
+        fund = np.bincount(eu[eknown], weights=data['emergency']['fund'].to_numpy(dtype=np.float64)[eknown], minlength=n)
+        values[:, 1] = np.where(avg_expenses > 0, fund / avg_expenses, np.nan)
+
+        values[:, 2] = np.where(avg_expenses > 0, by_month.std(axis=1) / avg_expenses, np.nan)
+
+    # Spend per (budget, month), matched on (user, category)
+    budgets = data['budgets']
+    if not budgets.empty:
+        bu, bknown = codes(budgets)
+        budgets = budgets[bknown].reset_index(drop=True)
+        bu = bu[bknown]
+        spent = monthly[expense].assign(m=months[expense]).merge(
+            budgets.reset_index(names='b')[['b', 'user_id', 'category']], on=['user_id', 'category']
+        )
+        per_month = np.bincount(spent['b'].to_numpy() * m + spent['m'].to_numpy(),
+                                weights=spent['total'].to_numpy(dtype=np.float64),
+                                minlength=len(budgets) * m).reshape(len(budgets), m)
+        met = (per_month <= budgets['limit_amount'].to_numpy(dtype=np.float64)[:, None]).sum(axis=1)
+        pairs = np.bincount(bu, minlength=n) * m
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values[:, 3] = np.where(pairs > 0, np.bincount(bu, weights=met, minlength=n) / pairs, np.nan)
+
+    return user_ids, values, versions['version'].to_numpy(dtype=np.int64)
+
+
+class HealthIndex:
+    """Per-user metric rows plus one sorted array of values per metric"""
+
+    def __init__(self, user_ids, values, versions, first_month, last_month, built_at=None, ranked=None):
+        self.user_ids = user_ids
+        self.values = values
+        self.versions = versions
+        self.first_month = first_month
+        self.last_month = last_month
+        self.built_at = built_at or time.time()
+        self.ranked = ranked if ranked is not None else {
+            metric: np.sort(values[:, j][~np.isnan(values[:, j])]) for j, metric in enumerate(METRICS)
+        }
+
+    @classmethod
+    def build(cls, router, fx, as_of=None):
+        first, last = current_window(as_of)
+        parts = list(router.fan_out(lambda shard: read_shard(router, shard, fx, first, last)).values())
+        data = {name: _concat(parts, name) for name in parts[0]}
+        return cls(*compute_metrics(data, first, last), first, last)
+
+    def _row(self, user_id):
+        i = int(np.searchsorted(self.user_ids, user_id))
+        return i if i < len(self.user_ids) and self.user_ids[i] == user_id else None
+
+    def version_of(self, user_id):
+        i = self._row(user_id)
+        return int(self.versions[i]) if i is not None else None
+
+    def percentile(self, metric, value):
+        """Share of users this value is at least as good as, in percent"""
+        ranked = self.ranked[metric]
+        if np.isnan(value) or not len(ranked):
+            return None
+        if metric in LOWER_IS_BETTER:
+            better_or_equal = len(ranked) - np.searchsorted(ranked, value, side='left')
+        else:
+            better_or_equal = np.searchsorted(ranked, value, side='right')
+        return round(float(better_or_equal) / len(ranked) * 100, 1)
+
+    def report(self, user_id):
+        i = self._row(user_id)
+        if i is None:
+            return None
+        metrics = {}
+        for j, metric in enumerate(METRICS):
+            value = self.values[i, j]
+            metrics[metric] = {
+                "value": None if np.isnan(value) else round(float(value), 4),
+                "percentile": self.percentile(metric, value),
+            }
+        percentiles = [m['percentile'] for m in metrics.values() if m['percentile'] is not None]
+        return {
+            "window": {"from": month_label(self.first_month), "to": month_label(self.last_month)},
+            "metrics": metrics,
+            "score": round(sum(percentiles) / len(percentiles), 1) if percentiles else None,
+            "cohort_size": len(self.user_ids),
+        }
+
+    def update(self, user_ids, values, versions):
+        """
+        Replace or add users' rows, moving each changed value within the
+        sorted arrays. Returns a new index; this one is left untouched so
+        readers holding it (or its mapped arrays) are unaffected.
+        """
+        ranked = {metric: np.asarray(self.ranked[metric]) for metric in METRICS}
+        all_ids = np.asarray(self.user_ids)
+        all_values = np.array(self.values)
+        all_versions = np.array(self.versions)
+
+        for user_id, row, version in zip(user_ids, values, versions):
+            i = int(np.searchsorted(all_ids, user_id))
+            present = i < len(all_ids) and all_ids[i] == user_id
+            for j, metric in enumerate(METRICS):
+                if present and not np.isnan(all_values[i, j]):
+                    k = int(np.searchsorted(ranked[metric], all_values[i, j]))
+                    ranked[metric] = np.delete(ranked[metric], k)
+                if not np.isnan(row[j]):
+                    ranked[metric] = np.insert(ranked[metric], np.searchsorted(ranked[metric], row[j]), row[j])
+            if present:
+                all_values[i] = row
+                all_versions[i] = version
+            else:
+                all_ids = np.insert(all_ids, i, user_id)
+                all_values = np.insert(all_values, i, row, axis=0)
+                all_versions = np.insert(all_versions, i, version)
+
+        return HealthIndex(all_ids, all_values, all_versions, self.first_month, self.last_month,
+                           self.built_at, ranked)
+
+    def remove(self, user_ids):
+        """New index without the given users"""
+        keep = ~np.isin(self.user_ids, np.asarray(list(user_ids), dtype=np.int64))
+        return HealthIndex(np.asarray(self.user_ids)[keep], np.asarray(self.values)[keep],
+                           np.asarray(self.versions)[keep], self.first_month, self.last_month, self.built_at)
+
+    def save(self, path=HEALTH_INDEX_PATH):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(fd)
+        joblib.dump(self.__dict__, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=HEALTH_INDEX_PATH):
+        try:
+            state = joblib.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        return cls(**state)
+
+
+def recompute_users(router, fx, index, user_ids):
+    """(user ids, values, versions) for the given users at the index's window"""
+    by_shard = {}
+    for user_id in user_ids:
+        by_shard.setdefault(router.shard_for(user_id), []).append(int(user_id))
+
+    parts = []
+    for shard, ids in by_shard.items():
+        for i in range(0, len(ids), HEALTH_REFRESH_BATCH):
+            parts.append(read_shard(router, shard, fx, index.first_month, index.last_month,
+                                    ids[i:i + HEALTH_REFRESH_BATCH]))
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, len(METRICS))), np.zeros(0, dtype=np.int64)
+    data = {name: _concat(parts, name) for name in parts[0]}
+    return compute_metrics(data, index.first_month, index.last_month)
+
+
+def refresh_index(router, fx, index, as_of=None):
+    """
+    Bring a saved index up to date: a full build when the window moved,
+    otherwise recompute only users whose ledger version changed
+
+    Returns:
+        tuple: (new index, number of users recomputed)
+    """
+    if index is None or (index.first_month, index.last_month) != current_window(as_of):
+        index = HealthIndex.build(router, fx, as_of)
+        return index, len(index.user_ids)
+
+    def versions_on(shard):
+        connection = router.connect(shard)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT user_id, version FROM ledger_versions")
+            return cursor.fetchall()
+        finally:
+            connection.close()
+
+    current = {int(u): int(v) for rows in router.fan_out(versions_on).values() for u, v in rows}
+    known = dict(zip(np.asarray(index.user_ids).tolist(), np.asarray(index.versions).tolist()))
+    changed = [u for u, v in current.items() if known.get(u) != v]
+    gone = [u for u in known if u not in current]
+
+    if gone:
+        index = index.remove(gone)
+    if changed:
+        index = index.update(*recompute_users(router, fx, index, changed))
+    return index, len(changed)
+
+
+class HealthIndexMissing(Exception):
+    """No index has been saved yet; `python health.py build` creates one"""
+
+    def __init__(self, path):
+        super().__init__("Health metrics are not available yet, retry later")
+        self.path = path
+
+
+class HealthEngine:
+    """
+    Serves reports from the saved index, reloading it when the file
+    changes. The index is only ever built by the CLI (from cron); a
+    worker keeps serving the one it has until a newer file appears.
+    """
+
+    def __init__(self, path=HEALTH_INDEX_PATH):
+        self.path = path
+        self._index = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+        self.served = 0
+        self.loads = 0
+
+    def index(self):
+        """The most recently saved index; raises HealthIndexMissing before the first build"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+
+        with self._lock:
+            if mtime is None or mtime == self._mtime:
+                if self._index is None:
+                    raise HealthIndexMissing(self.path)
+                return self._index
+
+        loaded = HealthIndex.load(self.path)
+        with self._lock:
+            if loaded is None:
+                # Replaced or removed between the stat and the load
+                if self._index is None:
+                    raise HealthIndexMissing(self.path)
+            elif mtime != self._mtime:
+                self._index = loaded
+                self._mtime = mtime
+                self.loads += 1
+            return self._index
+
+    def report(self, user_id):
+        """The user's metrics and percentiles as of the last build or refresh"""
+        index = self.index()
+        with self._lock:
+            self.served += 1
+        return index.report(user_id)
+
+    def stats(self):
+        with self._lock:
+            index = self._index
+            return {
+                "served": self.served,
+                "loads": self.loads,
+                "cohort_size": len(index.user_ids) if index is not None else None,
+                "built_at": index.built_at if index is not None else None,
+            }
+
+
+if __name__ == '__main__':
+    from app import fx_rates, shard_router
+
+    if sys.argv[1:] == ['build']:
+        started = time.perf_counter()
+        index = HealthIndex.build(shard_router, fx_rates)
+        index.save()
+        print(f"indexed {len(index.user_ids)} users in {time.perf_counter() - started:.1f}s")
+    elif sys.argv[1:] == ['refresh']:
+        started = time.perf_counter()
+        index, recomputed = refresh_index(shard_router, fx_rates, HealthIndex.load())
+        index.save()
+        print(f"recomputed {recomputed} of {len(index.user_ids)} users in {time.perf_counter() - started:.1f}s")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,280 @@
+"""
+Notification inbox: keyset listing, unread counters and long-poll delivery.
+
+    python inbox.py recount [user_id]
+
+`notification_counters` holds each user's unread count, highest
+notification id and an inbox version. Triggers on `notifications` keep
+it current on every insert, read and delete, whichever path wrote the
+row (API, stored procedure or another trigger), so the badge is a
+primary key read instead of a COUNT(*). The version is the inbox's
+consistency token (X-Inbox-Token); notification writes never touch
+ledger_versions, so they leave ledger-keyed caches alone.
+
+Long-poll waiters park on one in-process NotificationHub. A single
+poller thread reads latest_id for every waiting user with one query per
+shard each INBOX_POLL_INTERVAL, and wakes only the users whose id moved,
+so an idle client costs a parked thread and a share of that query. The
+poller stops when nobody is waiting.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+INBOX_PAGE_SIZE = 20
+INBOX_MAX_PAGE = 100
+INBOX_BULK_MAX = 500
+INBOX_WAIT_TIMEOUT = float(os.environ.get('INBOX_WAIT_TIMEOUT', 25))
+INBOX_MAX_WAIT = float(os.environ.get('INBOX_MAX_WAIT', 55))
+INBOX_POLL_INTERVAL = float(os.environ.get('INBOX_POLL_INTERVAL', 1.0))
+
+NOTIFICATION_COLUMNS = "id, title, message, type, is_read, created_at"
+
+
+def _column(row, name, index):
+    return row[name] if isinstance(row, dict) else row[index]
+
+
+def unread_count(cursor, user_id):
+    """
+    Returns:
+        tuple: (unread count, highest notification id)
+    """
+    cursor.execute(
+        "SELECT unread, latest_id FROM notification_counters WHERE user_id = %s",
+        (user_id,)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return 0, 0
+    return max(int(_column(row, 'unread', 0)), 0), int(_column(row, 'latest_id', 1))
+
+
+def inbox_version(cursor, user_id):
+    """Version the inbox's consistency token is checked against"""
+    cursor.execute("SELECT version FROM notification_counters WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    return int(_column(row, 'version', 0)) if row else 0
+
+
+def list_notifications(cursor, user_id, before=None, limit=INBOX_PAGE_SIZE, unread_only=False):
+    """
+    One page of notifications, newest first
+
+    Each read state is a range scan of idx_user_read (user_id, is_read,
+    id) below the `before` cursor; the full inbox merges the two scans.
+
+    Args:
+        cursor: Dictionary cursor on the user's shard
+        user_id: Owner of the inbox
+        before: Id of the last notification on the previous page
+        limit: Page size
+        unread_only: Skip read notifications
+
+    Returns:
+        tuple: (list of row dicts, cursor for the next page or None)
+    """
+    before = before or 2 ** 31 - 1
+    page = f"""(SELECT {NOTIFICATION_COLUMNS} FROM notifications
+        WHERE user_id = %s AND is_read = %s AND id < %s
+        ORDER BY id DESC LIMIT %s)"""
+
+    if unread_only:
+        cursor.execute(page, (user_id, False, before, limit))
+    else:
+        cursor.execute(
+            f"{page} UNION ALL {page} ORDER BY id DESC LIMIT %s",
+            (user_id, False, before, limit, user_id, True, before, limit, limit)
+        )
+    rows = cursor.fetchall()
+    for row in rows:
+        row['is_read'] = bool(row['is_read'])
+    return rows, (rows[-1]['id'] if len(rows) == limit else None)
+
+
+def notifications_after(cursor, user_id, after, limit=INBOX_MAX_PAGE):
+    """Notifications with id > after, oldest first"""
+    cursor.execute(
+        f"""SELECT {NOTIFICATION_COLUMNS} FROM notifications
+        WHERE user_id = %s AND id > %s
+        ORDER BY id LIMIT %s""",
+        (user_id, after, limit)
+    )
+    rows = cursor.fetchall()
+    for row in rows:
+        row['is_read'] = bool(row['is_read'])
+    return rows
+
+
+def _selection(user_id, ids, up_to):
+    if ids:
+        return f"user_id = %s AND id IN ({', '.join(['%s'] * len(ids))})", (user_id, *ids)
+    return "user_id = %s AND id <= %s", (user_id, up_to)
+
+
+def mark_read(cursor, user_id, ids=None, up_to=None):
+    """
+    Mark the given ids, or every notification up to and including up_to,
+    read in one statement
+
+    Returns:
+        int: Number of notifications that were unread
+    """
+    where, params = _selection(user_id, ids, up_to)
+    cursor.execute(f"UPDATE notifications SET is_read = TRUE WHERE {where} AND is_read = FALSE", params)
+    return cursor.rowcount
+
+
+def delete_notifications(cursor, user_id, ids=None, up_to=None):
+    """
+    Delete the given ids, or every notification up to and including
+    up_to, in one statement
+
+    Returns:
+        int: Number of notifications deleted
+    """
+    where, params = _selection(user_id, ids, up_to)
+    cursor.execute(f"DELETE FROM notifications WHERE {where}", params)
+    return cursor.rowcount
+
+
+def recount_user(connection, user_id):
+    """Rebuild user_id's counter row from the notifications table"""
+    cursor = connection.cursor()
+    try:
+        # Update in place: the version must keep moving forward
+        cursor.execute(
+            """INSERT INTO notification_counters (user_id, unread, latest_id, version)
+            SELECT %s, COALESCE(SUM(is_read = FALSE), 0), COALESCE(MAX(id), 0), 1
+            FROM notifications
+            WHERE user_id = %s
+            ON DUPLICATE KEY UPDATE unread = VALUES(unread), latest_id = VALUES(latest_id),
+                version = version + 1""",
+            (user_id, user_id)
+        )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+class NotificationHub:
+    """Parks long-poll waiters and wakes them when their latest_id moves"""
+
+    def __init__(self, router, interval=INBOX_POLL_INTERVAL):
+        self.router = router
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._waiters = Counter()
+        self._latest = {}
+        self._poller = None
+
+        self.polls = 0
+        self.wakeups = 0
+
+    def wait(self, user_id, after, timeout):
+        """
+        Block until user_id has a notification with id > after, or timeout
+
+        Returns:
+            int: Highest notification id seen for the user
+        """
+        with self._cond:
+            self._waiters[user_id] += 1
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='inbox-poller', daemon=True)
+                self._poller.start()
+            try:
+                self._cond.wait_for(lambda: self._latest.get(user_id, 0) > after, timeout)
+                return self._latest.get(user_id, 0)
+            finally:
+                self._waiters[user_id] -= 1
+                if not self._waiters[user_id]:
+                    del self._waiters[user_id]
+                    self._latest.pop(user_id, None)
+
+    def _poll(self):
+        while True:
+            time.sleep(self.interval)
+            with self._cond:
+                users = list(self._waiters)
+                if not users:
+                    self._poller = None
+                    return
+            try:
+                latest = self._fetch(users)
+            except Exception as e:
+                print(f"Error polling notification counters: {e}")
+                continue
+
+            with self._cond:
+                self.polls += 1
+                moved = [u for u, i in latest.items() if i > self._latest.get(u, 0)]
+                self._latest.update(latest)
+                if moved:
+                    self.wakeups += len(moved)
+                    self._cond.notify_all()
+
+    def _fetch(self, user_ids):
+        by_shard = {}
+        for user_id in user_ids:
+            by_shard.setdefault(self.router.shard_for(user_id), []).append(user_id)
+
+        latest = {}
+        for shard, ids in by_shard.items():
+            connection = self.router.connect(shard)
+            try:
+                cursor = connection.cursor()
+                cursor.execute(self.router.sql(
+                    shard,
+                    f"""SELECT user_id, latest_id FROM notification_counters
+                    WHERE user_id IN ({', '.join(['%s'] * len(ids))})"""
+                ), ids)
+                latest.update({int(u): int(i) for u, i in cursor.fetchall()})
+                cursor.close()
+            finally:
+                connection.close()
+        return latest
+
+    def stats(self):
+        with self._cond:
+            return {
+                "waiting_clients": sum(self._waiters.values()),
+                "waiting_users": len(self._waiters),
+                "poll_interval_s": self.interval,
+                "polls": self.polls,
+                "wakeups": self.wakeups,
+            }
+
+
+if __name__ == '__main__':
+    from app import shard_router
+
+    def users_on(shard):
+        connection = shard_router.connect(shard)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT DISTINCT user_id FROM notifications")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+
+    if len(sys.argv) in (2, 3) and sys.argv[1] == 'recount':
+        if len(sys.argv) == 3:
+            user_ids = [int(sys.argv[2])]
+        else:
+            user_ids = [u for ids in shard_router.fan_out(users_on).values() for u in ids]
+        for user_id in user_ids:
+            connection = shard_router.connect_user(user_id, for_write=True)
+            try:
+                recount_user(connection, user_id)
+                print(f"user {user_id}: recounted")
+            finally:
+                connection.close()
+    else:
+        print(__doc__)
+        sys.exit(1)
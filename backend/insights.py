@@ -0,0 +1,235 @@
+"""
+Spending insights from mergeable per-month partial aggregates.
+
+Every insight in generate_spending_insights is a function of a few
+additive totals per calendar month:
+
+    weekday_total[m, d], weekday_count[m, d]   expenses by day of week
+    category_total[m, c]                       expenses by category
+    impulse_count[m]                           small discretionary expenses
+
+`SpendingAggregates.from_frame` builds them in one pass: the frame is
+encoded once into integer month, weekday and category codes, and each
+table is a single np.bincount over a combined key. Partials add, so a
+new transaction is folded in with `observe` in O(1) and two aggregates
+combine with `merge`, without rescanning the ledger.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from forecasting import month_index, month_label
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+IMPULSE_CATEGORIES = ('Entertainment', 'Shopping', 'Food & Dining')
+IMPULSE_MAX_AMOUNT = 50
+IMPULSE_MIN_EXPENSES = 10
+TREND_THRESHOLD_PCT = 10
+
+
+class SpendingAggregates:
+    """
+    Expense partials for the months first_month .. first_month + n - 1.
+
+    Rows of every table are months; `categories` names the columns of
+    category_total. `ledger_version` and `currency` record which ledger the
+    aggregates reflect, and in which currency, like ForecastState.
+    """
+
+    def __init__(self, first_month=0, categories=None, weekday_total=None, weekday_count=None,
+                 category_total=None, impulse_count=None, ledger_version=0, currency=None):
+        self.first_month = int(first_month)
+        self.categories = list(categories or [])
+        n_categories = len(self.categories)
+        self.weekday_total = _table(weekday_total, (0, 7), np.float64)
+        self.weekday_count = _table(weekday_count, (0, 7), np.int64)
+        self.category_total = _table(category_total, (0, n_categories), np.float64)
+        self.impulse_count = _table(impulse_count, (0,), np.int64)
+        self.ledger_version = ledger_version
+        self.currency = currency
+        self._category_index = {c: i for i, c in enumerate(self.categories)}
+
+    @property
+    def n_months(self):
+        return len(self.impulse_count)
+
+    @classmethod
+    def from_frame(cls, df, ledger_version=0, currency=None):
+        """
+        Aggregate a transactions frame (date, amount, type, category) in one pass
+
+        The frame is not modified; income rows are ignored.
+        """
+        if df.empty:
+            return cls(ledger_version=ledger_version, currency=currency)
+
+        expense = (df['type'] == 'expense').to_numpy()
+        amounts = df['amount'].to_numpy(dtype=np.float64)[expense]
+        if not len(amounts):
+            return cls(ledger_version=ledger_version, currency=currency)
+
+        # A ledger has far fewer distinct days than rows; parse each day once
+        day_codes, days = pd.factorize(df['date'].to_numpy()[expense])
+        days = pd.to_datetime(days)
+        months = month_index(days.year.to_numpy(), days.month.to_numpy())[day_codes]
+        weekdays = days.dayofweek.to_numpy()[day_codes]
+        first = int(months.min())
+        rows = months - first
+        n = int(rows.max()) + 1
+        codes, categories = pd.factorize(df['category'].to_numpy()[expense], use_na_sentinel=False)
+        categories = [None if pd.isna(c) else str(c) for c in categories]
+        k = len(categories)
+
+        day_key = rows * 7 + weekdays
+        impulse_codes = [i for i, c in enumerate(categories) if c in IMPULSE_CATEGORIES]
+        impulse = np.isin(codes, impulse_codes) & (amounts < IMPULSE_MAX_AMOUNT)
+
+        return cls(
+            first_month=first,
+            categories=categories,
+            weekday_total=np.bincount(day_key, weights=amounts, minlength=n * 7).reshape(n, 7),
+            weekday_count=np.bincount(day_key, minlength=n * 7).reshape(n, 7),
+            category_total=np.bincount(rows * k + codes, weights=amounts, minlength=n * k).reshape(n, k),
+            impulse_count=np.bincount(rows, weights=impulse, minlength=n).astype(np.int64),
+            ledger_version=ledger_version,
+            currency=currency,
+        )
+
+    def _row(self, index):
+        """Table row for month index, growing the tables to cover it"""
+        if not self.n_months:
+            self.first_month = index
+        before = max(self.first_month - index, 0)
+        after = max(index - (self.first_month + self.n_months - 1), 0)
+        if before or after:
+            pad = ((before, after), (0, 0))
+            self.weekday_total = np.pad(self.weekday_total, pad)
+            self.weekday_count = np.pad(self.weekday_count, pad)
+            self.category_total = np.pad(self.category_total, pad)
+            self.impulse_count = np.pad(self.impulse_count, (before, after))
+            self.first_month -= before
+        return index - self.first_month
+
+    def _column(self, category):
+        column = self._category_index.get(category)
+        if column is None:
+            column = self._category_index[category] = len(self.categories)
+            self.categories.append(category)
+            self.category_total = np.pad(self.category_total, ((0, 0), (0, 1)))
+        return column
+
+    def observe(self, transaction_type, category, date, amount):
+        """Fold one new transaction into its month's partials in O(1)"""
+        if transaction_type != 'expense':
+            return
+        date = pd.Timestamp(date)
+        row = self._row(month_index(date.year, date.month))
+        column = self._column(category)
+        day = date.dayofweek
+        amount = float(amount)
+
+        self.weekday_total[row, day] += amount
+        self.weekday_count[row, day] += 1
+        self.category_total[row, column] += amount
+        if category in IMPULSE_CATEGORIES and amount < IMPULSE_MAX_AMOUNT:
+            self.impulse_count[row] += 1
+
+    def merge(self, other):
+        """Add other's partials into these; the months and categories may differ"""
+        if not other.n_months:
+            return self
+        self._row(other.first_month)
+        offset = self._row(other.first_month + other.n_months - 1) - other.n_months + 1
+        rows = slice(offset, offset + other.n_months)
+        columns = [self._column(c) for c in other.categories]
+
+        self.weekday_total[rows] += other.weekday_total
+        self.weekday_count[rows] += other.weekday_count
+        self.category_total[rows, columns] += other.category_total
+        self.impulse_count[rows] += other.impulse_count
+        return self
+
+    def monthly_totals(self):
+        """(month label, expense total) for every month with an expense"""
+        totals = self.weekday_total.sum(axis=1)
+        active = np.flatnonzero(self.weekday_count.sum(axis=1))
+        return [(month_label(self.first_month + i), float(totals[i])) for i in active]
+
+    def insights(self):
+        """Same shape as FinancialPredictor.generate_spending_insights"""
+        day_totals = self.weekday_total.sum(axis=0)
+        day_counts = self.weekday_count.sum(axis=0)
+        expenses = int(day_counts.sum())
+
+        weekend_total, weekend_count = day_totals[5:].sum(), day_counts[5:].sum()
+        weekday_total, weekday_count = day_totals[:5].sum(), day_counts[:5].sum()
+        weekend_avg = float(weekend_total / weekend_count) if weekend_count else 0.0
+        weekday_avg = float(weekday_total / weekday_count) if weekday_count else 0.0
+
+        return {
+            "top_spending_day": WEEKDAYS[int(day_totals.argmax())] if expenses else None,
+            "weekend_vs_weekday": {
+                "weekend_avg": round(weekend_avg, 2),
+                "weekday_avg": round(weekday_avg, 2),
+                "difference_pct": round((weekend_avg / weekday_avg - 1) * 100, 1) if weekday_avg > 0 else 0
+            },
+            "monthly_trend": self._trend(),
+            "category_concentration": self._concentration(),
+            "impulse_spending_score": (
+                round(int(self.impulse_count.sum()) / expenses * 100, 1) if expenses >= IMPULSE_MIN_EXPENSES else 0
+            ),
+        }
+
+    def _trend(self):
+        """Last month with expenses against the mean of the earlier ones"""
+        monthly = [total for _, total in self.monthly_totals()]
+        if len(monthly) < 2:
+            return "insufficient_data"
+
+        avg_previous = sum(monthly[:-1]) / (len(monthly) - 1)
+        change = (monthly[-1] / avg_previous - 1) * 100 if avg_previous > 0 else 0
+        if change > TREND_THRESHOLD_PCT:
+            return "increasing"
+        elif change < -TREND_THRESHOLD_PCT:
+            return "decreasing"
+        return "stable"
+
+    def _concentration(self):
+        """Herfindahl index of expense shares by category"""
+        totals = self.category_total.sum(axis=0)
+        total_spending = totals.sum()
+        if total_spending == 0:
+            return 0
+
+        hhi = float(((totals / total_spending) ** 2).sum() * 100)
+        if hhi > 25:
+            return "highly_concentrated"
+        elif hhi > 15:
+            return "moderately_concentrated"
+        return "diversified"
+
+    def to_json(self):
+        return json.dumps({
+            "first_month": self.first_month,
+            "ledger_version": self.ledger_version,
+            "currency": self.currency,
+            "categories": self.categories,
+            "weekday_total": self.weekday_total.round(2).tolist(),
+            "weekday_count": self.weekday_count.tolist(),
+            "category_total": self.category_total.round(2).tolist(),
+            "impulse_count": self.impulse_count.tolist(),
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode('utf-8')
+        return cls(**json.loads(data))
+
+
+def _table(values, empty_shape, dtype):
+    if values is None:
+        return np.zeros(empty_shape, dtype=dtype)
+    table = np.asarray(values, dtype=dtype)
+    return table.reshape(empty_shape) if table.size == 0 else table
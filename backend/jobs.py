@@ -0,0 +1,261 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+JOB_MAX_PER_USER = int(os.environ.get('JOB_MAX_PER_USER', 4))
+JOB_MAX_QUEUED = int(os.environ.get('JOB_MAX_QUEUED', 256))
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 300))
+JOB_START_METHOD = os.environ.get('JOB_START_METHOD', 'spawn')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    __slots__ = ('id', 'user_id', 'kind', 'key', 'func', 'args', 'status', 'result',
+                 'error', 'submitted_at', 'started_at', 'finished_at', 'done', 'callbacks')
+
+    def __init__(self, user_id, kind, key, func, args):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.kind = kind
+        self.key = key
+        self.func = func
+        self.args = args
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        self.callbacks = []  # None once the job has finished
+
+    def to_dict(self, include_result=True):
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == 'done' and include_result:
+            data["result"] = self.result
+        if self.status == 'failed':
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """
+    Local in-process job queue in front of a bounded process pool.
+
+    Pending jobs are kept per user and dispatched round-robin, so one user
+    with many queued jobs cannot starve the others. At most `workers` jobs
+    run at once. Jobs with the same key (user, kind, ledger version) are
+    submitted once; a finished job is reused as a fresh result until its
+    TTL expires or the ledger version in the key changes.
+
+    Job ids are local to the worker process that created them, so a
+    deployment running several gunicorn workers needs sticky routing for
+    polling, or one worker with threads.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_per_user=JOB_MAX_PER_USER,
+                 max_queued=JOB_MAX_QUEUED, result_ttl=JOB_RESULT_TTL,
+                 start_method=JOB_START_METHOD):
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._start_method = start_method
+        self._executor = None
+
+        # Re-entrant: a future that is already done runs its callback inside submit()
+        self._lock = threading.RLock()
+        self._pending = OrderedDict()  # user_id -> deque of jobs
+        self._jobs = {}
+        self._by_key = {}
+        self._running = 0
+
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._run_times = deque(maxlen=1000)
+        self._wait_times = deque(maxlen=1000)
+
+    def _get_executor(self):
+        if self._executor is None:
+            context = multiprocessing.get_context(self._start_method)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._executor
+
+    def submit(self, user_id, kind, key, func, *args):
+        """
+        Queue func(*args) for user_id, or return the existing job for key
+
+        Raises:
+            QueueFull: If the user or the whole queue is at its limit
+        """
+        with self._lock:
+            self._expire()
+
+            existing = self._by_key.get(key)
+            if existing is not None and existing.status != 'failed':
+                return existing
+
+            queued_for_user = len(self._pending.get(user_id, ()))
+            queued_total = sum(len(q) for q in self._pending.values())
+            if queued_for_user >= self.max_per_user or queued_total >= self.max_queued:
+                self._rejected += 1
+                raise QueueFull("Too many queued prediction jobs, try again shortly")
+
+            job = Job(user_id, kind, key, func, args)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+            self._pending.setdefault(user_id, deque()).append(job)
+            self._dispatch()
+            return job
+
+    def fresh_result(self, key):
+        """Finished job for key if it is still within its TTL"""
+        with self._lock:
+            self._expire()
+            job = self._by_key.get(key)
+            return job if job is not None and job.status == 'done' else None
+
+    def get(self, job_id, user_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def wait(self, job, timeout):
+        job.done.wait(timeout)
+        return job
+
+    def add_done_callback(self, job, fn):
+        """Call fn(job) once job is done or failed; right away if it already is"""
+        with self._lock:
+            if job.callbacks is not None:
+                job.callbacks.append(fn)
+                return
+        fn(job)
+
+    @staticmethod
+    def _run_callbacks(job, callbacks):
+        for fn in callbacks:
+            try:
+                fn(job)
+            except Exception as e:
+                print(f"Error in callback for job {job.id}: {e}")
+
+    def _dispatch(self):
+        # Called with the lock held
+        while self._running < self.workers and self._pending:
+            user_id, queue = next(iter(self._pending.items()))
+            job = queue.popleft()
+            # Rotate the user to the back so users take turns
+            del self._pending[user_id]
+            if queue:
+                self._pending[user_id] = queue
+
+            job.status = 'running'
+            job.started_at = time.time()
+            self._wait_times.append(job.started_at - job.submitted_at)
+            self._running += 1
+            try:
+                future = self._get_executor().submit(job.func, *job.args)
+            except Exception as e:
+                # BrokenProcessPool, or a pool shut down under us; fail this
+                # job and let the next one start a new pool
+                self._running -= 1
+                job.finished_at = time.time()
+                job.error = str(e) or type(e).__name__
+                job.status = 'failed'
+                self._failed += 1
+                self._reset_executor()
+                callbacks, job.callbacks = job.callbacks, None
+                job.done.set()
+                self._run_callbacks(job, callbacks)
+                continue
+            future.add_done_callback(lambda f, job=job: self._finish(job, f))
+
+    def _reset_executor(self):
+        # Called with the lock held
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _finish(self, job, future):
+        with self._lock:
+            job.finished_at = time.time()
+            self._running -= 1
+            self._run_times.append(job.finished_at - job.started_at)
+
+            error = future.exception()
+            if error is None:
+                job.result = future.result()
+                job.status = 'done'
+                self._completed += 1
+            else:
+                job.error = str(error)
+                job.status = 'failed'
+                self._failed += 1
+                if isinstance(error, BrokenProcessPool):
+                    # A crashed child poisons the pool; start a new one for later jobs
+                    self._executor = None
+
+            callbacks, job.callbacks = job.callbacks, None
+            self._dispatch()
+        job.done.set()
+        self._run_callbacks(job, callbacks)
+
+    def _expire(self):
+        # Called with the lock held
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+    def metrics(self):
+        with self._lock:
+            run_times = np.array(self._run_times) if self._run_times else np.zeros(1)
+            wait_times = np.array(self._wait_times) if self._wait_times else np.zeros(1)
+            return {
+                "workers": self.workers,
+                "queue_depth": sum(len(q) for q in self._pending.values()),
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "run_time_ms": {
+                    "p50": round(float(np.percentile(run_times, 50)) * 1000, 1),
+                    "p95": round(float(np.percentile(run_times, 95)) * 1000, 1),
+                    "max": round(float(run_times.max()) * 1000, 1),
+                },
+                "queue_wait_ms": {
+                    "p50": round(float(np.percentile(wait_times, 50)) * 1000, 1),
+                    "p95": round(float(np.percentile(wait_times, 95)) * 1000, 1),
+                },
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,246 @@
+"""
+Schema migrations for every shard, and EXPLAIN checks of the hot queries.
+
+    python migrate.py status
+    python migrate.py up
+    python migrate.py check
+
+database/schema.sql is the baseline a new database starts from. Every
+change after it is a numbered script in database/migrations
+(NNNN_description.sql). `up` applies the pending ones in order on each
+shard and records them in schema_migrations, under a named lock so two
+deploys can't run them at once. Scripts are plain MySQL and may use the
+mysql client's DELIMITER lines around procedure and trigger bodies.
+
+MySQL commits DDL implicitly, so a script that fails half way is not
+rolled back: fix the database or the script and run `up` again, which
+resumes with the first unrecorded migration. SQLite stand-in shards are
+skipped.
+
+`check` runs EXPLAIN on the hot per-request queries (HOT_QUERIES) for
+the user with the busiest ledger on each shard, and exits non-zero if
+any of them reads a table in full or stops using the index it was
+written for. Run it against a database with realistic data, such as
+one seeded by benchmarks.loadtest; on near-empty tables the optimizer
+may rightly prefer a full scan. tests/test_migrate.py runs the same
+check under pytest when DB_HOST or SHARDS_CONFIG is set.
+"""
+import os
+import re
+import sys
+from datetime import date, timedelta
+
+MIGRATIONS_DIR = os.environ.get(
+    'MIGRATIONS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'migrations')
+)
+MIGRATION_LOCK_TIMEOUT = int(os.environ.get('MIGRATION_LOCK_TIMEOUT', 60))
+
+_FILENAME = re.compile(r'^(?P<version>\d{4})_(?P<name>[\w-]+)\.sql$')
+
+# (name, query, index it must use on transactions or None for any index)
+HOT_QUERIES = [
+    ('monthly totals', """
+        SELECT `year_month` AS month, type, category, SUM(amount) AS total, COUNT(*) AS count
+        FROM transactions
+        WHERE user_id = %(user_id)s AND (currency IS NULL OR currency = %(currency)s)
+        GROUP BY `year_month`, type, category""", 'idx_user_month_cover'),
+    ('monthly totals, foreign currency', """
+        SELECT transaction_date, type, category, currency, SUM(amount) AS total, COUNT(*) AS count
+        FROM transactions
+        WHERE user_id = %(user_id)s AND currency <> %(currency)s
+        GROUP BY transaction_date, type, category, currency""", None),
+    ('transaction list', """
+        SELECT * FROM transactions WHERE user_id = %(user_id)s
+        ORDER BY transaction_date DESC""", 'idx_user_date'),
+    ('expense rows', """
+        SELECT transaction_date AS date, amount, type, category, currency
+        FROM transactions
+        WHERE user_id = %(user_id)s AND type = 'expense'""", 'idx_user_type_date_cover'),
+    ('category spend this month', """
+        SELECT COALESCE(SUM(amount), 0) FROM transactions
+        WHERE user_id = %(user_id)s AND category = %(category)s AND type = 'expense'
+        AND transaction_date >= %(month_start)s AND transaction_date < %(next_month)s""",
+     'idx_user_type_date_cover'),
+    ('spending by weekday', """
+        SELECT DAYNAME(transaction_date) as day_of_week, COUNT(*) as transaction_count,
+            SUM(amount) as total_amount
+        FROM transactions
+        WHERE user_id = %(user_id)s AND type = 'expense' AND (currency IS NULL OR currency = %(currency)s)
+        GROUP BY DAYNAME(transaction_date)""", 'idx_user_type_date_cover'),
+    ('ledger version', "SELECT version FROM ledger_versions WHERE user_id = %(user_id)s", None),
+    ('budgets', "SELECT * FROM budgets WHERE user_id = %(user_id)s ORDER BY id", None),
+]
+
+
+def migrations(directory=MIGRATIONS_DIR):
+    """(version, name, path) of every migration script, in order"""
+    found = []
+    for entry in os.listdir(directory):
+        match = _FILENAME.match(entry)
+        if match:
+            found.append((int(match['version']), match['name'], os.path.join(directory, entry)))
+    found.sort()
+    versions = [version for version, _, _ in found]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration numbers in {directory}")
+    return found
+
+
+def split_statements(script):
+    """Statements of a mysql client script, honouring DELIMITER lines"""
+    delimiter = ';'
+    statements = []
+    current = []
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        if not current and (not stripped or stripped.startswith('--')):
+            continue
+        current.append(line)
+        if stripped.endswith(delimiter):
+            statement = '\n'.join(current).rstrip()
+            statements.append(statement[:-len(delimiter)].strip())
+            current = []
+    if current:
+        statements.append('\n'.join(current).strip())
+    return statements
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(router, shard, directory=MIGRATIONS_DIR):
+    """
+    Apply the shard's pending migrations in order
+
+    Returns:
+        list: Names of the migrations applied
+    """
+    connection = router.connect(shard)
+    applied = []
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT GET_LOCK('schema_migrations', %s)", (MIGRATION_LOCK_TIMEOUT,))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError(f"{shard}: another migration run holds the lock")
+        try:
+            done = applied_versions(cursor)
+            for version, name, path in migrations(directory):
+                if version in done:
+                    continue
+                with open(path) as f:
+                    statements = split_statements(f.read())
+                for statement in statements:
+                    cursor.execute(statement)
+                    if cursor.with_rows:
+                        cursor.fetchall()
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name)
+                )
+                connection.commit()
+                applied.append(f"{version:04d}_{name}")
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('schema_migrations')")
+            cursor.fetchall()
+            cursor.close()
+    finally:
+        connection.close()
+    return applied
+
+
+def pending(router, shard, directory=MIGRATIONS_DIR):
+    connection = router.connect(shard)
+    try:
+        cursor = connection.cursor()
+        done = applied_versions(cursor)
+        cursor.close()
+    finally:
+        connection.close()
+    return [f"{version:04d}_{name}" for version, name, _ in migrations(directory) if version not in done]
+
+
+def explain_hot_queries(router, shard):
+    """
+    EXPLAIN each of HOT_QUERIES for the shard's busiest user
+
+    Returns:
+        list: (name, ok, plan summary) per query
+    """
+    connection = router.connect(shard)
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT user_id FROM ledger_versions ORDER BY version DESC LIMIT 1")
+        row = cursor.fetchone()
+        if row is None:
+            return []
+        user_id = row['user_id']
+        cursor.execute("SELECT currency FROM user_preferences WHERE user_id = %s", (user_id,))
+        row = cursor.fetchone()
+        cursor.execute("SELECT category FROM transactions WHERE user_id = %s LIMIT 1", (user_id,))
+        category = cursor.fetchone()
+        month_start = date.today().replace(day=1)
+        params = {
+            'user_id': user_id,
+            'currency': (row and row['currency']) or 'INR',
+            'category': category['category'] if category else 'Other',
+            'month_start': month_start,
+            'next_month': (month_start + timedelta(days=32)).replace(day=1),
+        }
+
+        results = []
+        for name, query, index in HOT_QUERIES:
+            cursor.execute("EXPLAIN " + query, params)
+            plan = cursor.fetchall()
+            problems = []
+            for step in plan:
+                if step['type'] == 'ALL':
+                    problems.append(f"full scan of {step['table']}")
+                elif index and step['table'] == 'transactions' and step['key'] != index:
+                    problems.append(f"uses {step['key']} instead of {index}")
+            summary = '; '.join(
+                f"{step['table']}: {step['type']} on {step['key']}, ~{step['rows']} rows"
+                + (f" ({step['Extra']})" if step.get('Extra') else '')
+                for step in plan
+            )
+            results.append((name, not problems, '; '.join(problems) or summary))
+        cursor.close()
+        return results
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    from app import shard_router
+
+    shards = [shard for shard in shard_router.shards if shard_router.dialect(shard) == 'mysql']
+    command = sys.argv[1:]
+
+    if command == ['status']:
+        for shard in shards:
+            waiting = pending(shard_router, shard)
+            print(f"{shard}: {len(waiting)} pending" + ''.join(f"\n  {name}" for name in waiting))
+    elif command == ['up']:
+        for shard in shards:
+            applied = migrate(shard_router, shard)
+            print(f"{shard}: applied {len(applied)}" + ''.join(f"\n  {name}" for name in applied))
+    elif command == ['check']:
+        failed = False
+        for shard in shards:
+            for name, ok, detail in explain_hot_queries(shard_router, shard):
+                print(f"{shard}: {'ok  ' if ok else 'FAIL'} {name}: {detail}")
+                failed |= not ok
+        sys.exit(1 if failed else 0)
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,306 @@
+"""
+Per-user model artifacts persisted with joblib and loaded memory-mapped.
+
+    python modelstore.py stats
+    python modelstore.py cleanup
+
+An artifact is any picklable value derived from a user's ledger. It is
+stored as MODEL_DIR/users/<user_id>/<name>.<version>.joblib, where the
+version names the ledger it was fitted from (ledger version plus
+anything else it depends on, such as the FX table). A request asks for
+the version it needs and only refits on a miss; writing a new version
+removes the old one.
+
+Files are dumped uncompressed and opened with mmap_mode='r', so numpy
+arrays inside an artifact are mapped rather than unpickled: every
+worker on the host shares the same page-cache pages, and a freshly
+started worker serves the artifact without refitting. Mapped arrays are
+read-only.
+
+Loads touch the file's mtime, so mtime is last use. `cleanup` drops
+leftover temp files, artifacts unused for MODEL_STORE_MAX_AGE_DAYS, and
+then the least recently used artifacts until the store is under
+MODEL_STORE_MAX_BYTES. Workers run it in the background at most every
+MODEL_STORE_CLEANUP_INTERVAL seconds after a write.
+"""
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from categorize import MODEL_DIR
+from singleflight import SingleFlight
+
+MODEL_STORE_MAX_BYTES = int(os.environ.get('MODEL_STORE_MAX_BYTES', 2 * 1024 ** 3))
+MODEL_STORE_MAX_AGE_DAYS = float(os.environ.get('MODEL_STORE_MAX_AGE_DAYS', 30))
+MODEL_STORE_CACHE_ENTRIES = int(os.environ.get('MODEL_STORE_CACHE_ENTRIES', 256))
+MODEL_STORE_CLEANUP_INTERVAL = float(os.environ.get('MODEL_STORE_CLEANUP_INTERVAL', 600))
+TEMP_FILE_MAX_AGE = 3600
+
+_FILENAME = re.compile(r'^(?P<name>[\w-]+)\.(?P<version>[\w-]+)\.joblib$')
+
+
+class ModelStore:
+    """Versioned per-user artifacts on disk, with a small in-process cache of loaded ones"""
+
+    def __init__(self, model_dir=MODEL_DIR, cache_entries=MODEL_STORE_CACHE_ENTRIES,
+                 max_bytes=MODEL_STORE_MAX_BYTES, max_age_days=MODEL_STORE_MAX_AGE_DAYS,
+                 cleanup_interval=MODEL_STORE_CLEANUP_INTERVAL):
+        self.root = os.path.join(model_dir, 'users')
+        self.cache_entries = cache_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.cleanup_interval = cleanup_interval
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._fits = SingleFlight()
+        self._last_cleanup = time.monotonic()
+        self._cleaning = False
+
+        self.hits = 0
+        self.loads = 0
+        self.fits = 0
+
+    def _dir(self, user_id):
+        return os.path.join(self.root, str(int(user_id)))
+
+    def _path(self, user_id, name, version):
+        return os.path.join(self._dir(user_id), f"{name}.{version}.joblib")
+
+    def get(self, user_id, name, version):
+        """The artifact at version, or None if it was never stored or is stale"""
+        key = (int(user_id), name)
+        with self._lock:
+            cached = self._loaded.get(key)
+            if cached is not None and cached[0] == version:
+                self._loaded.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+
+        path = self._path(user_id, name, version)
+        try:
+            artifact = joblib.load(path, mmap_mode='r')
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            self.loads += 1
+            self._remember(key, version, artifact)
+        return artifact
+
+    def put(self, user_id, name, version, artifact):
+        """
+        Persist artifact as the user's current version of name
+
+        Returns:
+            The artifact reloaded memory-mapped from the new file, so the
+            cache holds shared pages rather than this worker's private copy
+        """
+        directory = self._dir(user_id)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            joblib.dump(artifact, tmp)
+            os.replace(tmp, self._path(user_id, name, version))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        # Older versions can never be asked for again
+        for entry in os.listdir(directory):
+            match = _FILENAME.match(entry)
+            if match and match['name'] == name and match['version'] != str(version):
+                try:
+                    os.unlink(os.path.join(directory, entry))
+                except FileNotFoundError:
+                    pass
+
+        try:
+            mapped = joblib.load(self._path(user_id, name, version), mmap_mode='r')
+        except FileNotFoundError:
+            # Removed by a concurrent cleanup or a newer version; nothing to cache
+            return artifact
+        with self._lock:
+            self._remember((int(user_id), name), version, mapped)
+        self._maybe_cleanup()
+        return mapped
+
+    def get_or_fit(self, user_id, name, version, fit):
+        """
+        The artifact at version, calling fit() and storing its result on a
+        miss. Concurrent misses in this process share one fit.
+        """
+        artifact = self.get(user_id, name, version)
+        if artifact is not None:
+            return artifact
+
+        def fit_and_put():
+            artifact = self.put(user_id, name, version, fit())
+            with self._lock:
+                self.fits += 1
+            return artifact
+
+        return self._fits.do((int(user_id), name, version), fit_and_put)
+
+    def _remember(self, key, version, artifact):
+        self._loaded[key] = (version, artifact)
+        self._loaded.move_to_end(key)
+        while len(self._loaded) > self.cache_entries:
+            self._loaded.popitem(last=False)
+
+    def _files(self):
+        """(name, path, size, mtime) of every file in the store"""
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            for entry in names:
+                path = os.path.join(dirpath, entry)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((entry, path, st.st_size, st.st_mtime))
+        return files
+
+    def usage(self):
+        """Bytes and files on disk, in total and per artifact name"""
+        by_name = {}
+        users = set()
+        for entry, path, size, _ in self._files():
+            match = _FILENAME.match(entry)
+            name = match['name'] if match else 'temp'
+            stats = by_name.setdefault(name, {'files': 0, 'bytes': 0})
+            stats['files'] += 1
+            stats['bytes'] += size
+            users.add(os.path.basename(os.path.dirname(path)))
+        return {
+            'bytes': sum(s['bytes'] for s in by_name.values()),
+            'files': sum(s['files'] for s in by_name.values()),
+            'users': len(users),
+            'max_bytes': self.max_bytes,
+            'artifacts': by_name,
+        }
+
+    def cleanup(self, now=None):
+        """
+        Apply the retention policy
+
+        Returns:
+            dict: Files and bytes removed
+        """
+        now = now or time.time()
+        removed = {'files': 0, 'bytes': 0}
+
+        def remove(path, size):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                return
+            removed['files'] += 1
+            removed['bytes'] += size
+
+        kept = []
+        for entry, path, size, mtime in self._files():
+            if entry.endswith('.tmp'):
+                if now - mtime > TEMP_FILE_MAX_AGE:
+                    remove(path, size)
+            elif now - mtime > self.max_age:
+                remove(path, size)
+            else:
+                kept.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in kept)
+        for mtime, size, path in sorted(kept):
+            if total <= self.max_bytes:
+                break
+            remove(path, size)
+            total -= size
+
+        for dirpath, dirnames, names in os.walk(self.root, topdown=False):
+            if dirpath != self.root and not dirnames and not names:
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    pass
+        return removed
+
+    def _maybe_cleanup(self):
+        with self._lock:
+            if self._cleaning or time.monotonic() - self._last_cleanup < self.cleanup_interval:
+                return
+            self._cleaning = True
+            self._last_cleanup = time.monotonic()
+
+        def run():
+            try:
+                self.cleanup()
+            except Exception as e:
+                print(f"Error cleaning model store: {e}")
+            finally:
+                with self._lock:
+                    self._cleaning = False
+
+        threading.Thread(target=run, name='model-store-cleanup', daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'loads': self.loads,
+                'fits': self.fits,
+                'cached': len(self._loaded),
+                'fits_deduplicated': self._fits.deduplicated,
+            }
+
+
+def pack_frame(df):
+    """
+    A DataFrame as plain arrays that joblib can memory-map: numeric and
+    datetime columns as they are, text columns as int32 codes plus their
+    distinct values
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if not (pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values)):
+            codes, uniques = pd.factorize(values)
+            columns[column] = ('codes', codes.astype(np.int32), np.asarray(uniques, dtype=object))
+        else:
+            columns[column] = ('values', values.to_numpy(), None)
+    return {'length': len(df), 'columns': columns}
+
+
+def unpack_frame(packed):
+    """DataFrame from pack_frame output; numeric columns stay views of the mapped arrays"""
+    data = {}
+    for column, (kind, values, uniques) in packed['columns'].items():
+        if kind == 'codes':
+            decoded = np.append(uniques, None).take(values) if len(uniques) else np.full(len(values), None)
+            data[column] = decoded
+        else:
+            data[column] = values
+    return pd.DataFrame(data, index=pd.RangeIndex(packed['length']), copy=False)
+
+
+if __name__ == '__main__':
+    store = ModelStore()
+
+    if sys.argv[1:] == ['stats']:
+        usage = store.usage()
+        print(f"{usage['bytes']} bytes in {usage['files']} files for {usage['users']} users")
+        for name, stats in sorted(usage['artifacts'].items()):
+            print(f"  {name}: {stats['files']} files, {stats['bytes']} bytes")
+    elif sys.argv[1:] == ['cleanup']:
+        removed = store.cleanup()
+        print(f"removed {removed['files']} files, {removed['bytes']} bytes")
+    else:
+        print(__doc__)
+        sys.exit(1)
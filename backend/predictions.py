@@ -1,11 +1,24 @@
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.linear_model import Ridge
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 from datetime import datetime, timedelta
 import calendar
 import json
+from forecasting import batch_fit
+from insights import SpendingAggregates
+
+
+def as_of_date(as_of=None):
+    """Day an evaluation is made on, as a Timestamp; today when as_of is None"""
+    return pd.Timestamp(as_of if as_of is not None else datetime.now().date()).normalize()
+
+
+def known_at(transactions_df, as_of):
+    """Rows dated on or before as_of; the frame's date column must already be datetimes"""
+    return transactions_df[transactions_df['date'] < as_of + pd.Timedelta(days=1)]
+
 
 class FinancialPredictor:
     """
@@ -15,12 +28,13 @@ class FinancialPredictor:
     def __init__(self):
         self.scaler = StandardScaler()
         
-    def predict_cash_flow(self, transactions_df):
+    def predict_cash_flow(self, transactions_df, as_of=None):
         """
         Predict end-of-month balance based on current spending patterns
         
         Args:
             transactions_df: DataFrame with columns [date, amount, type]
+            as_of: Date the prediction is made on; later rows are ignored
         
         Returns:
             dict: Predicted balance, confidence, and breakdown
@@ -29,11 +43,13 @@ class FinancialPredictor:
             return {"error": "Insufficient data for prediction"}
         
         # Prepare data
+        as_of = as_of_date(as_of)
         transactions_df['date'] = pd.to_datetime(transactions_df['date'])
         transactions_df['day'] = transactions_df['date'].dt.day
+        transactions_df = known_at(transactions_df, as_of)
         
-        current_month = datetime.now().month
-        current_year = datetime.now().year
+        current_month = as_of.month
+        current_year = as_of.year
         
         # Filter current month
         current_month_data = transactions_df[
@@ -45,7 +61,7 @@ class FinancialPredictor:
         income = current_month_data[current_month_data['type'] == 'income']['amount'].sum()
         expenses = current_month_data[current_month_data['type'] == 'expense']['amount'].sum()
         
-        days_passed = datetime.now().day
+        days_passed = as_of.day
         days_in_month = calendar.monthrange(current_year, current_month)[1]
         
         # Linear projection
@@ -79,13 +95,120 @@ class FinancialPredictor:
             "avg_daily_spend": round(avg_daily_expense, 2)
         }
     
-    def predict_category_spending(self, transactions_df, category):
+    def simulate_cash_flow(self, transactions_df, n_paths=10000, seed=0,
+                           lookback_days=180, month_to_date_net=None, as_of=None):
+        """
+        Monte Carlo end-of-month balance by bootstrapping daily cash flows
+        
+        The ledger has no opening account balance, so "balance" here is the
+        month's net cash flow (income minus expenses since the 1st): the
+        paths start from the month-to-date net and end at what the month
+        leaves saved, or overspent if negative.
+        
+        Recurring charges (same merchant and amount, 3+ times across 2+ months)
+        are scheduled on their usual day of month; every other day of the
+        remaining month is drawn from the user's recent daily net flows.
+        All paths are simulated as one (n_paths x days_remaining) array.
+        
+        Args:
+            transactions_df: DataFrame with columns [date, amount, type, category, merchant]
+            n_paths: Number of simulated month-end paths
+            seed: RNG seed, the same seed gives the same result
+            lookback_days: History window the daily draws come from
+            month_to_date_net: Net to start from, defaults to this month's net so far
+            as_of: Date the simulation starts from; later rows are ignored
+            
+        Returns:
+            dict: Balance percentiles and probability of going negative
+        """
+        if len(transactions_df) < 5:
+            return {"error": "Insufficient data for simulation"}
+        
+        now = today = as_of_date(as_of)
+        month_start = today.replace(day=1)
+        days_in_month = calendar.monthrange(now.year, now.month)[1]
+        days_remaining = days_in_month - now.day
+        
+        dates = pd.to_datetime(transactions_df['date']).dt.normalize()
+        if (dates > today).any():
+            transactions_df = transactions_df[(dates <= today).to_numpy()]
+            dates = dates[dates <= today]
+        signed = np.where(transactions_df['type'] == 'income', 1.0, -1.0) * transactions_df['amount'].to_numpy(dtype=float)
+        
+        if month_to_date_net is None:
+            this_month = (dates >= month_start) & (dates <= today)
+            month_to_date_net = float(signed[this_month.to_numpy()].sum())
+        
+        recurring_mask, recurring_schedule = self._recurring_schedule(
+            transactions_df, dates, signed, today
+        )
+        
+        # Daily non-recurring net flow over the lookback window, zero days included
+        window_start = today - pd.Timedelta(days=lookback_days)
+        in_window = ((dates > window_start) & (dates <= today)).to_numpy() & ~recurring_mask
+        day_offsets = (today - dates[in_window]).dt.days.to_numpy()
+        daily_net = np.bincount(day_offsets, weights=signed[in_window], minlength=lookback_days)[:lookback_days]
+        
+        # Remaining recurring charges land on known days
+        scheduled = np.zeros(days_remaining)
+        for day, amount in recurring_schedule:
+            if now.day < day <= days_in_month:
+                scheduled[day - now.day - 1] += amount
+        
+        rng = np.random.default_rng(seed)
+        draws = daily_net[rng.integers(0, len(daily_net), size=(n_paths, days_remaining))]
+        paths = month_to_date_net + np.cumsum(draws + scheduled, axis=1)
+        
+        end_balance = paths[:, -1] if days_remaining else np.full(n_paths, month_to_date_net)
+        lowest = paths.min(axis=1) if days_remaining else end_balance
+        p5, p50, p95 = np.percentile(end_balance, [5, 50, 95])
+        
+        return {
+            "month_to_date_net": round(month_to_date_net, 2),
+            "days_remaining": days_remaining,
+            "p5_balance": round(float(p5), 2),
+            "p50_balance": round(float(p50), 2),
+            "p95_balance": round(float(p95), 2),
+            "prob_negative": round(float((end_balance < 0).mean()), 4),
+            "prob_negative_any_day": round(float((lowest < 0).mean()), 4),
+            "scheduled_recurring": round(float(scheduled.sum()), 2),
+            "paths": n_paths,
+            "seed": seed
+        }
+    
+    def _recurring_schedule(self, df, dates, signed, today):
+        """Find recurring charges and the day of month they usually land on"""
+        key = df['merchant'].fillna(df['category']).astype(str) + '|' + df['amount'].astype(str) + '|' + df['type']
+        months = dates.dt.year * 12 + dates.dt.month
+        stats = pd.DataFrame({'key': key, 'month': months, 'day': dates.dt.day, 'date': dates}).groupby('key').agg(
+            count=('month', 'size'), months=('month', 'nunique'),
+            last_month=('month', 'max'), last_date=('date', 'max'), day=('day', 'median')
+        )
+        recurring = stats[(stats['count'] >= 3) & (stats['months'] >= 2)]
+        
+        mask = key.isin(recurring.index).to_numpy()
+        current_month = today.year * 12 + today.month
+        # Still running: last charged last month (not yet this month) and,
+        # as in identify_subscription_waste, within the last 60 days
+        due = recurring[
+            (recurring['last_month'] == current_month - 1)
+            & ((today - recurring['last_date']).dt.days < 60)
+        ]
+        first_signed = pd.Series(signed, index=key.index).groupby(key).first()
+        schedule = [
+            (int(round(day)), float(first_signed[k]))
+            for k, day in due['day'].items()
+        ]
+        return mask, schedule
+    
+    def predict_category_spending(self, transactions_df, category, as_of=None):
         """
         Predict spending for a specific category next month
         
         Args:
             transactions_df: DataFrame with transaction history
             category: Category to predict
+            as_of: Date the prediction is made on; later rows are ignored
             
         Returns:
             dict: Prediction with confidence intervals
@@ -94,39 +217,30 @@ class FinancialPredictor:
             (transactions_df['category'] == category) & 
             (transactions_df['type'] == 'expense')
         ].copy()
+        category_data['date'] = pd.to_datetime(category_data['date'])
+        category_data = known_at(category_data, as_of_date(as_of))
         
         if len(category_data) < 3:
             return {"error": "Insufficient data for category prediction"}
         
-        # Group by month
-        category_data['date'] = pd.to_datetime(category_data['date'])
-        monthly_spending = category_data.groupby(
-            [category_data['date'].dt.year, category_data['date'].dt.month]
-        )['amount'].sum().reset_index()
-        
-        monthly_spending.columns = ['year', 'month', 'amount']
-        monthly_spending['month_num'] = range(len(monthly_spending))
-        
-        # Train linear regression
-        X = monthly_spending[['month_num']].values
-        y = monthly_spending['amount'].values
-        
-        model = LinearRegression()
-        model.fit(X, y)
+        # Group by month, keeping empty months as zeros
+        months = category_data['date'].dt.year * 12 + category_data['date'].dt.month - 1
+        monthly_spending = category_data.groupby(months)['amount'].sum()
+        first_month = int(monthly_spending.index.min())
+        y = np.zeros(int(monthly_spending.index.max()) - first_month + 1)
+        y[monthly_spending.index.values - first_month] = monthly_spending.values
         
-        # Predict next month
-        next_month = len(monthly_spending)
-        prediction = model.predict([[next_month]])[0]
-        
-        # Calculate standard deviation for confidence interval
-        std_dev = np.std(y)
+        # Holt-Winters fit, seasonal once two years of history exist
+        state = batch_fit(y[None, :], first_month)[0]
+        next_month = first_month + len(y)
+        prediction, lower, upper = state.forecast(1, next_month % 12)
         
         return {
             "predicted_amount": round(max(0, prediction), 2),
-            "lower_bound": round(max(0, prediction - std_dev), 2),
-            "upper_bound": round(prediction + std_dev, 2),
-            "avg_historical": round(np.mean(y), 2),
-            "trend": "increasing" if model.coef_[0] > 0 else "decreasing"
+            "lower_bound": round(max(0, lower), 2),
+            "upper_bound": round(max(0, upper), 2),
+            "avg_historical": round(float(np.mean(y)), 2),
+            "trend": "increasing" if state.trend > 0 else "decreasing"
         }
     
     def detect_anomalies(self, transactions_df, threshold=2.5):
@@ -176,20 +290,22 @@ class FinancialPredictor:
         
         return anomalies
     
-    def predict_budget_overrun(self, transactions_df, budgets_dict):
+    def predict_budget_overrun(self, transactions_df, budgets_dict, as_of=None):
         """
         Predict which budgets are likely to be exceeded
         
         Args:
             transactions_df: DataFrame with current month transactions
             budgets_dict: Dictionary of {category: budget_limit}
+            as_of: Date the month is projected from; later rows are ignored
             
         Returns:
             list: Categories at risk with predictions
         """
-        current_month = datetime.now().month
-        current_year = datetime.now().year
-        current_day = datetime.now().day
+        as_of = as_of_date(as_of)
+        current_month = as_of.month
+        current_year = as_of.year
+        current_day = as_of.day
         days_in_month = calendar.monthrange(current_year, current_month)[1]
         
         at_risk = []
@@ -198,6 +314,7 @@ class FinancialPredictor:
         current_month_expenses = transactions_df[
             (transactions_df['date'].dt.month == current_month) & 
             (transactions_df['date'].dt.year == current_year) &
+            (transactions_df['date'] < as_of + pd.Timedelta(days=1)) &
             (transactions_df['type'] == 'expense')
         ]
         
@@ -222,7 +339,94 @@ class FinancialPredictor:
                 })
         
         return sorted(at_risk, key=lambda x: x['overrun_amount'], reverse=True)
-    
+
+    def evaluate_budget_scenarios(self, spent_by_category, scenarios, current_budgets=None,
+                                  as_of=None):
+        """
+        Vectorized predict_budget_overrun over many candidate budget sets
+
+        Every scenario is a row of one (scenarios x categories) limit
+        matrix, compared against a single month-to-date run-rate vector.
+
+        Args:
+            spent_by_category: Dictionary of {category: spent this month}
+            scenarios: List of {category: budget_limit}; categories a
+                scenario leaves out keep their current budget
+            current_budgets: Dictionary of {category: budget_limit}
+            as_of: Date the month is projected from (defaults to today)
+
+        Returns:
+            list: One result per scenario, in input order, with the
+                categories at risk in the shape of predict_budget_overrun
+        """
+        if not scenarios:
+            return []
+
+        as_of = as_of_date(as_of)
+        current_day = as_of.day
+        days_in_month = calendar.monthrange(as_of.year, as_of.month)[1]
+        current_budgets = current_budgets or {}
+
+        categories = sorted(set(current_budgets).union(*scenarios))
+        column = {category: j for j, category in enumerate(categories)}
+        limits = np.full((len(scenarios), len(categories)), np.nan)
+        for category, limit in current_budgets.items():
+            limits[:, column[category]] = limit
+        for i, scenario in enumerate(scenarios):
+            for category, limit in scenario.items():
+                limits[i, column[category]] = np.nan if limit is None else limit
+
+        spent = np.array([float(spent_by_category.get(c, 0)) for c in categories])
+        daily_rate = spent / current_day
+        projected = daily_rate * days_in_month
+
+        # NaN limits (no budget) compare False and drop out of every mask
+        with np.errstate(divide='ignore', invalid='ignore'):
+            overrun = projected - limits
+            at_risk = projected > limits
+            high = projected > limits * 1.2
+            days_until = np.where(
+                daily_rate > 0,
+                np.maximum(np.floor((limits - spent) / daily_rate), 0),
+                days_in_month - current_day
+            )
+        # No budget, no day count; NaN would warn when cast to int below
+        days_until[np.isnan(days_until)] = 0
+
+        # Categories at risk first, largest overrun first, within each row
+        order = np.argsort(np.where(at_risk, -overrun, np.inf), axis=1, kind='stable')
+        n_at_risk = at_risk.sum(axis=1)
+        total_budget = np.nansum(limits, axis=1)
+        total_overrun = np.where(at_risk, overrun, 0).sum(axis=1)
+
+        # Plain Python values up front; per-element numpy scalar access dominates otherwise
+        spent_list = spent.round(2).tolist()
+        projected_list = projected.round(2).tolist()
+        limits_list, overrun_list = limits.tolist(), overrun.round(2).tolist()
+        high_list, days_list = high.tolist(), days_until.astype(np.int64).tolist()
+
+        results = []
+        for i, (columns, n) in enumerate(zip(order.tolist(), n_at_risk.tolist())):
+            results.append({
+                "total_budget": round(float(total_budget[i]), 2),
+                "projected_overrun": round(float(total_overrun[i]), 2),
+                "categories_at_risk": n,
+                "at_risk": [
+                    {
+                        "category": categories[j],
+                        "budget_limit": limits_list[i][j],
+                        "current_spent": spent_list[j],
+                        "projected_total": projected_list[j],
+                        "overrun_amount": overrun_list[i][j],
+                        "risk_level": "high" if high_list[i][j] else "medium",
+                        "days_until_overrun": days_list[i][j]
+                    }
+                    for j in columns[:n]
+                ]
+            })
+
+        return results
+
     def calculate_savings_goal_timeline(self, current_amount, target_amount, 
                                        monthly_income, monthly_expenses):
         """
@@ -276,18 +480,101 @@ class FinancialPredictor:
             "recommendation": f"Save {round(conservative_monthly, 2)} per month for comfortable progress"
         }
     
-    def identify_subscription_waste(self, transactions_df):
+    def calculate_savings_goal_timelines(self, goals, monthly_income, monthly_expenses,
+                                         as_of=None):
+        """
+        Vectorized calculate_savings_goal_timeline over many goals, with
+        deadline feasibility
+        
+        Args:
+            goals: List of dicts with id, goal_name, current_amount, target_amount, deadline
+            monthly_income: Average monthly income
+            monthly_expenses: Average monthly expenses
+            as_of: Date the deadlines are measured from (defaults to today)
+            
+        Returns:
+            list: One timeline per goal, in input order
+        """
+        if not goals:
+            return []
+        
+        today = as_of_date(as_of)
+        current = np.array([float(g['current_amount'] or 0) for g in goals])
+        target = np.array([float(g['target_amount']) for g in goals])
+        deadlines = pd.to_datetime([g['deadline'] for g in goals])
+        
+        remaining = target - current
+        monthly_surplus = monthly_income - monthly_expenses
+        conservative_monthly = monthly_surplus * 0.7
+        aggressive_monthly = monthly_surplus * 0.9
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            conservative_months = np.where(conservative_monthly > 0, remaining / conservative_monthly, np.inf)
+            aggressive_months = np.where(aggressive_monthly > 0, remaining / aggressive_monthly, np.inf)
+            months_to_deadline = np.asarray((deadlines - today).days, dtype=float) / 30.44
+            required_monthly = np.where(months_to_deadline > 0, remaining / months_to_deadline, np.inf)
+        
+        deadline_status = np.select(
+            [months_to_deadline <= 0,
+             conservative_months <= months_to_deadline,
+             aggressive_months <= months_to_deadline],
+            ['passed', 'on_track', 'at_risk'],
+            default='unreachable'
+        )
+        
+        timelines = []
+        for i, goal in enumerate(goals):
+            timeline = {
+                "goal_id": goal.get('id'),
+                "goal_name": goal.get('goal_name'),
+                "deadline": str(deadlines[i].date()),
+                "months_to_deadline": round(float(months_to_deadline[i]), 1)
+            }
+            
+            if remaining[i] <= 0:
+                timeline.update({"status": "achieved", "message": "Goal already reached!"})
+            elif monthly_surplus <= 0:
+                timeline.update({
+                    "status": "impossible",
+                    "message": "Current spending exceeds income. Reduce expenses first.",
+                    "recommendation": "Cut expenses by at least " + str(round(abs(monthly_surplus) + 100, 2)),
+                    "deadline_status": "unreachable"
+                })
+            else:
+                timeline.update({
+                    "status": "achievable",
+                    "remaining_amount": round(float(remaining[i]), 2),
+                    "conservative_timeline": {
+                        "months": round(float(conservative_months[i]), 1),
+                        "monthly_savings": round(conservative_monthly, 2)
+                    },
+                    "aggressive_timeline": {
+                        "months": round(float(aggressive_months[i]), 1),
+                        "monthly_savings": round(aggressive_monthly, 2)
+                    },
+                    "recommendation": f"Save {round(conservative_monthly, 2)} per month for comfortable progress",
+                    "required_monthly": round(float(required_monthly[i]), 2) if np.isfinite(required_monthly[i]) else None,
+                    "deadline_status": str(deadline_status[i])
+                })
+            timelines.append(timeline)
+        
+        return timelines
+    
+    def identify_subscription_waste(self, transactions_df, as_of=None):
         """
         Identify potentially unused recurring subscriptions
         
         Args:
             transactions_df: DataFrame with transaction history
+            as_of: Date activity is judged from; later rows are ignored
             
         Returns:
             list: Suspicious subscriptions
         """
         # Look for recurring patterns
+        as_of = as_of_date(as_of)
         transactions_df['date'] = pd.to_datetime(transactions_df['date'])
+        transactions_df = known_at(transactions_df, as_of)
         
         # Group by merchant and amount
         recurring = transactions_df.groupby(['merchant', 'amount']).agg({
@@ -303,7 +590,7 @@ class FinancialPredictor:
         suspicious = []
         for _, sub in subscriptions.iterrows():
             # Check if last transaction was recent
-            days_since_last = (datetime.now() - sub['last_date']).days
+            days_since_last = (as_of - sub['last_date']).days
             
             if days_since_last < 60:  # Active subscription
                 suspicious.append({
@@ -327,90 +614,4 @@ class FinancialPredictor:
         Returns:
             dict: Various insights and recommendations
         """
-        transactions_df['date'] = pd.to_datetime(transactions_df['date'])
-        
-        # Time-based patterns
-        transactions_df['day_of_week'] = transactions_df['date'].dt.day_name()
-        transactions_df['hour'] = transactions_df['date'].dt.hour if 'time' in transactions_df.columns else 12
-        
-        insights = {
-            "top_spending_day": transactions_df.groupby('day_of_week')['amount'].sum().idxmax(),
-            "weekend_vs_weekday": self._weekend_analysis(transactions_df),
-            "monthly_trend": self._calculate_trend(transactions_df),
-            "category_concentration": self._category_concentration(transactions_df),
-            "impulse_spending_score": self._calculate_impulse_score(transactions_df)
-        }
-        
-        return insights
-    
-    def _weekend_analysis(self, df):
-        """Compare weekend vs weekday spending"""
-        df['is_weekend'] = df['date'].dt.dayofweek >= 5
-        weekend_avg = float(df[df['is_weekend'] & (df['type'] == 'expense')]['amount'].mean() or 0)
-        weekday_avg = float(df[~df['is_weekend'] & (df['type'] == 'expense')]['amount'].mean() or 0)
-        
-        return {
-            "weekend_avg": round(weekend_avg, 2) if not np.isnan(weekend_avg) else 0,
-            "weekday_avg": round(weekday_avg, 2) if not np.isnan(weekday_avg) else 0,
-            "difference_pct": round((weekend_avg / weekday_avg - 1) * 100, 1) if weekday_avg > 0 else 0
-        }
-    
-    def _calculate_trend(self, df):
-        """Calculate spending trend over time"""
-        monthly = df[df['type'] == 'expense'].groupby(
-            [df['date'].dt.year, df['date'].dt.month]
-        )['amount'].sum()
-        
-        if len(monthly) < 2:
-            return "insufficient_data"
-        
-        # Simple trend: compare last month to average
-        last_month = float(monthly.iloc[-1])
-        avg_previous = float(monthly.iloc[:-1].mean())
-        
-        change = (last_month / avg_previous - 1) * 100 if avg_previous > 0 else 0
-        
-        if change > 10:
-            return "increasing"
-        elif change < -10:
-            return "decreasing"
-        else:
-            return "stable"
-    
-    def _category_concentration(self, df):
-        """Calculate spending concentration (Herfindahl index)"""
-        expenses = df[df['type'] == 'expense']
-        category_totals = expenses.groupby('category')['amount'].sum()
-        total_spending = category_totals.sum()
-        
-        if total_spending == 0:
-            return 0
-        
-        shares = (category_totals / total_spending) ** 2
-        hhi = shares.sum() * 100
-        
-        # Interpretation
-        if hhi > 25:
-            return "highly_concentrated"
-        elif hhi > 15:
-            return "moderately_concentrated"
-        else:
-            return "diversified"
-    
-    def _calculate_impulse_score(self, df):
-        """Estimate impulse spending based on transaction patterns"""
-        expenses = df[df['type'] == 'expense'].copy()
-        
-        if len(expenses) < 10:
-            return 0
-        
-        # Small transactions (<$50) in non-essential categories
-        impulse_categories = ['Entertainment', 'Shopping', 'Food & Dining']
-        impulse_transactions = expenses[
-            (expenses['category'].isin(impulse_categories)) & 
-            (expenses['amount'] < 50)
-        ]
-        
-        impulse_ratio = len(impulse_transactions) / len(expenses)
-        
-        return round(impulse_ratio * 100, 1)
\ No newline at end of file
+        return SpendingAggregates.from_frame(transactions_df).insights()
\ No newline at end of file
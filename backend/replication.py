@@ -0,0 +1,78 @@
+import os
+
+# How a replica is judged fresh enough to serve a read:
+#   ledger  - the replica's counter row for the user has reached the
+#             client's consistency token (needs no replication privileges)
+#   seconds - the replica reports at most REPLICA_MAX_LAG_SECONDS of lag;
+#             reads carrying a token go to the primary
+#   none    - replicas are always used
+REPLICA_LAG_CHECK = os.environ.get('REPLICA_LAG_CHECK', 'ledger')
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+
+CONSISTENCY_HEADER = 'X-Consistency-Token'
+INBOX_CONSISTENCY_HEADER = 'X-Inbox-Token'
+
+# Counter each kind of token is checked against. The inbox has its own so
+# that notification writes leave the ledger version, and everything keyed
+# by it, alone.
+TOKEN_COUNTERS = {
+    'ledger': ('ledger_versions', 'version'),
+    'inbox': ('notification_counters', 'version'),
+}
+
+
+def parse_token(value):
+    """Consistency token sent by the client, or None if absent or malformed"""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def _replica_version(connection, dialect, user_id, scope):
+    table, column = TOKEN_COUNTERS[scope]
+    placeholder = '?' if dialect == 'sqlite' else '%s'
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT {column} FROM {table} WHERE user_id = {placeholder}", (user_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else 0
+
+
+def _replica_lag_seconds(connection):
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute("SHOW REPLICA STATUS")
+    row = cursor.fetchone()
+    cursor.close()
+    if not row or row.get('Seconds_Behind_Source') is None:
+        return None
+    return float(row['Seconds_Behind_Source'])
+
+
+def replica_is_fresh(connection, dialect, user_id, min_version, scope='ledger',
+                     mode=REPLICA_LAG_CHECK, max_lag_seconds=REPLICA_MAX_LAG_SECONDS):
+    """
+    Decide whether a replica connection may serve a read for user_id
+
+    Args:
+        connection: Open connection to the replica
+        dialect: 'mysql' or 'sqlite'
+        user_id: User the read is for
+        min_version: Version from the client's consistency token, or None
+        scope: 'ledger' or 'inbox', the counter min_version refers to
+        mode: 'ledger', 'seconds' or 'none'
+        max_lag_seconds: Lag allowed in 'seconds' mode
+
+    Returns:
+        bool: True if the replica may be used
+    """
+    if mode == 'none':
+        return True
+    if mode == 'seconds':
+        if min_version is not None:
+            return False
+        lag = _replica_lag_seconds(connection)
+        return lag is not None and lag <= max_lag_seconds
+    if min_version is None:
+        return True
+    return _replica_version(connection, dialect, user_id, scope) >= min_version
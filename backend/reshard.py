@@ -0,0 +1,200 @@
+"""
+Move a user's rows between shards while the app keeps serving.
+
+    python reshard.py move <user_id> <target_shard>
+    python reshard.py plan
+
+`move` marks the user as moving in the directory (writes get 503 while
+reads keep hitting the source), waits for every worker's placement cache
+to expire, copies the rows in one target transaction, flips the
+directory entry and finally deletes the source rows. Row ids are copied
+as-is, so shards should use disjoint auto_increment_offset values; a
+collision aborts the move and leaves the user on the source shard.
+
+`plan` lists users whose ring shard differs from where they live now,
+e.g. after adding a shard to SHARDS_CONFIG.
+"""
+import sys
+import time
+
+# Per-user tables in foreign key order; derived state (ledger_versions,
+# forecast_states, insight_states, notification_counters) is rebuilt on
+# the target instead of copied
+USER_TABLES = [
+    'transactions',
+    'budgets',
+    'savings_goals',
+    'goal_contributions',
+    'notifications',
+    'user_preferences',
+    'recurring_transactions',
+    'insights_cache',
+    'transaction_archive',
+    'archived_transactions',
+    'transaction_terms',
+    'merchant_terms',
+    'category_stats',
+    'category_corrections',
+]
+# Computed by the database; inserting a value into them is an error
+GENERATED_COLUMNS = {
+    'transactions': {'year_month'},
+}
+
+
+def _set_placement(router, user_id, shard, state):
+    connection = router.connect_directory()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(router.sql(router.directory, "DELETE FROM user_shards WHERE user_id = %s"), (user_id,))
+        cursor.execute(
+            router.sql(router.directory, "INSERT INTO user_shards (user_id, shard, state) VALUES (%s, %s, %s)"),
+            (user_id, shard, state)
+        )
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    router.forget(user_id)
+
+
+def _fetch_rows(router, connection, shard, table, user_id, key='user_id'):
+    cursor = connection.cursor()
+    cursor.execute(router.sql(shard, f"SELECT * FROM {table} WHERE {key} = %s"), (user_id,))
+    columns = [d[0] for d in cursor.description]
+    rows = cursor.fetchall()
+    cursor.close()
+    return columns, rows
+
+
+def _insert_rows(router, cursor, shard, table, columns, rows):
+    if not rows:
+        return
+    generated = GENERATED_COLUMNS.get(table, set())
+    keep = [i for i, column in enumerate(columns) if column not in generated]
+    placeholders = ', '.join(['%s'] * len(keep))
+    cursor.executemany(
+        router.sql(shard, f"INSERT INTO {table} ({', '.join(columns[i] for i in keep)}) VALUES ({placeholders})"),
+        [tuple(row[i] for i in keep) for row in rows]
+    )
+
+
+def _bump_version(router, cursor, shard, table, version):
+    # Versions only move forward so caches and consistency tokens minted
+    # on the old shard's version never match new data
+    if router.dialect(shard) == 'sqlite':
+        cursor.execute(
+            f"""INSERT INTO {table} (user_id, version) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET version = MAX(version, excluded.version)""",
+            version
+        )
+    else:
+        cursor.execute(
+            f"""INSERT INTO {table} (user_id, version) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE version = GREATEST(version, VALUES(version))""",
+            version
+        )
+
+
+def move_user(router, user_id, target, log=print):
+    """
+    Move every row owned by user_id to the target shard
+
+    Returns:
+        int: Number of rows copied
+    """
+    source = router.shard_for(user_id)
+    if source == target:
+        log(f"user {user_id} already on {target}")
+        return 0
+    if target not in router.shards:
+        raise ValueError(f"Unknown shard {target}")
+
+    _set_placement(router, user_id, source, 'moving')
+    log(f"user {user_id}: marked moving on {source}, waiting {router.map_ttl}s for workers")
+    time.sleep(router.map_ttl + 0.5)
+
+    source_conn = router.connect(source)
+    target_conn = router.connect(target)
+    copied = 0
+    try:
+        target_cursor = target_conn.cursor()
+
+        if target != router.directory:
+            # Stub users row so the target's foreign keys hold
+            columns, users = _fetch_rows(router, source_conn, source, 'users', user_id, key='id')
+            user = dict(zip(columns, users[0]))
+            _insert_rows(router, target_cursor, target, 'users',
+                         ['id', 'email', 'password_hash', 'name'],
+                         [(user_id, user['email'], '!', user['name'])])
+
+        for table in USER_TABLES:
+            columns, rows = _fetch_rows(router, source_conn, source, table, user_id)
+            _insert_rows(router, target_cursor, target, table, columns, rows)
+            copied += len(rows)
+            log(f"user {user_id}: copied {len(rows)} rows from {table}")
+
+        for table in ('ledger_versions', 'notification_counters'):
+            columns, versions = _fetch_rows(router, source_conn, source, table, user_id)
+            source_version = versions[0][columns.index('version')] if versions else 0
+            _bump_version(router, target_cursor, target, table, (user_id, source_version + 1))
+
+        target_conn.commit()
+        target_cursor.close()
+    except Exception:
+        target_conn.rollback()
+        _set_placement(router, user_id, source, 'active')
+        source_conn.close()
+        target_conn.close()
+        raise
+
+    _set_placement(router, user_id, target, 'active')
+    log(f"user {user_id}: now served from {target}")
+
+    try:
+        source_cursor = source_conn.cursor()
+        derived = ['ledger_versions', 'forecast_states', 'insight_states', 'notification_counters']
+        for table in reversed(USER_TABLES + derived):
+            source_cursor.execute(router.sql(source, f"DELETE FROM {table} WHERE user_id = %s"), (user_id,))
+        if source != router.directory:
+            source_cursor.execute(router.sql(source, "DELETE FROM users WHERE id = %s"), (user_id,))
+        source_conn.commit()
+        source_cursor.close()
+    finally:
+        source_conn.close()
+        target_conn.close()
+
+    return copied
+
+
+def plan(router):
+    """Users whose current shard differs from their ring shard"""
+    def users_on(shard):
+        connection = router.connect(shard)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT DISTINCT user_id FROM transactions")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+
+    moves = []
+    for shard, user_ids in router.fan_out(users_on).items():
+        for user_id in user_ids:
+            wanted = router.ring_shard(user_id)
+            if wanted != shard:
+                moves.append((user_id, shard, wanted))
+    return moves
+
+
+if __name__ == '__main__':
+    from app import shard_router
+
+    if len(sys.argv) == 4 and sys.argv[1] == 'move':
+        move_user(shard_router, int(sys.argv[2]), sys.argv[3])
+    elif len(sys.argv) == 2 and sys.argv[1] == 'plan':
+        for user_id, current, wanted in plan(shard_router):
+            print(f"{user_id}\t{current}\t->\t{wanted}")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,256 @@
+import gzip
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from functools import lru_cache
+from uuid import UUID
+
+import numpy as np
+from flask import current_app, request
+from flask.json.provider import JSONProvider
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 5))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/csv'}
+
+
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _format_datetime(value):
+    """Same output as werkzeug.http.http_date without the email.utils round trip"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return (f"{_WEEKDAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} "
+            f"{value.year:04d} {value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT")
+
+
+@lru_cache(maxsize=8192)
+def _format_date(value):
+    # Ledgers repeat the same few thousand dates, so the formatting is cached
+    return f"{_WEEKDAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} {value.year:04d} 00:00:00 GMT"
+
+
+def _default(obj):
+    """
+    Fallback encoder for types neither orjson nor json handle natively.
+    Decimal and dates are encoded exactly like Flask's default provider
+    (string and HTTP date) so the wire format does not change.
+    """
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return _format_datetime(obj)
+    if isinstance(obj, date):
+        return _format_date(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, UUID):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = (
+        orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_SERIALIZE_NUMPY
+        | orjson.OPT_NON_STR_KEYS
+    )
+
+    def encode_json(obj, sort_keys=False, indent=False):
+        """Serialize obj to UTF-8 JSON bytes, optionally with sorted keys or a two-space indent"""
+        option = _ORJSON_OPTIONS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def decode_json(data):
+        return orjson.loads(data)
+else:
+    def encode_json(obj, sort_keys=False, indent=False):
+        """Serialize obj to UTF-8 JSON bytes, optionally with sorted keys or a two-space indent"""
+        return json.dumps(obj, default=_default, sort_keys=sort_keys, indent=2 if indent else None,
+                          separators=(',', ': ') if indent else (',', ':')).encode('utf-8')
+
+    def decode_json(data):
+        return json.loads(data)
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    Drop-in replacement for Flask's JSON provider so every jsonify() call
+    goes through encode_json instead of the stdlib encoder hooks
+    """
+
+    def dumps(self, obj, **kwargs):
+        sort_keys = kwargs.pop('sort_keys', False)
+        indent = kwargs.pop('indent', None)
+        if kwargs or indent not in (None, 2):
+            # Options orjson has no equivalent for go to the stdlib encoder
+            kwargs.setdefault('default', _default)
+            return json.dumps(obj, sort_keys=sort_keys, indent=indent, **kwargs)
+        return encode_json(obj, sort_keys=sort_keys, indent=indent == 2).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return decode_json(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(encode_json(obj), mimetype='application/json')
+
+
+class EncodedPayload:
+    """
+    A serialized JSON body plus its lazily built compressed variants,
+    so a cached payload is encoded and compressed at most once
+    """
+
+    __slots__ = ('body', '_variants', '_lock')
+
+    def __init__(self, body):
+        self.body = body
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_obj(cls, obj):
+        return cls(encode_json(obj))
+
+    def variant(self, encoding):
+        data = self._variants.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._variants.get(encoding)
+                if data is None:
+                    data = _compress(self.body, encoding)
+                    self._variants[encoding] = data
+        return data
+
+
+class PayloadCache:
+    """
+    Thread-safe LRU of EncodedPayload objects with a TTL.
+
+    Keys are tuples whose first element is the user id; callers put the
+    user's ledger version in the key so writes from any worker invalidate
+    the entry without coordination.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, payload):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, build):
+        """Return the cached payload for key, serializing build() on a miss"""
+        payload = self.get(key)
+        if payload is None:
+            payload = EncodedPayload.from_obj(build())
+            self.put(key, payload)
+        return payload
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+
+def payload_response(payload, status=200):
+    """Build a JSON response from an EncodedPayload without re-encoding it"""
+    response = current_app.response_class(payload.body, status=status, mimetype='application/json')
+    response.encoded_payload = payload
+    return response
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def negotiate_encoding(accept_encodings):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None"""
+    if brotli is not None and accept_encodings['br'] > 0:
+        return 'br'
+    if accept_encodings['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """after_request hook: compress JSON/CSV bodies above COMPRESS_MIN_SIZE"""
+    response.vary.add('Accept-Encoding')
+
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code >= 300
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    payload = getattr(response, 'encoded_payload', None)
+    if payload is not None:
+        if len(payload.body) < COMPRESS_MIN_SIZE:
+            return response
+        body = payload.variant(encoding)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return response
+        body = _compress(body, encoding)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,286 @@
+"""
+Per-user inverted index over transaction merchant and description text.
+
+    python search.py reindex [user_id]
+
+`transaction_terms` holds one (user_id, term, transaction_id) row per
+distinct token, so a prefix query is a range scan on the primary key
+instead of a LIKE '%...%' scan of `transactions`. `merchant_terms` maps
+each token of a merchant name to the merchant, with a use count and the
+last category used, for autocomplete. Both are updated inside the
+transaction that writes the ledger row.
+
+Index rows are keyed by transaction id and outlive archival (archive.py
+keeps ids), so archived transactions stay searchable.
+"""
+import os
+import re
+import sys
+
+SEARCH_MAX_TERMS = int(os.environ.get('SEARCH_MAX_TERMS', 32))
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 500
+SUGGEST_LIMIT = 10
+REINDEX_BATCH_SIZE = 5000
+SELECTIVITY_PROBE = 2000
+
+# Matches the VARCHAR length of the term columns
+TERM_LENGTH = 32
+
+_TOKEN = re.compile(r'[^\W_]+', re.UNICODE)
+
+
+def tokenize(*texts):
+    """Distinct lowercase word tokens of the given texts, truncated to TERM_LENGTH"""
+    terms = []
+    seen = set()
+    for text in texts:
+        for token in _TOKEN.findall((text or '').lower()):
+            token = token[:TERM_LENGTH]
+            if token not in seen:
+                seen.add(token)
+                terms.append(token)
+                if len(terms) == SEARCH_MAX_TERMS:
+                    return terms
+    return terms
+
+
+def _column(row, name, index):
+    return row[name] if isinstance(row, dict) else row[index]
+
+
+# Maintenance, called inside the writing transaction
+
+def _merchant_rows(user_id, merchant, category, uses=1):
+    merchant = (merchant or '').strip()[:100]
+    if not merchant:
+        return []
+    return [(user_id, term, merchant, uses, category) for term in tokenize(merchant)]
+
+
+def _insert_terms(cursor, term_rows, merchant_rows):
+    if term_rows:
+        cursor.executemany(
+            "INSERT IGNORE INTO transaction_terms (user_id, term, transaction_id) VALUES (%s, %s, %s)",
+            term_rows
+        )
+    if merchant_rows:
+        cursor.executemany(
+            """INSERT INTO merchant_terms (user_id, term, merchant, uses, last_category)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE uses = uses + VALUES(uses), last_category = VALUES(last_category)""",
+            merchant_rows
+        )
+
+
+def index_transaction(cursor, user_id, transaction_id, merchant, description, category):
+    _insert_terms(
+        cursor,
+        [(user_id, term, transaction_id) for term in tokenize(merchant, description)],
+        _merchant_rows(user_id, merchant, category)
+    )
+
+
+def index_transactions(cursor, rows):
+    """
+    Index many new transactions with one statement per table
+
+    Args:
+        rows: Tuples of (user_id, transaction_id, merchant, description, category)
+    """
+    _insert_terms(
+        cursor,
+        [(user_id, term, transaction_id)
+         for user_id, transaction_id, merchant, description, _ in rows
+         for term in tokenize(merchant, description)],
+        [r for user_id, _, merchant, _, category in rows
+         for r in _merchant_rows(user_id, merchant, category)]
+    )
+
+
+def unindex_transaction(cursor, user_id, transaction_id, merchant):
+    cursor.execute(
+        "DELETE FROM transaction_terms WHERE user_id = %s AND transaction_id = %s",
+        (user_id, transaction_id)
+    )
+
+    merchant = (merchant or '').strip()
+    if merchant:
+        cursor.execute(
+            "UPDATE merchant_terms SET uses = uses - 1 WHERE user_id = %s AND merchant = %s",
+            (user_id, merchant[:100])
+        )
+        cursor.execute(
+            "DELETE FROM merchant_terms WHERE user_id = %s AND merchant = %s AND uses <= 0",
+            (user_id, merchant[:100])
+        )
+
+
+# Queries
+
+def _match_count(cursor, user_id, term, cap=SELECTIVITY_PROBE):
+    """Index entries matching a prefix, counted up to cap"""
+    cursor.execute(
+        """SELECT COUNT(*) AS n FROM (
+            SELECT 1 FROM transaction_terms
+            WHERE user_id = %s AND term LIKE %s
+            LIMIT %s
+        ) AS probe""",
+        (user_id, term + '%', cap)
+    )
+    return _column(cursor.fetchone(), 'n', 0)
+
+
+def search_transaction_ids(cursor, user_id, query, limit=SEARCH_DEFAULT_LIMIT):
+    """
+    Ids of the user's transactions where every token of query prefixes a
+    merchant or description word, newest id first
+
+    Args:
+        cursor: Cursor on the user's shard
+        user_id: Owner of the transactions
+        query: Free text, e.g. "star coff"
+        limit: Maximum number of ids
+
+    Returns:
+        list: Transaction ids
+    """
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    counts = {term: _match_count(cursor, user_id, term) for term in terms}
+    terms.sort(key=counts.get)
+
+    # Sparse matches: range-scan the primary key on the rarest token, probe
+    # the others through (user_id, transaction_id, term), sort what is left.
+    # Dense matches: walk idx_user_transaction from the newest id and stop
+    # at the limit. Without hints the optimizer tends to pick the second
+    # plan even for rare tokens, reading every term the user has, and may
+    # reorder the joins so a common token drives.
+    driver_index = 'PRIMARY' if counts[terms[0]] < SELECTIVITY_PROBE else 'idx_user_transaction'
+    joins = ''.join(
+        f" JOIN transaction_terms t{i} ON t{i}.user_id = t0.user_id"
+        f" AND t{i}.transaction_id = t0.transaction_id AND t{i}.term LIKE %s"
+        for i in range(1, len(terms))
+    )
+    cursor.execute(
+        f"""SELECT DISTINCT STRAIGHT_JOIN t0.transaction_id AS id
+        FROM transaction_terms t0 FORCE INDEX ({driver_index}){joins}
+        WHERE t0.user_id = %s AND t0.term LIKE %s
+        ORDER BY t0.transaction_id DESC
+        LIMIT %s""",
+        (*[term + '%' for term in terms[1:]], user_id, terms[0] + '%', limit)
+    )
+    return [_column(row, 'id', 0) for row in cursor.fetchall()]
+
+
+def suggest_merchants(cursor, user_id, prefix, limit=SUGGEST_LIMIT):
+    """
+    Merchants with a word starting with prefix, most used first
+
+    Returns:
+        list: Dicts with merchant, uses and last_category
+    """
+    terms = tokenize(prefix)
+    if not terms:
+        return []
+
+    cursor.execute(
+        """SELECT merchant, MAX(uses) AS uses, MAX(last_category) AS last_category
+        FROM merchant_terms
+        WHERE user_id = %s AND term LIKE %s
+        GROUP BY merchant
+        ORDER BY uses DESC, merchant
+        LIMIT %s""",
+        (user_id, terms[-1] + '%', limit * 4)
+    )
+    rows = [
+        {'merchant': _column(row, 'merchant', 0), 'uses': int(_column(row, 'uses', 1)),
+         'last_category': _column(row, 'last_category', 2)}
+        for row in cursor.fetchall()
+    ]
+
+    # Earlier words of a multi-word prefix must also appear in the merchant name
+    if len(terms) > 1:
+        rows = [
+            row for row in rows
+            if all(any(word.startswith(term) for word in tokenize(row['merchant'])) for term in terms[:-1])
+        ]
+    return rows[:limit]
+
+
+def reindex_user(connection, user_id):
+    """
+    Rebuild both indexes for user_id from the hot and archived transactions
+
+    Returns:
+        int: Number of transactions indexed
+    """
+    from archive import load_cold_rows
+
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("DELETE FROM transaction_terms WHERE user_id = %s", (user_id,))
+        cursor.execute("DELETE FROM merchant_terms WHERE user_id = %s", (user_id,))
+        cursor.execute(
+            "SELECT id, merchant, description, category FROM transactions WHERE user_id = %s",
+            (user_id,)
+        )
+        rows = cursor.fetchall() + load_cold_rows(cursor, user_id)
+
+        # Merchant uses are counted here so each (term, merchant) is written once
+        merchants = {}
+        for row in sorted(rows, key=lambda r: r['id']):
+            merchant = (row['merchant'] or '').strip()[:100]
+            if merchant:
+                uses, _ = merchants.get(merchant, (0, None))
+                merchants[merchant] = (uses + 1, row['category'])
+
+        term_rows = [
+            (user_id, term, row['id'])
+            for row in rows
+            for term in tokenize(row['merchant'], row['description'])
+        ]
+        merchant_rows = [
+            r for merchant, (uses, category) in merchants.items()
+            for r in _merchant_rows(user_id, merchant, category, uses)
+        ]
+        for i in range(0, max(len(term_rows), len(merchant_rows)), REINDEX_BATCH_SIZE):
+            _insert_terms(cursor, term_rows[i:i + REINDEX_BATCH_SIZE],
+                          merchant_rows[i:i + REINDEX_BATCH_SIZE])
+        connection.commit()
+        return len(rows)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    from app import shard_router
+
+    def users_on(shard):
+        connection = shard_router.connect(shard)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT DISTINCT user_id FROM transactions")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+
+    if len(sys.argv) in (2, 3) and sys.argv[1] == 'reindex':
+        if len(sys.argv) == 3:
+            user_ids = [int(sys.argv[2])]
+        else:
+            user_ids = [u for ids in shard_router.fan_out(users_on).values() for u in ids]
+        for user_id in user_ids:
+            connection = shard_router.connect_user(user_id, for_write=True)
+            try:
+                print(f"user {user_id}: indexed {reindex_user(connection, user_id)} transactions")
+            finally:
+                connection.close()
+    else:
+        print(__doc__)
+        sys.exit(1)
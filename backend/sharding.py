@@ -0,0 +1,241 @@
+import bisect
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+from replication import replica_is_fresh
+
+
+SHARD_MAP_TTL = float(os.environ.get('SHARD_MAP_TTL', 5))
+SHARD_VNODES = int(os.environ.get('SHARD_VNODES', 128))
+
+
+class ShardMoving(Exception):
+    """The user's rows are being moved between shards; writes must be retried"""
+
+    def __init__(self, user_id):
+        super().__init__(f"User {user_id} is being moved between shards, retry shortly")
+        self.user_id = user_id
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(str(value).encode('utf-8')).digest()[:8], 'big')
+
+
+class ShardRouter:
+    """
+    Maps a user_id to the database holding that user's rows.
+
+    Placement is a consistent-hash ring over the configured shards, with
+    per-user overrides read from the `user_shards` table in the directory
+    database (written by reshard.py). Overrides are cached for
+    SHARD_MAP_TTL seconds; the resharding tool waits that long after
+    marking a user as moving so every worker has stopped writing.
+
+    The directory database holds `users` and `user_shards`. Each shard
+    holds the per-user tables plus a stub `users` row per user so foreign
+    keys and ON DELETE CASCADE keep working. With a single shard the
+    directory and the shard are the same database.
+
+    Shard configs are mysql.connector keyword arguments. A config of
+    {"driver": "sqlite", "database": path} is accepted only for trying
+    out reshard.py's copy and placement flip against local files; the
+    app's own queries are MySQL, so a serving deployment must not list
+    SQLite shards. A shard config may list "replicas" (configs of the same shape); read-only
+    connections go to a replica when replication.replica_is_fresh accepts
+    it for the caller's consistency token, and to the primary otherwise.
+    """
+
+    def __init__(self, shards, directory=None, vnodes=SHARD_VNODES, map_ttl=SHARD_MAP_TTL):
+        if not shards:
+            raise ValueError("At least one shard is required")
+
+        self.shards = {}
+        self.replicas = {}
+        for name, config in shards.items():
+            config = dict(config)
+            self.replicas[name] = config.pop('replicas', [])
+            self.shards[name] = config
+        self.directory = directory or next(iter(self.shards))
+        self.map_ttl = map_ttl
+
+        self._ring = sorted(
+            (_hash(f"{name}#{i}"), name)
+            for name in self.shards
+            for i in range(vnodes)
+        )
+        self._ring_keys = [point for point, _ in self._ring]
+
+        self._overrides = {}
+        self._lock = threading.Lock()
+        self._next_replica = 0
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+
+    @classmethod
+    def from_env(cls, default_config):
+        """
+        Build the router from SHARDS_CONFIG (a JSON string or a path to a
+        JSON file) or fall back to a single shard using default_config
+        """
+        raw = os.environ.get('SHARDS_CONFIG')
+        if not raw:
+            # DB_REPLICA_HOSTS: comma separated host[:port] list for the single shard
+            replicas = []
+            for entry in filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')):
+                host, _, port = entry.strip().partition(':')
+                replicas.append(dict(default_config, host=host, port=int(port or default_config.get('port', 3306))))
+            return cls({'default': dict(default_config, replicas=replicas)})
+
+        if not raw.lstrip().startswith('{'):
+            with open(raw) as f:
+                raw = f.read()
+        config = json.loads(raw)
+        return cls(config['shards'], config.get('directory'), config.get('vnodes', SHARD_VNODES))
+
+    @property
+    def single_shard(self):
+        return len(self.shards) == 1
+
+    def dialect(self, name):
+        return self.shards[name].get('driver', 'mysql')
+
+    def ring_shard(self, user_id):
+        """Shard chosen by the hash ring alone, ignoring overrides"""
+        if self.single_shard:
+            return self.directory
+        index = bisect.bisect(self._ring_keys, _hash(user_id)) % len(self._ring)
+        return self._ring[index][1]
+
+    def placement(self, user_id):
+        """
+        Returns:
+            tuple: (shard name, state) where state is 'active' or 'moving'
+        """
+        if self.single_shard:
+            return self.directory, 'active'
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._overrides.get(user_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        placement = self._load_override(user_id) or (self.ring_shard(user_id), 'active')
+        with self._lock:
+            self._overrides[user_id] = (now + self.map_ttl, placement)
+        return placement
+
+    def shard_for(self, user_id):
+        return self.placement(user_id)[0]
+
+    def writable_shard(self, user_id):
+        """
+        Raises:
+            ShardMoving: If the user is mid-move
+        """
+        name, state = self.placement(user_id)
+        if state == 'moving':
+            raise ShardMoving(user_id)
+        return name
+
+    def _load_override(self, user_id):
+        connection = self.connect(self.directory)
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                self.sql(self.directory, "SELECT shard, state FROM user_shards WHERE user_id = %s"),
+                (user_id,)
+            )
+            row = cursor.fetchone()
+            cursor.close()
+        finally:
+            connection.close()
+        return (row[0], row[1]) if row else None
+
+    def forget(self, user_id):
+        with self._lock:
+            self._overrides.pop(user_id, None)
+
+    def connect(self, name):
+        return self._open(self.shards[name])
+
+    def _open(self, config):
+        config = dict(config)
+        if config.pop('driver', 'mysql') == 'sqlite':
+            return sqlite3.connect(config['database'], check_same_thread=False)
+        return mysql.connector.connect(**config)
+
+    def connect_directory(self):
+        return self.connect(self.directory)
+
+    def connect_user(self, user_id, for_write=False, read_only=False, min_version=None, scope='ledger'):
+        """
+        Open a connection to the shard holding user_id
+
+        Args:
+            user_id: Owner of the rows
+            for_write: Refuse while the user is being moved
+            read_only: Allow a replica that is fresh enough
+            min_version: Version the read must observe (consistency token)
+            scope: 'ledger' or 'inbox', the counter min_version refers to
+
+        Raises:
+            ShardMoving: If for_write and the user is mid-move
+        """
+        name, state = self.placement(user_id)
+        if for_write and state == 'moving':
+            raise ShardMoving(user_id)
+
+        if read_only and self.replicas[name]:
+            connection = self._connect_replica(name, user_id, min_version, scope)
+            if connection is not None:
+                return connection
+            with self._lock:
+                self.primary_fallbacks += 1
+        return self.connect(name)
+
+    def _connect_replica(self, name, user_id, min_version, scope):
+        replicas = self.replicas[name]
+        with self._lock:
+            start = self._next_replica
+            self._next_replica += 1
+
+        for i in range(len(replicas)):
+            config = replicas[(start + i) % len(replicas)]
+            try:
+                connection = self._open(config)
+            except Exception:
+                continue
+            try:
+                fresh = replica_is_fresh(connection, config.get('driver', 'mysql'), user_id, min_version, scope)
+            except Exception:
+                fresh = False
+            if fresh:
+                with self._lock:
+                    self.replica_reads += 1
+                return connection
+            connection.close()
+        return None
+
+    def sql(self, name, query):
+        """Adapt %s placeholders to the shard's driver"""
+        return query.replace('%s', '?') if self.dialect(name) == 'sqlite' else query
+
+    def fan_out(self, fn, max_workers=None):
+        """
+        Run fn(shard_name) on every shard in parallel
+
+        Returns:
+            dict: {shard_name: result}
+        """
+        names = list(self.shards)
+        with ThreadPoolExecutor(max_workers=max_workers or len(names)) as pool:
+            results = pool.map(fn, names)
+            return dict(zip(names, results))
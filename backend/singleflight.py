@@ -0,0 +1,101 @@
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'cancelled', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for it and get the same result, or the same exception. If the
+    running call is cancelled (a BaseException such as a worker timeout or
+    GeneratorExit rather than an ordinary error), waiters do not inherit the
+    cancellation: one of them runs the function again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.deduplicated = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.timeouts = 0
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn() once for all concurrent callers of key
+
+        Args:
+            key: Hashable identity of the computation
+            fn: Zero-argument callable
+            timeout: Seconds a waiting caller blocks before giving up
+
+        Raises:
+            TimeoutError: If timeout elapsed while waiting on another caller
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = _Call()
+                    self._calls[key] = call
+                    self.executions += 1
+                    leader = True
+                else:
+                    call.waiters += 1
+                    self.deduplicated += 1
+                    leader = False
+
+            if leader:
+                return self._run(key, call, fn)
+
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError("Timed out waiting for an identical request in flight")
+            if call.cancelled:
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+    def _run(self, key, call, fn):
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        except BaseException:
+            call.cancelled = True
+            with self._lock:
+                self.cancelled += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "deduplicated": self.deduplicated,
+                "errors": self.errors,
+                "cancelled": self.cancelled,
+                "timeouts": self.timeouts,
+            }
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def ledger():
+    """Random expenses and incomes over about two years, unsorted"""
+    rng = np.random.default_rng(7)
+    n = 600
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 730, n), unit='D')
+    return pd.DataFrame({
+        'date': dates.strftime('%Y-%m-%d'),
+        'amount': rng.gamma(2.0, 30.0, n).round(2),
+        'type': rng.choice(['expense', 'expense', 'expense', 'income'], n),
+        'category': rng.choice(['Food & Dining', 'Shopping', 'Rent', 'Entertainment', 'Travel'], n),
+    })
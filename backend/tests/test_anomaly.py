@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from anomaly import CategoryStats, forget_transaction, score_transactions
+
+
+def test_add_matches_numpy():
+    amounts = np.random.default_rng(1).gamma(2.0, 25.0, 200)
+    stats = CategoryStats()
+    for amount in amounts:
+        stats.add(float(amount))
+    assert stats.n == len(amounts)
+    assert stats.mean == pytest.approx(amounts.mean())
+    assert stats.std == pytest.approx(amounts.std(ddof=1))
+
+
+def test_remove_undoes_add():
+    amounts = np.random.default_rng(2).gamma(2.0, 25.0, 50).tolist()
+    stats = CategoryStats()
+    for amount in amounts:
+        stats.add(amount)
+    for amount in amounts[10:35]:
+        stats.remove(amount)
+
+    kept = np.array(amounts[:10] + amounts[35:])
+    assert stats.n == len(kept)
+    assert stats.mean == pytest.approx(kept.mean())
+    assert stats.std == pytest.approx(kept.std(ddof=1))
+
+
+def test_remove_in_any_order_to_empty():
+    stats = CategoryStats()
+    for amount in (10.0, 20.0, 60.0):
+        stats.add(amount)
+    for amount in (20.0, 60.0, 10.0):
+        stats.remove(amount)
+    assert (stats.n, stats.mean, stats.m2) == (0, 0.0, 0.0)
+    stats.remove(5.0)
+    assert stats.n == 0
+
+
+def test_score_needs_history():
+    stats = CategoryStats()
+    for amount in (10.0, 11.0):
+        stats.add(amount)
+    assert stats.score(1000.0) == (0.0, False)
+
+    for amount in np.random.default_rng(4).normal(40, 5, 30):
+        stats.add(float(amount))
+    z, anomalous = stats.score(500.0)
+    assert z > 3 and anomalous
+    assert not stats.score(41.0)[1]
+
+
+class StatsCursor:
+    """Keeps category_stats in a dict and answers the other queries scoring makes"""
+
+    def __init__(self, currency, stats, expenses=()):
+        self.currency = currency
+        self.stats = stats  # category -> (CategoryStats, currency)
+        self.expenses = list(expenses)
+        self.notified = 0
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        self._rows = []
+        if 'user_preferences' in sql:
+            self._rows = [{'currency': self.currency}]
+        elif 'FROM category_stats' in sql:
+            self._rows = [
+                {'category': c, 'n': s.n, 'mean': s.mean, 'm2': s.m2, 'quantile': s.quantile, 'currency': currency}
+                for c, (s, currency) in self.stats.items() if c in params[1:]
+            ]
+        elif 'FROM transactions' in sql:
+            self._rows = self.expenses
+        elif sql.startswith('DELETE FROM category_stats'):
+            self.stats = {}
+
+    def executemany(self, sql, params):
+        if 'category_stats' in sql:
+            for _, category, n, mean, m2, quantile, currency in params:
+                self.stats[category] = (CategoryStats(n, mean, m2, quantile), currency)
+        else:
+            self.notified += len(params)
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+
+def history(amounts):
+    stats = CategoryStats()
+    for amount in amounts:
+        stats.add(amount)
+    return stats
+
+
+def expense(amount, day='2024-03-01'):
+    return {'type': 'expense', 'category': 'Food', 'amount': amount, 'transaction_date': day, 'currency': None}
+
+
+def test_statistics_from_another_currency_are_rebuilt():
+    amounts = np.random.default_rng(5).normal(40, 5, 30).round(2).tolist()
+    # Built from INR amounts, but the user now keeps their books in EUR
+    cursor = StatsCursor('EUR', {'Food': (history([a * 90 for a in amounts]), 'INR')},
+                         [expense(a) for a in amounts + [45.0]])
+
+    assert score_transactions(cursor, 1, [expense(45.0)], [31]) == []
+    stats, currency = cursor.stats['Food']
+    assert currency == 'EUR'
+    assert stats.n == 31
+    assert stats.mean == pytest.approx(np.mean(amounts + [45.0]))
+
+    # From then on writes are scored against the rebuilt statistics
+    assert score_transactions(cursor, 1, [expense(500.0)], [32])[0]['transaction_id'] == 32
+    assert cursor.notified == 1
+
+
+def test_statistics_without_a_currency_are_trusted():
+    amounts = np.random.default_rng(6).normal(40, 5, 30).tolist()
+    cursor = StatsCursor('EUR', {'Food': (history(amounts), None)})
+    assert len(score_transactions(cursor, 1, [expense(500.0)])) == 1
+    assert cursor.stats['Food'][1] == 'EUR'
+
+
+def test_forget_leaves_stale_statistics_for_the_rebuild():
+    cursor = StatsCursor('EUR', {'Food': (history([100.0, 200.0]), 'INR')})
+    forget_transaction(cursor, 1, expense(100.0))
+    assert cursor.stats['Food'][0].n == 2
@@ -0,0 +1,144 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+import archive
+from archive import archive_cutoff, cold_monthly_totals, decode_segment, encode_segment, load_cold_rows, summarize
+
+
+def row(i, day, amount, kind='expense', category='Food & Dining', merchant='Cafe', currency=None):
+    return {
+        'id': i, 'type': kind, 'category': category, 'amount': Decimal(amount),
+        'transaction_date': day, 'description': f'row {i}', 'merchant': merchant,
+        'created_at': datetime(2022, 1, 1, 9, 30), 'currency': currency,
+    }
+
+
+ROWS = [
+    row(1, date(2022, 1, 3), '12.50'),
+    row(2, date(2022, 1, 3), '7.25', merchant=None),
+    row(3, date(2022, 1, 10), '2000.00', kind='income', category='Salary', merchant='Employer'),
+    row(4, date(2022, 1, 21), '40.00', category='Shopping', merchant='Cafe'),
+]
+
+
+class FakeCursor:
+    """Answers the transaction_archive queries load_cold_rows makes and the user's currency"""
+
+    def __init__(self, segments, currency='INR'):
+        self.segments = segments
+        self.currency = currency
+        self.segment_reads = 0
+        self._rows = []
+
+    def execute(self, sql, params):
+        if 'user_preferences' in sql:
+            self._rows = [{'currency': self.currency}]
+        elif 'segment_format' in sql:
+            self.segment_reads += 1
+            self._rows = [
+                {'period': period, 'segment_format': fmt, 'segment': blob}
+                for period, (fmt, blob, _) in self.segments.items() if period in params[1:]
+            ]
+        elif 'summary' in sql:
+            self._rows = [
+                {'period': period, 'summary': json.dumps(summary)}
+                for period, (_, _, summary) in sorted(self.segments.items())
+            ]
+        else:
+            self._rows = [
+                {'period': period, 'archived_at': datetime(2024, 1, 1), 'row_count': 4}
+                for period in self.segments
+            ]
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+
+class HalvingRates:
+    """FxRates stand-in: every foreign amount converts at 0.5"""
+
+    def convert(self, amounts, currencies, dates, to):
+        return [float(a) * (1 if c == to else 0.5) for a, c in zip(amounts, currencies)]
+
+
+def test_archive_cutoff():
+    assert archive_cutoff(date(2024, 3, 15), horizon=24) == date(2022, 3, 1)
+    assert archive_cutoff(date(2024, 1, 31), horizon=1) == date(2023, 12, 1)
+
+
+@pytest.mark.parametrize('with_arrow', [True, False])
+def test_segment_round_trip(monkeypatch, with_arrow):
+    if with_arrow:
+        pytest.importorskip('pyarrow')
+    else:
+        monkeypatch.setattr(archive, 'arrow_available', lambda: False)
+
+    segment_format, blob = encode_segment(ROWS)
+    assert segment_format == ('parquet' if with_arrow else 'json.z')
+    assert decode_segment(segment_format, blob) == ROWS
+
+
+def test_segments_without_a_currency_column_still_decode(monkeypatch):
+    monkeypatch.setattr(archive, 'arrow_available', lambda: False)
+    monkeypatch.setattr(archive, 'SEGMENT_COLUMNS', archive.SEGMENT_COLUMNS[:-1])
+    segment_format, blob = encode_segment(ROWS)
+    monkeypatch.undo()
+
+    assert decode_segment(segment_format, blob) == ROWS
+
+
+def test_summarize():
+    summary = summarize(ROWS)
+    assert sorted(summary['totals']) == [
+        ['expense', 'Food & Dining', '19.75', 2],
+        ['expense', 'Shopping', '40.00', 1],
+        ['income', 'Salary', '2000.00', 1],
+    ]
+    assert summary['weekdays'] == {'Monday': ['19.75', 2], 'Friday': ['40.00', 1]}
+    assert summary['merchants'] == {'Cafe': ['52.50', 2]}
+
+
+def test_cold_rows_are_filtered_and_cached(monkeypatch):
+    monkeypatch.setattr(archive, 'segment_cache', archive._SegmentCache())
+    february = [row(5, date(2022, 2, 1), '3.00')]
+    cursor = FakeCursor({
+        '2022-01': encode_segment(ROWS) + (summarize(ROWS),),
+        '2022-02': encode_segment(february) + (summarize(february),),
+    })
+
+    assert [r['id'] for r in load_cold_rows(cursor, 1)] == [1, 2, 3, 4, 5]
+    assert [r['id'] for r in load_cold_rows(cursor, 1, '2022-01-10', '2022-02-28')] == [3, 4, 5]
+    assert [r['id'] for r in load_cold_rows(cursor, 1, start_date='2022-02-01')] == [5]
+    assert cursor.segment_reads == 1
+
+
+def test_cold_monthly_totals():
+    cursor = FakeCursor({'2022-01': encode_segment(ROWS) + (summarize(ROWS),)})
+    totals = {(r['month'], r['type'], r['category']): (r['total'], r['count']) for r in cold_monthly_totals(cursor, 1)}
+    assert totals == {
+        ('2022-01', 'expense', 'Food & Dining'): (Decimal('19.75'), 2),
+        ('2022-01', 'expense', 'Shopping'): (Decimal('40.00'), 1),
+        ('2022-01', 'income', 'Salary'): (Decimal('2000.00'), 1),
+    }
+
+
+def test_summaries_in_an_old_currency_are_rebuilt(monkeypatch):
+    monkeypatch.setattr(archive, 'segment_cache', archive._SegmentCache())
+    rows = [row(1, date(2022, 1, 3), '10.00', currency='INR'), row(2, date(2022, 1, 4), '5.00')]
+    # Archived while the user kept their books in INR, read after a switch to EUR
+    cursor = FakeCursor({'2022-01': encode_segment(rows) + (summarize(rows, 'INR'),)}, currency='EUR')
+
+    assert cold_monthly_totals(cursor, 1)[0]['total'] == Decimal('15.00')
+    totals = cold_monthly_totals(cursor, 1, HalvingRates())
+    assert [(r['total'], r['count']) for r in totals] == [(Decimal('10.00'), 2)]
+
+    cursor.currency = 'INR'
+    segment_reads = cursor.segment_reads
+    assert cold_monthly_totals(cursor, 1, HalvingRates())[0]['total'] == Decimal('15.00')
+    assert cursor.segment_reads == segment_reads
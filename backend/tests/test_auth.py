@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from auth import MIN_SCRYPT_N, HashPoolBusy, PasswordHasher, calibrate_scrypt, hash_method
+
+
+METHOD = 'pbkdf2:sha256:1000'
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(method=METHOD, workers=2)
+    pwhash = hasher.hash('correct horse')
+    assert hash_method(pwhash) == METHOD
+    assert hasher.verify(pwhash, 'correct horse')
+    assert not hasher.verify(pwhash, 'wrong')
+    assert not hasher.verify(None, 'anything')
+    assert hasher.stats()['verified'] == 3
+
+
+def test_old_hashes_are_upgraded_in_the_background():
+    old = PasswordHasher(method='pbkdf2:sha256:500').hash('secret')
+    hasher = PasswordHasher(method=METHOD)
+    assert hasher.needs_rehash(old)
+
+    saved = []
+    done = threading.Event()
+    hasher.rehash_later('secret', lambda pwhash: (saved.append(pwhash), done.set()))
+    assert done.wait(5)
+    assert not hasher.needs_rehash(saved[0])
+    assert hasher.verify(saved[0], 'secret')
+
+
+def test_full_pool_rejects_instead_of_queueing():
+    hasher = PasswordHasher(method=METHOD, workers=1, max_queued=1)
+    release = threading.Event()
+    hasher._submit(release.wait, 5)
+    hasher._submit(release.wait, 5)
+
+    with pytest.raises(HashPoolBusy):
+        hasher.hash('secret')
+    # Background rehashes are dropped rather than raising
+    hasher.rehash_later('secret', lambda pwhash: None)
+    release.set()
+    assert hasher.stats()['rejected'] == 2
+
+
+def test_calibration_never_goes_below_the_minimum():
+    assert calibrate_scrypt(0) == f"scrypt:{MIN_SCRYPT_N}:8:1"
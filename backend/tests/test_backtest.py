@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from backtest import holt_winters_forecasts, run_backtest, stack_series, user_series
+from forecasting import batch_fit, month_index
+
+
+@pytest.fixture
+def series():
+    """Seasonal series of different lengths and start months"""
+    rng = np.random.default_rng(3)
+    result = []
+    for length, first in ((8, month_index(2023, 5)), (30, month_index(2021, 11)), (40, month_index(2020, 1))):
+        t = np.arange(length)
+        values = 500 + 5 * t + 80 * np.sin(2 * np.pi * (first + t) / 12) + rng.normal(0, 20, length)
+        result.append((first, values))
+    return result
+
+
+def test_matches_batch_fit_refit_at_every_month_end(series):
+    # The 30 and 40 month series also cover the switch to the seasonal fit
+    values, first_months, lengths = stack_series(series)
+    forecast, _, _ = holt_winters_forecasts(values, first_months)
+
+    for i, (first, row) in enumerate(series):
+        for t in range(1, len(row)):
+            state = batch_fit(row[None, :t], first)[0]
+            expected = state.level + state.trend + state.seasonal[(first + t) % 12]
+            assert forecast[i, t] == pytest.approx(expected, rel=1e-9, abs=1e-6), (i, t)
+
+
+def test_report_scores_every_model(series):
+    report = run_backtest(series, min_history=2)
+    assert report['series'] == 3
+    assert report['forecasts'] == sum(len(row) - 2 for _, row in series)
+    assert set(report['models']) == {'holt_winters', 'naive', 'mean', 'blend'}
+    assert 0 <= report['models']['holt_winters']['interval_coverage'] <= 1
+
+
+def test_user_series_excludes_the_open_month():
+    rows = [
+        {'month': '2025-01', 'type': 'expense', 'category': 'Rent', 'total': 100},
+        {'month': '2025-03', 'type': 'income', 'category': 'Salary', 'total': 900},
+        {'month': '2025-04', 'type': 'expense', 'category': 'Rent', 'total': 100},
+    ]
+    by_key = dict(zip(['expense:Rent', 'expense:total', 'income:total'],
+                      user_series(rows, month_index(2025, 4))))
+    first, values = by_key['expense:Rent']
+    assert first == month_index(2025, 1)
+    assert values.tolist() == [100, 0, 0]
+    assert by_key['income:total'][1].tolist() == [0, 0, 900]
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from categorize import CATEGORIZER_FEATURES, Categorizer, CategoryModel, transaction_text, vectorize
+
+
+EXAMPLES = [
+    ('expense', 'Starbucks', 'coffee #1021', 'Food & Dining'),
+    ('expense', 'Blue Bottle', 'latte', 'Food & Dining'),
+    ('expense', 'Chipotle', 'burrito bowl', 'Food & Dining'),
+    ('expense', 'Shell', 'fuel 45L', 'Transportation'),
+    ('expense', 'Uber', 'ride home', 'Transportation'),
+    ('expense', 'Amazon', 'usb cable', 'Shopping'),
+    ('expense', 'Target', 'towels', 'Shopping'),
+    ('income', 'Acme Corp', 'salary march', 'Salary'),
+]
+
+
+class LedgerCursor:
+    """Serves `transactions` rows newer than the requested id; every other table is empty"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self._result = []
+
+    def execute(self, sql, params):
+        if 'FROM transactions' in sql:
+            self._result = [r for r in self.rows if r['id'] > params[1]]
+        else:
+            self._result = []
+
+    def fetchall(self):
+        return self._result
+
+
+def ledger_rows(examples, first_id=1):
+    return [
+        {'id': first_id + i, 'type': t, 'merchant': m, 'description': d, 'category': c}
+        for i, (t, m, d, c) in enumerate(examples)
+    ]
+
+
+def texts_and_labels(examples):
+    return [transaction_text(t, m, d) for t, m, d, _ in examples], [c for *_, c in examples]
+
+
+def test_transaction_text_folds_digits():
+    assert transaction_text('expense', 'Shell', 'Fuel 45L #0931') == 'expense shell fuel 0l #0'
+    assert transaction_text(None, None, None) == '  '
+
+
+def test_incremental_fit_matches_one_batch():
+    texts, labels = texts_and_labels(EXAMPLES)
+    batch = CategoryModel()
+    batch.partial_fit(texts, labels, last_id=8)
+
+    incremental = CategoryModel()
+    for i in range(0, len(texts), 3):
+        incremental.partial_fit(texts[i:i + 3], labels[i:i + 3], last_id=min(i + 3, len(texts)))
+
+    assert incremental.classes == batch.classes
+    assert (incremental.counts != batch.counts).nnz == 0
+    assert incremental.trained_through == 8
+    queries = ['expense starbucks coffee', 'expense uber ride', 'income acme corp salary']
+    assert incremental.predict(queries)[0] == batch.predict(queries)[0] == ['Food & Dining', 'Transportation', 'Salary']
+
+
+def test_probabilities_match_dense_naive_bayes():
+    texts, labels = texts_and_labels(EXAMPLES)
+    model = CategoryModel(alpha=0.1)
+    model.partial_fit(texts, labels)
+
+    queries = ['expense amazon towels', 'expense shell fuel']
+    counts = model.counts.toarray()
+    log_likelihood = np.log((counts + 0.1) / (counts.sum(axis=1, keepdims=True) + 0.1 * CATEGORIZER_FEATURES))
+    prior = np.log((model.class_examples + 1) / (model.n_examples + len(model.classes)))
+    scores = vectorize(queries).toarray() @ log_likelihood.T + prior
+    expected = np.exp(scores - scores.max(axis=1, keepdims=True))
+    expected /= expected.sum(axis=1, keepdims=True)
+
+    labels, confidence = model.predict(queries)
+    assert labels == [model.classes[i] for i in expected.argmax(axis=1)]
+    assert confidence == pytest.approx(expected.max(axis=1), rel=1e-4)
+
+
+def test_untrained_model_predicts_nothing():
+    labels, confidence = CategoryModel().predict(['expense anything'])
+    assert labels == [None]
+    assert confidence.tolist() == [0.0]
+
+
+def test_user_model_catches_up_and_is_persisted(tmp_path):
+    categorizer = Categorizer(model_dir=str(tmp_path))
+    cursor = LedgerCursor(ledger_rows(EXAMPLES[:4]))
+    model = categorizer.user_model(cursor, 1)
+    assert model.n_examples == 4
+    assert model.trained_through == 4
+
+    cursor.rows += ledger_rows(EXAMPLES[4:], first_id=5)
+    assert categorizer.user_model(cursor, 1).n_examples == len(EXAMPLES)
+
+    # A new process picks up the saved model and only learns what is newer
+    reloaded = Categorizer(model_dir=str(tmp_path)).user_model(LedgerCursor([]), 1)
+    assert reloaded.n_examples >= 4
+
+
+def test_young_user_model_falls_back_to_the_global_model(tmp_path):
+    categorizer = Categorizer(model_dir=str(tmp_path))
+    texts, labels = texts_and_labels(EXAMPLES)
+    global_model = CategoryModel()
+    global_model.partial_fit(texts, labels)
+    categorizer._save('global', global_model)
+
+    suggestions = categorizer.categorize(LedgerCursor([]), 1, [
+        {'type': 'expense', 'merchant': 'Uber', 'description': 'ride'},
+        {'type': 'expense', 'merchant': 'Uber', 'description': 'ride'},
+    ])
+    assert suggestions[0] == suggestions[1]
+    assert suggestions[0]['category'] == 'Transportation'
+    assert suggestions[0]['source'] == 'global'
@@ -0,0 +1,66 @@
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from export import EXPORT_COLUMNS, iter_chunks, parse_columns, stream_arrow, stream_csv, stream_parquet
+
+
+ROWS = [
+    (i, 'expense', 'Food & Dining', Decimal('12.50') + i, date(2024, 1, 1 + i % 28),
+     f'Lunch {i}', 'Cafe', datetime(2024, 1, 1, 12, 0, 0), 'EUR' if i % 5 == 0 else None)
+    for i in range(25)
+]
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self._rows = list(rows)
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+
+def test_parse_columns():
+    assert parse_columns(None) == list(EXPORT_COLUMNS)
+    assert parse_columns(' amount, category ') == ['amount', 'category']
+    with pytest.raises(ValueError):
+        parse_columns('amount,password_hash')
+    with pytest.raises(ValueError):
+        parse_columns(',')
+
+
+def test_iter_chunks():
+    chunks = list(iter_chunks(FakeCursor(ROWS), chunk_size=10))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+
+
+def test_csv_streams_one_part_per_chunk():
+    columns = list(EXPORT_COLUMNS)
+    parts = list(stream_csv(iter_chunks(FakeCursor(ROWS), chunk_size=10), columns))
+    assert len(parts) == 3
+
+    rows = list(csv.reader(io.StringIO(b''.join(parts).decode('utf-8'))))
+    assert rows[0] == columns
+    assert len(rows) == len(ROWS) + 1
+    assert rows[1][3] == '12.50'
+
+
+def test_arrow_and_parquet_round_trip():
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    columns = list(EXPORT_COLUMNS)
+
+    body = b''.join(stream_arrow(iter_chunks(FakeCursor(ROWS), chunk_size=10), columns))
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.column_names == columns
+    assert table.num_rows == len(ROWS)
+    assert table.column('amount')[0].as_py() == Decimal('12.50')
+
+    body = b''.join(stream_parquet(iter_chunks(FakeCursor(ROWS), chunk_size=10), columns))
+    parquet = pq.ParquetFile(io.BytesIO(body))
+    assert parquet.metadata.num_row_groups == 3
+    assert parquet.read().column('transaction_date')[0].as_py() == date(2024, 1, 1)
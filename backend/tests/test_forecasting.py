@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pytest
+
+from forecasting import ForecastState, SeriesState, batch_fit, fit_forecast_state, month_index
+
+
+GRID = np.array([[0.3, 0.05, 0.2]])
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(3)
+    months = np.arange(36)
+    return (800 + 5 * months + 120 * np.sin(2 * np.pi * months / 12) + rng.normal(0, 30, 36)).round(2)
+
+
+def test_close_month_continues_the_batch_fit(values):
+    first = month_index(2021, 1)
+    state, = batch_fit(values[None, :30], first, GRID)
+    for t in range(30, 36):
+        state.open_total = values[t]
+        state.close_month((first + t) % 12)
+
+    expected, = batch_fit(values[None, :], first, GRID)
+    assert state.level == pytest.approx(expected.level)
+    assert state.trend == pytest.approx(expected.trend)
+    assert state.seasonal == pytest.approx(expected.seasonal)
+    assert state.sse == pytest.approx(expected.sse)
+
+
+def rows(totals, category='Food & Dining'):
+    return [
+        {'month': month, 'type': 'expense', 'category': category, 'total': total}
+        for month, total in totals.items()
+    ]
+
+
+def test_observe_matches_a_refit_of_the_open_month():
+    history = {'2024-01': 100.0, '2024-02': 120.0, '2024-03': 90.0}
+    state = fit_forecast_state(rows(history), 2024, 4)
+    assert state.observe_transaction('expense', 'Food & Dining', 2024, 4, 40.0)
+    assert state.observe_transaction('expense', 'Food & Dining', 2024, 4, 2.5)
+
+    refit = fit_forecast_state(rows({**history, '2024-04': 42.5}), 2024, 4)
+    assert state.forecast('expense:total') == refit.forecast('expense:total')
+    assert state.history('expense:Food & Dining', 4) == refit.history('expense:Food & Dining', 4)
+
+
+def test_closed_months_need_a_refit():
+    state = fit_forecast_state(rows({'2024-01': 100.0, '2024-02': 120.0}), 2024, 3)
+    assert not state.observe_transaction('expense', 'Food & Dining', 2024, 2, 10.0)
+    assert state.series['expense:total'].open_total == 0.0
+
+
+def test_advance_closes_the_open_month():
+    state = fit_forecast_state(rows({'2024-01': 100.0, '2024-02': 120.0}), 2024, 3)
+    state.observe_transaction('expense', 'Food & Dining', 2024, 3, 75.0)
+    assert state.advance_to(2024, 5)
+    assert state.open_month == month_index(2024, 5)
+    assert state.history('expense:total', 4) == [
+        ('2024-02', 120.0), ('2024-03', 75.0), ('2024-04', 0.0), ('2024-05', 0.0),
+    ]
+    assert not state.advance_to(2024, 4)
+
+
+def test_interval_widens_with_the_horizon(values):
+    state = SeriesState.from_dict(batch_fit(values[None, :], month_index(2021, 1))[0].to_dict())
+    widths = [upper - lower for _, lower, upper in (state.forecast(h, h % 12) for h in (1, 3, 6))]
+    assert widths == sorted(widths)
+    assert widths[0] > 0
+
+
+def test_json_round_trip():
+    state = fit_forecast_state(rows({'2024-01': 100.0, '2024-02': 120.0}), 2024, 3, ledger_version=9, currency='EUR')
+    restored = ForecastState.from_json(state.to_json().encode('utf-8'))
+    assert (restored.ledger_version, restored.currency) == (9, 'EUR')
+    assert restored.to_json() == state.to_json()
+
+
+def test_states_saved_without_a_currency_read_as_none():
+    state = fit_forecast_state(rows({'2024-01': 100.0}), 2024, 2, ledger_version=3)
+    raw = json.loads(state.to_json())
+    del raw['currency']
+    assert ForecastState.from_json(json.dumps(raw)).currency is None
@@ -0,0 +1,110 @@
+import sqlite3
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from fx import FxRates, MissingRate, convert_rows, to_days, user_currency
+from sharding import ShardRouter
+
+
+# Units per USD
+RATES = [
+    ('EUR', '2024-01-01', 0.90), ('EUR', '2024-01-10', 0.92),
+    ('INR', '2024-01-01', 83.0), ('INR', '2024-01-10', 83.5),
+]
+
+
+@pytest.fixture
+def directory(tmp_path):
+    path = str(tmp_path / 'directory.db')
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE fx_rates (currency TEXT, rate_date TEXT, rate REAL, updated_at TEXT)")
+    connection.executemany("INSERT INTO fx_rates VALUES (?, ?, ?, '2024-01-10 00:00:00')", RATES)
+    connection.commit()
+    connection.close()
+    return path
+
+
+@pytest.fixture
+def fx(directory):
+    return FxRates(ShardRouter({'default': {'driver': 'sqlite', 'database': directory}}), refresh_seconds=3600)
+
+
+class PreferencesCursor:
+    def __init__(self, currency):
+        self.currency = currency
+
+    def execute(self, sql, params):
+        assert 'user_preferences' in sql
+
+    def fetchone(self):
+        return {'currency': self.currency} if self.currency else None
+
+
+def test_to_days():
+    days = to_days(['1970-01-02', '2024-01-01', '1970-01-02'])
+    assert days.tolist() == [1, 19723, 1]
+
+
+def test_convert_uses_the_latest_rate_on_or_before_each_date(fx):
+    converted = fx.convert(
+        [100.0, 100.0, 100.0, 100.0, 100.0],
+        ['EUR', 'EUR', 'EUR', 'USD', None],
+        ['2024-01-05', '2024-01-10', '2023-12-01', '2024-01-05', '2024-01-05'],
+        'INR'
+    )
+    assert converted == pytest.approx([
+        100 * 83.0 / 0.90,
+        100 * 83.5 / 0.92,
+        100 * 83.0 / 0.90,  # before the first rate: the earliest one
+        100 * 83.0,
+        100.0,  # already in the target currency
+    ])
+
+
+def test_unknown_currency_raises(fx):
+    assert fx.supports('EUR')
+    assert not fx.supports('GBP')
+    with pytest.raises(MissingRate):
+        fx.convert([1.0], ['GBP'], ['2024-01-05'], 'INR')
+
+
+def test_refresh_picks_up_new_rates(fx, directory):
+    fx.refresh()
+    connection = sqlite3.connect(directory)
+    connection.execute("INSERT INTO fx_rates VALUES ('GBP', '2024-01-01', 0.8, '2024-01-11 00:00:00')")
+    connection.commit()
+    connection.close()
+
+    assert not fx.supports('GBP')
+    fx.refresh(force=True)
+    assert fx.supports('GBP')
+
+
+def test_convert_rows(fx):
+    rows = [
+        {'amount': Decimal('10.00'), 'currency': None, 'transaction_date': date(2024, 1, 5)},
+        {'amount': Decimal('10.00'), 'currency': 'EUR', 'transaction_date': date(2024, 1, 5)},
+    ]
+    converted = convert_rows(fx, PreferencesCursor('INR'), 1, rows)
+    assert converted[0] is rows[0]
+    assert converted[1]['amount'] == Decimal(f"{10 * 83.0 / 0.90:.2f}")
+    assert rows[1]['amount'] == Decimal('10.00')
+
+    domestic = rows[:1]
+    assert convert_rows(fx, PreferencesCursor('INR'), 1, domestic) is domestic
+
+
+def test_user_currency_defaults_to_inr():
+    assert user_currency(PreferencesCursor(None), 1) == 'INR'
+    assert user_currency(PreferencesCursor('EUR'), 1) == 'EUR'
+
+
+def test_rates_are_per_currency_slices(fx):
+    fx.refresh()
+    days = to_days(['2024-01-01', '2024-01-09', '2024-01-10'])
+    assert fx.rates_on('EUR', days) == pytest.approx([0.90, 0.90, 0.92])
+    assert fx.rates_on('USD', days).tolist() == [1.0, 1.0, 1.0]
+    assert isinstance(fx.rates_on('INR', days), np.ndarray)
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecasting import month_index
+from health import METRICS, HealthEngine, HealthIndex, HealthIndexMissing, compute_metrics
+
+FIRST, LAST = month_index(2025, 1), month_index(2025, 3)
+
+
+def frames(monthly, budgets=(), emergency=(), versions=()):
+    return {
+        'monthly': pd.DataFrame(monthly, columns=['user_id', 'month', 'type', 'category', 'total']),
+        'budgets': pd.DataFrame(list(budgets), columns=['user_id', 'category', 'limit_amount']),
+        'emergency': pd.DataFrame(list(emergency), columns=['user_id', 'fund']),
+        'versions': pd.DataFrame(list(versions), columns=['user_id', 'version']),
+    }
+
+
+def test_compute_metrics():
+    data = frames(
+        monthly=[
+            (1, '2025-01', 'income', 'Salary', 1000), (1, '2025-01', 'expense', 'Food', 300),
+            (1, '2025-02', 'income', 'Salary', 1000), (1, '2025-02', 'expense', 'Food', 500),
+            (1, '2025-03', 'income', 'Salary', 1000), (1, '2025-03', 'expense', 'Food', 400),
+            # Outside the window
+            (1, '2024-12', 'expense', 'Food', 9999),
+            (2, '2025-02', 'expense', 'Rent', 600),
+        ],
+        budgets=[(1, 'Food', 450), (2, 'Travel', 100)],
+        emergency=[(1, 2400)],
+        versions=[(2, 5), (1, 9)],
+    )
+    user_ids, values, versions = compute_metrics(data, FIRST, LAST)
+
+    assert user_ids.tolist() == [1, 2]
+    assert versions.tolist() == [9, 5]
+    savings, emergency, volatility, adherence = values[0]
+    assert savings == pytest.approx((3000 - 1200) / 3000)
+    assert emergency == pytest.approx(2400 / 400)
+    assert volatility == pytest.approx(np.std([300, 500, 400]) / 400)
+    assert adherence == pytest.approx(2 / 3)
+
+    # No income, no emergency fund, a budget with no spending
+    assert np.isnan(values[1, 0])
+    assert values[1, 1] == 0
+    assert values[1, 3] == 1
+
+
+def random_index(rng, n):
+    values = rng.normal(0, 1, (n, len(METRICS)))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    return HealthIndex(np.arange(1, n + 1) * 3, values, np.ones(n, dtype=np.int64), FIRST, LAST)
+
+
+def test_update_matches_a_rebuild():
+    rng = np.random.default_rng(5)
+    index = random_index(rng, 200)
+
+    # Changed users, a user losing a metric, and users new to the index
+    ids = np.array([3, 30, 31, 600, 604, 1000])
+    rows = rng.normal(0, 1, (len(ids), len(METRICS)))
+    rows[1, 2] = np.nan
+    updated = index.update(ids, rows, np.full(len(ids), 7))
+
+    by_user = dict(zip(index.user_ids.tolist(), index.values))
+    by_user.update(zip(ids.tolist(), rows))
+    expected_ids = np.array(sorted(by_user))
+    rebuilt = HealthIndex(expected_ids, np.array([by_user[u] for u in expected_ids]),
+                          np.ones(len(expected_ids)), FIRST, LAST)
+
+    assert updated.user_ids.tolist() == expected_ids.tolist()
+    np.testing.assert_array_equal(updated.values, rebuilt.values)
+    for metric in METRICS:
+        np.testing.assert_array_equal(updated.ranked[metric], rebuilt.ranked[metric])
+    assert updated.version_of(30) == 7 and updated.version_of(6) == 1
+    # The original index is left untouched
+    assert index.version_of(30) == 1 and index.version_of(1000) is None
+
+
+def test_percentiles_respect_direction():
+    values = np.array([[0.1, 1.0, 0.5, 0.2], [0.2, 2.0, 0.3, 0.4], [0.3, 3.0, 0.1, 0.6]])
+    index = HealthIndex(np.array([1, 2, 3]), values, np.zeros(3, dtype=np.int64), FIRST, LAST)
+    best = index.report(3)['metrics']
+    assert best['savings_rate']['percentile'] == 100.0
+    assert best['expense_volatility']['percentile'] == 100.0
+    assert index.report(1)['metrics']['expense_volatility']['percentile'] == pytest.approx(33.3)
+    assert index.report(4) is None
+
+
+def test_engine_serves_only_saved_indexes(tmp_path):
+    path = str(tmp_path / 'index.joblib')
+    engine = HealthEngine(path=path)
+    with pytest.raises(HealthIndexMissing):
+        engine.index()
+    random_index(np.random.default_rng(6), 10).save(path)
+    index = engine.index()
+    assert engine.index() is index
+    # Served as built: the engine has no database to recompute from
+    assert engine.report(3) == index.report(3)
+    assert engine.stats()['served'] == 1
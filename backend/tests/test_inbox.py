@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from inbox import NotificationHub, delete_notifications, inbox_version, mark_read, unread_count
+from sharding import ShardRouter
+
+
+class RecordingCursor:
+    def __init__(self, row=None):
+        self.row = row
+        self.statements = []
+        self.rowcount = 0
+
+    def execute(self, sql, params):
+        self.statements.append((' '.join(sql.split()), params))
+
+    def fetchone(self):
+        return self.row
+
+
+def test_unread_count():
+    assert unread_count(RecordingCursor({'unread': 3, 'latest_id': 40}), 1) == (3, 40)
+    # A counter that drifted below zero reads as zero
+    assert unread_count(RecordingCursor((-1, 40)), 1) == (0, 40)
+    assert unread_count(RecordingCursor(None), 1) == (0, 0)
+
+
+def test_inbox_version():
+    assert inbox_version(RecordingCursor({'version': 12}), 1) == 12
+    assert inbox_version(RecordingCursor(None), 1) == 0
+
+
+def test_bulk_updates_are_one_statement():
+    cursor = RecordingCursor()
+    mark_read(cursor, 1, ids=[4, 5])
+    delete_notifications(cursor, 1, up_to=9)
+    assert cursor.statements == [
+        ("UPDATE notifications SET is_read = TRUE WHERE user_id = %s AND id IN (%s, %s) AND is_read = FALSE",
+         (1, 4, 5)),
+        ("DELETE FROM notifications WHERE user_id = %s AND id <= %s", (1, 9)),
+    ]
+
+
+@pytest.fixture
+def counters(tmp_path):
+    path = str(tmp_path / 'shard.db')
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("CREATE TABLE notification_counters (user_id INTEGER PRIMARY KEY, unread INTEGER, latest_id INTEGER)")
+    connection.execute("INSERT INTO notification_counters VALUES (1, 0, 10), (2, 0, 20)")
+    connection.commit()
+    yield ShardRouter({'default': {'driver': 'sqlite', 'database': path}}), connection
+    connection.close()
+
+
+def test_waiter_wakes_when_its_latest_id_moves(counters):
+    router, connection = counters
+    hub = NotificationHub(router, interval=0.01)
+
+    def notify():
+        time.sleep(0.05)
+        connection.execute("UPDATE notification_counters SET latest_id = 11 WHERE user_id = 1")
+        connection.commit()
+
+    thread = threading.Thread(target=notify)
+    thread.start()
+    assert hub.wait(1, 10, timeout=5) == 11
+    thread.join()
+    assert hub.stats()['wakeups'] >= 1
+    assert hub.stats()['waiting_clients'] == 0
+
+
+def test_waiter_returns_at_once_when_it_is_behind(counters):
+    router, _ = counters
+    hub = NotificationHub(router, interval=0.01)
+    started = time.monotonic()
+    assert hub.wait(2, 5, timeout=5) == 20
+    assert time.monotonic() - started < 1
+
+
+def test_waiter_times_out_without_news(counters):
+    router, _ = counters
+    hub = NotificationHub(router, interval=0.01)
+    assert hub.wait(1, 10, timeout=0.1) == 10
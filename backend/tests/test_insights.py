@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from insights import SpendingAggregates
+
+
+def tables(aggregates):
+    """Tables keyed by month and category name, so layouts can differ"""
+    months = range(aggregates.first_month, aggregates.first_month + aggregates.n_months)
+    by_category = {
+        (month, category): aggregates.category_total[i, j]
+        for i, month in enumerate(months)
+        for j, category in enumerate(aggregates.categories)
+        if aggregates.category_total[i, j]
+    }
+    return {
+        'weekday_total': dict(zip(months, aggregates.weekday_total.tolist())),
+        'weekday_count': dict(zip(months, aggregates.weekday_count.tolist())),
+        'impulse_count': dict(zip(months, aggregates.impulse_count.tolist())),
+        'category_total': by_category,
+    }
+
+
+def assert_same(left, right):
+    left, right = tables(left), tables(right)
+    assert left['weekday_count'] == right['weekday_count']
+    assert left['impulse_count'] == right['impulse_count']
+    for month, row in left['weekday_total'].items():
+        np.testing.assert_allclose(row, right['weekday_total'][month])
+    assert left['category_total'].keys() == right['category_total'].keys()
+    for key, total in left['category_total'].items():
+        assert np.isclose(total, right['category_total'][key])
+
+
+def test_observe_matches_from_frame(ledger):
+    observed = SpendingAggregates()
+    for row in ledger.itertuples():
+        observed.observe(row.type, row.category, row.date, row.amount)
+    assert_same(observed, SpendingAggregates.from_frame(ledger))
+
+
+def test_merge_matches_from_frame(ledger):
+    # Halves split by date so the two partials cover different months
+    ordered = ledger.sort_values('date')
+    early, late = ordered.iloc[:250], ordered.iloc[250:]
+    merged = SpendingAggregates.from_frame(late).merge(SpendingAggregates.from_frame(early))
+    assert_same(merged, SpendingAggregates.from_frame(ledger))
+    assert merged.insights() == SpendingAggregates.from_frame(ledger).insights()
+
+
+def test_merge_adds_new_categories():
+    first = SpendingAggregates.from_frame(pd.DataFrame({
+        'date': ['2025-01-03'], 'amount': [10.0], 'type': ['expense'], 'category': ['Food & Dining'],
+    }))
+    second = SpendingAggregates.from_frame(pd.DataFrame({
+        'date': ['2025-03-03'], 'amount': [99.0], 'type': ['expense'], 'category': ['Rent'],
+    }))
+    merged = first.merge(second)
+    assert merged.categories == ['Food & Dining', 'Rent']
+    assert merged.monthly_totals() == [('2025-01', 10.0), ('2025-03', 99.0)]
+
+
+def test_json_round_trip(ledger):
+    aggregates = SpendingAggregates.from_frame(ledger, ledger_version=12, currency='EUR')
+    restored = SpendingAggregates.from_json(aggregates.to_json())
+    assert (restored.ledger_version, restored.currency) == (12, 'EUR')
+    assert_same(restored, aggregates)
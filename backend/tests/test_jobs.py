@@ -0,0 +1,78 @@
+import math
+import time
+
+import pytest
+
+from jobs import JobQueue, QueueFull
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(workers=1, max_per_user=2, max_queued=4, result_ttl=60)
+    yield queue
+    queue.shutdown()
+
+
+def test_runs_a_job_and_reuses_its_result(queue):
+    job = queue.submit(1, 'pow', (1, 'pow', 7), pow, 2, 10)
+    assert queue.wait(job, 30).status == 'done'
+    assert job.result == 1024
+    assert job.to_dict()['result'] == 1024
+
+    assert queue.submit(1, 'pow', (1, 'pow', 7), pow, 2, 10) is job
+    assert queue.fresh_result((1, 'pow', 7)) is job
+    assert queue.fresh_result((1, 'pow', 8)) is None
+    assert queue.get(job.id, 1) is job
+    assert queue.get(job.id, 2) is None
+
+
+def test_failed_job_is_resubmitted(queue):
+    job = queue.wait(queue.submit(1, 'sqrt', (1, 'sqrt', 1), math.sqrt, -1), 30)
+    assert job.status == 'failed'
+    assert 'math domain error' in job.to_dict()['error']
+
+    retry = queue.submit(1, 'sqrt', (1, 'sqrt', 1), math.sqrt, 4)
+    assert retry is not job
+    assert queue.wait(retry, 30).result == 2.0
+
+
+def test_users_take_turns(queue):
+    first = queue.submit(1, 'sleep', (1, 'sleep', 0), time.sleep, 0.3)
+    jobs = [
+        queue.submit(1, 'sleep', (1, 'sleep', 1), time.sleep, 0),
+        queue.submit(1, 'sleep', (1, 'sleep', 2), time.sleep, 0),
+        queue.submit(2, 'sleep', (2, 'sleep', 1), time.sleep, 0),
+    ]
+    for job in [first] + jobs:
+        queue.wait(job, 30)
+
+    order = sorted(jobs, key=lambda job: job.started_at)
+    assert [job.key for job in order] == [(1, 'sleep', 1), (2, 'sleep', 1), (1, 'sleep', 2)]
+
+
+def test_queue_limits(queue):
+    blocker = queue.submit(1, 'sleep', (1, 'sleep', 0), time.sleep, 0.5)
+    queue.submit(1, 'sleep', (1, 'sleep', 1), time.sleep, 0)
+    queue.submit(1, 'sleep', (1, 'sleep', 2), time.sleep, 0)
+    with pytest.raises(QueueFull):
+        queue.submit(1, 'sleep', (1, 'sleep', 3), time.sleep, 0)
+
+    queue.submit(2, 'sleep', (2, 'sleep', 1), time.sleep, 0)
+    queue.submit(3, 'sleep', (3, 'sleep', 1), time.sleep, 0)
+    with pytest.raises(QueueFull):
+        queue.submit(4, 'sleep', (4, 'sleep', 1), time.sleep, 0)
+
+    metrics = queue.metrics()
+    assert metrics['queue_depth'] == 4
+    assert metrics['rejected'] == 2
+    # Shared by every user through /api/jobs/metrics, so no per-user breakdown
+    assert not any('user' in name for name in metrics)
+    queue.wait(blocker, 30)
+
+
+def test_finished_jobs_expire(queue):
+    queue.result_ttl = 0
+    job = queue.wait(queue.submit(1, 'pow', (1, 'pow', 7), pow, 2, 3), 30)
+    time.sleep(0.01)
+    assert queue.fresh_result((1, 'pow', 7)) is None
+    assert queue.get(job.id, 1) is None
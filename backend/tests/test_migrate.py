@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from migrate import explain_hot_queries, migrations, split_statements
+
+
+def test_migrations_are_numbered_in_order():
+    found = migrations()
+    assert [version for version, _, _ in found] == list(range(1, len(found) + 1))
+    for _, _, path in found:
+        with open(path) as f:
+            assert split_statements(f.read())
+
+
+def test_split_statements_honours_delimiter():
+    script = """
+-- comment
+CREATE TABLE t (id INT);
+
+DELIMITER //
+CREATE TRIGGER trg AFTER INSERT ON t
+FOR EACH ROW
+BEGIN
+    INSERT INTO u VALUES (NEW.id);
+END //
+DELIMITER ;
+DROP TABLE x;
+"""
+    statements = split_statements(script)
+    assert len(statements) == 3
+    assert statements[0] == 'CREATE TABLE t (id INT)'
+    assert statements[1].startswith('CREATE TRIGGER') and statements[1].endswith('END')
+    assert statements[2] == 'DROP TABLE x'
+
+
+def test_duplicate_numbers_are_rejected(tmp_path):
+    for name in ('0001_a.sql', '0001_b.sql'):
+        (tmp_path / name).write_text('SELECT 1;')
+    with pytest.raises(ValueError):
+        migrations(str(tmp_path))
+
+
+@pytest.fixture
+def mysql_shards():
+    if not (os.environ.get('DB_HOST') or os.environ.get('SHARDS_CONFIG')):
+        pytest.skip('No MySQL database configured (DB_HOST or SHARDS_CONFIG)')
+    from mysql.connector import Error
+
+    from app import shard_router
+
+    shards = [shard for shard in shard_router.shards if shard_router.dialect(shard) == 'mysql']
+    try:
+        for shard in shards:
+            shard_router.connect(shard).close()
+    except Error as e:
+        pytest.skip(f'MySQL database unavailable: {e}')
+    return shard_router, shards
+
+
+@pytest.mark.mysql
+def test_hot_queries_use_their_indexes(mysql_shards):
+    """Needs a migrated database with realistic data, e.g. seeded by benchmarks.loadtest"""
+    router, shards = mysql_shards
+    failures = [
+        f"{shard}: {name}: {detail}"
+        for shard in shards
+        for name, ok, detail in explain_hot_queries(router, shard)
+        if not ok
+    ]
+    assert not failures, '\n'.join(failures)
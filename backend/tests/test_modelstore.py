@@ -0,0 +1,85 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from modelstore import ModelStore, pack_frame, unpack_frame
+
+
+def artifact():
+    return {'weights': np.arange(50000, dtype=np.float64), 'classes': ['Food & Dining', 'Shopping']}
+
+
+def test_artifacts_are_versioned_and_memory_mapped(tmp_path):
+    store = ModelStore(model_dir=str(tmp_path))
+    store.put(1, 'forecast', 'v1', artifact())
+    store.put(1, 'forecast', 'v2', artifact())
+    assert os.listdir(tmp_path / 'users' / '1') == ['forecast.v2.joblib']
+
+    # Another worker on the host maps the file instead of refitting
+    other = ModelStore(model_dir=str(tmp_path))
+    assert other.get(1, 'forecast', 'v1') is None
+    loaded = other.get(1, 'forecast', 'v2')
+    assert isinstance(loaded['weights'], np.memmap)
+    assert not loaded['weights'].flags.writeable
+    assert np.array_equal(loaded['weights'], artifact()['weights'])
+    assert other.get(1, 'forecast', 'v2') is loaded
+    assert other.stats()['hits'] == 1
+    assert other.stats()['loads'] == 1
+
+
+def test_get_or_fit_fits_once_per_version(tmp_path):
+    store = ModelStore(model_dir=str(tmp_path))
+    fits = []
+
+    def fit():
+        fits.append(1)
+        return artifact()
+
+    store.get_or_fit(1, 'forecast', 'v1', fit)
+    store.get_or_fit(1, 'forecast', 'v1', fit)
+    store.get_or_fit(1, 'forecast', 'v2', fit)
+    assert len(fits) == 2
+    assert store.stats()['fits'] == 2
+
+
+def test_cleanup_drops_old_temp_and_least_recently_used_files(tmp_path):
+    store = ModelStore(model_dir=str(tmp_path), max_age_days=1)
+    for user_id in (1, 2, 3):
+        store.put(user_id, 'forecast', 'v1', artifact())
+    now = time.time()
+    directory = tmp_path / 'users'
+    os.utime(directory / '1' / 'forecast.v1.joblib', (now - 2 * 86400, now - 2 * 86400))
+    os.utime(directory / '2' / 'forecast.v1.joblib', (now - 3600, now - 3600))
+    stale_tmp = directory / '3' / 'leftover.tmp'
+    stale_tmp.write_bytes(b'x')
+    os.utime(stale_tmp, (now - 7200, now - 7200))
+
+    size = os.path.getsize(directory / '3' / 'forecast.v1.joblib')
+    store.max_bytes = size
+    removed = store.cleanup(now)
+
+    assert removed['files'] == 3
+    assert sorted(os.listdir(directory)) == ['3']
+    assert os.listdir(directory / '3') == ['forecast.v1.joblib']
+    assert store.usage()['users'] == 1
+
+
+def test_pack_frame_round_trip():
+    df = pd.DataFrame({
+        'date': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-02']),
+        'amount': [12.5, 40.0, 7.25],
+        'category': ['Food & Dining', None, 'Food & Dining'],
+        'type': ['expense', 'expense', 'income'],
+    })
+    packed = pack_frame(df)
+    assert packed['columns']['category'][0] == 'codes'
+    restored = unpack_frame(packed)
+    pd.testing.assert_frame_equal(restored, df, check_dtype=False)
+
+
+def test_pack_frame_of_an_empty_text_column():
+    df = pd.DataFrame({'merchant': pd.Series([], dtype=object), 'amount': pd.Series([], dtype=float)})
+    assert unpack_frame(pack_frame(df)).shape == (0, 2)
+
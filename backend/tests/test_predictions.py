@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from predictions import FinancialPredictor
+
+
+AS_OF = '2024-06-10'
+
+
+@pytest.fixture
+def salary_ledger():
+    """Monthly salary and rent plus daily spending, up to AS_OF"""
+    rng = np.random.default_rng(11)
+    rows = []
+    for month in pd.date_range('2024-01-01', '2024-06-01', freq='MS'):
+        rows.append((month, 4000.0, 'income', 'Salary', 'Employer'))
+        if month.month < 6:
+            rows.append((month + pd.Timedelta(days=14), 1500.0, 'expense', 'Rent', 'Landlord'))
+    for day in pd.date_range('2024-01-01', '2024-06-10', freq='D'):
+        rows.append((day, round(float(rng.gamma(2.0, 20.0)), 2), 'expense', 'Food & Dining', None))
+    return pd.DataFrame(rows, columns=['date', 'amount', 'type', 'category', 'merchant'])
+
+
+def test_simulation_is_reproducible(salary_ledger):
+    predictor = FinancialPredictor()
+    first = predictor.simulate_cash_flow(salary_ledger, n_paths=2000, seed=5, as_of=AS_OF)
+    assert first == predictor.simulate_cash_flow(salary_ledger, n_paths=2000, seed=5, as_of=AS_OF)
+    assert first['p5_balance'] <= first['p50_balance'] <= first['p95_balance']
+
+
+def test_simulation_starts_from_the_month_to_date_net(salary_ledger):
+    result = FinancialPredictor().simulate_cash_flow(salary_ledger, n_paths=1000, seed=1, as_of=AS_OF)
+    this_month = pd.to_datetime(salary_ledger['date']) >= '2024-06-01'
+    june = salary_ledger[this_month]
+    expected = june['amount'].where(june['type'] == 'income', -june['amount']).sum()
+    assert result['month_to_date_net'] == pytest.approx(expected, abs=0.01)
+    assert result['days_remaining'] == 20
+
+
+def test_rent_is_scheduled_for_the_rest_of_the_month(salary_ledger):
+    result = FinancialPredictor().simulate_cash_flow(salary_ledger, n_paths=1000, seed=1, as_of=AS_OF)
+    assert result['scheduled_recurring'] == -1500.0
+    # Rent plus about 40 a day of spending against a month-to-date net near 3600
+    assert 1000 < result['p50_balance'] < 2000
+
+
+def test_as_of_ignores_later_rows(salary_ledger):
+    predictor = FinancialPredictor()
+    later = pd.DataFrame({
+        'date': pd.to_datetime(['2024-06-11', '2024-06-20', '2024-07-02']),
+        'amount': [900.0, 35.0, 4000.0],
+        'type': ['expense', 'expense', 'income'],
+        'category': ['Travel', 'Food & Dining', 'Salary'],
+        'merchant': [None, None, 'Employer'],
+    })
+    full = pd.concat([salary_ledger, later], ignore_index=True)
+
+    assert (predictor.simulate_cash_flow(full, n_paths=500, seed=2, as_of=AS_OF)
+            == predictor.simulate_cash_flow(salary_ledger, n_paths=500, seed=2, as_of=AS_OF))
+    assert (predictor.predict_cash_flow(full.copy(), as_of=AS_OF)
+            == predictor.predict_cash_flow(salary_ledger.copy(), as_of=AS_OF))
+    budgets = {'Travel': 100.0, 'Food & Dining': 200.0}
+    assert (predictor.predict_budget_overrun(full.copy(), budgets, as_of=AS_OF)
+            == predictor.predict_budget_overrun(salary_ledger.copy(), budgets, as_of=AS_OF))
+
+
+def test_simulation_needs_history():
+    ledger = pd.DataFrame({'date': ['2024-06-01'], 'amount': [10.0], 'type': ['expense'],
+                           'category': ['Food & Dining'], 'merchant': [None]})
+    assert 'error' in FinancialPredictor().simulate_cash_flow(ledger)
+
+
+GOALS = [
+    {'id': 1, 'goal_name': 'Laptop', 'current_amount': 200, 'target_amount': 1200, 'deadline': '2024-12-01'},
+    {'id': 2, 'goal_name': 'Car', 'current_amount': 0, 'target_amount': 9000, 'deadline': '2025-06-01'},
+    {'id': 3, 'goal_name': 'House', 'current_amount': 0, 'target_amount': 90000, 'deadline': '2025-01-01'},
+    {'id': 4, 'goal_name': 'Trip', 'current_amount': 800, 'target_amount': 1000, 'deadline': '2024-05-01'},
+    {'id': 5, 'goal_name': 'Phone', 'current_amount': 900, 'target_amount': 900, 'deadline': '2024-12-01'},
+]
+
+
+def test_goal_timelines_match_the_single_goal_call():
+    predictor = FinancialPredictor()
+    timelines = predictor.calculate_savings_goal_timelines(GOALS, 3000.0, 2000.0, as_of='2024-06-01')
+    assert [t['goal_id'] for t in timelines] == [1, 2, 3, 4, 5]
+
+    for goal, timeline in zip(GOALS, timelines):
+        single = predictor.calculate_savings_goal_timeline(
+            float(goal['current_amount']), float(goal['target_amount']), 3000.0, 2000.0)
+        assert {k: v for k, v in timeline.items() if k in single} == single
+
+
+def test_goal_deadline_status():
+    timelines = FinancialPredictor().calculate_savings_goal_timelines(
+        GOALS, 3000.0, 2000.0, as_of='2024-06-01')
+    # 700 a month conservatively, 900 aggressively
+    assert [t.get('deadline_status') for t in timelines] == [
+        'on_track', 'at_risk', 'unreachable', 'passed', None,
+    ]
+    assert timelines[0]['required_monthly'] == pytest.approx(1000 / (183 / 30.44), abs=0.01)
+
+
+def test_goal_timelines_without_a_surplus():
+    timelines = FinancialPredictor().calculate_savings_goal_timelines(GOALS[:1], 2000.0, 2500.0)
+    assert timelines[0]['status'] == 'impossible'
+    assert timelines[0]['deadline_status'] == 'unreachable'
+
+
+def june_spending():
+    rng = np.random.default_rng(4)
+    days = pd.date_range('2024-06-01', '2024-06-10', freq='D')
+    rows = [
+        (day, round(float(rng.gamma(2.0, scale)), 2), 'expense', category)
+        for day in days
+        for category, scale in (('Food & Dining', 15.0), ('Shopping', 30.0), ('Travel', 5.0))
+    ]
+    rows.append((days[0], 4000.0, 'income', 'Salary'))
+    return pd.DataFrame(rows, columns=['date', 'amount', 'type', 'category'])
+
+
+def test_budget_scenarios_match_predict_budget_overrun():
+    ledger = june_spending()
+    expenses = ledger[ledger['type'] == 'expense']
+    spent = expenses.groupby('category')['amount'].sum().to_dict()
+    saved = {'Food & Dining': 600.0, 'Shopping': 500.0, 'Rent': 1500.0}
+    scenarios = [
+        {},
+        {'Food & Dining': 1200.0},
+        {'Shopping': None, 'Travel': 50.0},
+        {'Food & Dining': 100.0, 'Shopping': 100.0, 'Travel': 500.0},
+    ]
+
+    predictor = FinancialPredictor()
+    results = predictor.evaluate_budget_scenarios(spent, scenarios, saved, as_of=AS_OF)
+    assert len(results) == len(scenarios)
+
+    for scenario, result in zip(scenarios, results):
+        budgets = {c: limit for c, limit in {**saved, **scenario}.items() if limit is not None}
+        expected = predictor.predict_budget_overrun(ledger.copy(), budgets, as_of=AS_OF)
+        assert [r['category'] for r in result['at_risk']] == [r['category'] for r in expected]
+        assert result['categories_at_risk'] == len(expected)
+        assert result['total_budget'] == round(sum(budgets.values()), 2)
+        for got, want in zip(result['at_risk'], expected):
+            assert got['projected_total'] == pytest.approx(want['projected_total'])
+            assert got['overrun_amount'] == pytest.approx(want['overrun_amount'])
+            assert got['risk_level'] == want['risk_level']
+            assert got['days_until_overrun'] == want['days_until_overrun']
+
+
+def test_budget_scenarios_without_spending():
+    results = FinancialPredictor().evaluate_budget_scenarios(
+        {}, [{'Food & Dining': 100.0}], as_of=AS_OF)
+    assert results == [{'total_budget': 100.0, 'projected_overrun': 0.0, 'categories_at_risk': 0, 'at_risk': []}]
+    assert FinancialPredictor().evaluate_budget_scenarios({}, []) == []
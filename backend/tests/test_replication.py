@@ -0,0 +1,117 @@
+import sqlite3
+
+import pytest
+
+from replication import parse_token, replica_is_fresh
+from sharding import ShardRouter
+
+
+def create_database(path, version, inbox_version=0):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE ledger_versions (user_id INTEGER PRIMARY KEY, version INTEGER)")
+    connection.execute("INSERT INTO ledger_versions VALUES (1, ?)", (version,))
+    connection.execute("CREATE TABLE notification_counters (user_id INTEGER PRIMARY KEY, version INTEGER)")
+    connection.execute("INSERT INTO notification_counters VALUES (1, ?)", (inbox_version,))
+    connection.commit()
+    connection.close()
+
+
+def set_version(path, version, table='ledger_versions'):
+    connection = sqlite3.connect(path)
+    connection.execute(f"UPDATE {table} SET version = ? WHERE user_id = 1", (version,))
+    connection.commit()
+    connection.close()
+
+
+def served_by(connection):
+    try:
+        return connection.execute("PRAGMA database_list").fetchone()[2]
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def databases(tmp_path):
+    """A primary at ledger version 5 and inbox version 9, and a replica lagging at 3 and 9"""
+    primary, replica = str(tmp_path / 'primary.db'), str(tmp_path / 'replica.db')
+    create_database(primary, 5, 9)
+    create_database(replica, 3, 9)
+    router = ShardRouter({'default': {
+        'driver': 'sqlite', 'database': primary,
+        'replicas': [{'driver': 'sqlite', 'database': replica}],
+    }})
+    return router, primary, replica
+
+
+def test_reads_after_a_write_go_to_the_primary_until_the_replica_catches_up(databases):
+    router, primary, replica = databases
+
+    assert served_by(router.connect_user(1, read_only=True, min_version=5)) == primary
+    assert router.primary_fallbacks == 1
+
+    set_version(replica, 5)
+    assert served_by(router.connect_user(1, read_only=True, min_version=5)) == replica
+    assert router.replica_reads == 1
+
+
+def test_reads_without_a_fresh_token_use_the_replica(databases):
+    router, primary, replica = databases
+    assert served_by(router.connect_user(1, read_only=True)) == replica
+    assert served_by(router.connect_user(1, read_only=True, min_version=3)) == replica
+    assert served_by(router.connect_user(1)) == primary
+    assert served_by(router.connect_user(1, for_write=True)) == primary
+
+
+def test_inbox_tokens_are_checked_against_the_inbox_version(databases):
+    router, primary, replica = databases
+    # The replica has every notification write even though its ledger lags
+    assert served_by(router.connect_user(1, read_only=True, min_version=9, scope='inbox')) == replica
+
+    set_version(primary, 10, 'notification_counters')
+    assert served_by(router.connect_user(1, read_only=True, min_version=10, scope='inbox')) == primary
+    set_version(replica, 10, 'notification_counters')
+    assert served_by(router.connect_user(1, read_only=True, min_version=10, scope='inbox')) == replica
+
+
+def test_unreachable_replica_falls_back_to_the_primary(tmp_path):
+    primary = str(tmp_path / 'primary.db')
+    create_database(primary, 5)
+    router = ShardRouter({'default': {
+        'driver': 'sqlite', 'database': primary,
+        'replicas': [{'driver': 'sqlite', 'database': str(tmp_path / 'missing' / 'replica.db')}],
+    }})
+    assert served_by(router.connect_user(1, read_only=True)) == primary
+    assert router.primary_fallbacks == 1
+
+
+def test_freshness_modes(databases):
+    _, _, replica = databases
+    connection = sqlite3.connect(replica)
+    try:
+        assert replica_is_fresh(connection, 'sqlite', 1, None, mode='ledger')
+        assert not replica_is_fresh(connection, 'sqlite', 1, 4, mode='ledger')
+        assert not replica_is_fresh(connection, 'sqlite', 2, 1, mode='ledger')
+        assert not replica_is_fresh(connection, 'sqlite', 1, 1, mode='seconds')
+        assert replica_is_fresh(connection, 'sqlite', 1, 99, mode='none')
+    finally:
+        connection.close()
+
+
+def test_parse_token():
+    assert parse_token('12') == 12
+    assert parse_token(None) is None
+    assert parse_token('abc') is None
+
+
+def test_request_token_reaches_the_router(databases, monkeypatch):
+    import app as backend
+    router, primary, replica = databases
+    monkeypatch.setattr(backend, 'shard_router', router)
+
+    with backend.app.test_request_context(headers={'X-Consistency-Token': '5'}):
+        assert served_by(backend.get_db_connection(1, read_only=True)) == primary
+    with backend.app.test_request_context():
+        assert served_by(backend.get_db_connection(1, read_only=True)) == replica
+    # Inbox reads only look at the inbox token
+    with backend.app.test_request_context(headers={'X-Consistency-Token': '5', 'X-Inbox-Token': '9'}):
+        assert served_by(backend.get_db_connection(1, read_only=True, scope='inbox')) == replica
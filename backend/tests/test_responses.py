@@ -0,0 +1,115 @@
+import gzip
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+import responses
+from responses import EncodedPayload, FastJSONProvider, PayloadCache, compress_response, payload_response
+
+
+def make_app():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
+    return app
+
+
+def test_wire_format_matches_the_default_provider():
+    row = {
+        'amount': Decimal('12.50'),
+        'transaction_date': date(2024, 3, 9),
+        'created_at': datetime(2024, 3, 9, 14, 5, 7),
+        'category': 'Food & Dining',
+        'id': 3,
+    }
+    default = DefaultJSONProvider(Flask(__name__))
+    assert json.loads(responses.encode_json(row)) == json.loads(default.dumps(row))
+
+
+def test_numpy_values_are_encoded():
+    data = {'total': np.float64(1.5), 'count': np.int64(2), 'series': np.array([1.0, 2.0])}
+    assert json.loads(responses.encode_json(data)) == {'total': 1.5, 'count': 2, 'series': [1.0, 2.0]}
+
+
+def test_dumps_honours_sort_keys_and_indent():
+    provider = FastJSONProvider(Flask(__name__))
+    data = {'b': 1, 'a': [1, 2], 'when': date(2024, 3, 9)}
+
+    assert provider.dumps(data) == '{"b":1,"a":[1,2],"when":"Sat, 09 Mar 2024 00:00:00 GMT"}'
+    assert provider.dumps(data, sort_keys=True, indent=2) == json.dumps(
+        {'a': [1, 2], 'b': 1, 'when': 'Sat, 09 Mar 2024 00:00:00 GMT'}, indent=2)
+    # No orjson equivalent: encoded by the stdlib with the same fallbacks
+    assert provider.dumps(data, indent=4, separators=(', ', ': ')) == json.dumps(
+        {'b': 1, 'a': [1, 2], 'when': 'Sat, 09 Mar 2024 00:00:00 GMT'}, indent=4, separators=(', ', ': '))
+
+
+def test_large_bodies_are_compressed_small_ones_are_not():
+    app = make_app()
+
+    @app.route('/large')
+    def large():
+        return jsonify([{'id': i, 'merchant': 'Coffee shop'} for i in range(200)])
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    client = app.test_client()
+    response = client.get('/large', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(response.data))) == 200
+
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json() == {'ok': True}
+
+
+def test_cached_payload_is_compressed_once():
+    app = make_app()
+    payload = EncodedPayload.from_obj([{'id': i} for i in range(500)])
+
+    @app.route('/cached')
+    def cached():
+        return payload_response(payload)
+
+    client = app.test_client()
+    first = client.get('/cached', headers={'Accept-Encoding': 'gzip'}).data
+    second = client.get('/cached', headers={'Accept-Encoding': 'gzip'}).data
+    assert first == second == payload.variant('gzip')
+    assert list(payload._variants) == ['gzip']
+
+
+def test_payload_cache_evicts_expires_and_invalidates():
+    cache = PayloadCache(max_entries=2, ttl_seconds=60)
+    cache.put((1, 'a'), 'first')
+    cache.put((1, 'b'), 'second')
+    cache.put((2, 'a'), 'third')
+    assert cache.get((1, 'a')) is None
+    assert cache.get((1, 'b')) == 'second'
+
+    cache.invalidate_user(1)
+    assert cache.get((1, 'b')) is None
+    assert cache.get((2, 'a')) == 'third'
+
+    cache.ttl_seconds = -1
+    cache.put((3, 'a'), 'stale')
+    assert cache.get((3, 'a')) is None
+
+
+def test_get_or_build_builds_on_a_miss_only():
+    cache = PayloadCache()
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {'built_at': time.time()}
+
+    first = cache.get_or_build((1, 'summary', 4), build)
+    second = cache.get_or_build((1, 'summary', 4), build)
+    assert first is second
+    assert len(calls) == 1
@@ -0,0 +1,74 @@
+import search
+from search import SELECTIVITY_PROBE, index_transaction, search_transaction_ids, suggest_merchants, tokenize
+
+
+class RecordingCursor:
+    """Records statements and answers each fetch from a queue of results"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, params))
+
+    def executemany(self, sql, rows):
+        self.statements.append((sql, list(rows)))
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+
+def test_tokenize():
+    assert tokenize('Starbucks Coffee #1234', 'coffee with Ana') == ['starbucks', 'coffee', '1234', 'with', 'ana']
+    assert tokenize('Café_Zürich') == ['café', 'zürich']
+    assert tokenize(None, '') == []
+    assert tokenize('x' * 40) == ['x' * search.TERM_LENGTH]
+
+
+def test_tokenize_caps_the_number_of_terms(monkeypatch):
+    monkeypatch.setattr(search, 'SEARCH_MAX_TERMS', 3)
+    assert tokenize('a b c d e') == ['a', 'b', 'c']
+
+
+def test_index_transaction_writes_terms_and_merchant_tokens():
+    cursor = RecordingCursor()
+    index_transaction(cursor, 1, 42, 'Blue Bottle', 'oat latte', 'Food & Dining')
+    (_, term_rows), (_, merchant_rows) = cursor.statements
+    assert term_rows == [(1, 'blue', 42), (1, 'bottle', 42), (1, 'oat', 42), (1, 'latte', 42)]
+    assert merchant_rows == [(1, 'blue', 'Blue Bottle', 1, 'Food & Dining'),
+                             (1, 'bottle', 'Blue Bottle', 1, 'Food & Dining')]
+
+
+def test_search_drives_from_the_rarest_term():
+    cursor = RecordingCursor({'n': SELECTIVITY_PROBE}, {'n': 3}, [{'id': 9}, {'id': 4}])
+    assert search_transaction_ids(cursor, 1, 'coffee star') == [9, 4]
+
+    sql, params = cursor.statements[-1]
+    assert 'FORCE INDEX (PRIMARY)' in sql
+    assert params == ('coffee%', 1, 'star%', search.SEARCH_DEFAULT_LIMIT)
+
+
+def test_search_walks_recent_ids_when_every_term_is_common():
+    cursor = RecordingCursor({'n': SELECTIVITY_PROBE}, [{'id': 9}])
+    assert search_transaction_ids(cursor, 1, 'card', limit=1) == [9]
+    assert 'FORCE INDEX (idx_user_transaction)' in cursor.statements[-1][0]
+
+
+def test_search_without_terms_runs_no_query():
+    cursor = RecordingCursor()
+    assert search_transaction_ids(cursor, 1, ' -- ') == []
+    assert cursor.statements == []
+
+
+def test_suggestions_match_every_word_of_the_prefix():
+    cursor = RecordingCursor([
+        {'merchant': 'Blue Bottle Coffee', 'uses': 7, 'last_category': 'Food & Dining'},
+        {'merchant': 'Coffee Bean', 'uses': 3, 'last_category': 'Food & Dining'},
+    ])
+    suggestions = suggest_merchants(cursor, 1, 'blue co')
+    assert suggestions == [{'merchant': 'Blue Bottle Coffee', 'uses': 7, 'last_category': 'Food & Dining'}]
+    assert cursor.statements[0][1] == (1, 'co%', search.SUGGEST_LIMIT * 4)
@@ -0,0 +1,136 @@
+import sqlite3
+from collections import Counter
+
+import pytest
+
+import reshard
+from sharding import ShardMoving, ShardRouter
+
+
+# Per-user state move_user rebuilds on the target instead of copying
+DERIVED_TABLES = ['forecast_states', 'insight_states']
+
+
+def create_shard(path):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT, password_hash TEXT, name TEXT)")
+    connection.execute("CREATE TABLE user_shards (user_id INTEGER PRIMARY KEY, shard TEXT, state TEXT)")
+    connection.execute("CREATE TABLE ledger_versions (user_id INTEGER PRIMARY KEY, version INTEGER)")
+    connection.execute("CREATE TABLE notification_counters (user_id INTEGER PRIMARY KEY, unread INTEGER DEFAULT 0, "
+                       "latest_id INTEGER DEFAULT 0, version INTEGER)")
+    for table in DERIVED_TABLES:
+        connection.execute(f"CREATE TABLE {table} (user_id INTEGER PRIMARY KEY, state TEXT)")
+    for table in reshard.USER_TABLES:
+        connection.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, user_id INTEGER, note TEXT)")
+    connection.commit()
+    connection.close()
+
+
+@pytest.fixture
+def router(tmp_path):
+    shards = {}
+    for name in ('a', 'b'):
+        path = str(tmp_path / f"{name}.db")
+        create_shard(path)
+        shards[name] = {'driver': 'sqlite', 'database': path}
+    return ShardRouter(shards, directory='a', map_ttl=60)
+
+
+def query(router, shard, sql, params=()):
+    connection = router.connect(shard)
+    try:
+        return connection.execute(sql, params).fetchall()
+    finally:
+        connection.close()
+
+
+def execute(router, shard, sql, params=()):
+    connection = router.connect(shard)
+    try:
+        connection.execute(sql, params)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def user_on(router, shard):
+    """A user id the ring places on shard"""
+    return next(user_id for user_id in range(1, 1000) if router.ring_shard(user_id) == shard)
+
+
+def test_ring_spreads_users_and_moves_few_when_a_shard_is_added():
+    three = ShardRouter({name: {} for name in 'abc'})
+    four = ShardRouter({name: {} for name in 'abcd'})
+    users = range(1, 6001)
+
+    counts = Counter(three.ring_shard(user_id) for user_id in users)
+    assert all(1500 < count < 2500 for count in counts.values())
+
+    moved = [user_id for user_id in users if three.ring_shard(user_id) != four.ring_shard(user_id)]
+    assert all(four.ring_shard(user_id) == 'd' for user_id in moved)
+    assert 0.15 < len(moved) / len(users) < 0.35
+
+
+def test_single_shard_never_reads_the_directory():
+    router = ShardRouter({'default': {'host': 'unreachable'}})
+    assert router.placement(42) == ('default', 'active')
+
+
+def test_overrides_are_cached_until_forgotten(router):
+    user_id = user_on(router, 'a')
+    assert router.placement(user_id) == ('a', 'active')
+
+    execute(router, 'a', "INSERT INTO user_shards VALUES (?, 'b', 'active')", (user_id,))
+    assert router.placement(user_id) == ('a', 'active')
+    router.forget(user_id)
+    assert router.placement(user_id) == ('b', 'active')
+
+
+def test_moving_user_cannot_write(router):
+    user_id = user_on(router, 'b')
+    execute(router, 'a', "INSERT INTO user_shards VALUES (?, 'b', 'moving')", (user_id,))
+
+    with pytest.raises(ShardMoving):
+        router.connect_user(user_id, for_write=True)
+    router.connect_user(user_id).close()
+
+
+def seed_user(router, shard, user_id):
+    execute(router, 'a', "INSERT INTO users VALUES (?, 'x@example.com', 'hash', 'X')", (user_id,))
+    for i, table in enumerate(reshard.USER_TABLES):
+        execute(router, shard, f"INSERT INTO {table} VALUES (?, ?, ?)", (100 + i, user_id, table))
+    execute(router, shard, "INSERT INTO ledger_versions VALUES (?, 7)", (user_id,))
+    execute(router, shard, "INSERT INTO notification_counters VALUES (?, 1, 100, 3)", (user_id,))
+
+
+def test_move_user_copies_and_flips_placement(router):
+    router.map_ttl = 0
+    user_id = user_on(router, 'a')
+    seed_user(router, 'a', user_id)
+
+    copied = reshard.move_user(router, user_id, 'b', log=lambda message: None)
+
+    assert copied == len(reshard.USER_TABLES)
+    assert router.placement(user_id) == ('b', 'active')
+    for table in reshard.USER_TABLES:
+        assert query(router, 'b', f"SELECT note FROM {table} WHERE user_id = ?", (user_id,)) == [(table,)]
+        assert query(router, 'a', f"SELECT * FROM {table} WHERE user_id = ?", (user_id,)) == []
+    assert query(router, 'b', "SELECT version FROM ledger_versions WHERE user_id = ?", (user_id,)) == [(8,)]
+    assert query(router, 'b', "SELECT version FROM notification_counters WHERE user_id = ?", (user_id,)) == [(4,)]
+    assert query(router, 'b', "SELECT password_hash FROM users WHERE id = ?", (user_id,)) == [('!',)]
+    # The directory keeps the login row
+    assert query(router, 'a', "SELECT email FROM users WHERE id = ?", (user_id,)) == [('x@example.com',)]
+
+
+def test_move_user_rolls_back_on_an_id_collision(router):
+    router.map_ttl = 0
+    user_id = user_on(router, 'a')
+    seed_user(router, 'a', user_id)
+    execute(router, 'b', "INSERT INTO transactions VALUES (100, 999, 'someone else')")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        reshard.move_user(router, user_id, 'b', log=lambda message: None)
+
+    assert router.placement(user_id) == ('a', 'active')
+    assert query(router, 'b', "SELECT COUNT(*) FROM budgets") == [(0,)]
+    assert query(router, 'a', "SELECT COUNT(*) FROM transactions WHERE user_id = ?", (user_id,)) == [(1,)]
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class Cancelled(BaseException):
+    pass
+
+
+def start_waiters(flight, key, fn, n, timeout=None):
+    results = [None] * n
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn, timeout)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for_waiters(flight, key, n):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with flight._lock:
+            call = flight._calls.get(key)
+            if call is not None and call.waiters == n:
+                return
+        time.sleep(0.001)
+    raise AssertionError("waiters never arrived")
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'total': 42}
+
+    threads, results = start_waiters(flight, 'k', compute, 1)
+    wait_for_waiters(flight, 'k', 0)
+    more, more_results = start_waiters(flight, 'k', compute, 4)
+    wait_for_waiters(flight, 'k', 4)
+    release.set()
+    for thread in threads + more:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in more_results)
+    assert flight.stats() == {'in_flight': 0, 'executions': 1, 'deduplicated': 4,
+                              'errors': 0, 'cancelled': 0, 'timeouts': 0}
+    # The next call after the flight landed runs again
+    flight.do('k', compute)
+    assert len(calls) == 2
+
+
+def test_waiters_get_the_same_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("ledger unavailable")
+
+    threads, results = start_waiters(flight, 'k', fail, 1)
+    wait_for_waiters(flight, 'k', 0)
+    more, more_results = start_waiters(flight, 'k', fail, 2)
+    wait_for_waiters(flight, 'k', 2)
+    release.set()
+    for thread in threads + more:
+        thread.join()
+
+    assert all(isinstance(result, ValueError) for result in results + more_results)
+    assert flight.stats()['errors'] == 1
+
+
+def test_cancelled_leader_hands_over_to_a_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader_error = []
+
+    def cancelled():
+        release.wait(5)
+        raise Cancelled()
+
+    def leader():
+        try:
+            flight.do('k', cancelled)
+        except Cancelled as e:
+            leader_error.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    wait_for_waiters(flight, 'k', 0)
+    waiters, results = start_waiters(flight, 'k', lambda: 'recomputed', 1)
+    wait_for_waiters(flight, 'k', 1)
+    release.set()
+    for t in [thread] + waiters:
+        t.join()
+
+    assert leader_error
+    assert results == ['recomputed']
+    assert flight.stats()['cancelled'] == 1
+    assert flight.stats()['executions'] == 2
+
+
+def test_waiter_times_out():
+    flight = SingleFlight()
+    release = threading.Event()
+    threads, _ = start_waiters(flight, 'k', lambda: release.wait(5), 1)
+    wait_for_waiters(flight, 'k', 0)
+
+    with pytest.raises(TimeoutError):
+        flight.do('k', lambda: None, timeout=0.05)
+    release.set()
+    threads[0].join()
+    assert flight.stats()['timeouts'] == 1
@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+from warmup import Warmer
+
+
+def wait_idle(warmer):
+    warmer._executor.shutdown(wait=True)
+    warmer._executor = None
+
+
+def test_warm_hits_and_misses_are_counted_once_per_cache():
+    warmer = Warmer(workers=1)
+
+    def warm(user_id, filled):
+        filled((user_id, 'transactions', 7), 0.25)
+        filled((user_id, 'monthly-totals', 7), 0.5)
+
+    assert warmer.schedule(1, warm)
+    wait_idle(warmer)
+
+    warmer.claim((1, 'transactions', 7))
+    warmer.claim((1, 'transactions', 7))
+    # The ledger moved on before the request came in
+    warmer.claim((1, 'monthly-totals', 8))
+    warmer.claim((1, 'insights', 7))
+    # Users that were never warmed do not count
+    warmer.claim((2, 'transactions', 7))
+
+    stats = warmer.stats()
+    assert (stats['warm_hits'], stats['warm_misses']) == (1, 2)
+    assert stats['seconds_saved'] == 0.25
+    assert stats['completed'] == 1
+
+
+def test_a_user_is_warmed_once_per_cooldown():
+    warmer = Warmer(workers=1, cooldown=60)
+    release = threading.Event()
+    assert warmer.schedule(1, lambda user_id, filled: release.wait(5))
+    assert not warmer.schedule(1, lambda user_id, filled: None)
+    release.set()
+    wait_idle(warmer)
+    assert not warmer.schedule(1, lambda user_id, filled: None)
+    assert warmer.stats()['deduplicated'] == 2
+
+    warmer.cooldown = 0
+    assert warmer.schedule(1, lambda user_id, filled: None)
+    wait_idle(warmer)
+
+
+def test_backlog_is_dropped_not_queued():
+    warmer = Warmer(workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block(user_id, filled):
+        started.set()
+        release.wait(5)
+
+    warmer.schedule(1, block)
+    started.wait(5)
+    assert warmer.schedule(2, block)
+    assert not warmer.schedule(3, block)
+    release.set()
+    wait_idle(warmer)
+    assert warmer.stats()['rejected'] == 1
+
+
+def test_failed_warm_up_is_counted(capsys):
+    warmer = Warmer(workers=1)
+
+    def fail(user_id, filled):
+        raise RuntimeError("shard down")
+
+    warmer.schedule(1, fail)
+    wait_idle(warmer)
+    assert warmer.stats()['failed'] == 1
+    assert 'shard down' in capsys.readouterr().out
+
+
+def test_claims_after_the_window_are_ignored():
+    warmer = Warmer(workers=1, window=0)
+    warmer.schedule(1, lambda user_id, filled: filled((user_id, 'transactions', 1), 0.1))
+    wait_idle(warmer)
+    warmer.claim((1, 'transactions', 1))
+    assert warmer.stats()['warm_hit_rate'] is None
+
+
+@pytest.mark.parametrize('claims', [0, 3])
+def test_hit_rate(claims):
+    warmer = Warmer(workers=1)
+    warmer.schedule(1, lambda user_id, filled: [filled((user_id, f'cache-{i}', 1), 0.1) for i in range(3)])
+    wait_idle(warmer)
+    for i in range(claims):
+        warmer.claim((1, f'cache-{i}', 1))
+    assert warmer.stats()['warm_hit_rate'] == (1.0 if claims else None)
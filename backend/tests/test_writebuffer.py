@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from writebuffer import GroupCommitter
+
+
+def submit_all(committer, items, key='shard'):
+    """Submit items from one thread each; (results, errors) in item order"""
+    results = [None] * len(items)
+    errors = [None] * len(items)
+
+    def call(i, item):
+        try:
+            results[i] = committer.submit(key, item)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i, item)) for i, item in enumerate(items)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+
+def test_batches_concurrent_writes():
+    flushed = []
+
+    def flush(key, items):
+        flushed.append(list(items))
+        return [item * 10 for item in items]
+
+    committer = GroupCommitter(flush, window_ms=2000, max_batch=4)
+    results, errors = submit_all(committer, [1, 2, 3, 4])
+
+    assert sorted(results) == [10, 20, 30, 40]
+    assert errors == [None] * 4
+    assert len(flushed) == 1
+    assert committer.stats()['retried_batches'] == 0
+
+
+def test_failed_batch_is_retried_item_by_item():
+    flushed = []
+
+    def flush(key, items):
+        flushed.append(list(items))
+        if 'bad' in items:
+            raise ValueError('bad row')
+        return [item.upper() for item in items]
+
+    committer = GroupCommitter(flush, window_ms=2000, max_batch=4)
+    results, errors = submit_all(committer, ['a', 'bad', 'c', 'd'])
+
+    assert results == ['A', None, 'C', 'D']
+    assert errors[0] is None and errors[2] is None and errors[3] is None
+    assert isinstance(errors[1], ValueError)
+    # One batch attempt, then one flush per item
+    assert len(flushed) == 5 and all(len(items) == 1 for items in flushed[1:])
+    assert committer.stats()['retried_batches'] == 1
+
+
+def test_single_item_failure_is_not_retried():
+    calls = []
+
+    def flush(key, items):
+        calls.append(items)
+        raise RuntimeError('down')
+
+    committer = GroupCommitter(flush, window_ms=0)
+    with pytest.raises(RuntimeError):
+        committer.submit('shard', 'x')
+    assert len(calls) == 1
+    assert committer.stats()['retried_batches'] == 0
+
+
+def test_keys_are_batched_separately():
+    seen = []
+
+    def flush(key, items):
+        seen.append((key, sorted(items)))
+        return [key] * len(items)
+
+    committer = GroupCommitter(flush, window_ms=0)
+    assert committer.submit('one', 1) == 'one'
+    assert committer.submit('two', 2) == 'two'
+    assert seen == [('one', [1]), ('two', [2])]
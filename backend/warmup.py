@@ -0,0 +1,157 @@
+"""
+Background warm-up of a user's caches right after login.
+
+The first dashboard load after login asks for the ledger, the monthly
+totals and several predictions at once, all cold. Login schedules a
+warm-up instead: a function that fills those caches under the same keys
+the request handlers look up, so the requests that follow a moment later
+are hits.
+
+Warm-ups run on a small per-worker thread pool. A user is warmed at
+most once at a time and not again within WARMUP_COOLDOWN seconds, and
+when WARMUP_MAX_PENDING warm-ups are already waiting new ones are
+dropped; warming is an optimization and never holds up a login.
+
+Each step of a warm-up reports the cache key it filled and how long the
+fill took. Handlers claim the key they are about to serve, and the first
+claim of each cache per user after a warm-up counts as a warm hit (the
+key was filled and is still current) or a warm miss (it was not filled
+yet, or the ledger changed since). Time saved is the fill time of the
+keys that were hit.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+WARMUP_WORKERS = int(os.environ.get('WARMUP_WORKERS', 2))
+WARMUP_MAX_PENDING = int(os.environ.get('WARMUP_MAX_PENDING', 64))
+WARMUP_COOLDOWN = float(os.environ.get('WARMUP_COOLDOWN', 60))
+# How long after a warm-up the first requests are attributed to it
+WARMUP_WINDOW = float(os.environ.get('WARMUP_WINDOW', 300))
+
+
+class Warmer:
+    """Deduplicated, bounded background warm-ups with hit accounting"""
+
+    def __init__(self, workers=WARMUP_WORKERS, max_pending=WARMUP_MAX_PENDING,
+                 cooldown=WARMUP_COOLDOWN, window=WARMUP_WINDOW):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.cooldown = cooldown
+        self.window = window
+        self._executor = None
+        self._lock = threading.Lock()
+        self._active = set()
+        self._pending = 0
+        self._sessions = {}  # user_id -> (started, {cache name: claimed}, {key: seconds})
+
+        self.scheduled = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._run_times = deque(maxlen=1000)
+
+    def schedule(self, user_id, warm):
+        """
+        Run warm(user_id, filled) in the background, where warm calls
+        filled(key, seconds) for every cache entry it fills
+
+        Returns:
+            bool: False if the warm-up was skipped
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(user_id)
+            if user_id in self._active or (session and now - session[0] < self.cooldown):
+                self.deduplicated += 1
+                return False
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                return False
+
+            self._active.add(user_id)
+            self._pending += 1
+            self._sessions[user_id] = (now, set(), {})
+            self.scheduled += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='warmup')
+
+        self._executor.submit(self._run, user_id, warm)
+        return True
+
+    def _run(self, user_id, warm):
+        with self._lock:
+            self._pending -= 1
+        started = time.perf_counter()
+
+        def filled(key, seconds):
+            with self._lock:
+                session = self._sessions.get(user_id)
+                if session is not None:
+                    session[2][key] = seconds
+
+        try:
+            warm(user_id, filled)
+        except Exception as e:
+            print(f"Error warming caches for user {user_id}: {e}")
+            with self._lock:
+                self.failed += 1
+        else:
+            with self._lock:
+                self.completed += 1
+                self._run_times.append(time.perf_counter() - started)
+        finally:
+            with self._lock:
+                self._active.discard(user_id)
+
+    def claim(self, key):
+        """
+        Record that a request is about to serve cache key (user_id, name, ...).
+        Only the first claim per cache name after a warm-up is counted.
+        """
+        with self._lock:
+            session = self._sessions.get(key[0])
+            if session is None or key[1] in session[1]:
+                return
+            if time.monotonic() - session[0] > self.window:
+                return
+            session[1].add(key[1])
+            seconds = session[2].pop(key, None)
+            if seconds is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.seconds_saved += seconds
+
+    def _expire(self, now):
+        # Called with the lock held
+        for user_id in [u for u, s in self._sessions.items()
+                        if now - s[0] > max(self.window, self.cooldown) and u not in self._active]:
+            del self._sessions[user_id]
+
+    def stats(self):
+        with self._lock:
+            claimed = self.hits + self.misses
+            run_times = sorted(self._run_times)
+            return {
+                "workers": self.workers,
+                "running": len(self._active) - self._pending,
+                "pending": self._pending,
+                "scheduled": self.scheduled,
+                "deduplicated": self.deduplicated,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "warm_hits": self.hits,
+                "warm_misses": self.misses,
+                "warm_hit_rate": round(self.hits / claimed, 4) if claimed else None,
+                "seconds_saved": round(self.seconds_saved, 3),
+                "warmup_p50_s": round(run_times[len(run_times) // 2], 3) if run_times else None,
+            }
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 5))
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 200))
+GROUP_COMMIT_TIMEOUT = float(os.environ.get('GROUP_COMMIT_TIMEOUT', 30))
+
+
+class _Batch:
+    __slots__ = ('items', 'results', 'errors', 'full', 'done')
+
+    def __init__(self):
+        self.items = []
+        self.results = None
+        self.errors = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    """
+    Collect writes from concurrent callers and commit them together.
+
+    The first caller for a key (a shard) opens a batch and becomes its
+    leader: it waits up to `window_ms`, or until `max_batch` items have
+    joined, then runs flush(key, items) once on its own thread and hands
+    each caller its own result. flush must commit before returning, so a
+    caller that gets a result has a durable write.
+
+    If flush raises, the leader retries the items one by one so a single
+    bad row only fails its own caller.
+    """
+
+    def __init__(self, flush, window_ms=GROUP_COMMIT_WINDOW_MS, max_batch=GROUP_COMMIT_MAX_BATCH,
+                 timeout=GROUP_COMMIT_TIMEOUT):
+        self.flush = flush
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._open = {}
+
+        self.batches = 0
+        self.items = 0
+        self.retried = 0
+        self._batch_sizes = deque(maxlen=1000)
+        self._flush_times = deque(maxlen=1000)
+
+    def submit(self, key, item):
+        """
+        Add item to the open batch for key and block until it is committed
+
+        Returns:
+            The flush result for this item
+
+        Raises:
+            Whatever flush raised for this item
+            TimeoutError: If the batch did not finish within the timeout
+        """
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            position = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch:
+                # Nobody else may join a full batch
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._run(key, batch)
+        elif not batch.done.wait(self.timeout):
+            raise TimeoutError("Timed out waiting for the write batch to commit")
+
+        if batch.errors[position] is not None:
+            raise batch.errors[position]
+        return batch.results[position]
+
+    def _run(self, key, batch):
+        items = batch.items
+        start = time.perf_counter()
+        try:
+            batch.results = list(self.flush(key, items))
+            batch.errors = [None] * len(items)
+        except Exception as e:
+            batch.results = [None] * len(items)
+            if len(items) == 1:
+                batch.errors = [e]
+            else:
+                batch.errors = [None] * len(items)
+                with self._lock:
+                    self.retried += 1
+                for i, item in enumerate(items):
+                    try:
+                        batch.results[i] = self.flush(key, [item])[0]
+                    except Exception as item_error:
+                        batch.errors[i] = item_error
+        finally:
+            if batch.errors is None:
+                # A BaseException escaped flush; release the waiters with it
+                error = RuntimeError("Write batch was aborted")
+                batch.results = [None] * len(items)
+                batch.errors = [error] * len(items)
+            with self._lock:
+                self.batches += 1
+                self.items += len(items)
+                self._batch_sizes.append(len(items))
+                self._flush_times.append(time.perf_counter() - start)
+            batch.done.set()
+
+    def stats(self):
+        with self._lock:
+            sizes = list(self._batch_sizes) or [0]
+            times = sorted(self._flush_times) or [0.0]
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "items": self.items,
+                "retried_batches": self.retried,
+                "mean_batch_size": round(sum(sizes) / len(sizes), 2),
+                "max_batch_size": max(sizes),
+                "flush_ms_p50": round(times[len(times) // 2] * 1000, 2),
+                "flush_ms_max": round(times[-1] * 1000, 2),
+            }
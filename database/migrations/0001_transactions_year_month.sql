@@ -0,0 +1,6 @@
+-- Month of each transaction as 'YYYY-MM', so monthly aggregates group on a
+-- column (and an index on it) instead of DATE_FORMAT(transaction_date, ...)
+-- evaluated per row. YEAR_MONTH is a MySQL keyword: always quote the column.
+-- Adding a stored column rebuilds the table.
+ALTER TABLE transactions
+    ADD COLUMN `year_month` CHAR(7) AS (DATE_FORMAT(transaction_date, '%Y-%m')) STORED;
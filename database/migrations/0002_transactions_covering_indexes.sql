@@ -0,0 +1,14 @@
+-- Covering indexes for the per-user transaction reads, so they never touch
+-- the clustered rows.
+
+-- Monthly totals (get_monthly_totals, health.py): grouped in index order,
+-- with the currency filter and the summed amount read from the index
+ALTER TABLE transactions
+    ADD INDEX idx_user_month_cover (user_id, `year_month`, type, category, currency, amount),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Expense scans (insight state, anomaly baselines, spending patterns) and
+-- category spend over a date range (budget checks)
+ALTER TABLE transactions
+    ADD INDEX idx_user_type_date_cover (user_id, type, transaction_date, category, amount, currency),
+    ALGORITHM=INPLACE, LOCK=NONE;
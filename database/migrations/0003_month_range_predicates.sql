@@ -0,0 +1,191 @@
+-- Monthly views and procedures on `year_month` and date ranges instead of
+-- MONTH()/YEAR()/DATE_FORMAT() of transaction_date, which no index can serve.
+
+CREATE OR REPLACE VIEW v_monthly_summary AS
+SELECT 
+    user_id,
+    `year_month` as month,
+    SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as total_income,
+    SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as total_expenses,
+    SUM(CASE WHEN type = 'income' THEN amount ELSE -amount END) as net_balance,
+    COUNT(*) as transaction_count
+FROM transactions
+GROUP BY user_id, `year_month`;
+
+CREATE OR REPLACE VIEW v_category_spending AS
+SELECT 
+    user_id,
+    category,
+    `year_month` as month,
+    SUM(amount) as total_spent,
+    COUNT(*) as transaction_count,
+    AVG(amount) as avg_transaction
+FROM transactions
+WHERE type = 'expense'
+GROUP BY user_id, category, `year_month`;
+
+CREATE OR REPLACE VIEW v_budget_performance AS
+SELECT 
+    b.id as budget_id,
+    b.user_id,
+    b.category,
+    b.limit_amount,
+    COALESCE(SUM(t.amount), 0) as spent,
+    b.limit_amount - COALESCE(SUM(t.amount), 0) as remaining,
+    ROUND((COALESCE(SUM(t.amount), 0) / b.limit_amount) * 100, 2) as usage_percentage
+FROM budgets b
+LEFT JOIN transactions t ON 
+    t.user_id = b.user_id 
+    AND t.category = b.category 
+    AND t.type = 'expense'
+    AND t.transaction_date >= DATE_FORMAT(CURRENT_DATE(), '%Y-%m-01')
+    AND t.transaction_date < DATE_FORMAT(CURRENT_DATE(), '%Y-%m-01') + INTERVAL 1 MONTH
+GROUP BY b.id, b.user_id, b.category, b.limit_amount;
+
+DROP PROCEDURE IF EXISTS sp_add_transaction;
+DROP PROCEDURE IF EXISTS sp_financial_health_metrics;
+
+DELIMITER //
+
+CREATE PROCEDURE sp_add_transaction(
+    IN p_user_id INT,
+    IN p_type VARCHAR(10),
+    IN p_category VARCHAR(50),
+    IN p_amount DECIMAL(10, 2),
+    IN p_date DATE,
+    IN p_description TEXT,
+    IN p_merchant VARCHAR(100)
+)
+BEGIN
+    DECLARE v_transaction_id INT;
+    DECLARE v_budget_limit DECIMAL(10, 2);
+    DECLARE v_current_spent DECIMAL(10, 2);
+    DECLARE v_n INT DEFAULT 0;
+    DECLARE v_mean DOUBLE DEFAULT 0;
+    DECLARE v_m2 DOUBLE DEFAULT 0;
+    DECLARE v_quantile DOUBLE DEFAULT NULL;
+    DECLARE v_std DOUBLE DEFAULT 0;
+    DECLARE v_delta DOUBLE;
+    
+    -- Insert transaction
+    INSERT INTO transactions (user_id, type, category, amount, transaction_date, description, merchant)
+    VALUES (p_user_id, p_type, p_category, p_amount, p_date, p_description, p_merchant);
+    
+    SET v_transaction_id = LAST_INSERT_ID();
+    
+    IF p_type = 'expense' THEN
+        -- Score against the running category statistics, then fold the
+        -- amount in; same rule and default thresholds as anomaly.py
+        SELECT n, mean, m2, quantile INTO v_n, v_mean, v_m2, v_quantile
+        FROM category_stats
+        WHERE user_id = p_user_id AND category = p_category
+        FOR UPDATE;
+        
+        IF v_n > 1 THEN
+            SET v_std = SQRT(v_m2 / (v_n - 1));
+        END IF;
+        
+        IF v_n >= 8 AND v_std > 0 AND (p_amount - v_mean) / v_std > 2.5 AND p_amount > v_quantile THEN
+            INSERT INTO notifications (user_id, title, message, type)
+            VALUES (
+                p_user_id,
+                'Unusual Transaction',
+                CONCAT(ROUND(p_amount, 2), ' on ', p_category,
+                       IF(p_merchant IS NULL OR p_merchant = '', '', CONCAT(' at ', p_merchant)),
+                       ' is well above your usual ', p_category, ' spending (',
+                       ROUND(GREATEST(v_mean - v_std, 0), 2), ' - ', ROUND(v_mean + v_std, 2), ')'),
+                'anomaly_alert'
+            );
+        END IF;
+        
+        SET v_n = v_n + 1;
+        SET v_delta = p_amount - v_mean;
+        SET v_mean = v_mean + v_delta / v_n;
+        SET v_m2 = v_m2 + v_delta * (p_amount - v_mean);
+        SET v_std = IF(v_n > 1, SQRT(v_m2 / (v_n - 1)), 0);
+        
+        IF v_quantile IS NULL THEN
+            SET v_quantile = p_amount;
+        ELSEIF p_amount > v_quantile THEN
+            SET v_quantile = v_quantile + 0.1 * v_std * 0.95;
+        ELSEIF p_amount < v_quantile THEN
+            SET v_quantile = v_quantile - 0.1 * v_std * 0.05;
+        END IF;
+        
+        INSERT INTO category_stats (user_id, category, n, mean, m2, quantile)
+        VALUES (p_user_id, p_category, v_n, v_mean, v_m2, v_quantile)
+        ON DUPLICATE KEY UPDATE n = VALUES(n), mean = VALUES(mean), m2 = VALUES(m2),
+            quantile = VALUES(quantile);
+    END IF;
+    
+    -- Check budget if expense
+    IF p_type = 'expense' THEN
+        SELECT limit_amount INTO v_budget_limit
+        FROM budgets
+        WHERE user_id = p_user_id AND category = p_category;
+        
+        IF v_budget_limit IS NOT NULL THEN
+            SELECT COALESCE(SUM(amount), 0) INTO v_current_spent
+            FROM transactions
+            WHERE user_id = p_user_id 
+            AND category = p_category 
+            AND type = 'expense'
+            AND transaction_date >= DATE_FORMAT(p_date, '%Y-%m-01')
+            AND transaction_date < DATE_FORMAT(p_date, '%Y-%m-01') + INTERVAL 1 MONTH;
+            
+            -- Create notification if over 80% of budget
+            IF (v_current_spent / v_budget_limit) > 0.8 THEN
+                INSERT INTO notifications (user_id, title, message, type)
+                VALUES (
+                    p_user_id,
+                    'Budget Alert',
+                    CONCAT('You have spent ', ROUND((v_current_spent/v_budget_limit)*100, 0), 
+                           '% of your ', p_category, ' budget'),
+                    'budget_alert'
+                );
+            END IF;
+        END IF;
+    END IF;
+    
+    SELECT v_transaction_id as transaction_id;
+END //
+
+CREATE PROCEDURE sp_financial_health_metrics(
+    IN p_user_id INT
+)
+BEGIN
+    DECLARE v_avg_monthly_expenses DECIMAL(10, 2);
+    DECLARE v_emergency_fund DECIMAL(10, 2);
+    
+    -- Calculate average monthly expenses (last 6 months)
+    SELECT AVG(monthly_expenses) INTO v_avg_monthly_expenses
+    FROM (
+        SELECT SUM(amount) as monthly_expenses
+        FROM transactions
+        WHERE user_id = p_user_id
+        AND type = 'expense'
+        AND transaction_date >= CURRENT_DATE() - INTERVAL 6 MONTH
+        GROUP BY `year_month`
+    ) as monthly_data;
+    
+    -- Get emergency fund (sum of savings goals marked as emergency)
+    SELECT COALESCE(SUM(current_amount), 0) INTO v_emergency_fund
+    FROM savings_goals
+    WHERE user_id = p_user_id
+    AND goal_name LIKE '%emergency%'
+    AND status = 'active';
+    
+    -- Return metrics
+    SELECT 
+        v_avg_monthly_expenses as avg_monthly_expenses,
+        v_emergency_fund as emergency_fund,
+        CASE 
+            WHEN v_avg_monthly_expenses > 0 
+            THEN ROUND(v_emergency_fund / v_avg_monthly_expenses, 1)
+            ELSE 0 
+        END as months_covered,
+        (SELECT COUNT(*) FROM budgets WHERE user_id = p_user_id) as total_budgets,
+        (SELECT COUNT(*) FROM savings_goals WHERE user_id = p_user_id AND status = 'active') as active_goals;
+END //
+
+DELIMITER ;
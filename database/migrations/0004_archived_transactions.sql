@@ -0,0 +1,12 @@
+-- Which archived month each cold transaction is in, so a row can be found
+-- by id (edits, deletes, search hits) by decoding only its own segment.
+-- Written by archive.py with each segment; fill it for months archived
+-- before this migration with `python archive.py index`.
+CREATE TABLE IF NOT EXISTS archived_transactions (
+    user_id INT NOT NULL,
+    transaction_id INT NOT NULL,
+    period CHAR(7) NOT NULL,
+    PRIMARY KEY (user_id, transaction_id),
+    INDEX idx_user_period (user_id, period),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
@@ -0,0 +1,16 @@
+-- Edits and deletes of transactions the categorizer may already have
+-- learned from. Each row is the old text and category to unlearn and
+-- the new ones to learn (NULL for a delete); categorize.py folds them
+-- into every worker's model the next time the user's model is used.
+CREATE TABLE IF NOT EXISTS category_corrections (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    transaction_id INT NOT NULL,
+    old_text TEXT NOT NULL,
+    old_category VARCHAR(50) NOT NULL,
+    new_text TEXT NULL,
+    new_category VARCHAR(50) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_user_id (user_id, id),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
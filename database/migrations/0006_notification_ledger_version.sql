@@ -0,0 +1,33 @@
+-- Notification writes bump the ledger version like every other write,
+-- so the consistency token returned by marking or deleting notifications
+-- keeps inbox reads off replicas that haven't applied them yet.
+
+DROP TRIGGER IF EXISTS trg_notification_insert_ledger_version;
+DROP TRIGGER IF EXISTS trg_notification_update_ledger_version;
+DROP TRIGGER IF EXISTS trg_notification_delete_ledger_version;
+
+DELIMITER //
+CREATE TRIGGER trg_notification_insert_ledger_version
+AFTER INSERT ON notifications
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (NEW.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_notification_update_ledger_version
+AFTER UPDATE ON notifications
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (NEW.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_notification_delete_ledger_version
+AFTER DELETE ON notifications
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (OLD.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+DELIMITER ;
@@ -0,0 +1,14 @@
+-- Contributions written by POST /api/goals/<id>/contribute. The app has
+-- always inserted into this table but the baseline schema never created
+-- it; reshard.py copies it with the rest of a user's rows.
+CREATE TABLE IF NOT EXISTS goal_contributions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    goal_id INT NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    contribution_date DATE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (goal_id) REFERENCES savings_goals(id) ON DELETE CASCADE,
+    INDEX idx_user_goal (user_id, goal_id)
+);
@@ -0,0 +1,48 @@
+-- The inbox gets its own consistency counter. 0006 made notification
+-- writes bump ledger_versions, which invalidated every ledger-keyed
+-- cache and state on each mark-read and threw off the incremental
+-- forecast and insight updates when a write also raised an alert.
+-- notification_counters.version now moves on every insert, read and
+-- delete instead, and is returned to clients as X-Inbox-Token.
+
+DROP TRIGGER IF EXISTS trg_notification_insert_ledger_version;
+DROP TRIGGER IF EXISTS trg_notification_update_ledger_version;
+DROP TRIGGER IF EXISTS trg_notification_delete_ledger_version;
+
+ALTER TABLE notification_counters ADD COLUMN version BIGINT NOT NULL DEFAULT 0;
+
+DROP TRIGGER IF EXISTS trg_notification_insert_counter;
+DROP TRIGGER IF EXISTS trg_notification_update_counter;
+DROP TRIGGER IF EXISTS trg_notification_delete_counter;
+
+DELIMITER //
+CREATE TRIGGER trg_notification_insert_counter
+AFTER INSERT ON notifications
+FOR EACH ROW
+BEGIN
+    INSERT INTO notification_counters (user_id, unread, latest_id, version)
+    VALUES (NEW.user_id, IF(NEW.is_read, 0, 1), NEW.id, 1)
+    ON DUPLICATE KEY UPDATE unread = unread + IF(NEW.is_read, 0, 1), latest_id = GREATEST(latest_id, NEW.id),
+        version = version + 1;
+END //
+
+CREATE TRIGGER trg_notification_update_counter
+AFTER UPDATE ON notifications
+FOR EACH ROW
+BEGIN
+    UPDATE notification_counters
+    SET unread = unread + IF(NEW.is_read = OLD.is_read, 0, IF(NEW.is_read, -1, 1)),
+        version = version + 1
+    WHERE user_id = NEW.user_id;
+END //
+
+CREATE TRIGGER trg_notification_delete_counter
+AFTER DELETE ON notifications
+FOR EACH ROW
+BEGIN
+    UPDATE notification_counters
+    SET unread = unread - IF(OLD.is_read, 0, 1),
+        version = version + 1
+    WHERE user_id = OLD.user_id;
+END //
+DELIMITER ;
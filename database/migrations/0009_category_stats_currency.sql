@@ -0,0 +1,10 @@
+-- category_stats records the currency its moments are in. After a
+-- change of user_preferences.currency, anomaly.py rebuilds them instead
+-- of scoring new amounts against moments in the old currency. Existing
+-- rows were built in the user's current currency.
+
+ALTER TABLE category_stats ADD COLUMN currency VARCHAR(10) NULL;
+
+UPDATE category_stats s
+LEFT JOIN user_preferences p ON p.user_id = s.user_id
+SET s.currency = COALESCE(NULLIF(p.currency, ''), 'INR');
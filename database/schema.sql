@@ -1,3 +1,6 @@
+-- Baseline schema. Later changes are numbered scripts in database/migrations,
+-- applied on top of this one with `python backend/migrate.py up`.
+
 -- Create Database
 CREATE DATABASE IF NOT EXISTS finance_tracker_p3;
 USE finance_tracker_p3;
@@ -23,6 +26,7 @@ CREATE TABLE transactions (
     transaction_date DATE NOT NULL,
     description TEXT,
     merchant VARCHAR(100),
+    currency CHAR(3) NULL,  -- NULL: in the user's currency (user_preferences.currency)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
@@ -95,13 +99,21 @@ CREATE TABLE notifications (
     user_id INT NOT NULL,
     title VARCHAR(200) NOT NULL,
     message TEXT NOT NULL,
-    type ENUM('budget_alert', 'goal_reminder', 'insight', 'general') NOT NULL,
+    type ENUM('budget_alert', 'goal_reminder', 'insight', 'anomaly_alert', 'general') NOT NULL,
     is_read BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     INDEX idx_user_read (user_id, is_read)
 );
 
+-- Notification Counters Table (unread count and newest id per user, maintained by triggers)
+CREATE TABLE notification_counters (
+    user_id INT PRIMARY KEY,
+    unread INT NOT NULL DEFAULT 0,
+    latest_id INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
 -- User Preferences Table
 CREATE TABLE user_preferences (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -148,6 +160,101 @@ CREATE TABLE insights_cache (
     INDEX idx_valid (valid_until)
 );
 
+-- Ledger Versions Table (bumped by triggers; keys response and prediction caches)
+CREATE TABLE ledger_versions (
+    user_id INT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Forecast State Table (per-user Holt-Winters state, one entry per series)
+CREATE TABLE forecast_states (
+    user_id INT PRIMARY KEY,
+    state JSON NOT NULL,
+    ledger_version BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Insight State Table (per-user expense partials by month, weekday and category)
+CREATE TABLE insight_states (
+    user_id INT PRIMARY KEY,
+    state JSON NOT NULL,
+    ledger_version BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- User Shards Table (directory database only; overrides the hash ring, written by reshard.py)
+CREATE TABLE user_shards (
+    user_id INT PRIMARY KEY,
+    shard VARCHAR(50) NOT NULL,
+    state ENUM('active', 'moving') DEFAULT 'active',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- FX Rates Table (directory database only; units of currency per unit of FX_QUOTE_CURRENCY, loaded by fx.py)
+CREATE TABLE fx_rates (
+    currency CHAR(3) NOT NULL,
+    rate_date DATE NOT NULL,
+    rate DECIMAL(18, 8) NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (currency, rate_date),
+    INDEX idx_updated (updated_at)
+);
+
+-- Transaction Archive Table (cold tier, one compressed segment per user-month, written by archive.py)
+CREATE TABLE transaction_archive (
+    user_id INT NOT NULL,
+    period CHAR(7) NOT NULL,
+    row_count INT NOT NULL,
+    total_income DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    total_expenses DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    summary JSON NOT NULL,
+    segment_format VARCHAR(16) NOT NULL,
+    segment LONGBLOB NOT NULL,
+    archived_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, period),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Transaction Terms Table (inverted index over merchant/description tokens, maintained by search.py)
+CREATE TABLE transaction_terms (
+    user_id INT NOT NULL,
+    term VARCHAR(32) NOT NULL,
+    transaction_id INT NOT NULL,
+    PRIMARY KEY (user_id, term, transaction_id),
+    INDEX idx_user_transaction (user_id, transaction_id, term),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Merchant Terms Table (merchant autocomplete, one row per merchant word)
+CREATE TABLE merchant_terms (
+    user_id INT NOT NULL,
+    term VARCHAR(32) NOT NULL,
+    merchant VARCHAR(100) NOT NULL,
+    uses INT NOT NULL DEFAULT 0,
+    last_category VARCHAR(50),
+    PRIMARY KEY (user_id, term, merchant),
+    INDEX idx_user_merchant (user_id, merchant),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Category Stats Table (running expense statistics for insert-time anomaly scoring, maintained by anomaly.py)
+CREATE TABLE category_stats (
+    user_id INT NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    n INT NOT NULL DEFAULT 0,
+    mean DOUBLE NOT NULL DEFAULT 0,
+    m2 DOUBLE NOT NULL DEFAULT 0,
+    quantile DOUBLE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, category),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
 -- Views for common queries
 
 -- Monthly Summary View
@@ -212,6 +319,12 @@ BEGIN
     DECLARE v_transaction_id INT;
     DECLARE v_budget_limit DECIMAL(10, 2);
     DECLARE v_current_spent DECIMAL(10, 2);
+    DECLARE v_n INT DEFAULT 0;
+    DECLARE v_mean DOUBLE DEFAULT 0;
+    DECLARE v_m2 DOUBLE DEFAULT 0;
+    DECLARE v_quantile DOUBLE DEFAULT NULL;
+    DECLARE v_std DOUBLE DEFAULT 0;
+    DECLARE v_delta DOUBLE;
     
     -- Insert transaction
     INSERT INTO transactions (user_id, type, category, amount, transaction_date, description, merchant)
@@ -219,6 +332,51 @@ BEGIN
     
     SET v_transaction_id = LAST_INSERT_ID();
     
+    IF p_type = 'expense' THEN
+        -- Score against the running category statistics, then fold the
+        -- amount in; same rule and default thresholds as anomaly.py
+        SELECT n, mean, m2, quantile INTO v_n, v_mean, v_m2, v_quantile
+        FROM category_stats
+        WHERE user_id = p_user_id AND category = p_category
+        FOR UPDATE;
+        
+        IF v_n > 1 THEN
+            SET v_std = SQRT(v_m2 / (v_n - 1));
+        END IF;
+        
+        IF v_n >= 8 AND v_std > 0 AND (p_amount - v_mean) / v_std > 2.5 AND p_amount > v_quantile THEN
+            INSERT INTO notifications (user_id, title, message, type)
+            VALUES (
+                p_user_id,
+                'Unusual Transaction',
+                CONCAT(ROUND(p_amount, 2), ' on ', p_category,
+                       IF(p_merchant IS NULL OR p_merchant = '', '', CONCAT(' at ', p_merchant)),
+                       ' is well above your usual ', p_category, ' spending (',
+                       ROUND(GREATEST(v_mean - v_std, 0), 2), ' - ', ROUND(v_mean + v_std, 2), ')'),
+                'anomaly_alert'
+            );
+        END IF;
+        
+        SET v_n = v_n + 1;
+        SET v_delta = p_amount - v_mean;
+        SET v_mean = v_mean + v_delta / v_n;
+        SET v_m2 = v_m2 + v_delta * (p_amount - v_mean);
+        SET v_std = IF(v_n > 1, SQRT(v_m2 / (v_n - 1)), 0);
+        
+        IF v_quantile IS NULL THEN
+            SET v_quantile = p_amount;
+        ELSEIF p_amount > v_quantile THEN
+            SET v_quantile = v_quantile + 0.1 * v_std * 0.95;
+        ELSEIF p_amount < v_quantile THEN
+            SET v_quantile = v_quantile - 0.1 * v_std * 0.05;
+        END IF;
+        
+        INSERT INTO category_stats (user_id, category, n, mean, m2, quantile)
+        VALUES (p_user_id, p_category, v_n, v_mean, v_m2, v_quantile)
+        ON DUPLICATE KEY UPDATE n = VALUES(n), mean = VALUES(mean), m2 = VALUES(m2),
+            quantile = VALUES(quantile);
+    END IF;
+    
     -- Check budget if expense
     IF p_type = 'expense' THEN
         SELECT limit_amount INTO v_budget_limit
@@ -276,7 +434,8 @@ BEGIN
     AND transaction_date BETWEEN p_start_date AND p_end_date;
 END //
 
--- Procedure to get financial health metrics
+-- Procedure to get financial health metrics (single user, no ranking; the API serves
+-- cohort-ranked metrics from backend/health.py)
 CREATE PROCEDURE sp_financial_health_metrics(
     IN p_user_id INT
 )
@@ -341,6 +500,112 @@ BEGIN
 END //
 DELIMITER ;
 
+-- Triggers to bump the per-user ledger version on every write
+DELIMITER //
+CREATE TRIGGER trg_transaction_insert_ledger_version
+AFTER INSERT ON transactions
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (NEW.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_transaction_update_ledger_version
+AFTER UPDATE ON transactions
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (NEW.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_transaction_delete_ledger_version
+AFTER DELETE ON transactions
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (OLD.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_budget_insert_ledger_version
+AFTER INSERT ON budgets
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (NEW.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_budget_update_ledger_version
+AFTER UPDATE ON budgets
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (NEW.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_budget_delete_ledger_version
+AFTER DELETE ON budgets
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (OLD.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_goal_insert_ledger_version
+AFTER INSERT ON savings_goals
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (NEW.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_goal_update_ledger_version
+AFTER UPDATE ON savings_goals
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (NEW.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_goal_delete_ledger_version
+AFTER DELETE ON savings_goals
+FOR EACH ROW
+BEGIN
+    INSERT INTO ledger_versions (user_id, version) VALUES (OLD.user_id, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END //
+
+CREATE TRIGGER trg_notification_insert_counter
+AFTER INSERT ON notifications
+FOR EACH ROW
+BEGIN
+    INSERT INTO notification_counters (user_id, unread, latest_id)
+    VALUES (NEW.user_id, IF(NEW.is_read, 0, 1), NEW.id)
+    ON DUPLICATE KEY UPDATE unread = unread + IF(NEW.is_read, 0, 1), latest_id = GREATEST(latest_id, NEW.id);
+END //
+
+CREATE TRIGGER trg_notification_update_counter
+AFTER UPDATE ON notifications
+FOR EACH ROW
+BEGIN
+    IF NEW.is_read <> OLD.is_read THEN
+        UPDATE notification_counters
+        SET unread = unread + IF(NEW.is_read, -1, 1)
+        WHERE user_id = NEW.user_id;
+    END IF;
+END //
+
+CREATE TRIGGER trg_notification_delete_counter
+AFTER DELETE ON notifications
+FOR EACH ROW
+BEGIN
+    IF NOT OLD.is_read THEN
+        UPDATE notification_counters
+        SET unread = unread - 1
+        WHERE user_id = OLD.user_id;
+    END IF;
+END //
+DELIMITER ;
+
 -- Sample Data (for testing)
 INSERT INTO users (email, password_hash, name) VALUES
 ('sahil@example.com', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewY5NU7nQQ4EqYvS', 'Sahil Saini');
@@ -1,6 +1,6 @@
-import React, { useState, useMemo, useEffect } from 'react';
+import React, { useState, useMemo, useEffect, useRef } from 'react';
 import { PieChart, Pie, BarChart, Bar, LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, Cell, ResponsiveContainer } from 'recharts';
-import { TrendingUp, TrendingDown, Wallet, Target, AlertCircle, PlusCircle, Award, Activity } from 'lucide-react';
+import { TrendingUp, TrendingDown, Wallet, Target, AlertCircle, PlusCircle, Award, Activity, Bell } from 'lucide-react';
 import { useNavigate } from "react-router-dom";
 import { LogOut } from "lucide-react";
 import { useAuth } from "../auth/AuthContext";
@@ -22,6 +22,48 @@ const FinanceTracker = () => {
       Authorization: `Bearer ${token}`
     }), [token]);
 
+    // Newest ledger and inbox versions this session has written; every read
+    // after a write carries them so a replica serves the read only once it
+    // has caught up
+    const consistencyTokens = useRef({});
+    useEffect(() => {
+      consistencyTokens.current = {};
+    }, [token]);
+
+    const noteWrite = (res) => {
+      for (const header of ["X-Consistency-Token", "X-Inbox-Token"]) {
+        const written = Number(res.headers.get(header));
+        if (written > (consistencyTokens.current[header] || 0)) {
+          consistencyTokens.current[header] = written;
+        }
+      }
+      return res;
+    };
+
+    const readHeaders = () => {
+      const headers = { ...authHeaders };
+      for (const [header, version] of Object.entries(consistencyTokens.current)) {
+        headers[header] = String(version);
+      }
+      return headers;
+    };
+
+    // Heavy predictions answer 202 with a queued job; long-poll the job
+    // until its result is in instead of holding the request open
+    const fetchPrediction = async (path) => {
+      const res = await fetch(`${API_BASE}${path}`, { headers: authHeaders });
+      const data = await res.json();
+      if (!res.ok) throw new Error(data.error || `${path} failed`);
+      if (res.status !== 202) return data;
+
+      for (;;) {
+        const poll = await fetch(`${API_BASE}/jobs/${data.job_id}?wait=20`, { headers: authHeaders });
+        const job = await poll.json();
+        if (!poll.ok || job.status === "failed") throw new Error(job.error || `${path} failed`);
+        if (job.status === "done") return job.result;
+      }
+    };
+
   const [activeTab, setActiveTab] = useState('dashboard');
   const [editingTransaction, setEditingTransaction] = useState(null);
   const [transactions, setTransactions] = useState([]);
@@ -32,6 +74,7 @@ const FinanceTracker = () => {
   const [activeGoalId, setActiveGoalId] = useState(null);
 
   const [spendingInsights, setSpendingInsights] = useState(null);
+  const [merchantSuggestions, setMerchantSuggestions] = useState([]);
 
 
 
@@ -52,6 +95,7 @@ const FinanceTracker = () => {
   const [cashflowPrediction, setCashflowPrediction] = useState(null);
   const [budgetRisks, setBudgetRisks] = useState([]);
   const [cashFlowData, setCashFlowData] = useState([]);
+  const [inbox, setInbox] = useState({ unread: 0, latestId: 0 });
 
 useEffect(() => {
   if (!token) return;
@@ -154,13 +198,7 @@ useEffect(() => {
 useEffect(() => {
   if (!token) return;
 
-  fetch(`${API_BASE}/predictions/cashflow-advanced`, {
-    headers: authHeaders
-  })
-    .then(res => {
-      if (!res.ok) throw new Error("Cashflow fetch failed");
-      return res.json();
-    })
+  fetchPrediction("/predictions/cashflow-advanced")
     .then(data => {
       setCashflowPrediction(data);
       setCashFlowData(data.historical_data || []);
@@ -183,20 +221,76 @@ useEffect(() => {
 useEffect(() => {
   if (!token) return;
 
-  fetch(`${API_BASE}/predictions/spending-insights`, {
-    headers: authHeaders
-  })
-    .then(res => res.json())
+  fetchPrediction("/predictions/spending-insights")
     .then(setSpendingInsights)
     .catch(err => console.error("Failed to load insights", err));
 }, [token,authHeaders]);
 
+// Long-poll the inbox; the server answers as soon as a notification arrives
+useEffect(() => {
+  if (!token) return;
+
+  let cancelled = false;
+  const controller = new AbortController();
+
+  const poll = async () => {
+    let after = 0;
+    try {
+      const res = await fetch(`${API_BASE}/notifications/unread-count`, {
+        headers: readHeaders(),
+        signal: controller.signal
+      });
+      const data = await res.json();
+      after = data.latest_id;
+      setInbox({ unread: data.unread, latestId: data.latest_id });
+    } catch (err) {
+      if (cancelled) return;
+    }
+
+    while (!cancelled) {
+      try {
+        const res = await fetch(`${API_BASE}/notifications/wait?after=${after}`, {
+          headers: authHeaders,
+          signal: controller.signal
+        });
+        if (!res.ok) throw new Error("Notification wait failed");
+        const data = await res.json();
+        after = data.latest_id;
+        setInbox({ unread: data.unread, latestId: data.latest_id });
+      } catch (err) {
+        if (cancelled) return;
+        await new Promise(resolve => setTimeout(resolve, 5000));
+      }
+    }
+  };
+
+  poll();
+  return () => {
+    cancelled = true;
+    controller.abort();
+  };
+}, [token,authHeaders]);
+
+const markNotificationsRead = async () => {
+  if (!inbox.unread) return;
+
+  const res = noteWrite(await fetch(`${API_BASE}/notifications/read`, {
+    method: "POST",
+    headers: authHeaders,
+    body: JSON.stringify({ up_to: inbox.latestId })
+  }));
+  if (res.ok) {
+    const data = await res.json();
+    setInbox({ unread: data.unread, latestId: data.latest_id });
+  }
+};
+
 const loadGoalProjection = async (goalId) => {
   if (goalProjections[goalId]) return;
 
   const res = await fetch(
     `${API_BASE}/predictions/goal-timeline/${goalId}`,
-    { headers: authHeaders }
+    { headers: readHeaders() }
   );
   const data = await res.json();
 
@@ -209,7 +303,7 @@ const loadGoalProjection = async (goalId) => {
       if (!contributionAmount || !activeGoalId) return;
 
       try {
-        const res = await fetch(
+        const res = noteWrite(await fetch(
           `${API_BASE}/goals/${activeGoalId}/contribute`,
           {
             method: "POST",
@@ -218,7 +312,7 @@ const loadGoalProjection = async (goalId) => {
               amount: Number(contributionAmount)
             })
           }
-        );
+        ));
 
         if (!res.ok) throw new Error("Contribution failed");
 
@@ -355,16 +449,16 @@ const categoryChartData =
         ]);
 
         // 2️⃣ Backend persistence
-await fetch(`${API_BASE}/transactions`, {
+noteWrite(await fetch(`${API_BASE}/transactions`, {
   method: "POST",
   headers: authHeaders,
   body: JSON.stringify(payload)
-});
+}));
 
 await loadBudgets();
 // 🔄 Re-fetch from backend
 const refreshed = await fetch(`${API_BASE}/transactions`, {
-  headers: authHeaders
+  headers: readHeaders()
 });
 const data = await refreshed.json();
 
@@ -392,19 +486,46 @@ setTransactions(
     setTransactions(prev => prev.filter(t => t.id !== id));
 
     try {
-        await fetch(`${API_BASE}/transactions/${id}`, {
+        noteWrite(await fetch(`${API_BASE}/transactions/${id}`, {
         method: "DELETE",
         headers: authHeaders
-        });
+        }));
         await loadBudgets();
     } catch (err) {
         console.error("Failed to delete transaction", err);
     }
   };
+const handleMerchantChange = async (value) => {
+  setNewTransaction(prev => ({ ...prev, merchant: value }));
+
+  const picked = merchantSuggestions.find(s => s.merchant === value);
+  if (picked && picked.last_category) {
+    setNewTransaction(prev => ({ ...prev, category: picked.last_category }));
+    return;
+  }
+  if (value.trim().length < 2) {
+    setMerchantSuggestions([]);
+    return;
+  }
+
+  try {
+    const res = await fetch(
+      `${API_BASE}/merchants/suggest?prefix=${encodeURIComponent(value)}`,
+      { headers: readHeaders() }
+    );
+    const data = await res.json();
+    if (Array.isArray(data)) {
+      setMerchantSuggestions(data);
+    }
+  } catch (err) {
+    console.error("Failed to load merchant suggestions", err);
+  }
+};
+
 const loadBudgets = async () => {
   try {
     const res = await fetch(`${API_BASE}/budgets`, {
-      headers: authHeaders
+      headers: readHeaders()
     });
     const data = await res.json();
 
@@ -428,11 +549,11 @@ const handleAddBudget = async () => {
 
 
   try {
-    await fetch(`${API_BASE}/budgets`, {
+    noteWrite(await fetch(`${API_BASE}/budgets`, {
       method: "POST",
       headers: authHeaders,
       body: JSON.stringify(payload)
-    });
+    }));
     await loadBudgets();
   } catch (err) {
     console.error("Failed to save budget", err);
@@ -446,10 +567,10 @@ const handleDeleteBudget = async (id) => {
   setBudgets(prev => prev.filter(b => b.id !== id));
 
   try {
-    await fetch(`${API_BASE}/budgets/${id}`, {
+    noteWrite(await fetch(`${API_BASE}/budgets/${id}`, {
       method: "DELETE",
       headers: authHeaders
-    });
+    }));
   } catch (err) {
     console.error("Failed to delete budget", err);
   }
@@ -465,11 +586,11 @@ const handleAddGoal = async () => {
   };
 
   try {
-    const res = await fetch(`${API_BASE}/goals`, {
+    const res = noteWrite(await fetch(`${API_BASE}/goals`, {
       method: "POST",
       headers: authHeaders,
       body: JSON.stringify(payload)
-    });
+    }));
 
     const savedGoal = await res.json(); // 👈 get real DB goal
     const normalizedGoal = {
@@ -491,10 +612,10 @@ const handleDeleteGoal = async (id) => {
   setSavingsGoals(prev => prev.filter(g => g.id !== id));
 
   try {
-    await fetch(`${API_BASE}/goals/${id}`, {
+    noteWrite(await fetch(`${API_BASE}/goals/${id}`, {
       method: "DELETE",
       headers: authHeaders
-    });
+    }));
   } catch (err) {
     console.error("Failed to delete goal", err);
   }
@@ -529,14 +650,14 @@ const handleUpdateTransaction = async () => {
   );
 
   try {
-    const res = await fetch(
+    const res = noteWrite(await fetch(
       `${API_BASE}/transactions/${editingTransaction.id}`,
       {
         method: "PUT",
         headers: authHeaders,
         body: JSON.stringify(payload)
       }
-    );
+    ));
 
     if (!res.ok) {
       throw new Error("Update failed");
@@ -560,7 +681,7 @@ const handleUpdateTransaction = async () => {
 const fetchGoalTimeline = async (goalId) => {
   const res = await fetch(
     `${API_BASE}/predictions/goal-timeline/${goalId}`,
-    { headers: authHeaders }
+    { headers: readHeaders() }
   );
   return res.json();
 };
@@ -605,6 +726,18 @@ const emergencyMonths =
               </div>
             </div>
             <div className="flex items-center gap-4">
+              <button
+                onClick={markNotificationsRead}
+                className="relative p-2 rounded-lg hover:bg-indigo-50"
+                title={inbox.unread ? `${inbox.unread} unread notifications` : "No unread notifications"}
+              >
+                <Bell className="text-gray-600" size={22} />
+                {inbox.unread > 0 && (
+                  <span className="absolute -top-1 -right-1 bg-red-500 text-white text-xs rounded-full px-1.5">
+                    {inbox.unread}
+                  </span>
+                )}
+              </button>
               <div className="text-right">
                 <p className="text-sm text-gray-500">Current Balance</p>
                 <p className="text-2xl font-bold text-gray-800">₹{insights.balance.toLocaleString()}</p>
@@ -885,10 +1018,16 @@ const emergencyMonths =
                 <input
                   type="text"
                   placeholder="Merchant"
+                  list="merchant-suggestions"
                   value={newTransaction.merchant}
-                  onChange={(e) => setNewTransaction({...newTransaction, merchant: e.target.value})}
+                  onChange={(e) => handleMerchantChange(e.target.value)}
                   className="px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent"
                 />
+                <datalist id="merchant-suggestions">
+                  {merchantSuggestions.map(s => (
+                    <option key={s.merchant} value={s.merchant} />
+                  ))}
+                </datalist>
               </div>
                 <button
                 onClick={editingTransaction ? handleUpdateTransaction : handleAddTransaction}